@@ -0,0 +1,234 @@
+"""
+Controle de admissão na borda da aplicação (middleware ASGI puro).
+
+Antes de qualquer rota (e portanto antes de abrir session no banco) cada requisição passa por:
+1. token buckets por cliente (IP) e por rota, que devolvem 429 com Retry-After;
+2. um limite global de requisições simultâneas com fila de espera limitada; fila cheia ou
+   espera longa demais devolvem 503 com Retry-After.
+Assim o excesso é recusado em microssegundos em vez de se acumular no threadpool e
+derrubar a latência de todo mundo. O feed SSE e /api/metrics ficam de fora.
+"""
+import asyncio
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import config_section
+from .metrics import metrics
+
+DEFAULT_EXEMPT = ("/api/appointments/stream", "/api/metrics")
+MAX_TRACKED_CLIENTS = 10000
+
+
+class TokenBucket:
+    """Balde de `burst` fichas reabastecido a `rate` fichas/s."""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Consome uma ficha; retorna 0 se conseguiu, ou quantos segundos faltam para a próxima."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+def _positive_rate(name: str, value: Optional[float]) -> Optional[float]:
+    """Taxa de reabastecimento > 0: com 0 o balde nunca enche e o Retry-After seria infinito."""
+    if value is not None and value <= 0:
+        raise ValueError(f"admission: {name} deve ser > 0 (recebido {value}); para bloquear, use uma taxa baixa")
+    return value
+
+
+class RouteRule:
+    """Limites de uma rota: método + caminho exato, ou tudo abaixo dele com `prefix: true`."""
+
+    def __init__(self, method: str, path: str, rate: Optional[float] = None, burst: Optional[float] = None,
+                 client_rate: Optional[float] = None, client_burst: Optional[float] = None, prefix: bool = False):
+        self.method = method.upper()
+        self.path = path.rstrip("/") or "/"
+        self.prefix = prefix
+        self.rate, self.burst = _positive_rate("rate", rate), burst
+        self.client_rate, self.client_burst = _positive_rate("client_rate", client_rate), client_burst
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.method not in ("*", method):
+            return False
+        path = path.rstrip("/") or "/"
+        return path == self.path or (self.prefix and path.startswith(self.path.rstrip("/") + "/"))
+
+    @property
+    def key(self) -> str:
+        return f"{self.method} {self.path}"
+
+
+class RateLimiter:
+    """Buckets por (cliente, rota) em um LRU limitado, mais um bucket global por rota configurada."""
+
+    def __init__(self, client_rate: float, client_burst: float, rules: List[RouteRule],
+                 clock: Callable[[], float] = time.monotonic, max_clients: int = MAX_TRACKED_CLIENTS):
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.rules = rules
+        self.clock = clock
+        self.max_clients = max_clients
+        self._clients: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self._routes: Dict[str, TokenBucket] = {}
+
+    def _rule_for(self, method: str, path: str) -> Optional[RouteRule]:
+        return next((r for r in self.rules if r.matches(method, path)), None)
+
+    def check(self, client: str, method: str, path: str) -> float:
+        """0 se a requisição pode seguir; senão o Retry-After em segundos."""
+        now = self.clock()
+        rule = self._rule_for(method, path)
+        rule_key = rule.key if rule else "*"
+        rate = rule.client_rate if rule and rule.client_rate is not None else self.client_rate
+        burst = rule.client_burst if rule and rule.client_burst is not None else self.client_burst
+
+        key = (client, rule_key)
+        bucket = self._clients.get(key)
+        if bucket is None:
+            bucket = self._clients[key] = TokenBucket(rate, burst, now)
+            if len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(key)
+        wait = bucket.take(now)
+        if wait or rule is None or rule.rate is None:
+            return wait
+
+        route_bucket = self._routes.get(rule_key)
+        if route_bucket is None:
+            route_bucket = self._routes[rule_key] = TokenBucket(rule.rate, rule.burst or rule.rate, now)
+        wait = route_bucket.take(now)
+        if wait:
+            bucket.tokens += 1  # a rota recusou: devolve a ficha do cliente
+        return wait
+
+
+class ConcurrencyGate:
+    """Até `limit` requisições ao mesmo tempo, no máximo `max_queue` esperando por até `timeout` s."""
+
+    def __init__(self, limit: int, max_queue: int, timeout: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self._waiters: "OrderedDict[asyncio.Future, None]" = OrderedDict()
+
+    async def acquire(self) -> bool:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[waiter] = None
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+            return True  # a vaga foi transferida por release()
+        except BaseException as exc:
+            # timeout, ou a requisição foi cancelada (cliente desconectou) enquanto esperava
+            self._waiters.pop(waiter, None)
+            granted = waiter.done() and not waiter.cancelled()
+            if not granted:
+                waiter.cancel()
+            if isinstance(exc, asyncio.TimeoutError):
+                return granted  # liberado no mesmo instante do timeout
+            if granted:
+                self.release()  # a vaga já era dela: passa adiante em vez de vazar
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter, _ = self._waiters.popitem(last=False)
+            if not waiter.done():
+                waiter.set_result(None)  # vaga passa direto para o próximo, in_flight não muda
+                return
+        self.in_flight -= 1
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+
+class AdmissionMiddleware:
+    """
+    Middleware ASGI. Config lida na primeira requisição (não no import), em `admission`:
+    enabled, max_concurrent, max_queue, queue_timeout_seconds, client_rate, client_burst,
+    exempt (prefixos) e routes (lista de {method, path, prefix, rate, burst, client_rate, client_burst}).
+    Taxa <= 0 é erro de configuração (ValueError).
+    """
+
+    def __init__(self, app, settings: Optional[Dict[str, Any]] = None, clock: Callable[[], float] = time.monotonic):
+        self.app = app
+        self._settings = settings
+        self._clock = clock
+        self._limiter: Optional[RateLimiter] = None
+        self._gate: Optional[ConcurrencyGate] = None
+        self._gate_loop = None
+        self._loaded = False
+
+    def _load(self) -> None:
+        cfg = self._settings if self._settings is not None else config_section("admission")
+        self.enabled = cfg.get("enabled", True)
+        self.exempt = tuple(cfg.get("exempt", DEFAULT_EXEMPT))
+        self.retry_after_busy = float(cfg.get("busy_retry_after_seconds", 1))
+        rules = [RouteRule(**r) for r in cfg.get("routes", [])]
+        client_rate = _positive_rate("client_rate", float(cfg.get("client_rate", 20)))
+        self._limiter = RateLimiter(client_rate, float(cfg.get("client_burst", 40)), rules, clock=self._clock)
+        self._gate_args = (int(cfg.get("max_concurrent", 64)), int(cfg.get("max_queue", 128)),
+                           float(cfg.get("queue_timeout_seconds", 2)))
+        self._loaded = True
+
+    def _gate_for_loop(self) -> ConcurrencyGate:
+        loop = asyncio.get_running_loop()
+        if self._gate is None or self._gate_loop is not loop:
+            self._gate, self._gate_loop = ConcurrencyGate(*self._gate_args), loop
+        return self._gate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if not self._loaded:
+            self._load()
+        path = scope.get("path", "")
+        if not self.enabled or path.startswith(self.exempt):
+            return await self.app(scope, receive, send)
+
+        client = (scope.get("client") or ("anon", 0))[0]
+        wait = self._limiter.check(client, scope.get("method", "GET"), path)
+        if wait:
+            metrics.incr("admission.rate_limited")
+            return await _reject(send, 429, "Muitas requisições; tente novamente em instantes", wait)
+
+        gate = self._gate_for_loop()
+        if not await gate.acquire():
+            metrics.incr("admission.shed")
+            return await _reject(send, 503, "Servidor ocupado; tente novamente em instantes", self.retry_after_busy)
+        metrics.set_gauge("admission.in_flight", gate.in_flight)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
+            metrics.set_gauge("admission.in_flight", gate.in_flight)
+
+
+async def _reject(send, status: int, detail: str, retry_after: float) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,220 @@
+"""
+Análise de ocupação dos recursos com NumPy.
+
+Os intervalos de uma janela são lidos por um select Core já convertidos em inteiros
+(minutos desde a época e código de status), viram colunas int64 e todo o resto é
+vetorizado: ocupação por hora via soma acumulada + searchsorted e mapa de calor
+(recurso x dia da semana x hora) via bincount. A capacidade é o expediente de cada recurso
+(calendário compilado, com grade semanal e exceções por data), expandido em minutos abertos por
+hora da janela no processo da API; o cálculo roda num ProcessPoolExecutor para não segurar os
+workers da API.
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import case, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .archive import appointment_source
+from .calendars import CompiledCalendar, calendars as shared_calendars
+from .compact import epoch_minutes_sql as _epoch_minutes_sql, to_epoch_minutes
+from .config import config_section
+
+STATUS_CODES = {"scheduled": 0, "done": 1, "cancelled": 2, "no_show": 3}
+CANCELLED, NO_SHOW = STATUS_CODES["cancelled"], STATUS_CODES["no_show"]
+EPOCH_WEEKDAY = 3  # 1970-01-01 foi quinta-feira (segunda = 0)
+HOURS_PER_WEEK = 7 * 24
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def load_intervals(db: Session, start: datetime, end: datetime, resource_id: Optional[int] = None,
+                   include_archived: bool = False) -> Dict[str, np.ndarray]:
+    """Colunas int64 (resource, start, end, status) dos agendamentos que cruzam a janela, sem hidratar ORM."""
+    c = appointment_source(include_archived).c
+    status = case(*((c.status == name, code) for name, code in STATUS_CODES.items()), else_=0)
+    stmt = (select(c.resource_id, _epoch_minutes_sql(c.start_time), _epoch_minutes_sql(c.end_time), status)
+            .where(c.start_time < end, c.end_time > start))
+    if resource_id is not None:
+        stmt = stmt.where(c.resource_id == resource_id)
+    data = np.array(db.execute(stmt).all(), dtype=np.int64).reshape(-1, 4)
+    return {"resource": data[:, 0], "start": data[:, 1], "end": data[:, 2], "status": data[:, 3]}
+
+
+def load_resource_ids(db: Session, resource_id: Optional[int] = None) -> np.ndarray:
+    """Ids da tabela resources (só `resource_id`, se dado, e se existir)."""
+    stmt = select(models.Resource.id).order_by(models.Resource.id)
+    if resource_id is not None:
+        stmt = stmt.where(models.Resource.id == resource_id)
+    return np.array(db.scalars(stmt).all(), dtype=np.int64)
+
+
+def _occupied_per_hour(r_idx: np.ndarray, starts: np.ndarray, ends: np.ndarray, n_res: int, n_hours: int) -> np.ndarray:
+    """
+    Minutos ocupados por (recurso, hora da janela).
+    Cada recurso é deslocado para um trecho próprio do eixo do tempo; a ocupação acumulada
+    F(t) = sum(t - s | s <= t) - sum(t - e | e <= t) é avaliada em todas as fronteiras de hora
+    de uma vez, e a diferença entre fronteiras consecutivas dá a ocupação de cada hora.
+    """
+    span = n_hours * 60
+    offset = r_idx * span
+    s = np.sort(starts + offset)
+    e = np.sort(ends + offset)
+    cs = np.concatenate(([0], np.cumsum(s)))
+    ce = np.concatenate(([0], np.cumsum(e)))
+    bounds = (np.arange(n_res)[:, None] * span + np.arange(n_hours + 1)[None, :] * 60).ravel()
+    ns = np.searchsorted(s, bounds, side="right")
+    ne = np.searchsorted(e, bounds, side="right")
+    acc = (ns * bounds - cs[ns]) - (ne * bounds - ce[ne])
+    return np.diff(acc.reshape(n_res, n_hours + 1), axis=1)
+
+
+def hour_window(start: datetime, end: datetime) -> Tuple[datetime, int]:
+    """Início da janela alinhado à hora cheia e quantidade de horas até cobrir `end`."""
+    # mesma conta de compute_utilization (minutos inteiros), para as horas baterem
+    first = to_epoch_minutes(start)
+    first -= first % 60
+    return start.replace(minute=0, second=0, microsecond=0), max(1, -(-(to_epoch_minutes(end) - first) // 60))
+
+
+def hourly_capacity(calendar: CompiledCalendar, start: datetime, n_hours: int) -> np.ndarray:
+    """Minutos de expediente do calendário em cada hora da janela (`start` alinhado à hora cheia)."""
+    edges = np.arange(25) * 60
+    days = -(-(start.hour + n_hours) // 24)
+    by_day: Dict[Any, np.ndarray] = {}  # a grade semanal repete os mesmos DayHours
+    out = np.empty(days * 24, dtype=np.int64)
+    for k in range(days):
+        hours = calendar.hours_on(start.date() + timedelta(days=k))
+        row = by_day.get(hours)
+        if row is None:
+            row = np.zeros(24, dtype=np.int64)
+            for s, e in hours:
+                row += np.clip(np.minimum(edges[1:], e) - np.maximum(edges[:-1], s), 0, 60)
+            by_day[hours] = row
+        out[k * 24:(k + 1) * 24] = row
+    return out[start.hour:start.hour + n_hours]
+
+
+def resource_axis(resource: np.ndarray, resource_ids: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Recursos do relatório, ordenados: os conhecidos (`resource_ids`, com ou sem agendamento na
+    janela) mais os que aparecem nos agendamentos.
+    """
+    return np.unique(resource) if resource_ids is None else np.union1d(np.asarray(resource_ids, dtype=np.int64), resource)
+
+
+def compute_utilization(resource: np.ndarray, start: np.ndarray, end: np.ndarray, status: np.ndarray,
+                        window_start: int, window_end: int, capacity: np.ndarray,
+                        resource_ids: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """
+    Função pura (roda no pool de processos). Tempos em minutos desde a época. `capacity` tem os
+    minutos de expediente por (recurso, hora da janela), com as linhas na ordem de
+    resource_axis(resource, resource_ids) (ver hourly_capacity): recurso ocioso também entra na
+    capacidade. Retorna ocupação por recurso, mapa de calor dia x hora, horas de pico e taxas.
+    """
+    window_start -= window_start % 60  # alinha à hora cheia
+    n_hours = max(1, -(-(window_end - window_start) // 60))
+    res_ids = resource_axis(resource, resource_ids)
+    r_idx = np.searchsorted(res_ids, resource)
+    n_res = len(res_ids)
+    capacity = np.asarray(capacity, dtype=np.int64)
+    if capacity.shape != (n_res, n_hours):
+        raise ValueError(f"capacity {capacity.shape} não cobre {n_res} recursos x {n_hours} horas da janela")
+
+    # dia da semana / hora de cada hora da janela
+    hour_starts = window_start + 60 * np.arange(n_hours)
+    weekday = (hour_starts // 1440 + EPOCH_WEEKDAY) % 7
+    hour = (hour_starts // 60) % 24
+    slot = weekday * 24 + hour
+    flat = (np.arange(n_res)[:, None] * HOURS_PER_WEEK + slot[None, :]).ravel()
+    cap_slot = np.bincount(flat, weights=capacity.ravel(), minlength=n_res * HOURS_PER_WEEK).reshape(n_res, 7, 24)
+
+    # ocupação: só o que não foi cancelado, recortado à janela e ao expediente (capacidade 0 fora dele)
+    live = status != CANCELLED
+    s = np.clip(start[live], window_start, window_start + n_hours * 60) - window_start
+    e = np.clip(end[live], window_start, window_start + n_hours * 60) - window_start
+    occupied = (_occupied_per_hour(r_idx[live], s, e, n_res, n_hours) if n_res
+                else np.zeros((0, n_hours), dtype=np.int64))
+    occupied = np.minimum(occupied, capacity)
+    occ_slot = np.bincount(flat, weights=occupied.ravel(), minlength=n_res * HOURS_PER_WEEK).reshape(n_res, 7, 24)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        per_resource_heat = np.where(cap_slot > 0, occ_slot / cap_slot, 0.0)
+        cap = cap_slot.sum(axis=0)
+        overall_heat = np.where(cap > 0, occ_slot.sum(axis=0) / cap, 0.0)
+
+    capacity_total = capacity.sum(axis=1)
+    booked = occ_slot.sum(axis=(1, 2))
+    counts = np.bincount(r_idx, minlength=n_res)
+    cancelled = np.bincount(r_idx, weights=(status == CANCELLED), minlength=n_res)
+    no_show = np.bincount(r_idx, weights=(status == NO_SHOW), minlength=n_res)
+    by_hour = occ_slot.sum(axis=(0, 1))
+    peak = [int(h) for h in np.argsort(-by_hour, kind="stable")[:3] if by_hour[h] > 0]
+    total = int(counts.sum())
+
+    return {
+        "resources": [
+            {
+                "resource_id": int(rid),
+                "appointments": int(counts[i]),
+                "booked_minutes": int(booked[i]),
+                "capacity_minutes": int(capacity_total[i]),
+                "utilization": round(float(booked[i]) / capacity_total[i], 4) if capacity_total[i] else 0.0,
+                "cancellation_rate": round(float(cancelled[i]) / counts[i], 4) if counts[i] else 0.0,
+                "no_show_rate": round(float(no_show[i]) / counts[i], 4) if counts[i] else 0.0,
+                "heatmap": np.round(per_resource_heat[i], 4).tolist(),
+            }
+            for i, rid in enumerate(res_ids)
+        ],
+        "heatmap": np.round(overall_heat, 4).tolist(),
+        "peak_hours": peak,
+        "appointments": total,
+        "cancellation_rate": round(float(cancelled.sum()) / total, 4) if total else 0.0,
+        "no_show_rate": round(float(no_show.sum()) / total, 4) if total else 0.0,
+        "capacity_minutes": int(capacity_total.sum()),
+    }
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    workers = int(config_section("analytics").get("process_workers", 2))
+    if workers <= 0:
+        return None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def utilization_report(columns: Dict[str, np.ndarray], start: datetime, end: datetime,
+                             calendars: Optional[Mapping[int, CompiledCalendar]] = None,
+                             resource_ids: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """
+    Roda compute_utilization no pool de processos (ou inline com process_workers: 0). `calendars`
+    tem o calendário compilado de cada recurso; recurso sem calendário usa o working_hours global.
+    `resource_ids` (ver load_resource_ids) põe no relatório os recursos sem agendamento na janela.
+    """
+    calendars = calendars or {}
+    aligned, n_hours = hour_window(start, end)
+    axis = resource_axis(columns["resource"], resource_ids)
+    capacity = np.array([hourly_capacity(calendars.get(int(rid), shared_calendars.default), aligned, n_hours)
+                         for rid in axis], dtype=np.int64).reshape(-1, n_hours)
+    args = (columns["resource"], columns["start"], columns["end"], columns["status"],
+            to_epoch_minutes(start), to_epoch_minutes(end), capacity, axis)
+    pool = _get_pool()
+    if pool is None:
+        result = compute_utilization(*args)
+    else:
+        result = await asyncio.get_running_loop().run_in_executor(pool, compute_utilization, *args)
+    result.update({"start": start, "end": end})
+    return result
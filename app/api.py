@@ -1,14 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
-from .db import get_db
-from . import schemas, models
-from .repositories import SqlAlchemyUserRepository, SqlAlchemyAppointmentRepository
+from .db import get_db, new_session
+from . import ics, schemas, models, search
+from .repositories import (SqlAlchemyUserRepository, SqlAlchemyAppointmentRepository, SqlAlchemySeriesRepository,
+                           SqlAlchemyResourceRepository, SqlAlchemyLocationRepository, SqlAlchemyEventRepository,
+                           SqlAlchemyCalendarRepository, UserRepository, AppointmentRepository)
 from .services import AppointmentService, UserService
+from .scheduler import FlexibleRequest
 from .exceptions import AppException, NotFoundException, BusinessRuleException
-from .config import CONFIG
+from .config import config_section
 from typing import List, Optional
 from datetime import datetime, date, timedelta
 from .utils import export_appointments_to_csv
+from .recurrence import as_appointments, merge_occurrences, occurrences
+from .events import change_bus, sse_stream
+from .reports import cached_summary
+from .archive import archive_expired, retention_horizon
+from .metrics import metrics
+from .singleflight import async_reads, json_response, reads, request_key, serialize
+from .idempotency import idempotent_response
+from .calendars import calendars
+from .waitlist import waitlist
+from .ics import feeds
+from itertools import islice
+import heapq
 import logging
 
 router = APIRouter()
@@ -17,63 +34,503 @@ logger = logging.getLogger(__name__)
 # DI: Repositories instanciadas (poderiam vir de um contêiner)
 user_repo = SqlAlchemyUserRepository()
 app_repo = SqlAlchemyAppointmentRepository()
+series_repo = SqlAlchemySeriesRepository()
+resource_repo = SqlAlchemyResourceRepository()
+location_repo = SqlAlchemyLocationRepository()
+event_repo = SqlAlchemyEventRepository()
+calendar_repo = SqlAlchemyCalendarRepository()
 
 # Services
-appointment_service = AppointmentService(app_repo, user_repo)
+appointment_service = AppointmentService(app_repo, user_repo, series_repo, calendars=calendars,
+                                         waitlist=waitlist)
 user_service = UserService(user_repo, app_repo)
 
+def use_repositories(users: UserRepository, appointments: AppointmentRepository) -> None:
+    """Troca o backend de usuários/agendamentos das rotas e dos services (startup, ver storage.backend)."""
+    global user_repo, app_repo
+    user_repo, app_repo = users, appointments
+    appointment_service.user_repo = user_service.user_repo = users
+    appointment_service.app_repo = user_service.app_repo = appointments
+
+def sql_appointments() -> None:
+    """Rotas que consultam a tabela appointments direto: com outro backend responderiam sem os agendamentos."""
+    if not isinstance(app_repo, SqlAlchemyAppointmentRepository):
+        raise HTTPException(status_code=501, detail="Indisponível com storage.backend: memory "
+                                                     "(consulta a tabela appointments do SQLite)")
+
+SQL_ONLY = [Depends(sql_appointments)]
+
 @router.post("/users", response_model=schemas.UserRead)
-def create_user(u: schemas.UserCreate, db: Session = Depends(get_db)):
-    """Create user (CRUD 1)."""
-    user = models.User(name=u.name, email=u.email)
-    try:
-        created = user_repo.create(db, user)
-        logger.info("User created %s", created.id)
-        return created
-    except Exception as e:
-        logger.exception("Failed to create user")
-        raise HTTPException(status_code=400, detail=str(e))
+def create_user(u: schemas.UserCreate, db: Session = Depends(get_db),
+                idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    """Create user (CRUD 1). Com Idempotency-Key, retentativas recebem a resposta da primeira."""
+    def run():
+        user = models.User(name=u.name, email=u.email)
+        try:
+            created = user_repo.create(db, user)
+            logger.info("User created %s", created.id)
+            return created
+        except Exception as e:
+            logger.exception("Failed to create user")
+            raise HTTPException(status_code=400, detail=str(e))
+    if idempotency_key is None:
+        return run()
+    return idempotent_response(db, "users", idempotency_key, u, run, schemas.UserRead)
+
+@router.post("/users/bulk", response_model=schemas.UserBulkResponse)
+def create_users_bulk(payload: schemas.UserBulkCreate, db: Session = Depends(get_db)):
+    """Cadastro em massa: um resultado por linha, duplicados não interrompem o lote."""
+    results = user_service.bulk_create_users(db, [u.model_dump() for u in payload.users])
+    created = sum(1 for r in results if r["status"] == "created")
+    logger.info("Bulk de usuários: %s criados de %s", created, len(results))
+    return {"created": created, "skipped": len(results) - created, "results": results}
 
 @router.get("/users/{user_id}", response_model=schemas.UserRead)
-def read_user(user_id: int, db: Session = Depends(get_db)):
-    u = user_repo.get(db, user_id)
-    if not u:
-        raise HTTPException(status_code=404, detail="User not found")
-    return u
+def read_user(user_id: int, request: Request, db: Session = Depends(get_db)):
+    def load():
+        u = user_repo.get(db, user_id)
+        if not u:
+            raise HTTPException(status_code=404, detail="User not found")
+        return serialize(u, schemas.UserRead)
+    return json_response(reads.do(request_key(request), load)[0])
 
 @router.delete("/users/{user_id}", status_code=204)
 def delete_user(user_id: int, db: Session = Depends(get_db)):
-    user_repo.delete(db, user_id)
+    # agendamentos removidos junto liberam horários: a fila de espera é promovida
+    appointment_service.release_freed(db, user_repo.delete(db, user_id))
     return {}
 
+# --- Feeds iCalendar ---
+# Clientes de calendário consultam a cada poucos minutos: a janela é lida sempre (o ETag sai dos
+# dados), e um If-None-Match que ainda casa volta 304 sem escrever o corpo; o corpo escrito fica
+# em cache guardado com o ETag de que saiu. O cache economiza só a escrita do corpo, não as
+# consultas: o ETag cobre agendamentos, séries e nomes, e nenhum agregado barato cobre tudo isso.
+def _ics_feed(request: Request, key, load):
+    """`load(start, end)` devolve (nome, eventos, título por evento); o ETag sai desses dados."""
+    start, end = ics.window()
+    name, events, summary = load(start, end)
+    etag = ics.etag_for(key, start, name, events, summary)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if ics.if_none_match(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    body = feeds.get(key, etag)
+    if body is not None:
+        return Response(body, media_type=ics.MEDIA_TYPE, headers=headers)
+    return StreamingResponse(ics.stream(key, etag, ics.write_calendar(name, events, summary)),
+                             media_type=ics.MEDIA_TYPE, headers=headers)
+
+def _with_series(db: Session, rows, start, end, **owner):
+    """Agendamentos (já por início) intercalados com as ocorrências das séries do dono na janela."""
+    found = series_repo.list_overlapping(db, start=start, end=end, **owner)
+    return list(heapq.merge(rows, as_appointments(found, start, end), key=lambda a: a.start_time))
+
+@router.get("/users/{user_id}/calendar.ics")
+def user_calendar(user_id: int, request: Request, db: Session = Depends(get_db)):
+    def load(start, end):
+        user = _found(user_repo.get(db, user_id), "User")
+        rows = app_repo.list_by_filter(db, user_id=user_id, start=start, end=end)
+        events = _with_series(db, rows, start, end, user_id=user_id)
+        names = {r.id: r.name for r in resource_repo.get_many(db, {a.resource_id for a in events})}
+        return f"Agenda de {user.name}", events, lambda a: names.get(a.resource_id, f"Recurso {a.resource_id}")
+    return _ics_feed(request, ("user", user_id), load)
+
+@router.get("/resources/{resource_id}/calendar.ics")
+def resource_calendar(resource_id: int, request: Request, db: Session = Depends(get_db)):
+    def load(start, end):
+        resource = _found(resource_repo.get(db, resource_id), "Resource")
+        rows = app_repo.list_by_resource(db, resource_id, start, end)
+        events = _with_series(db, rows, start, end, resource_id=resource_id)
+        # nomes resolvidos aqui (um SELECT ... IN): o corpo é escrito depois que a sessão fecha
+        names = {u.id: u.name for u in user_repo.get_many(db, {a.user_id for a in events})}
+        return resource.name, events, lambda a: f"{resource.name}: {names.get(a.user_id, f'Usuário {a.user_id}')}"
+    return _ics_feed(request, ("resource", resource_id), load)
+
+# --- Resources / Locations / Events ---
+# Cada rota declara o que carrega: listas simples não tocam nos relacionamentos, e as que
+# devolvem filhos usam selectinload/joinedload (número de consultas fixo, sem N+1).
+def _found(obj, what: str):
+    if obj is None:
+        raise HTTPException(status_code=404, detail=f"{what} not found")
+    return obj
+
+@router.post("/resources", response_model=schemas.ResourceRead)
+def create_resource(payload: schemas.ResourceCreate, db: Session = Depends(get_db)):
+    return resource_repo.create(db, payload.model_dump())
+
+@router.get("/resources", response_model=List[schemas.ResourceRead])
+def list_resources(skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000), db: Session = Depends(get_db)):
+    return resource_repo.list(db, skip, limit)
+
+@router.get("/resources/upcoming", response_model=List[schemas.ResourceWithAppointments], dependencies=SQL_ONLY)
+def list_resources_upcoming(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                            skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000),
+                            db: Session = Depends(get_db)):
+    """Recursos com os agendamentos que ainda não terminaram (ou da janela since/until)."""
+    return resource_repo.list_with_upcoming(db, since or datetime.now(), until, skip, limit)
+
+@router.get("/resources/batch", response_model=List[schemas.ResourceRead])
+def get_resources_batch(ids: List[int] = Query(...), db: Session = Depends(get_db)):
+    return resource_repo.get_many(db, ids)
+
+@router.get("/resources/{resource_id}", response_model=schemas.ResourceWithAppointments, dependencies=SQL_ONLY)
+def read_resource(resource_id: int, since: Optional[datetime] = None, db: Session = Depends(get_db)):
+    options = [resource_repo.upcoming(since or datetime.now())]
+    return _found(resource_repo.get(db, resource_id, options), "Resource")
+
+@router.put("/resources/{resource_id}", response_model=schemas.ResourceRead)
+def update_resource(resource_id: int, payload: schemas.ResourceCreate, db: Session = Depends(get_db)):
+    return _found(resource_repo.update(db, resource_id, payload.model_dump()), "Resource")
+
+@router.delete("/resources/{resource_id}", status_code=204)
+def delete_resource(resource_id: int, db: Session = Depends(get_db)):
+    _found(resource_repo.delete(db, resource_id) or None, "Resource")
+
+# --- Calendários (grade semanal por recurso + exceções por data) ---
+@router.get("/resources/{resource_id}/schedule", response_model=List[schemas.ScheduleSlotRead])
+def read_schedule(resource_id: int, db: Session = Depends(get_db)):
+    """Grade semanal do recurso; lista vazia = usa o working_hours global."""
+    _found(resource_repo.get(db, resource_id), "Resource")
+    return calendar_repo.schedule(db, resource_id)
+
+@router.put("/resources/{resource_id}/schedule", response_model=List[schemas.ScheduleSlotRead])
+def replace_schedule(resource_id: int, payload: List[schemas.ScheduleSlot], db: Session = Depends(get_db)):
+    """Substitui a grade semanal inteira; o calendário compilado em cache é invalidado."""
+    _found(resource_repo.get(db, resource_id), "Resource")
+    return calendar_repo.replace_schedule(db, resource_id, [slot.model_dump() for slot in payload])
+
+@router.get("/resources/{resource_id}/free_slots", response_model=List[schemas.FreeSlot])
+def read_free_slots(resource_id: int, day: date, duration_minutes: int = Query(1, ge=1), db: Session = Depends(get_db)):
+    """Janelas livres do recurso no dia (expediente menos o que já está ocupado) que comportam a duração."""
+    _found(resource_repo.get(db, resource_id), "Resource")
+    slots = appointment_service.free_slots(db, resource_id, day, duration_minutes)
+    return [{"start_time": s, "end_time": e} for s, e in slots]
+
+@router.get("/calendar/exceptions", response_model=List[schemas.CalendarExceptionRead])
+def list_calendar_exceptions(resource_id: Optional[int] = None, start: Optional[date] = None,
+                             end: Optional[date] = None, db: Session = Depends(get_db)):
+    return calendar_repo.exceptions(db, resource_id, start, end)
+
+@router.post("/calendar/exceptions", response_model=schemas.CalendarExceptionRead)
+def create_calendar_exception(payload: schemas.CalendarExceptionCreate, db: Session = Depends(get_db)):
+    if payload.resource_id is not None:
+        _found(resource_repo.get(db, payload.resource_id), "Resource")
+    return calendar_repo.add_exception(db, payload.model_dump())
+
+@router.delete("/calendar/exceptions/{exception_id}", status_code=204)
+def delete_calendar_exception(exception_id: int, db: Session = Depends(get_db)):
+    _found(calendar_repo.delete_exception(db, exception_id) or None, "Calendar exception")
+
+@router.post("/locations", response_model=schemas.LocationRead)
+def create_location(payload: schemas.LocationCreate, db: Session = Depends(get_db)):
+    return location_repo.create(db, payload.model_dump())
+
+@router.get("/locations", response_model=List[schemas.LocationWithEvents])
+def list_locations(skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000), db: Session = Depends(get_db)):
+    return location_repo.list(db, skip, limit, options=[location_repo.WITH_EVENTS])
+
+@router.get("/locations/batch", response_model=List[schemas.LocationRead])
+def get_locations_batch(ids: List[int] = Query(...), db: Session = Depends(get_db)):
+    return location_repo.get_many(db, ids)
+
+@router.get("/locations/{location_id}", response_model=schemas.LocationWithEvents)
+def read_location(location_id: int, db: Session = Depends(get_db)):
+    return _found(location_repo.get(db, location_id, [location_repo.WITH_EVENTS]), "Location")
+
+@router.put("/locations/{location_id}", response_model=schemas.LocationRead)
+def update_location(location_id: int, payload: schemas.LocationCreate, db: Session = Depends(get_db)):
+    return _found(location_repo.update(db, location_id, payload.model_dump()), "Location")
+
+@router.delete("/locations/{location_id}", status_code=204)
+def delete_location(location_id: int, db: Session = Depends(get_db)):
+    _found(location_repo.delete(db, location_id) or None, "Location")
+
+@router.post("/events", response_model=schemas.EventRead)
+def create_event(payload: schemas.EventCreate, db: Session = Depends(get_db)):
+    _found(location_repo.get(db, payload.location_id), "Location")
+    return event_repo.create(db, payload.model_dump())
+
+@router.get("/events", response_model=List[schemas.EventWithLocation])
+def list_events(location_id: Optional[int] = None, skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000),
+                db: Session = Depends(get_db)):
+    options = [event_repo.WITH_LOCATION]
+    if location_id is not None:
+        return event_repo.list_by_location(db, location_id, options)
+    return event_repo.list(db, skip, limit, options)
+
+@router.get("/events/batch", response_model=List[schemas.EventWithLocation])
+def get_events_batch(ids: List[int] = Query(...), db: Session = Depends(get_db)):
+    return event_repo.get_many(db, ids, [event_repo.WITH_LOCATION])
+
+@router.get("/events/{event_id}", response_model=schemas.EventWithLocation)
+def read_event(event_id: int, db: Session = Depends(get_db)):
+    return _found(event_repo.get(db, event_id, [event_repo.WITH_LOCATION]), "Event")
+
+@router.put("/events/{event_id}", response_model=schemas.EventRead)
+def update_event(event_id: int, payload: schemas.EventCreate, db: Session = Depends(get_db)):
+    return _found(event_repo.update(db, event_id, payload.model_dump()), "Event")
+
+@router.delete("/events/{event_id}", status_code=204)
+def delete_event(event_id: int, db: Session = Depends(get_db)):
+    _found(event_repo.delete(db, event_id) or None, "Event")
+
 # --- Appointments CRUD ---
 @router.post("/appointments", response_model=schemas.AppointmentRead)
-def create_appointment(payload: schemas.AppointmentCreate, db: Session = Depends(get_db)):
+def create_appointment(payload: schemas.AppointmentCreate, db: Session = Depends(get_db),
+                       idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    def run():
+        try:
+            appt = appointment_service.create_appointment(db, payload.user_id, payload.resource_id, payload.start_time, payload.duration_minutes, payload.notes)
+            return appt
+        except BusinessRuleException as e:
+            logger.warning("Business rule failed: %s", e)
+            raise HTTPException(status_code=422, detail=str(e))
+        except NotFoundException as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            logger.exception("Unexpected error creating appointment")
+            raise HTTPException(status_code=500, detail="Erro interno")
+    if idempotency_key is None:
+        return run()
+    return idempotent_response(db, "appointments", idempotency_key, payload, run, schemas.AppointmentRead)
+
+@router.post("/appointments/assign", response_model=schemas.BatchAssignResponse)
+def assign_appointments(payload: schemas.BatchAssignRequest, db: Session = Depends(get_db)):
+    """
+    Lote de pedidos flexíveis (tipo de recurso + janela + duração): o servidor escolhe recurso e
+    horário de cada um, com as regras do agendamento avulso. dry_run só devolve a proposta.
+    """
+    requests = [FlexibleRequest(i, r.user_id, r.resource_type, r.earliest, r.latest,
+                                timedelta(minutes=r.duration_minutes), r.notes)
+                for i, r in enumerate(payload.requests)]
+    resources = resource_repo.ids_by_type(db, {r.resource_type for r in requests})
+    results = appointment_service.assign_batch(db, requests, resources, payload.dry_run)
+    assigned = sum(1 for r in results if r["status"] == "assigned")
+    logger.info("Lote de alocação: %s de %s pedidos alocados", assigned, len(results))
+    return {"assigned": assigned, "unassigned": len(results) - assigned, "results": results}
+
+@router.delete("/appointments/{appointment_id}", status_code=204)
+def delete_appointment(appointment_id: int, db: Session = Depends(get_db)):
+    """Exclui o agendamento; pedidos da fila de espera que cabem no horário são promovidos na mesma transação."""
     try:
-        appt = appointment_service.create_appointment(db, payload.user_id, payload.resource_id, payload.start_time, payload.duration_minutes, payload.notes)
-        return appt
+        appointment_service.delete_appointment(db, appointment_id)
+    except NotFoundException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.post("/appointments/{appointment_id}/cancel", response_model=schemas.AppointmentRead)
+def cancel_appointment(appointment_id: int, db: Session = Depends(get_db)):
+    """Cancela o agendamento; o horário volta a ficar livre e a fila de espera é promovida na mesma transação."""
+    try:
+        return appointment_service.cancel_appointment(db, appointment_id)
+    except BusinessRuleException as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except NotFoundException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.post("/appointments/{appointment_id}/no_show", response_model=schemas.AppointmentRead)
+def mark_no_show(appointment_id: int, db: Session = Depends(get_db)):
+    """Registra o não comparecimento (agendamento já começado e não cancelado); entra na taxa de no-show dos relatórios."""
+    try:
+        return appointment_service.mark_no_show(db, appointment_id)
+    except BusinessRuleException as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except NotFoundException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+# --- Fila de espera ---
+@router.post("/waitlist", response_model=schemas.WaitlistEntryRead)
+def join_waitlist(payload: schemas.AppointmentCreate, db: Session = Depends(get_db)):
+    """
+    Entra na fila do recurso para o horário pedido, em vez de retentar a reserva.
+    Se o horário já estiver livre volta com status "promoted" e o appointment_id criado.
+    """
+    try:
+        return appointment_service.join_waitlist(db, payload.user_id, payload.resource_id, payload.start_time,
+                                                 payload.duration_minutes, payload.notes)
     except BusinessRuleException as e:
         logger.warning("Business rule failed: %s", e)
         raise HTTPException(status_code=422, detail=str(e))
     except NotFoundException as e:
         raise HTTPException(status_code=404, detail=str(e))
-    except Exception as e:
-        logger.exception("Unexpected error creating appointment")
-        raise HTTPException(status_code=500, detail="Erro interno")
 
-@router.get("/appointments", response_model=List[schemas.AppointmentRead])
-def list_appointments(user_id: Optional[int] = None, start: Optional[datetime] = None, end: Optional[datetime] = None, order_by: str = "start_time", db: Session = Depends(get_db)):
-    """Consulta com filtros e ordenação (requisito)."""
-    return app_repo.list_by_filter(db, user_id=user_id, start=start, end=end, order_by=order_by)
+@router.get("/waitlist", response_model=List[schemas.WaitlistEntryRead])
+def list_waitlist(resource_id: Optional[int] = None, user_id: Optional[int] = None, status: Optional[str] = None,
+                  limit: int = Query(100, ge=1, le=1000), db: Session = Depends(get_db)):
+    return appointment_service.waitlist.repo.list(db, resource_id, user_id, status, limit)
+
+@router.get("/waitlist/{entry_id}", response_model=schemas.WaitlistEntryRead)
+def read_waitlist_entry(entry_id: int, db: Session = Depends(get_db)):
+    return _found(appointment_service.waitlist.repo.get(db, entry_id), "Waitlist entry")
+
+@router.delete("/waitlist/{entry_id}", status_code=204)
+def leave_waitlist(entry_id: int, db: Session = Depends(get_db)):
+    try:
+        appointment_service.leave_waitlist(db, entry_id)
+    except NotFoundException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/appointments", response_model=List[schemas.AppointmentListItem])
+def list_appointments(request: Request, user_id: Optional[int] = None, start: Optional[datetime] = None, end: Optional[datetime] = None, order_by: str = "start_time", include_archived: bool = False, include_cancelled: bool = False, include_series: bool = False, db: Session = Depends(get_db)):
+    """
+    Consulta com filtros e ordenação (requisito). include_archived junta a tabela de arquivo;
+    cancelados só aparecem com include_cancelled; include_series intercala as ocorrências das
+    séries recorrentes (sem id, com series_id).
+    Requisições iguais em voo ao mesmo tempo dividem uma única consulta (single-flight).
+    """
+    def load():
+        rows = app_repo.list_by_filter(db, user_id=user_id, start=start, end=end, order_by=order_by,
+                                       include_archived=include_archived, include_cancelled=include_cancelled)
+        if include_series:
+            found = series_repo.list_overlapping(db, start=start, end=end, user_id=user_id)
+            extra = as_appointments(found, start, end)
+            if order_by == "start_time":
+                rows = list(heapq.merge(rows, extra, key=lambda a: a.start_time))
+            else:
+                rows = list(rows) + list(extra)
+        return serialize(rows, List[schemas.AppointmentListItem])
+    return json_response(reads.do(request_key(request), load)[0])
+
+@router.get("/appointments/stream")
+async def stream_appointments(request: Request, user_id: Optional[int] = None, resource_id: Optional[int] = None,
+                              last_event_id: Optional[int] = None,
+                              last_event_id_header: Optional[int] = Header(None, alias="Last-Event-ID")):
+    """
+    Feed SSE de mudanças (appointment.* e user.*), com filtro opcional por usuário/recurso.
+    Reconexões retomam a partir do Last-Event-ID (header ou query) enquanto ele estiver no histórico;
+    fora dele o cliente recebe um evento "reset" e deve recarregar a lista.
+    """
+    resume_from = last_event_id_header if last_event_id_header is not None else last_event_id
+    sub, backlog = change_bus.subscribe(user_id=user_id, resource_id=resource_id, last_event_id=resume_from)
+    heartbeat = float(config_section("events").get("heartbeat_seconds", 15))
+
+    async def body():
+        try:
+            async for chunk in sse_stream(sub, backlog, heartbeat=heartbeat):
+                if await request.is_disconnected():
+                    break
+                yield chunk
+        finally:
+            change_bus.unsubscribe(sub)
+
+    return StreamingResponse(body(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @router.get("/appointments/export")
 def export_appointments(db: Session = Depends(get_db)):
     """Exporta appointments para CSV (manipulação de arquivo)."""
-    apps = db.query(models.Appointment).all()
+    apps = app_repo.list_by_filter(db, order_by="id", include_cancelled=True)
     path = export_appointments_to_csv(apps)
     return {"path": path}
 
 @router.get("/users/{user_id}/reserved_minutes")
-def get_reserved_minutes(user_id: int, db: Session = Depends(get_db)):
-    tot = user_service.total_reserved_minutes(db, user_id)
-    return {"user_id": user_id, "reserved_minutes": tot}
+def get_reserved_minutes(user_id: int, request: Request, db: Session = Depends(get_db)):
+    def load():
+        return serialize({"user_id": user_id, "reserved_minutes": user_service.total_reserved_minutes(db, user_id)})
+    return json_response(reads.do(request_key(request), load)[0])
+
+# --- Séries recorrentes ---
+@router.post("/series", response_model=schemas.SeriesRead)
+def create_series(payload: schemas.SeriesCreate, db: Session = Depends(get_db)):
+    """Cria uma série recorrente (uma linha só; ocorrências são expandidas na leitura)."""
+    try:
+        return appointment_service.create_series(db, payload.user_id, payload.resource_id, payload.start_time,
+                                                 payload.duration_minutes, payload.freq, payload.interval,
+                                                 payload.count, payload.until, payload.notes)
+    except BusinessRuleException as e:
+        logger.warning("Business rule failed: %s", e)
+        raise HTTPException(status_code=422, detail=str(e))
+    except NotFoundException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/series/occurrences", response_model=List[schemas.OccurrenceRead])
+def list_series_occurrences(start: datetime, end: datetime, user_id: Optional[int] = None,
+                            resource_id: Optional[int] = None, limit: int = 500, db: Session = Depends(get_db)):
+    """Ocorrências de todas as séries na janela, intercaladas por horário de início."""
+    found = series_repo.list_overlapping(db, start=start, end=end, resource_id=resource_id, user_id=user_id)
+    merged = merge_occurrences(found, start, end)
+    return [schemas.OccurrenceRead(series_id=s.id, user_id=s.user_id, resource_id=s.resource_id,
+                                   start_time=o_start, end_time=o_end)
+            for o_start, o_end, s in islice(merged, max(0, min(limit, 5000)))]
+
+@router.get("/series/{series_id}", response_model=schemas.SeriesRead)
+def read_series(series_id: int, db: Session = Depends(get_db)):
+    s = series_repo.get(db, series_id)
+    if not s:
+        raise HTTPException(status_code=404, detail="Série não encontrada")
+    return s
+
+@router.get("/series/{series_id}/occurrences", response_model=List[schemas.OccurrenceRead])
+def read_series_occurrences(series_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                            limit: int = 500, db: Session = Depends(get_db)):
+    s = series_repo.get(db, series_id)
+    if not s:
+        raise HTTPException(status_code=404, detail="Série não encontrada")
+    return [schemas.OccurrenceRead(series_id=s.id, user_id=s.user_id, resource_id=s.resource_id,
+                                   start_time=o_start, end_time=o_end)
+            for o_start, o_end in islice(occurrences(s, start, end), max(0, min(limit, 5000)))]
+
+@router.delete("/series/{series_id}", status_code=204)
+def delete_series(series_id: int, db: Session = Depends(get_db)):
+    series_repo.delete(db, series_id)
+    return {}
+
+# --- Relatórios ---
+@router.get("/reports/summary", response_model=schemas.ReportSummary, dependencies=SQL_ONLY)
+def report_summary(request: Request, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   include_archived: bool = False, include_series: bool = False, db: Session = Depends(get_db)):
+    """Resumo agregado no banco (status, recurso, usuário, dia) com cache curto; include_series soma as ocorrências."""
+    load = lambda: serialize(cached_summary(db, start, end, include_archived, include_series), schemas.ReportSummary)
+    return json_response(reads.do(request_key(request), load)[0])
+
+@router.get("/reports/utilization", dependencies=SQL_ONLY)
+async def report_utilization(request: Request, start: datetime, end: datetime, resource_id: Optional[int] = None,
+                             include_archived: bool = False, db: Session = Depends(get_db)):
+    """
+    Ocupação de cada recurso contra o próprio expediente, mapa de calor dia da semana x hora,
+    horas de pico e taxas de cancelamento/no-show. A leitura vai para o threadpool e o cálculo para o pool de processos.
+    """
+    if end <= start:
+        raise HTTPException(status_code=422, detail="end deve ser depois de start")
+    if end - start > timedelta(days=366):
+        raise HTTPException(status_code=422, detail="Janela máxima de 366 dias")
+    from . import analytics  # numpy só é carregado quando o relatório é pedido
+
+    # a task compartilhada sobrevive à requisição do líder (cuja session fecha se ele desconectar):
+    # a leitura usa uma session própria, no mesmo banco
+    bind = db.get_bind()
+
+    def load():
+        with new_session(bind) as own:
+            columns = analytics.load_intervals(own, start, end, resource_id, include_archived)
+            # todos os recursos (ociosos também somam capacidade), cada um pelo próprio expediente
+            ids = analytics.resource_axis(columns["resource"], analytics.load_resource_ids(own, resource_id))
+            found = {int(rid): appointment_service.calendar_for(own, int(rid)) for rid in ids}
+            return columns, found, ids
+
+    async def compute():
+        columns, found, ids = await run_in_threadpool(load)
+        return serialize(await analytics.utilization_report(columns, start, end, found, ids))
+
+    return json_response((await async_reads.do(request_key(request), compute))[0])
+
+# --- Busca ---
+@router.get("/search", response_model=schemas.SearchResponse, dependencies=SQL_ONLY)
+def search_text(request: Request, q: str = Query(..., min_length=1, max_length=200),
+                kind: Optional[List[str]] = Query(None), limit: int = Query(20, ge=1, le=100),
+                offset: int = Query(0, ge=0), db: Session = Depends(get_db)):
+    """Busca por nome/trecho de email de usuários e palavras nas observações dos agendamentos."""
+    load = lambda: serialize(search.search(db, q, kinds=kind, limit=limit, offset=offset), schemas.SearchResponse)
+    return json_response(reads.do(request_key(request), load)[0])
+
+# --- Administração ---
+@router.post("/admin/archive", dependencies=SQL_ONLY)
+def run_archive(retention_days: Optional[int] = None, batch_size: Optional[int] = None, db: Session = Depends(get_db)):
+    """Move para o arquivo os agendamentos encerrados antes do horizonte de retenção."""
+    before = retention_horizon(retention_days=retention_days)
+    moved = archive_expired(db, before, batch_size=batch_size)
+    logger.info("Arquivamento: %s agendamentos movidos (end_time < %s)", moved, before)
+    return {"archived": moved, "before": before}
+
+@router.get("/metrics")
+def read_metrics():
+    """Contadores do processo (jobs em background etc.)."""
+    return metrics.snapshot()
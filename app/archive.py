@@ -0,0 +1,57 @@
+"""
+Particionamento quente/frio: agendamentos encerrados antes do horizonte de retenção saem de
+`appointments` para `appointments_archive`. Reservas e checagens de conflito só leem a tabela
+quente; listagens e relatórios podem incluir o arquivo com `include_archived`.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, insert, literal, select, union_all
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import config_section
+
+A = models.Appointment
+ARCHIVE = models.ArchivedAppointment
+COLUMNS = ("id", "user_id", "resource_id", "start_time", "end_time", "status", "notes")
+
+
+def retention_horizon(now: Optional[datetime] = None, retention_days: Optional[int] = None) -> datetime:
+    if retention_days is None:
+        retention_days = int(config_section("archive").get("retention_days", 90))
+    return (now or datetime.now()) - timedelta(days=retention_days)
+
+
+def archive_expired(db: Session, before: datetime, batch_size: Optional[int] = None,
+                    max_batches: Optional[int] = None) -> int:
+    """
+    Move, em lotes, os agendamentos com end_time < before.
+    Cada lote é uma transação (INSERT ... SELECT no arquivo + DELETE na tabela quente); se o
+    processo cair no meio, basta rodar de novo que ele continua de onde parou.
+    Retorna quantas linhas foram movidas.
+    """
+    if batch_size is None:
+        batch_size = int(config_section("archive").get("batch_size", 1000))
+    moved, batches = 0, 0
+    while max_batches is None or batches < max_batches:
+        ids = db.scalars(select(A.id).where(A.end_time < before).order_by(A.id).limit(batch_size)).all()
+        if not ids:
+            break
+        now = datetime.now()
+        source = select(*(getattr(A, c) for c in COLUMNS), literal(now).label("archived_at")).where(A.id.in_(ids))
+        db.execute(insert(ARCHIVE).from_select([*COLUMNS, "archived_at"], source))
+        db.execute(delete(A).where(A.id.in_(ids)))
+        db.commit()
+        moved += len(ids)
+        batches += 1
+    return moved
+
+
+def appointment_source(include_archived: bool = False):
+    """Tabela quente, ou a união com o arquivo, com as colunas comuns (para relatórios)."""
+    if not include_archived:
+        return A.__table__
+    hot = select(*(getattr(A, c) for c in COLUMNS))
+    cold = select(*(getattr(ARCHIVE, c) for c in COLUMNS))
+    return union_all(hot, cold).subquery("all_appointments")
@@ -0,0 +1,197 @@
+"""
+Calendários de expediente por recurso.
+
+Cada recurso pode ter uma grade semanal (ResourceSchedule: dia da semana + faixas de horário)
+e exceções por data (CalendarException: fechado, ou expediente especial naquele dia; com
+resource_id nulo a exceção vale para todos os recursos, ex.: feriado). Recurso sem grade
+própria usa o working_hours global em todos os dias da semana.
+
+Grade e exceções são compiladas uma vez em conjuntos de intervalos ordenados e disjuntos por
+dia (minutos desde 00:00) e ficam num cache por recurso, invalidado pelo evento
+"calendar.changed" do change_bus (o TTL só limita a defasagem entre processos). A regra de
+expediente e o cálculo de horários livres respondem com um bisect sobre esses conjuntos, sem
+reler config nem banco a cada reserva.
+"""
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from .cache import TTLCache
+from .config import CONFIG, config_section
+from .events import ChangeEvent, change_bus
+from .repositories import SqlAlchemyCalendarRepository
+
+MINUTES_PER_DAY = 24 * 60
+
+Interval = Tuple[datetime, datetime]
+
+
+def minute_of_day(t: time) -> int:
+    return t.hour * 60 + t.minute
+
+
+class DayHours:
+    """Faixas abertas de um dia, em minutos desde 00:00; `starts` e `ends` ordenados e disjuntos."""
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, ranges: Iterable[Tuple[int, int]] = ()):
+        starts: List[int] = []
+        ends: List[int] = []
+        for s, e in sorted(r for r in ranges if r[0] < r[1]):
+            if ends and s <= ends[-1]:  # sobrepõe ou encosta na anterior: funde
+                ends[-1] = max(ends[-1], e)
+            else:
+                starts.append(s)
+                ends.append(e)
+        self.starts = tuple(starts)
+        self.ends = tuple(ends)
+
+    def contains(self, start: int, end: int) -> bool:
+        """[start, end) cabe inteiro numa faixa aberta."""
+        i = bisect_right(self.starts, start) - 1
+        return i >= 0 and end <= self.ends[i]
+
+    def __iter__(self):
+        return iter(zip(self.starts, self.ends))
+
+    def __bool__(self) -> bool:
+        return bool(self.starts)
+
+    def __str__(self) -> str:
+        if not self.starts:
+            return "fechado"
+        fmt = lambda m: f"{m // 60:02d}:{m % 60:02d}"
+        return ", ".join(f"{fmt(s)}-{fmt(e)}" for s, e in self)
+
+
+
+class CompiledCalendar:
+    """Grade semanal (7 DayHours) mais as datas com exceção; imutável depois de compilado."""
+    __slots__ = ("weekly", "exceptions")
+
+    def __init__(self, weekly: Sequence[DayHours], exceptions: Optional[Dict[date, DayHours]] = None):
+        self.weekly = tuple(weekly)
+        self.exceptions = exceptions or {}
+
+    def hours_on(self, day: date) -> DayHours:
+        found = self.exceptions.get(day)
+        return found if found is not None else self.weekly[day.weekday()]
+
+    def allows(self, start: datetime, end: datetime) -> bool:
+        """O intervalo [start, end) está dentro do expediente do dia de `start`."""
+        day = start.date()
+        end_minute = (end - datetime.combine(day, time.min)) // timedelta(minutes=1)
+        return end_minute <= MINUTES_PER_DAY and self.hours_on(day).contains(minute_of_day(start), end_minute)
+
+    def free_slots(self, day: date, busy: Iterable[Interval], duration_minutes: int = 1) -> List[Interval]:
+        """
+        Janelas livres do dia (expediente menos `busy`) com pelo menos `duration_minutes`.
+        `busy` precisa vir ordenado por início; pode ter sobreposições e sair do dia.
+        """
+        base = datetime.combine(day, time.min)
+        to_minute = lambda dt: (dt - base) // timedelta(minutes=1)
+        taken = [(to_minute(s), to_minute(e)) for s, e in busy]
+        slots: List[Tuple[int, int]] = []
+        k = 0
+        for s, e in self.hours_on(day):
+            cursor = s
+            while k < len(taken) and taken[k][0] < e:
+                bs, be = taken[k]
+                if bs - cursor >= duration_minutes:
+                    slots.append((cursor, bs))
+                cursor = max(cursor, be)
+                if be > e:  # continua ocupando a próxima faixa do dia
+                    break
+                k += 1
+            if e - cursor >= duration_minutes:
+                slots.append((cursor, e))
+        return [(base + timedelta(minutes=s), base + timedelta(minutes=e)) for s, e in slots]
+
+
+def compile_calendar(schedules: Sequence, exceptions: Sequence, default: DayHours) -> CompiledCalendar:
+    """
+    Compila linhas de ResourceSchedule/CalendarException (ou objetos com os mesmos atributos).
+    Numa data com exceções do próprio recurso as globais são ignoradas; exceção sem horários fecha o dia.
+    """
+    if schedules:
+        by_weekday = defaultdict(list)
+        for row in schedules:
+            by_weekday[row.weekday].append((minute_of_day(row.start), minute_of_day(row.end)))
+        weekly = [DayHours(by_weekday[d]) for d in range(7)]
+    else:
+        weekly = [default] * 7
+
+    own, shared = defaultdict(list), defaultdict(list)
+    for row in exceptions:
+        (shared if row.resource_id is None else own)[row.day].append(row)
+    compiled = {}
+    for day in shared.keys() | own.keys():
+        rows = own.get(day) or shared[day]
+        compiled[day] = DayHours((minute_of_day(r.start), minute_of_day(r.end))
+                                 for r in rows if r.start is not None and r.end is not None)
+    return CompiledCalendar(weekly, compiled)
+
+
+class CalendarRegistry:
+    """Calendários compilados por recurso, em cache; escutando o change_bus para invalidar."""
+
+    def __init__(self, repo: Optional[SqlAlchemyCalendarRepository] = None):
+        self.repo = repo or SqlAlchemyCalendarRepository()
+        self._cache: Optional[TTLCache] = None
+        self._default: Optional[CompiledCalendar] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self) -> TTLCache:
+        if self._cache is None:
+            cfg = config_section("calendars")
+            self._cache = TTLCache(ttl=float(cfg.get("cache_ttl_seconds", 300)), maxsize=int(cfg.get("cache_size", 1024)))
+        return self._cache
+
+    @property
+    def default(self) -> CompiledCalendar:
+        """Expediente global (working_hours) em todos os dias, sem exceções; não precisa de banco."""
+        if self._default is None:
+            wh = CONFIG["app"]["working_hours"]
+            hours = DayHours([(minute_of_day(time.fromisoformat(wh["start"])), minute_of_day(time.fromisoformat(wh["end"])))])
+            self._default = CompiledCalendar([hours] * 7)
+        return self._default
+
+    def default_hours(self) -> DayHours:
+        return self.default.weekly[0]
+
+    def get(self, db: Session, resource_id: int) -> CompiledCalendar:
+        found = self.cache.get(resource_id)
+        if found is not None:
+            return found
+        with self._lock:
+            generation = self._generation
+        compiled = compile_calendar(self.repo.schedule(db, resource_id), self.repo.exceptions(db, resource_id),
+                                    self.default_hours())
+        with self._lock:
+            # invalidado enquanto compilava: devolve o resultado mas não guarda (pode estar velho)
+            if generation == self._generation:
+                self.cache.set(resource_id, compiled)
+        return compiled
+
+    def invalidate(self, resource_id: Optional[int] = None) -> None:
+        """Descarta o calendário do recurso; None (exceção global) descarta todos."""
+        with self._lock:
+            self._generation += 1
+            if resource_id is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(resource_id)
+
+    def on_change(self, event: ChangeEvent) -> None:
+        if event.type == "calendar.changed":
+            self.invalidate(event.data.get("resource_id"))
+
+
+calendars = CalendarRegistry()
+change_bus.add_listener(calendars.on_change)
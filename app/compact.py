@@ -0,0 +1,185 @@
+"""
+Armazenamento colunar compacto de intervalos (struct-of-arrays) para cálculos em memória.
+
+Uma instância ORM de Appointment custa bem mais de 1 KB (estado da instância, dicts,
+relacionamentos); aqui cada intervalo ocupa 5 inteiros de 8 bytes em `array('q')`.
+Tempos são minutos desde a época Unix. A carga vem de um select Core, sem hidratação ORM,
+e as colunas podem ser vistas como arrays NumPy sem cópia. A alocação em lote
+(AppointmentService.assign_batch) lê assim a ocupação de todos os recursos do lote de uma vez.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.orm import Session
+
+from .archive import appointment_source
+
+EPOCH = datetime(1970, 1, 1)
+FIELDS = ("id", "resource_id", "user_id", "start", "end")
+
+
+def to_epoch_minutes(dt: datetime) -> int:
+    return int((dt - EPOCH).total_seconds() // 60)
+
+
+def from_epoch_minutes(minutes: int) -> datetime:
+    return EPOCH + timedelta(minutes=minutes)
+
+
+def epoch_minutes_sql(column):
+    # julianday da época Unix é 2440587.5; arredonda para não perder um minuto por erro de ponto flutuante
+    return cast(func.round((func.julianday(column) - 2440587.5) * 1440), Integer)
+
+
+class IntervalRecord:
+    """Visão de uma linha do store; só __slots__, sem __dict__."""
+    __slots__ = FIELDS
+
+    def __init__(self, id: int, resource_id: int, user_id: int, start: int, end: int):
+        self.id = id
+        self.resource_id = resource_id
+        self.user_id = user_id
+        self.start = start
+        self.end = end
+
+    def __repr__(self) -> str:
+        return f"IntervalRecord(id={self.id}, resource_id={self.resource_id}, start={self.start}, end={self.end})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, IntervalRecord) and all(getattr(self, f) == getattr(other, f) for f in FIELDS)
+
+
+class IntervalStore:
+    """
+    Colunas int64 paralelas. Depois de `sort()` (por recurso e início) as consultas por recurso
+    usam bisect no trecho do recurso: o candidato a sobrepor [s, e) começa em [s - maior duração, e).
+    """
+
+    def __init__(self):
+        self.id = array("q")
+        self.resource_id = array("q")
+        self.user_id = array("q")
+        self.start = array("q")
+        self.end = array("q")
+        self._max_duration = 0
+        self._ranges: Optional[Dict[int, Tuple[int, int]]] = None
+
+    # ------------------------------------------------------------------ carga
+
+    def append(self, id: int, resource_id: int, user_id: int, start: int, end: int) -> None:
+        self.id.append(id)
+        self.resource_id.append(resource_id)
+        self.user_id.append(user_id)
+        self.start.append(start)
+        self.end.append(end)
+        self._max_duration = max(self._max_duration, end - start)
+        self._ranges = None
+
+    def extend(self, rows: Iterable[Tuple[int, int, int, int, int]]) -> None:
+        for row in rows:
+            self.append(*row)
+
+    @classmethod
+    def from_db(cls, db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                resource_id: Optional[int] = None, include_archived: bool = False,
+                include_cancelled: bool = False, chunk_size: int = 10000,
+                resource_ids: Optional[Iterable[int]] = None) -> "IntervalStore":
+        """
+        Carrega via select Core (minutos já convertidos no SQLite), em blocos, já ordenado pelo
+        banco. `resource_ids` restringe a um conjunto de recursos (um IN só).
+        """
+        c = appointment_source(include_archived).c
+        stmt = select(c.id, c.resource_id, c.user_id, epoch_minutes_sql(c.start_time), epoch_minutes_sql(c.end_time))
+        if start is not None:
+            stmt = stmt.where(c.end_time > start)
+        if end is not None:
+            stmt = stmt.where(c.start_time < end)
+        if resource_id is not None:
+            stmt = stmt.where(c.resource_id == resource_id)
+        if resource_ids is not None:
+            stmt = stmt.where(c.resource_id.in_(list(resource_ids)))
+        if not include_cancelled:
+            stmt = stmt.where(c.status != "cancelled")
+        # a ordem de sort() sai do índice (recurso, início) em vez de ser refeita aqui
+        stmt = stmt.order_by(c.resource_id, c.start_time)
+        store = cls()
+        result = db.execute(stmt.execution_options(yield_per=chunk_size))
+        for rows in result.partitions():
+            store.extend(rows)
+        store._index()
+        return store
+
+    # ------------------------------------------------------------------ acesso
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    def __getitem__(self, i: int) -> IntervalRecord:
+        return IntervalRecord(self.id[i], self.resource_id[i], self.user_id[i], self.start[i], self.end[i])
+
+    def __iter__(self) -> Iterator[IntervalRecord]:
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(col.itemsize * len(col) for col in self._columns())
+
+    def _columns(self):
+        return (self.id, self.resource_id, self.user_id, self.start, self.end)
+
+    def as_numpy(self) -> Dict[str, "numpy.ndarray"]:  # noqa: F821
+        """Views int64 sem cópia (numpy é importado só aqui)."""
+        import numpy as np
+        return {name: np.frombuffer(col, dtype=np.int64) for name, col in zip(FIELDS, self._columns())}
+
+    # ------------------------------------------------------------------ consultas
+
+    def sort(self) -> None:
+        """Ordena por (recurso, início) e indexa o trecho de cada recurso."""
+        # duas passadas estáveis com chave em C (início, depois recurso): nenhuma tupla por linha
+        order = sorted(range(len(self)), key=self.start.__getitem__)
+        order.sort(key=self.resource_id.__getitem__)
+        for name in FIELDS:
+            col = getattr(self, name)
+            setattr(self, name, array("q", map(col.__getitem__, order)))
+        self._index()
+
+    def _index(self) -> None:
+        """Trecho [lo, hi) de cada recurso; as colunas já precisam estar ordenadas por recurso."""
+        ranges: Dict[int, Tuple[int, int]] = {}
+        lo, n = 0, len(self.resource_id)
+        while lo < n:
+            rid = self.resource_id[lo]
+            hi = bisect_right(self.resource_id, rid, lo)
+            ranges[rid] = (lo, hi)
+            lo = hi
+        self._ranges = ranges
+
+    def _range(self, resource_id: int) -> Tuple[int, int]:
+        if self._ranges is None:
+            self.sort()
+        return self._ranges.get(resource_id, (0, 0))
+
+    def overlapping(self, resource_id: int, start: int, end: int) -> Iterator[IntervalRecord]:
+        """Intervalos do recurso que cruzam [start, end)."""
+        lo, hi = self._range(resource_id)
+        i = bisect_left(self.start, start - self._max_duration, lo, hi)
+        while i < hi and self.start[i] < end:
+            if self.end[i] > start:
+                yield self[i]
+            i += 1
+
+    def has_overlap(self, resource_id: int, start: int, end: int) -> bool:
+        return next(self.overlapping(resource_id, start, end), None) is not None
+
+    def busy(self, resource_id: int) -> Iterator[Tuple[int, int]]:
+        """(início, fim) do recurso em ordem de início, no formato de recurrence.first_overlap."""
+        lo, hi = self._range(resource_id)
+        return zip(self.start[lo:hi], self.end[lo:hi])
+
+    def busy_datetimes(self, resource_id: int) -> Iterator[Tuple[datetime, datetime]]:
+        """Como busy(), em datetime (o formato dos calendários e das séries)."""
+        return ((from_epoch_minutes(s), from_epoch_minutes(e)) for s, e in self.busy(resource_id))
@@ -1,9 +1,42 @@
-import yaml
-from typing import Any, Dict
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Any, Dict, Iterator
 
-def load_config(path: str = "config.yaml") -> Dict[str, Any]:
+CONFIG_PATH = "config.yaml"
+
+def load_config(path: str = CONFIG_PATH) -> Dict[str, Any]:
     """Carrega arquivo de configuração YAML."""
+    import yaml  # import adiado: só paga o custo do yaml quem lê a config
+
     with open(path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-CONFIG = load_config()
+@lru_cache(maxsize=1)
+def get_config() -> Dict[str, Any]:
+    """Retorna a configuração, lendo o YAML apenas no primeiro acesso."""
+    return load_config(CONFIG_PATH)
+
+class _LazyConfig(Mapping):
+    """Proxy de leitura para a config: o arquivo só é lido quando alguém consulta uma chave."""
+
+    def __getitem__(self, key: str) -> Any:
+        return get_config()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(get_config())
+
+    def __len__(self) -> int:
+        return len(get_config())
+
+    def __repr__(self) -> str:
+        return f"LazyConfig({CONFIG_PATH!r}, loaded={get_config.cache_info().currsize > 0})"
+
+CONFIG = _LazyConfig()
+
+def config_section(name: str) -> Dict[str, Any]:
+    """
+    Seção `name` da config, ou {} se faltar ou vier vazia. Para chamar na hora do uso (primeira
+    requisição, primeiro acesso a um cache...), nunca no import: importar um módulo da app não lê
+    o config.yaml.
+    """
+    return CONFIG.get(name) or {}
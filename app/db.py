@@ -1,16 +1,128 @@
-from sqlalchemy import create_engine
+from functools import lru_cache
+from typing import Optional
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.orm import sessionmaker, Session, declarative_base
 from .config import CONFIG
 
-DATABASE_URL = CONFIG["database"]["url"]
+# Incrementar sempre que models.py ganhar tabelas/índices novos: é o que faz o
+# startup rodar create_all de novo em bancos já existentes.
+SCHEMA_VERSION = 11
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# índices que saíram de models.py: removidos de bancos antigos na migração
+RETIRED_INDEXES = ("ix_appointments_user_start", "ix_appointments_resource_start")
+
+# expire_on_commit=False: o que o repositório devolveu (via RETURNING) continua válido depois
+# do commit, sem um SELECT extra na hora de serializar a resposta
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+def database_url() -> str:
+    return CONFIG["database"]["url"]
+
+@lru_cache(maxsize=1)
+def get_engine() -> Engine:
+    """Cria o engine no primeiro uso (e não no import do módulo)."""
+    engine = create_engine(database_url(), connect_args={"check_same_thread": False})
+    SessionLocal.configure(bind=engine)
+    return engine
+
+def __getattr__(name: str):
+    # compatibilidade: `from app.db import engine` continua funcionando, mas só constrói o engine quando pedido
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_schema_version(engine: Engine) -> int:
+    """Lê a versão do schema gravada no banco (PRAGMA user_version no SQLite)."""
+    if engine.dialect.name != "sqlite":
+        return 0
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+
+def init_schema(engine: Engine) -> bool:
+    """
+    Garante que tabelas e índices existem.
+    Se o banco já está na SCHEMA_VERSION atual nada é feito (nem create_all, nem inspeção
+    do catálogo). Retorna True quando o schema foi (re)criado.
+    """
+    if get_schema_version(engine) == SCHEMA_VERSION:
+        return False
+    from . import models, search  # noqa: F401  (models registra as tabelas no metadata)
+
+    Base.metadata.create_all(bind=engine)
+    _ensure_autoincrement(engine, models.Appointment.__table__, models.ArchivedAppointment.__table__)
+    # create_all não adiciona colunas nem índices novos em tabelas que já existiam
+    existing = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        columns = {c["name"] for c in existing.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            if not column.nullable:
+                # ADD COLUMN NOT NULL sem default falha em tabela com linhas; pular deixaria o
+                # banco sem a coluna e a versão gravada como atual
+                raise RuntimeError(f"Coluna NOT NULL {table.name}.{column.name} não existe no banco e não pode "
+                                   "ser adicionada por ALTER TABLE; migre o banco manualmente")
+            ddl = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {ddl}')
+        names = {ix["name"] for ix in existing.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in names:
+                index.create(bind=engine)
+    with engine.begin() as conn:
+        for name in RETIRED_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+    search.install(engine)
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.execute(text(f"PRAGMA user_version = {int(SCHEMA_VERSION)}"))
+    return True
+
+def _ensure_autoincrement(engine: Engine, table, archive) -> None:
+    """
+    Recria `table` com AUTOINCREMENT em bancos criados antes dele. Sem AUTOINCREMENT o SQLite
+    reaproveita o maior id quando as últimas linhas saem da tabela (ex.: arquivadas), e o id
+    reaproveitado colide com o que já está em `archive`. A sequência parte do maior id das duas.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        ddl = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                   (table.name,)).scalar()
+        if "AUTOINCREMENT" in ddl.upper():
+            return
+        columns = ", ".join(c.name for c in table.columns)
+        create = str(CreateTable(table).compile(dialect=engine.dialect))
+        conn.exec_driver_sql(create.replace(f"TABLE {table.name}", f"TABLE {table.name}_rebuild", 1))
+        conn.exec_driver_sql(f"INSERT INTO {table.name}_rebuild ({columns}) SELECT {columns} FROM {table.name}")
+        # índices e gatilhos (busca) vão junto com a tabela antiga; init_schema e search.install os recriam
+        conn.exec_driver_sql(f"DROP TABLE {table.name}")
+        conn.exec_driver_sql(f"ALTER TABLE {table.name}_rebuild RENAME TO {table.name}")
+        top = conn.exec_driver_sql(f"SELECT max(id) FROM (SELECT id FROM {table.name} UNION ALL "
+                                   f"SELECT id FROM {archive.name})").scalar()
+        conn.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = ?", (table.name,))
+        conn.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table.name, top or 0))
+
+def begin_immediate(db: Session) -> None:
+    """
+    No SQLite, abre a transação já com o lock de escrita (BEGIN IMMEDIATE).
+    Quem chega depois espera no busy timeout em vez de falhar com "database is locked"
+    ao tentar promover um lock de leitura no meio do comando.
+    """
+    conn = db.connection()
+    if conn.dialect.name == "sqlite" and not conn.connection.dbapi_connection.in_transaction:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+def new_session(bind: Optional[Engine] = None) -> Session:
+    """Session fora de request (jobs em background, tasks que sobrevivem à requisição)."""
+    return SessionLocal(bind=bind or get_engine())
+
 def get_db() -> Session:
     """Dependency: fornece uma session do SQLAlchemy."""
-    db = SessionLocal()
+    db = new_session()
     try:
         yield db
     finally:
@@ -0,0 +1,169 @@
+"""
+Barramento de mudanças em processo (appointments/users) e o stream SSE alimentado por ele.
+
+Os repositórios publicam um evento por create/update/delete. Cada evento é serializado
+uma única vez e entregue aos assinantes com uma chamada por event loop, então N
+clientes observando custam um fan-out por mudança em vez de N consultas por polling.
+"""
+import asyncio
+import itertools
+import json
+import threading
+from collections import defaultdict, deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+HISTORY_SIZE = 1024
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+class ChangeEvent:
+    """Mudança publicada no barramento; `wire` é o texto SSE já pronto."""
+    __slots__ = ("id", "type", "data", "_wire")
+
+    def __init__(self, id: int, type: str, data: Dict[str, Any]):
+        self.id = id
+        self.type = type
+        self.data = data
+        self._wire = None
+
+    @property
+    def wire(self) -> str:
+        if self._wire is None:
+            payload = json.dumps(self.data, default=str, separators=(",", ":"))
+            self._wire = f"id: {self.id}\nevent: {self.type}\ndata: {payload}\n\n"
+        return self._wire
+
+    def matches(self, user_id: Optional[int] = None, resource_id: Optional[int] = None) -> bool:
+        if user_id is not None and self.data.get("user_id") != user_id:
+            return False
+        if resource_id is not None and self.data.get("resource_id") != resource_id:
+            return False
+        return True
+
+
+class Subscription:
+    """Fila de um cliente, presa ao event loop em que foi criada."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, user_id: Optional[int], resource_id: Optional[int],
+                 maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.loop = loop
+        self.user_id = user_id
+        self.resource_id = resource_id
+        self.queue: "asyncio.Queue[ChangeEvent]" = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def offer(self, event: ChangeEvent) -> None:
+        # roda dentro do loop do assinante; cliente lento demais perde o stream e recebe "reset"
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+def _deliver(subscribers: List[Subscription], event: ChangeEvent) -> None:
+    for sub in subscribers:
+        sub.offer(event)
+
+
+class ChangeBus:
+    """Pub/sub thread-safe com histórico limitado (ring buffer) para retomada via Last-Event-ID."""
+
+    def __init__(self, history: int = HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self._history: deque = deque(maxlen=history)
+        self._ids = itertools.count(1)
+        self._subscribers: set = set()
+        self._listeners: List[Callable[[ChangeEvent], None]] = []
+
+    @property
+    def last_id(self) -> int:
+        with self._lock:
+            return self._history[-1].id if self._history else 0
+
+    def publish(self, type: str, data: Dict[str, Any]) -> ChangeEvent:
+        """Publica uma mudança. Pode ser chamado de qualquer thread (ex.: rotas síncronas)."""
+        with self._lock:
+            event = ChangeEvent(next(self._ids), type, data)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+            listeners = list(self._listeners)
+        by_loop = defaultdict(list)
+        for sub in subscribers:
+            if event.matches(sub.user_id, sub.resource_id):
+                by_loop[sub.loop].append(sub)
+        for loop, subs in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, subs, event)
+            except RuntimeError:
+                # loop já encerrado: o assinante sumiu sem cancelar
+                self._discard(subs)
+        for listener in listeners:
+            listener(event)
+        return event
+
+    def add_listener(self, callback: Callable[[ChangeEvent], None]) -> None:
+        """Consumidor síncrono em processo (ex.: invalidação de cache); roda na thread que publicou."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[ChangeEvent], None]) -> None:
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def subscribe(self, user_id: Optional[int] = None, resource_id: Optional[int] = None,
+                  last_event_id: Optional[int] = None) -> Tuple[Subscription, Optional[List[ChangeEvent]]]:
+        """
+        Registra um assinante no loop atual.
+        Retorna também os eventos perdidos desde `last_event_id`; None quando esse id já saiu do
+        histórico (o cliente precisa recarregar a lista inteira).
+        """
+        sub = Subscription(asyncio.get_running_loop(), user_id, resource_id)
+        with self._lock:
+            self._subscribers.add(sub)
+            backlog: Optional[List[ChangeEvent]] = []
+            if last_event_id is not None:
+                oldest = self._history[0].id if self._history else 1
+                newest = self._history[-1].id if self._history else 0
+                # id anterior ao histórico (perdido) ou posterior ao último (processo reiniciou)
+                if last_event_id < oldest - 1 or last_event_id > newest:
+                    backlog = None
+                else:
+                    backlog = [e for e in self._history if e.id > last_event_id and e.matches(user_id, resource_id)]
+        return sub, backlog
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._discard([sub])
+
+    def _discard(self, subs: List[Subscription]) -> None:
+        with self._lock:
+            for sub in subs:
+                self._subscribers.discard(sub)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+
+async def sse_stream(sub: Subscription, backlog: Optional[List[ChangeEvent]],
+                     heartbeat: float = 15.0) -> AsyncIterator[str]:
+    """Gera o corpo text/event-stream: backlog, eventos ao vivo e comentários de keepalive."""
+    yield "retry: 3000\n\n"
+    if backlog is None:
+        yield "event: reset\ndata: {}\n\n"
+    else:
+        for event in backlog:
+            yield event.wire
+    while True:
+        if sub.overflowed:
+            yield "event: reset\ndata: {}\n\n"
+            return
+        try:
+            event = await asyncio.wait_for(sub.queue.get(), timeout=heartbeat)
+        except asyncio.TimeoutError:
+            yield ": keepalive\n\n"
+            continue
+        yield event.wire
+
+
+change_bus = ChangeBus()
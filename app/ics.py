@@ -0,0 +1,153 @@
+"""
+Feeds iCalendar (RFC 5545) por usuário e por recurso, para assinatura em apps de calendário.
+
+O feed cobre uma janela limitada (`ics.past_days` para trás e `ics.future_days` para frente a
+partir de hoje), com os agendamentos ativos e as ocorrências das séries recorrentes nela, e é
+escrito por um gerador: cabeçalho, um bloco VEVENT por evento e o rodapé, com escape de texto,
+CRLF e dobra de linha em 75 octetos. Horários saem em UTC (sufixo Z), sem depender de um
+VTIMEZONE. Cancelados saem do feed: quem assina remove o evento na próxima atualização.
+
+O ETag é derivado dos dados do feed (eventos, horários, títulos e a janela), então vale igual em
+qualquer worker e muda com qualquer escrita, inclusive de outro processo. Cada requisição faz a
+consulta da janela; o que um If-None-Match que ainda casa economiza é a escrita e o envio do
+corpo (304), e o corpo já escrito fica em cache (TTLCache) por feed, guardado com o seu ETag.
+"""
+import hashlib
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from .cache import TTLCache
+from .config import CONFIG, config_section
+
+CRLF = "\r\n"
+MEDIA_TYPE = "text/calendar; charset=utf-8"
+PRODID = "-//Sistema de Agendamento//ICS//PT-BR"
+FOLD_OCTETS = 75
+
+Key = Tuple[str, int]  # ("user" | "resource", id)
+
+
+def window(today: Optional[date] = None) -> Tuple[datetime, datetime]:
+    """Janela do feed: de `past_days` atrás até `future_days` à frente, alinhada em dias."""
+    cfg = config_section("ics")
+    start = datetime.combine(today or date.today(), datetime.min.time())
+    return (start - timedelta(days=int(cfg.get("past_days", 30))),
+            start + timedelta(days=int(cfg.get("future_days", 180))))
+
+
+def escape(text: str) -> str:
+    """Escape de TEXT (RFC 5545 3.3.11)."""
+    return (text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def fold(line: str) -> str:
+    """Dobra a linha em pedaços de até 75 octetos (UTF-8), sem partir caractere; continuação começa com espaço."""
+    if len(line.encode("utf-8")) <= FOLD_OCTETS:
+        return line + CRLF
+    parts, current, size = [], [], 0
+    for ch in line:
+        n = len(ch.encode("utf-8"))
+        # a partir da segunda linha o espaço inicial conta no limite
+        if size + n > FOLD_OCTETS - (1 if parts else 0):
+            parts.append("".join(current))
+            current, size = [], 0
+        current.append(ch)
+        size += n
+    parts.append("".join(current))
+    return (CRLF + " ").join(parts) + CRLF
+
+
+def _utc(dt: datetime, tz: ZoneInfo) -> str:
+    # horários do banco são locais (app.timezone), sem tzinfo
+    return dt.replace(tzinfo=tz).astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def uid(a, domain: str = "agendamento") -> str:
+    """UID estável: o id do agendamento, ou série + início para uma ocorrência (que não tem id)."""
+    if a.id is not None:
+        return f"appointment-{a.id}@{domain}"
+    return f"series-{a.series_id}-{a.start_time:%Y%m%dT%H%M%S}@{domain}"
+
+
+def write_calendar(name: str, events: Iterable, summary: Callable, domain: str = "agendamento") -> Iterator[str]:
+    """Gera o VCALENDAR em pedaços (um por evento). `summary(evento)` dá o título de cada evento."""
+    tz_name = CONFIG["app"].get("timezone", "America/Sao_Paulo")
+    tz = ZoneInfo(tz_name)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    yield "".join(fold(line) for line in (
+        "BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}", "CALSCALE:GREGORIAN", "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{escape(name)}", f"X-WR-TIMEZONE:{tz_name}"))
+    for a in events:
+        lines = ["BEGIN:VEVENT",
+                 f"UID:{uid(a, domain)}",
+                 f"DTSTAMP:{stamp}",
+                 f"DTSTART:{_utc(a.start_time, tz)}",
+                 f"DTEND:{_utc(a.end_time, tz)}",
+                 f"SUMMARY:{escape(summary(a))}",
+                 "STATUS:CONFIRMED"]
+        if a.notes:
+            lines.append(f"DESCRIPTION:{escape(a.notes)}")
+        lines.append("END:VEVENT")
+        yield "".join(fold(line) for line in lines)
+    yield fold("END:VCALENDAR")
+
+
+def etag_for(key: Key, start: datetime, name: str, events: List, summary: Callable) -> str:
+    """
+    ETag fraco (o DTSTAMP muda a cada escrita) calculado do conteúdo: mesmo feed, mesma janela e
+    mesmos eventos dão o mesmo ETag em qualquer processo.
+    """
+    h = hashlib.blake2b(digest_size=12)
+    h.update(f"{key[0]}:{key[1]}:{start:%Y%m%d}:{name}".encode())
+    for a in events:
+        h.update(f"\x00{uid(a)}|{a.start_time:%Y%m%d%H%M%S}|{a.end_time:%Y%m%d%H%M%S}|{summary(a)}|{a.notes or ''}".encode())
+    return f'W/"{h.hexdigest()}"'
+
+
+class FeedCache:
+    """Corpo escrito por (tipo, id), guardado com o ETag dos dados de que saiu."""
+
+    def __init__(self):
+        self._cache: Optional[TTLCache] = None
+
+    @property
+    def cache(self) -> TTLCache:
+        if self._cache is None:
+            cfg = config_section("ics")
+            self._cache = TTLCache(ttl=float(cfg.get("cache_ttl_seconds", 300)), maxsize=int(cfg.get("cache_size", 4096)))
+        return self._cache
+
+    def get(self, key: Key, etag: str) -> Optional[bytes]:
+        found = self.cache.get(key)
+        # corpo de dados que já mudaram (ou de outra janela) não serve
+        return found[1] if found is not None and found[0] == etag else None
+
+    def store(self, key: Key, etag: str, body: bytes) -> None:
+        self.cache.set(key, (etag, body))
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def if_none_match(header: Optional[str], etag: str) -> bool:
+    """If-None-Match casa com o ETag atual (comparação fraca, como manda a RFC 9110; aceita lista e '*')."""
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or _opaque(etag) in (_opaque(t) for t in tags)
+
+
+def stream(key: Key, etag: str, chunks: Iterator[str]) -> Iterator[bytes]:
+    """Repassa os pedaços à resposta e, no fim, guarda o corpo inteiro no cache."""
+    parts = []
+    for chunk in chunks:
+        data = chunk.encode("utf-8")
+        parts.append(data)
+        yield data
+    feeds.store(key, etag, b"".join(parts))
+
+
+feeds = FeedCache()
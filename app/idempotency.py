@@ -0,0 +1,199 @@
+"""
+Idempotency-Key para os POSTs que criam usuários e agendamentos.
+
+A primeira requisição com uma chave roda normalmente e a resposta (status + bytes) fica guardada
+por `idempotency.ttl_seconds`: num LRU em memória e na tabela idempotency_keys (que sobrevive a
+restart e é compartilhada entre workers). Retentativas com a mesma chave recebem a resposta
+gravada sem rodar validação nem tocar nas tabelas de negócio. Respostas 5xx não são gravadas,
+para a retentativa poder dar certo.
+
+Duplicatas simultâneas: no mesmo processo esperam a primeira via single-flight; entre workers,
+quem roda é quem reivindicou a chave (INSERT ... ON CONFLICT de uma linha pendente na tabela) e
+os outros consultam a linha até a resposta aparecer. A reivindicação vence em
+`idempotency.claim_seconds`, para um worker que caiu no meio não prender a chave.
+"""
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+from pydantic import BaseModel
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .cache import TTLCache
+from .config import config_section
+from .metrics import metrics
+from .singleflight import SingleFlight, serialize
+
+MAX_KEY_LENGTH = 255
+REPLAY_HEADER = "Idempotent-Replayed"
+PENDING = 0  # status_code da linha reivindicada enquanto a primeira requisição roda
+POLL_SECONDS = 0.05
+
+R = models.IdempotencyRecord
+
+
+class StoredResponse:
+    __slots__ = ("fingerprint", "status_code", "body")
+
+    def __init__(self, fingerprint: str, status_code: int, body: bytes):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.body = body
+
+
+class IdempotencyStore:
+    """LRU em memória na frente da tabela idempotency_keys; ambos com o mesmo TTL."""
+
+    def __init__(self, ttl: Optional[float] = None, maxsize: Optional[int] = None):
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._memory: Optional[TTLCache] = None
+        self._flight = SingleFlight()
+
+    @property
+    def ttl(self) -> float:
+        if self._ttl is None:
+            self._ttl = float(config_section("idempotency").get("ttl_seconds", 86400))
+        return self._ttl
+
+    @property
+    def memory(self) -> TTLCache:
+        if self._memory is None:
+            size = self._maxsize or config_section("idempotency").get("memory_size", 10000)
+            self._memory = TTLCache(self.ttl, int(size))
+        return self._memory
+
+    @property
+    def claim_seconds(self) -> float:
+        return float(config_section("idempotency").get("claim_seconds", 30))
+
+    def _row(self, db: Session, key: str):
+        # colunas, não a entidade: o mapa de identidade da session devolveria a linha já lida
+        row = db.execute(select(R.fingerprint, R.status_code, R.body, R.expires_at).where(R.key == key)).first()
+        db.rollback()  # não segura o snapshot de leitura entre consultas
+        return row
+
+    def get(self, db: Session, key: str) -> Optional[StoredResponse]:
+        """Resposta gravada e ainda válida; None se não há, venceu ou ainda está pendente."""
+        stored = self.memory.get(key)
+        if stored is not None:
+            return stored
+        row = self._row(db, key)
+        now = datetime.now()
+        if row is None or row.expires_at <= now or row.status_code == PENDING:
+            return None
+        stored = StoredResponse(row.fingerprint, row.status_code, row.body)
+        self.memory.set(key, stored, ttl=(row.expires_at - now).total_seconds())
+        return stored
+
+    def claim(self, db: Session, key: str, fingerprint: str) -> bool:
+        """
+        Reivindica a chave com uma linha pendente; True se esta requisição deve rodar.
+        Linha vencida (resposta expirada ou reivindicação abandonada) é retomada no mesmo comando.
+        """
+        now = datetime.now()
+        values = {"key": key, "fingerprint": fingerprint, "status_code": PENDING, "body": b"",
+                  "created_at": now, "expires_at": now + timedelta(seconds=self.claim_seconds)}
+        stmt = sqlite_insert(R).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=[R.key], set_=values, where=R.expires_at <= now)
+        claimed = db.execute(stmt).rowcount == 1
+        db.commit()
+        return claimed
+
+    def release(self, db: Session, key: str) -> None:
+        """Desiste da reivindicação (resposta 5xx ou erro): a próxima tentativa roda de novo."""
+        db.rollback()
+        db.execute(delete(R).where(R.key == key, R.status_code == PENDING))
+        db.commit()
+
+    def wait(self, db: Session, key: str) -> Optional[StoredResponse]:
+        """Espera outro worker terminar a chave; None se ela ficou livre (desistência ou vencimento)."""
+        while True:
+            row = self._row(db, key)
+            if row is None or row.expires_at <= datetime.now():
+                return None
+            if row.status_code != PENDING:
+                return self.get(db, key)
+            time.sleep(POLL_SECONDS)
+
+    def save(self, db: Session, key: str, stored: StoredResponse) -> None:
+        now = datetime.now()
+        values = {"key": key, "fingerprint": stored.fingerprint, "status_code": stored.status_code,
+                  "body": stored.body, "created_at": now, "expires_at": now + timedelta(seconds=self.ttl)}
+        stmt = sqlite_insert(R).values(**values)
+        db.execute(stmt.on_conflict_do_update(index_elements=[R.key], set_=values))
+        db.commit()
+        self.memory.set(key, stored)
+
+    def run(self, db: Session, key: str, fingerprint: str,
+            handler: Callable[[], Tuple[int, bytes]]) -> Tuple[StoredResponse, bool]:
+        """Resposta para a chave (gravada ou recém-produzida) e se ela é um replay."""
+        def once():
+            stored = self.get(db, key)
+            if stored is not None:
+                return stored, True
+            while not self.claim(db, key, fingerprint):
+                stored = self.wait(db, key)
+                if stored is not None:
+                    return stored, True
+            try:
+                status_code, body = handler()
+            except BaseException:
+                self.release(db, key)
+                raise
+            stored = StoredResponse(fingerprint, status_code, body)
+            if status_code < 500:
+                db.rollback()  # o handler pode ter deixado a session numa transação com erro
+                self.save(db, key, stored)
+            else:
+                self.release(db, key)
+            return stored, False
+
+        (stored, replayed), shared = self._flight.do(key, once)
+        if replayed or shared:
+            metrics.incr("idempotency.replayed")
+        return stored, replayed or shared
+
+
+def purge_expired(db: Session, now: Optional[datetime] = None) -> int:
+    """Remove da tabela as chaves vencidas (chamado pelo job de ciclo de vida)."""
+    removed = db.execute(delete(R).where(R.expires_at <= (now or datetime.now()))).rowcount
+    db.commit()
+    return removed
+
+
+def fingerprint_of(payload: BaseModel) -> str:
+    return hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+
+
+def idempotent_response(db: Session, scope: str, key: str, payload: BaseModel,
+                        handler: Callable[[], Any], response_type: Any) -> Response:
+    """
+    Roda `handler` (que devolve o objeto da resposta ou levanta HTTPException) no máximo uma vez
+    por (escopo, chave). Mesma chave com outro payload é erro do cliente (422).
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key deve ter de 1 a {MAX_KEY_LENGTH} caracteres")
+    fingerprint = fingerprint_of(payload)
+
+    def run() -> Tuple[int, bytes]:
+        try:
+            return 200, serialize(handler(), response_type)
+        except HTTPException as e:
+            return e.status_code, json.dumps({"detail": e.detail}).encode()
+
+    stored, replayed = store.run(db, f"{scope}:{key}", fingerprint, run)
+    if stored.fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key já usada com outro payload")
+    headers = {REPLAY_HEADER: "true"} if replayed else None
+    return Response(content=stored.body, status_code=stored.status_code, media_type="application/json", headers=headers)
+
+
+store = IdempotencyStore()
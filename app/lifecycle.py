@@ -0,0 +1,139 @@
+"""
+Job periódico do ciclo de vida dos agendamentos.
+
+Move `scheduled -> done` tudo que já terminou com um UPDATE por conjunto (em lotes limitados,
+apoiado no índice (status, end_time)), apaga usuários com exclusão lógica, expira chaves de
+idempotência e pedidos da fila de espera que já passaram, e opcionalmente roda o arquivamento. Assim filtros por
+status refletem a realidade sem que cada relatório compare com datetime.now() linha a linha.
+"""
+import asyncio
+import logging
+import time as _time
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from . import idempotency, models
+from .archive import archive_expired, retention_horizon
+from .config import config_section
+from .events import change_bus
+from .metrics import metrics
+from .repositories import CHILD_TABLES, SqlAlchemyWaitlistRepository, publish_removed
+from .waitlist import waitlist
+
+logger = logging.getLogger(__name__)
+
+A = models.Appointment
+
+
+def complete_expired(db: Session, now: Optional[datetime] = None, batch_size: Optional[int] = None) -> int:
+    """
+    UPDATE appointments SET status='done' WHERE status='scheduled' AND end_time < :now,
+    em lotes de `batch_size` linhas (uma transação curta por lote). Retorna o total alterado.
+    """
+    now = now or datetime.now()
+    batch_size = batch_size or int(config_section("lifecycle").get("batch_size", 500))
+    total = 0
+    while True:
+        batch = select(A.id).where(A.status == "scheduled", A.end_time < now).limit(batch_size)
+        changed = db.execute(
+            update(A).where(A.id.in_(batch)).values(status="done").execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        total += changed
+        if changed < batch_size:
+            break
+    return total
+
+
+def purge_deleted_users(db: Session, batch_size: Optional[int] = None,
+                        release: Optional[Callable[[Session, list], None]] = None) -> int:
+    """
+    Apaga de fato os usuários com exclusão lógica: primeiro as linhas filhas, em lotes de
+    `batch_size` (uma transação curta por lote, o banco nunca fica travado por segundos),
+    depois os próprios usuários. Cada lote de agendamentos vira eventos appointment.deleted e
+    vai para `release` (AppointmentService.release_freed) depois do commit. Retorna quantas
+    linhas filhas saíram.
+    """
+    batch_size = batch_size or int(config_section("deletes").get("purge_batch_size", 5000))
+    deleted_users = select(models.User.id).where(models.User.deleted_at.is_not(None))
+    removed = 0
+    for table in CHILD_TABLES:
+        while True:
+            batch = select(table.c.id).where(table.c.user_id.in_(deleted_users)).limit(batch_size)
+            stmt = delete(table).where(table.c.id.in_(batch))
+            if table is A.__table__:
+                freed = db.execute(stmt.returning(*table.c)).all()
+                changed = len(freed)
+            else:
+                freed, changed = [], db.execute(stmt).rowcount
+            db.commit()
+            publish_removed(freed)
+            if freed and release is not None:
+                release(db, freed)
+            removed += changed
+            if changed < batch_size:
+                break
+    db.execute(delete(models.User).where(models.User.deleted_at.is_not(None)))
+    db.commit()
+    return removed
+
+
+def expire_waitlist(db: Session, now: Optional[datetime] = None) -> int:
+    """Pedidos da fila de espera cujo horário já começou passam a "expired"."""
+    expired = SqlAlchemyWaitlistRepository().expire(db, now or datetime.now())
+    db.commit()
+    if expired:
+        waitlist.invalidate()
+    return expired
+
+
+def run_once(session_factory: Callable[[], Session], now: Optional[datetime] = None,
+             release: Optional[Callable[[Session, list], None]] = None) -> dict:
+    """Uma rodada do job; emite contadores em `metrics`. `release`: ver purge_deleted_users."""
+    started = _time.perf_counter()
+    result = {"completed": 0, "archived": 0, "purged": 0}
+    with session_factory() as db:
+        result["completed"] = complete_expired(db, now)
+        result["purged"] = purge_deleted_users(db, release=release)
+        metrics.incr("lifecycle.idempotency_expired", idempotency.purge_expired(db, now))
+        metrics.incr("lifecycle.waitlist_expired", expire_waitlist(db, now))
+        if config_section("archive").get("auto", False):
+            result["archived"] = archive_expired(db, retention_horizon(now))
+    metrics.incr("lifecycle.runs")
+    metrics.incr("lifecycle.completed", result["completed"])
+    metrics.incr("lifecycle.archived", result["archived"])
+    metrics.incr("lifecycle.purged", result["purged"])
+    metrics.set_gauge("lifecycle.last_run_seconds", round(_time.perf_counter() - started, 4))
+    metrics.set_gauge("lifecycle.last_run_at", _time.time())
+    if result["completed"]:
+        change_bus.publish("appointments.completed", {"count": result["completed"]})
+    return result
+
+
+async def worker_loop(session_factory: Callable[[], Session], interval: Optional[float] = None,
+                      release: Optional[Callable[[Session, list], None]] = None) -> None:
+    """Loop do worker iniciado no lifespan; o trabalho de banco vai para uma thread."""
+    interval = interval if interval is not None else float(config_section("lifecycle").get("interval_seconds", 60))
+    while True:
+        try:
+            result = await asyncio.to_thread(run_once, session_factory, release=release)
+            if any(result.values()):
+                logger.info("Ciclo de vida: %s concluídos, %s arquivados, %s removidos",
+                            result["completed"], result["archived"], result["purged"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics.incr("lifecycle.errors")
+            logger.exception("Falha no job de ciclo de vida")
+        await asyncio.sleep(interval)
+
+
+def start_worker(session_factory: Callable[[], Session],
+                 release: Optional[Callable[[Session, list], None]] = None) -> Optional[asyncio.Task]:
+    """Cria a task do worker (ou None se lifecycle.enabled for false)."""
+    if not config_section("lifecycle").get("enabled", True):
+        return None
+    return asyncio.create_task(worker_loop(session_factory, release=release), name="lifecycle-worker")
@@ -0,0 +1,19 @@
+import threading
+from typing import Hashable, List
+
+class LockStripes:
+    """
+    Conjunto fixo de locks indexado por chave (ex.: resource_id).
+    Reservas no mesmo recurso se serializam; recursos diferentes quase nunca
+    disputam o mesmo lock, ao contrário de um lock global.
+    """
+    def __init__(self, stripes: int = 64):
+        if stripes <= 0:
+            raise ValueError("stripes deve ser positivo")
+        self._locks: List[threading.Lock] = [threading.Lock() for _ in range(stripes)]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def lock_for(self, key: Hashable) -> threading.Lock:
+        return self._locks[hash(key) % len(self._locks)]
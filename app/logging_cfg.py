@@ -8,6 +8,10 @@ def configure_logging(cfg: Dict) -> None:
     level = getattr(logging, cfg.get("level", "INFO").upper())
     logger = logging.getLogger()
     logger.setLevel(level)
+    if getattr(logger, "_app_configured", False):
+        # startup pode rodar mais de uma vez no mesmo processo (reload, testes)
+        return
+    logger._app_configured = True
 
     formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
 
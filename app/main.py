@@ -1,25 +1,55 @@
 from fastapi import FastAPI
-from contextlib import asynccontextmanager
-from .api import router
-from .db import Base, engine
+from contextlib import asynccontextmanager, suppress
+from .api import appointment_service, router, use_repositories
+from .admission import AdmissionMiddleware
+from .db import get_engine, init_schema, new_session
 from .config import CONFIG
 from .logging_cfg import configure_logging
+import asyncio
 import logging
+import sys
 
-# configure logging
-configure_logging(CONFIG["logging"])
 logger = logging.getLogger(__name__)
 
+DEFAULT_TITLE = "Sistema de Agendamento"
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    Base.metadata.create_all(bind=engine)
-    logger.info("Banco e tabelas inicializadas")
+    # Startup: config, logging e schema ficam fora do import para o worker subir rápido
+    from . import lifecycle, memory
+
+    app.title = CONFIG["app"].get("title", DEFAULT_TITLE)
+    app.openapi_schema = None
+    configure_logging(CONFIG["logging"])
+    if init_schema(get_engine()):
+        logger.info("Banco e tabelas inicializadas")
+    else:
+        logger.info("Schema já está atualizado, create_all ignorado")
+    # storage.backend = memory: usuários e agendamentos saem do SQLite (ver app/memory.py)
+    store = None
+    if memory.backend() == "memory":
+        memory.check_supported()
+        store = memory.open_store()
+        use_repositories(*memory.repositories(store))
+        logger.info("Backend em memória: %s usuários, %s agendamentos", len(store.users), len(store.appointments))
+    # horários dos usuários expurgados vão para a fila de espera
+    lifecycle_task = lifecycle.start_worker(new_session, appointment_service.release_freed)
     yield
     # Shutdown
+    if lifecycle_task is not None:
+        lifecycle_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await lifecycle_task
+    if "app.analytics" in sys.modules:
+        sys.modules["app.analytics"].shutdown_pool()
+    if store is not None:
+        store.close()
     logger.info("Aplicação encerrando")
 
-app = FastAPI(title=CONFIG["app"]["title"], lifespan=lifespan)
+# título da config só no lifespan: importar app.main não lê o config.yaml
+app = FastAPI(title=DEFAULT_TITLE, lifespan=lifespan)
+# por fora de tudo: recusa excesso (429/503) antes de rotear e de abrir session no banco
+app.add_middleware(AdmissionMiddleware)
 
 # incluir rotas
 app.include_router(router, prefix="/api")
@@ -0,0 +1,763 @@
+"""
+Backend em memória para usuários e agendamentos.
+
+Para implantações em que a latência da reserva pesa mais que consultas ad hoc. O estado fica em
+dicts indexados: usuários por id e por email, agendamentos por id e por usuário, e por recurso
+os intervalos vivos (não cancelados) ordenados por início, onde a checagem de conflito é um
+bisect. Cada mutação vira uma linha no journal append-only antes de a chamada voltar; o fsync
+é feito em grupo por uma thread, então escritas que chegam juntas dividem o mesmo fsync, e
+cada uma só retorna depois que o seu registro está no disco. Uma escrita sem concorrência não
+espera a janela de `fsync_interval_ms`.
+
+A cada `storage.memory.snapshot_every` registros o estado inteiro vai para snapshot.json
+(arquivo temporário + os.replace) e o journal é rotacionado. No startup o snapshot é carregado
+e os registros posteriores a ele são reaplicados; uma última linha incompleta (queda no meio
+do write) é descartada.
+
+Escolhido em config.yaml (`storage.backend: memory`). Só usuários e agendamentos avulsos moram
+aqui: recursos, séries, calendários, fila de espera e idempotência continuam no SQLite.
+Listagens, exportação e minutos reservados passam pelos repositórios. O que lê a tabela
+appointments direto não enxergaria estes agendamentos: relatórios, analytics, busca, arquivo e
+recursos com agendamentos respondem 501 com este backend, e o startup recusa subir com os jobs
+que escrevem nela ligados (ver SQL_ONLY_JOBS). Exclusão de usuário é sempre definitiva.
+"""
+import json
+import logging
+import os
+import threading
+import time as _time
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from itertools import takewhile
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+from .compact import IntervalStore, to_epoch_minutes
+from .config import config_section
+from .events import change_bus
+from .repositories import (AppointmentRepository, SqlAlchemyAppointmentRepository, UserRepository,
+                           appointment_payload, assigned_values, delete_children, publish_removed, user_payload)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT = "snapshot.json"
+JOURNAL = "journal.log"
+
+
+# ============================================================================
+# Registros
+# ============================================================================
+
+class UserRecord(NamedTuple):
+    """Usuário guardado. Imutável: uma alteração troca o registro inteiro no índice."""
+    id: int
+    name: str
+    email: str
+    is_active: bool = True
+    deleted_at: Optional[datetime] = None
+
+
+class AppointmentRecord(NamedTuple):
+    """Agendamento guardado (mesmas colunas de models.Appointment)."""
+    id: int
+    user_id: int
+    resource_id: int
+    start_time: datetime
+    end_time: datetime
+    status: str = "scheduled"
+    notes: Optional[str] = None
+
+
+_DATETIME_FIELDS = {"start_time", "end_time", "deleted_at"}
+
+
+def _encode(record: tuple) -> list:
+    return [v.isoformat() if isinstance(v, datetime) else v for v in record]
+
+
+def _decode(cls, values: list):
+    return cls(*(datetime.fromisoformat(v) if v is not None and f in _DATETIME_FIELDS else v
+                 for f, v in zip(cls._fields, values)))
+
+
+# ============================================================================
+# Journal
+# ============================================================================
+
+class Journal:
+    """
+    Arquivo append-only de mutações, uma linha JSON por registro ({"seq", "op", "data"}).
+    `append` só escreve no buffer e devolve o seq; `wait(seq)` bloqueia até a thread de
+    fsync ter gravado esse registro (group commit).
+    """
+
+    def __init__(self, path: Path, seq: int = 0, fsync_interval: float = 0.0, fsync: bool = True):
+        self.path = Path(path)
+        self.fsync_interval = fsync_interval
+        self.fsync = fsync
+        self.seq = seq
+        self._synced = seq
+        self._file = open(self.path, "ab")
+        self._cond = threading.Condition()
+        self._io = threading.Lock()  # flush/fsync/rotação: o arquivo não troca no meio de um fsync
+        self._closed = False
+        self._thread = threading.Thread(target=self._flusher, name="journal-fsync", daemon=True)
+        self._thread.start()
+
+    def append(self, op: str, data) -> int:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Journal fechado")
+            self.seq += 1
+            line = json.dumps({"seq": self.seq, "op": op, "data": data}, separators=(",", ":"))
+            self._file.write(line.encode() + b"\n")
+            self._cond.notify_all()
+            return self.seq
+
+    def wait(self, seq: int) -> None:
+        """Bloqueia até o registro `seq` estar no disco."""
+        with self._cond:
+            while self._synced < seq and not self._closed:
+                self._cond.wait()
+
+    def _sync(self) -> None:
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _flusher(self) -> None:
+        while True:
+            with self._cond:
+                while self._synced == self.seq and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                pending = self.seq - self._synced
+            # escrita sozinha vai direto para o fsync; quem chega durante um fsync já entra no
+            # próximo. A janela só é esperada quando já há concorrência, para juntar mais gente
+            if self.fsync_interval and pending > 1:
+                _time.sleep(self.fsync_interval)
+            with self._io:
+                with self._cond:
+                    target = self.seq
+                self._sync()
+            with self._cond:
+                self._synced = max(self._synced, target)
+                self._cond.notify_all()
+
+    def rotate(self) -> Path:
+        """
+        Fecha o arquivo atual como journal.log.<seq> e abre um vazio. Quem chama garante que
+        não há append em andamento (ver MemoryStore.snapshot).
+        """
+        with self._io, self._cond:
+            self._sync()
+            self._file.close()
+            rotated = self.path.with_name(f"{self.path.name}.{self.seq}")
+            os.replace(self.path, rotated)
+            self._file = open(self.path, "ab")
+            self._synced = self.seq
+            self._cond.notify_all()
+        return rotated
+
+    def close(self) -> None:
+        with self._io, self._cond:
+            if self._closed:
+                return
+            self._sync()
+            self._synced = self.seq
+            self._closed = True
+            self._file.close()
+            self._cond.notify_all()
+        self._thread.join()
+
+
+def read_journal(path: Path) -> Tuple[List[dict], int]:
+    """
+    Registros de um arquivo do journal e o tamanho em bytes da parte íntegra. Uma última
+    linha que não é JSON válido (write interrompido) é ignorada; no meio do arquivo é erro.
+    """
+    records, good = [], 0
+    with open(path, "rb") as f:
+        lines = f.readlines()
+    for i, line in enumerate(lines):
+        try:
+            if not line.endswith(b"\n"):
+                raise ValueError("linha incompleta")
+            records.append(json.loads(line))
+        except ValueError:
+            if i == len(lines) - 1:
+                logger.warning("Journal %s: última linha incompleta descartada", path)
+                break
+            raise
+        good += len(line)
+    return records, good
+
+
+def _journal_files(directory: Path) -> List[Path]:
+    """journal.log.<seq> rotacionados (em ordem) e por último o journal.log atual."""
+    rotated = sorted(directory.glob(f"{JOURNAL}.*"), key=lambda p: int(p.suffix[1:]))
+    current = directory / JOURNAL
+    return rotated + ([current] if current.exists() else [])
+
+
+def _fsync_dir(directory: Path) -> None:
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+# ============================================================================
+# Estado
+# ============================================================================
+
+class _Timeline:
+    """Agendamentos vivos de um recurso, ordenados por (início, id)."""
+    __slots__ = ("keys", "longest")
+
+    def __init__(self):
+        self.keys: List[Tuple[datetime, int]] = []
+        self.longest = 0.0  # maior duração já vista (s): limita quanto o bisect volta
+
+    def add(self, a: AppointmentRecord) -> None:
+        insort(self.keys, (a.start_time, a.id))
+        self.longest = max(self.longest, (a.end_time - a.start_time).total_seconds())
+
+    def discard(self, a: AppointmentRecord) -> None:
+        i = bisect_left(self.keys, (a.start_time, a.id))
+        if i < len(self.keys) and self.keys[i] == (a.start_time, a.id):
+            del self.keys[i]
+
+    def overlapping(self, start: datetime, end: datetime, rows: Dict[int, AppointmentRecord]) -> Iterator[int]:
+        """Ids que cruzam [start, end), do último início para o primeiro."""
+        i = bisect_left(self.keys, (end,))
+        for j in range(i - 1, -1, -1):
+            s, id = self.keys[j]
+            if (start - s).total_seconds() >= self.longest:
+                return
+            if rows[id].end_time > start:
+                yield id
+
+
+class MemoryStore:
+    """
+    Estado em memória + journal. Toda mutação passa por `_write` sob `lock`: aplica nos índices
+    e anexa ao journal na mesma ordem, e `_apply` é o mesmo código usado no replay.
+    """
+
+    def __init__(self, directory, fsync_interval_ms: float = 2, snapshot_every: int = 100000,
+                 fsync: bool = True):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.snapshot_every = snapshot_every
+        self.lock = threading.RLock()
+        self.users: Dict[int, UserRecord] = {}
+        self.by_email: Dict[str, int] = {}
+        self.appointments: Dict[int, AppointmentRecord] = {}
+        self.by_user: Dict[int, List[Tuple[datetime, int]]] = {}
+        self.by_resource: Dict[int, _Timeline] = {}
+        self.next_user_id = 1
+        self.next_appointment_id = 1
+        self._snapshot_seq = 0
+        self._snapshotting = False
+        self._snapshot_lock = threading.Lock()
+        seq = self._recover()
+        self.journal = Journal(self.directory / JOURNAL, seq, fsync_interval_ms / 1000, fsync)
+
+    # --- replay ---
+
+    def _recover(self) -> int:
+        seq = 0
+        path = self.directory / SNAPSHOT
+        if path.exists():
+            seq = self._restore(json.loads(path.read_text()))
+        self._snapshot_seq = seq
+        for file in _journal_files(self.directory):
+            records, good = read_journal(file)
+            for r in records:
+                if r["seq"] > seq:
+                    self._apply(r["op"], r["data"])
+                    seq = r["seq"]
+            if file.name == JOURNAL and good < file.stat().st_size:
+                # sem isso o próximo append continuaria a linha quebrada
+                os.truncate(file, good)
+        return seq
+
+    def _restore(self, snap: dict) -> int:
+        for values in snap["users"]:
+            self._apply("user.put", values)
+        for values in snap["appointments"]:
+            self._apply("appointment.put", values)
+        self.next_user_id = max(self.next_user_id, snap["next_user_id"])
+        self.next_appointment_id = max(self.next_appointment_id, snap["next_appointment_id"])
+        return snap["seq"]
+
+    def _apply(self, op: str, data) -> None:
+        if op == "user.put":
+            self._put_user(_decode(UserRecord, data))
+        elif op == "user.del":
+            self._drop_user(data)
+        elif op == "appointment.put":
+            self._put_appointment(_decode(AppointmentRecord, data))
+        elif op == "appointment.del":
+            self._drop_appointment(data)
+        else:
+            raise ValueError(f"Operação desconhecida no journal: {op}")
+
+    # --- índices ---
+
+    def _put_user(self, u: UserRecord) -> None:
+        old = self.users.get(u.id)
+        if old is not None and old.email != u.email:
+            self.by_email.pop(old.email, None)
+        self.users[u.id] = u
+        self.by_email[u.email] = u.id
+        self.next_user_id = max(self.next_user_id, u.id + 1)
+
+    def _drop_user(self, user_id: int) -> int:
+        """Remove o usuário e os agendamentos dele; retorna quantos agendamentos saíram."""
+        u = self.users.pop(user_id, None)
+        if u is not None:
+            self.by_email.pop(u.email, None)
+        owned = [id for _, id in self.by_user.get(user_id, ())]
+        for id in owned:
+            self._drop_appointment(id)
+        self.by_user.pop(user_id, None)
+        return len(owned)
+
+    def _put_appointment(self, a: AppointmentRecord) -> None:
+        old = self.appointments.get(a.id)
+        if old is not None:
+            self._unindex(old)
+        self.appointments[a.id] = a
+        insort(self.by_user.setdefault(a.user_id, []), (a.start_time, a.id))
+        if a.status != "cancelled":
+            self.by_resource.setdefault(a.resource_id, _Timeline()).add(a)
+        self.next_appointment_id = max(self.next_appointment_id, a.id + 1)
+
+    def _drop_appointment(self, id: int) -> Optional[AppointmentRecord]:
+        a = self.appointments.pop(id, None)
+        if a is not None:
+            self._unindex(a)
+        return a
+
+    def _unindex(self, a: AppointmentRecord) -> None:
+        keys = self.by_user.get(a.user_id, [])
+        i = bisect_left(keys, (a.start_time, a.id))
+        if i < len(keys) and keys[i] == (a.start_time, a.id):
+            del keys[i]
+        timeline = self.by_resource.get(a.resource_id)
+        if timeline is not None:
+            timeline.discard(a)
+
+    # --- escrita ---
+
+    def _write(self, op: str, data) -> int:
+        """Aplica e anexa ao journal; chamar com `lock`. Retorna o seq para `durable`."""
+        self._apply(op, data)
+        seq = self.journal.append(op, data)
+        if seq - self._snapshot_seq >= self.snapshot_every and not self._snapshotting:
+            self._snapshotting = True
+            threading.Thread(target=self.snapshot, name="memory-snapshot", daemon=True).start()
+        return seq
+
+    def put_user(self, u: UserRecord) -> int:
+        return self._write("user.put", _encode(u))
+
+    def put_appointment(self, a: AppointmentRecord) -> int:
+        return self._write("appointment.put", _encode(a))
+
+    def drop(self, kind: str, id: int) -> int:
+        return self._write(f"{kind}.del", id)
+
+    def durable(self, seq: int) -> None:
+        """Espera o fsync do registro `seq` (fora do lock: outras escritas entram no mesmo grupo)."""
+        self.journal.wait(seq)
+
+    # --- consultas ---
+
+    def clashes(self, resource_id: int, start: datetime, end: datetime) -> bool:
+        timeline = self.by_resource.get(resource_id)
+        return timeline is not None and next(timeline.overlapping(start, end, self.appointments), None) is not None
+
+    def on_resource(self, resource_id: int, start: datetime, end: datetime) -> List[AppointmentRecord]:
+        timeline = self.by_resource.get(resource_id)
+        if timeline is None:
+            return []
+        return [self.appointments[id] for id in reversed(list(timeline.overlapping(start, end, self.appointments)))]
+
+    def of_user(self, user_id: int, start: Optional[datetime] = None) -> Iterator[AppointmentRecord]:
+        """Agendamentos do usuário (todos os status) a partir de `start`, por início."""
+        keys = self.by_user.get(user_id, [])
+        i = bisect_left(keys, (start,)) if start else 0
+        return (self.appointments[id] for _, id in keys[i:])
+
+    # --- snapshot ---
+
+    def snapshot(self) -> int:
+        """
+        Grava o estado inteiro em snapshot.json e apaga os journals que ele cobre. Só a cópia
+        dos registros e a rotação do journal acontecem sob o lock; o JSON e o fsync, fora.
+        Um snapshot por vez: o periódico e o do close() não rotacionam o mesmo seq duas vezes.
+        """
+        with self._snapshot_lock:
+            try:
+                with self.lock:
+                    seq = self.journal.seq
+                    if seq == self._snapshot_seq:
+                        return seq
+                    state = {"seq": seq, "next_user_id": self.next_user_id,
+                             "next_appointment_id": self.next_appointment_id,
+                             "users": list(self.users.values()), "appointments": list(self.appointments.values())}
+                    self.journal.rotate()
+                state["users"] = [_encode(u) for u in state["users"]]
+                state["appointments"] = [_encode(a) for a in state["appointments"]]
+                tmp = self.directory / f"{SNAPSHOT}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump(state, f, separators=(",", ":"))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.directory / SNAPSHOT)
+                _fsync_dir(self.directory)
+                for file in _journal_files(self.directory):
+                    if file.name != JOURNAL and int(file.suffix[1:]) <= seq:
+                        file.unlink()
+                self._snapshot_seq = seq
+                logger.info("Snapshot do backend em memória gravado (seq %s)", seq)
+                return seq
+            finally:
+                self._snapshotting = False
+
+    def close(self, snapshot: bool = True) -> None:
+        """Fecha o journal; por padrão grava um snapshot antes, para o próximo startup não reaplicar nada."""
+        if snapshot:
+            self.snapshot()
+        self.journal.close()
+
+
+# ============================================================================
+# Transação SQL de quem chama
+# ============================================================================
+
+_UNDO = "memory_undo"
+
+
+def _forget(session: Session) -> None:
+    session.info[_UNDO].clear()
+
+
+def _undo(session: Session) -> None:
+    pending = session.info[_UNDO]
+    while pending:
+        pending.pop()()
+
+
+def _on_rollback(db: Optional[Session], undo: Callable[[], None]) -> None:
+    """
+    insert_if_free/mark_cancelled/remove não fecham transação: o service compõe com a fila de
+    espera dentro de uma transação SQL. Aqui a mudança já foi aplicada; se essa transação
+    voltar atrás, `undo` grava a compensação (no journal também).
+    """
+    if db is None:
+        return
+    pending = db.info.get(_UNDO)
+    if pending is None:
+        pending = db.info[_UNDO] = []
+        event.listen(db, "after_commit", _forget)
+        event.listen(db, "after_rollback", _undo)
+    pending.append(undo)
+
+
+def _duplicate_email(email: str) -> IntegrityError:
+    # mesma exceção do banco: o service e a API já tratam IntegrityError como email repetido
+    return IntegrityError("INSERT INTO users", {"email": email}, Exception("UNIQUE constraint failed: users.email"))
+
+
+# ============================================================================
+# Repositórios
+# ============================================================================
+
+class InMemoryUserRepository(UserRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    def create(self, db: Session, user: models.User) -> UserRecord:
+        store = self.store
+        with store.lock:
+            if user.email in store.by_email:
+                raise _duplicate_email(user.email)
+            created = UserRecord(store.next_user_id, user.name, user.email,
+                                 True if user.is_active is None else user.is_active)
+            seq = store.put_user(created)
+        store.durable(seq)
+        change_bus.publish("user.created", user_payload(created))
+        return created
+
+    def get(self, db: Session, user_id: int) -> Optional[UserRecord]:
+        user = self.store.users.get(user_id)
+        return user if user is not None and user.deleted_at is None else None
+
+    def get_many(self, db: Session, ids: Iterable[int]) -> List[UserRecord]:
+        return [u for u in (self.get(db, id) for id in dict.fromkeys(ids)) if u is not None]
+
+    def list(self, db: Session, skip: int = 0, limit: int = 100) -> List[UserRecord]:
+        with self.store.lock:
+            ids = sorted(self.store.users)
+            return [self.store.users[id] for id in ids[skip:skip + limit]]
+
+    def update(self, db: Session, user: models.User, fields: Optional[Iterable[str]] = None) -> UserRecord:
+        store = self.store
+        with store.lock:
+            current = store.users.get(user.id)
+            if current is None:
+                raise ValueError(f"Usuário {user.id} não existe")
+            changed = current._replace(**{f: v for f, v in assigned_values(user, fields).items()
+                                          if f in ("name", "email", "is_active")})
+            if changed.email != current.email and changed.email in store.by_email:
+                raise _duplicate_email(changed.email)
+            seq = store.put_user(changed)
+        store.durable(seq)
+        change_bus.publish("user.updated", user_payload(changed))
+        return changed
+
+    def delete(self, db: Session, user_id: int) -> List[AppointmentRecord]:
+        """
+        Remove o usuário e os agendamentos dele (devolvidos, como no SQLAlchemy); o que é dele no
+        SQLite (séries, fila...) sai junto.
+        """
+        store = self.store
+        with store.lock:
+            user = store.users.get(user_id)
+            if user is None:
+                return []
+            removed = [store.appointments[id] for _, id in store.by_user.get(user_id, ())]
+            seq = store.drop("user", user_id)
+        store.durable(seq)
+        if db is not None:
+            try:
+                delete_children(db, "user_id", user_id)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        publish_removed(removed)
+        change_bus.publish("user.deleted", {**user_payload(user), "soft": False, "appointments_removed": len(removed)})
+        return removed
+
+    def existing_emails(self, db: Session, emails: Iterable[str]) -> Set[str]:
+        by_email = self.store.by_email
+        return {e for e in emails if e in by_email}
+
+    def bulk_create(self, db: Session, rows: List[dict]) -> List[Tuple[int, str]]:
+        """Tudo ou nada, como o executemany: um email já cadastrado recusa o bloco inteiro."""
+        store = self.store
+        seq = 0
+        with store.lock:
+            for r in rows:
+                if r["email"] in store.by_email:
+                    raise _duplicate_email(r["email"])
+            created = []
+            for r in rows:
+                u = UserRecord(store.next_user_id, r["name"], r["email"], r.get("is_active", True))
+                seq = store.put_user(u)
+                created.append((u.id, u.email))
+        store.durable(seq)
+        return created
+
+
+class InMemoryAppointmentRepository(AppointmentRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    def _record(self, app: models.Appointment) -> AppointmentRecord:
+        return AppointmentRecord(self.store.next_appointment_id, app.user_id, app.resource_id,
+                                 app.start_time, app.end_time, app.status or "scheduled", app.notes)
+
+    def create(self, db: Session, app: models.Appointment) -> AppointmentRecord:
+        store = self.store
+        with store.lock:
+            created = self._record(app)
+            seq = store.put_appointment(created)
+        store.durable(seq)
+        change_bus.publish("appointment.created", appointment_payload(created))
+        return created
+
+    def _insert_if_free(self, app: models.Appointment,
+                        daily_limit: Optional[int]) -> Tuple[Optional[AppointmentRecord], int]:
+        store = self.store
+        with store.lock:
+            if store.clashes(app.resource_id, app.start_time, app.end_time):
+                return None, 0
+            if daily_limit is not None:
+                day_start = datetime.combine(app.start_time.date(), time.min)
+                day_end = day_start + timedelta(days=1)
+                same_day = sum(1 for a in takewhile(lambda a: a.start_time < day_end,
+                                                    store.of_user(app.user_id, day_start))
+                               if a.status != "cancelled")
+                if same_day >= daily_limit:
+                    return None, 0
+            created = self._record(app)
+            return created, store.put_appointment(created)
+
+    def insert_if_free(self, db: Session, app: models.Appointment,
+                       daily_limit: Optional[int] = None) -> Optional[AppointmentRecord]:
+        """Checagem (bisect no recurso) e escrita sob o mesmo lock; desfeito se a transação de `db` voltar."""
+        created, seq = self._insert_if_free(app, daily_limit)
+        if created is not None:
+            self.store.durable(seq)
+            _on_rollback(db, lambda: self.store.durable(self.store.drop("appointment", created.id)))
+        return created
+
+    def reserve(self, db: Session, app: models.Appointment,
+                daily_limit: Optional[int] = None) -> Optional[AppointmentRecord]:
+        created, seq = self._insert_if_free(app, daily_limit)
+        if created is None:
+            return None
+        self.store.durable(seq)
+        change_bus.publish("appointment.created", appointment_payload(created))
+        return created
+
+    def get(self, db: Session, id: int) -> Optional[AppointmentRecord]:
+        return self.store.appointments.get(id)
+
+    def list_by_filter(self, db: Session, user_id=None, start=None, end=None, order_by="start_time",
+                       include_archived=False, include_cancelled=False) -> List[AppointmentRecord]:
+        store = self.store
+        with store.lock:
+            if user_id:
+                rows = store.of_user(user_id, start)
+            else:
+                rows = sorted(store.appointments.values(), key=lambda a: (a.start_time, a.id))
+            hot = [a for a in rows if (include_cancelled or a.status != "cancelled")
+                   and (not start or a.start_time >= start) and (not end or a.end_time <= end)]
+        if order_by != "start_time":
+            hot.sort(key=lambda a: a.id)
+        if not include_archived or db is None:
+            return hot
+        # o arquivo continua no SQLite
+        cold = SqlAlchemyAppointmentRepository._filtered(db, models.ArchivedAppointment, user_id, start, end,
+                                                         order_by, include_cancelled)
+        if order_by == "start_time":
+            return sorted(cold + hot, key=lambda a: a.start_time)
+        return cold + hot
+
+    def list_by_resource(self, db: Session, resource_id: int, start: datetime, end: datetime) -> List[AppointmentRecord]:
+        with self.store.lock:
+            return self.store.on_resource(resource_id, start, end)
+
+    def intervals(self, db: Session, resource_ids: Iterable[int], start: datetime, end: datetime) -> IntervalStore:
+        found = IntervalStore()
+        with self.store.lock:
+            for rid in sorted(set(resource_ids)):
+                found.extend((a.id, a.resource_id, a.user_id, to_epoch_minutes(a.start_time), to_epoch_minutes(a.end_time))
+                             for a in self.store.on_resource(rid, start, end))
+        found.sort()
+        return found
+
+    def count_by_day(self, db: Session, user_id: int, start: datetime, end: datetime) -> Dict[date, int]:
+        counts: Counter = Counter()
+        with self.store.lock:
+            for a in self.store.of_user(user_id, start):
+                if a.start_time >= end:
+                    break
+                if a.status != "cancelled":
+                    counts[a.start_time.date()] += 1
+        return dict(counts)
+
+    def reserved_minutes(self, db: Session, user_id: int, after: datetime) -> int:
+        with self.store.lock:
+            return sum(int((a.end_time - a.start_time).total_seconds() / 60)
+                       for a in self.store.of_user(user_id) if a.status != "cancelled" and a.end_time > after)
+
+    def update(self, db: Session, app: models.Appointment, fields: Optional[Iterable[str]] = None) -> AppointmentRecord:
+        store = self.store
+        with store.lock:
+            current = store.appointments.get(app.id)
+            if current is None:
+                raise ValueError(f"Agendamento {app.id} não existe")
+            changed = current._replace(**{f: v for f, v in assigned_values(app, fields).items()
+                                          if f in AppointmentRecord._fields[1:]})
+            seq = store.put_appointment(changed)
+        store.durable(seq)
+        change_bus.publish("appointment.updated", appointment_payload(changed))
+        return changed
+
+    def mark_no_show(self, db: Session, id: int, now: datetime) -> Optional[AppointmentRecord]:
+        store = self.store
+        with store.lock:
+            current = store.appointments.get(id)
+            if current is None or current.status not in ("scheduled", "done") or current.start_time > now:
+                return None
+            changed = current._replace(status="no_show")
+            seq = store.put_appointment(changed)
+        store.durable(seq)
+        change_bus.publish("appointment.updated", appointment_payload(changed))
+        return changed
+
+    def mark_cancelled(self, db: Session, id: int) -> Optional[AppointmentRecord]:
+        store = self.store
+        with store.lock:
+            current = store.appointments.get(id)
+            if current is None or current.status != "scheduled":
+                return None
+            cancelled = current._replace(status="cancelled")
+            seq = store.put_appointment(cancelled)
+        store.durable(seq)
+        _on_rollback(db, lambda: store.durable(store.put_appointment(current)))
+        return cancelled
+
+    def remove(self, db: Session, id: int) -> Optional[AppointmentRecord]:
+        store = self.store
+        with store.lock:
+            current = store.appointments.get(id)
+            if current is None:
+                return None
+            seq = store.drop("appointment", id)
+        store.durable(seq)
+        _on_rollback(db, lambda: store.durable(store.put_appointment(current)))
+        return current
+
+    def delete(self, db: Session, id: int) -> None:
+        row = self.remove(None, id)
+        if row is not None:
+            change_bus.publish("appointment.deleted", appointment_payload(row))
+
+
+# ============================================================================
+# Configuração
+# ============================================================================
+
+# jobs em background que leem/escrevem a tabela appointments do SQLite: (seção, chave que liga)
+SQL_ONLY_JOBS = (("lifecycle", "enabled"), ("archive", "auto"))
+
+
+def backend() -> str:
+    return config_section("storage").get("backend", "sqlalchemy")
+
+
+def check_supported() -> None:
+    """Recusa o backend em memória com jobs ligados que só enxergam o SQLite (RuntimeError)."""
+    enabled = [f"{section}.{key}" for section, key in SQL_ONLY_JOBS if config_section(section).get(key)]
+    if enabled:
+        raise RuntimeError(f"storage.backend: memory não suporta {', '.join(enabled)} "
+                           "(trabalham na tabela appointments do SQLite); desligue na config")
+
+
+def open_store(settings: Optional[dict] = None) -> MemoryStore:
+    """MemoryStore com os parâmetros de storage.memory (diretório, janela de fsync, snapshots)."""
+    settings = settings if settings is not None else (config_section("storage").get("memory") or {})
+    return MemoryStore(settings.get("dir", "./data"), float(settings.get("fsync_interval_ms", 2)),
+                       int(settings.get("snapshot_every", 100000)), bool(settings.get("fsync", True)))
+
+
+def repositories(store: MemoryStore) -> Tuple[InMemoryUserRepository, InMemoryAppointmentRepository]:
+    return InMemoryUserRepository(store), InMemoryAppointmentRepository(store)
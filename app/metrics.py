@@ -0,0 +1,35 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Union
+
+Number = Union[int, float]
+
+class Metrics:
+    """Contadores e gauges em memória do processo, expostos em /api/metrics."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Number] = defaultdict(int)
+        self._gauges: Dict[str, Number] = {}
+
+    def incr(self, name: str, value: Number = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: Number) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def get(self, name: str) -> Number:
+        with self._lock:
+            return self._counters.get(name, self._gauges.get(name, 0))
+
+    def snapshot(self) -> Dict[str, Dict[str, Number]]:
+        with self._lock:
+            return {"counters": dict(self._counters), "gauges": dict(self._gauges)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+
+metrics = Metrics()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, Date, Time, ForeignKey, Boolean, Text, Index, LargeBinary, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .db import Base
@@ -10,6 +10,7 @@ class User(Base):
     name = Column(String, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     is_active = Column(Boolean, default=True)
+    deleted_at = Column(DateTime, nullable=True)  # exclusão lógica; o job de ciclo de vida apaga de fato
     # relacionamento
     appointments = relationship("Appointment", back_populates="user")
 
@@ -20,7 +21,8 @@ class Location(Base):
     name = Column(String, nullable=False)
     capacity = Column(Integer, default=1)
     description = Column(Text, nullable=True)
-    events = relationship("Event", back_populates="location")
+    # raise_on_sql: carregar só com selectinload explícito (ver repositories.py)
+    events = relationship("Event", back_populates="location", lazy="raise_on_sql", order_by="Event.start_time")
 
 class Resource(Base):
     """Recurso (sala, equipamento, médico etc.)"""
@@ -29,7 +31,8 @@ class Resource(Base):
     name = Column(String, nullable=False)
     resource_type = Column(String, nullable=False)
     availability = Column(Boolean, default=True)
-    appointments = relationship("Appointment", back_populates="resource")
+    appointments = relationship("Appointment", back_populates="resource", lazy="raise_on_sql",
+                                order_by="Appointment.start_time")
 
 class Appointment(Base):
     """Reserva/consulta agendada."""
@@ -39,12 +42,25 @@ class Appointment(Base):
     resource_id = Column(Integer, ForeignKey("resources.id"), nullable=False)
     start_time = Column(DateTime, nullable=False)
     end_time = Column(DateTime, nullable=False)
-    status = Column(String, default="scheduled")  # scheduled / done / cancelled
+    status = Column(String, default="scheduled")  # scheduled / done / cancelled / no_show
     notes = Column(Text, nullable=True)
 
     user = relationship("User", back_populates="appointments")
     resource = relationship("Resource", back_populates="appointments")
 
+    __table_args__ = (
+        Index("ix_appointments_status_end", "status", "end_time"),
+        # índices parciais: checagem de conflito e listagens leem só reservas vivas, por mais
+        # cancelamentos que a tabela acumule (as consultas repetem o mesmo termo, ver repositories.LIVE).
+        # Substituem ix_appointments_user_start/resource_start (ver db.RETIRED_INDEXES).
+        Index("ix_appointments_live_resource_start", "resource_id", "start_time", "end_time",
+              sqlite_where=text("status != 'cancelled'")),
+        Index("ix_appointments_live_user_start", "user_id", "start_time",
+              sqlite_where=text("status != 'cancelled'")),
+        # ids nunca voltam: o arquivo guarda o mesmo id (ver ArchivedAppointment)
+        {"sqlite_autoincrement": True},
+    )
+
 class Event(Base):
     """Eventos que podem envolver várias pessoas (ex.: workshop)."""
     __tablename__ = "events"
@@ -56,4 +72,101 @@ class Event(Base):
     capacity = Column(Integer, default=10)
     description = Column(Text, nullable=True)
 
-    location = relationship("Location", back_populates="events")
+    location = relationship("Location", back_populates="events", lazy="raise_on_sql")
+
+class AppointmentSeries(Base):
+    """Série recorrente (estilo RRULE) guardada em uma única linha; as ocorrências são expandidas sob demanda."""
+    __tablename__ = "appointment_series"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    resource_id = Column(Integer, ForeignKey("resources.id"), nullable=False)
+    start_time = Column(DateTime, nullable=False)  # início da primeira ocorrência
+    end_time = Column(DateTime, nullable=False)  # fim da última ocorrência (permite filtrar por janela)
+    duration_minutes = Column(Integer, nullable=False)
+    freq = Column(String, nullable=False)  # DAILY / WEEKLY / MONTHLY
+    interval = Column(Integer, default=1, nullable=False)
+    count = Column(Integer, nullable=True)
+    until = Column(DateTime, nullable=True)
+    status = Column(String, default="scheduled")
+    notes = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_appointment_series_resource_window", "resource_id", "start_time", "end_time"),
+        Index("ix_appointment_series_user_window", "user_id", "start_time", "end_time"),
+    )
+
+class ArchivedAppointment(Base):
+    """Agendamentos encerrados há mais que o horizonte de retenção (tabela fria, fora do caminho das reservas)."""
+    __tablename__ = "appointments_archive"
+    id = Column(Integer, primary_key=True, autoincrement=False)  # mesmo id da tabela quente
+    user_id = Column(Integer, nullable=False)
+    resource_id = Column(Integer, nullable=False)
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=False)
+    status = Column(String, default="scheduled")
+    notes = Column(Text, nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_appointments_archive_user_start", "user_id", "start_time"),
+        Index("ix_appointments_archive_start", "start_time"),
+    )
+
+class IdempotencyRecord(Base):
+    """Resposta gravada de um POST com Idempotency-Key (replay em retentativas até expirar)."""
+    __tablename__ = "idempotency_keys"
+    key = Column(String, primary_key=True)  # "<escopo>:<Idempotency-Key>"
+    fingerprint = Column(String, nullable=False)  # sha256 do payload
+    status_code = Column(Integer, nullable=False)
+    body = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_idempotency_keys_expires", "expires_at"),
+    )
+
+class ResourceSchedule(Base):
+    """Faixa de expediente semanal de um recurso (várias por dia para intervalos, ex.: almoço)."""
+    __tablename__ = "resource_schedules"
+    id = Column(Integer, primary_key=True, index=True)
+    resource_id = Column(Integer, ForeignKey("resources.id"), nullable=False)
+    weekday = Column(Integer, nullable=False)  # segunda = 0 ... domingo = 6
+    start = Column(Time, nullable=False)
+    end = Column(Time, nullable=False)
+
+    __table_args__ = (
+        Index("ix_resource_schedules_resource_weekday", "resource_id", "weekday"),
+    )
+
+class CalendarException(Base):
+    """Exceção de calendário numa data: fechado (sem horários) ou expediente especial."""
+    __tablename__ = "calendar_exceptions"
+    id = Column(Integer, primary_key=True, index=True)
+    resource_id = Column(Integer, ForeignKey("resources.id"), nullable=True)  # nulo = todos os recursos (feriado)
+    day = Column(Date, nullable=False)
+    start = Column(Time, nullable=True)
+    end = Column(Time, nullable=True)
+    description = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_calendar_exceptions_resource_day", "resource_id", "day"),
+    )
+
+class WaitlistEntry(Base):
+    """Pedido que esbarrou num horário ocupado e espera ele vagar (promovido por ordem de chegada)."""
+    __tablename__ = "waitlist"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    resource_id = Column(Integer, ForeignKey("resources.id"), nullable=False)
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=False)
+    notes = Column(Text, nullable=True)
+    requested_at = Column(DateTime, nullable=False, default=datetime.now)
+    status = Column(String, nullable=False, default="waiting")  # waiting / promoted / expired / cancelled
+    appointment_id = Column(Integer, nullable=True)  # agendamento criado na promoção
+
+    __table_args__ = (
+        Index("ix_waitlist_resource_status_requested", "resource_id", "status", "requested_at"),
+        Index("ix_waitlist_status_start", "status", "start_time"),
+    )
@@ -0,0 +1,126 @@
+"""
+Expansão preguiçosa de séries recorrentes (subconjunto de RRULE: FREQ, INTERVAL, COUNT, UNTIL)
+e varredura ordenada para detectar sobreposição entre dois fluxos de intervalos.
+"""
+import calendar
+import heapq
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, NamedTuple, Optional, Tuple
+
+Interval = Tuple[datetime, datetime]
+
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY")
+MAX_OCCURRENCES = 1000
+
+_STEP_DAYS = {"DAILY": 1, "WEEKLY": 7}
+
+
+def _add_months(dt: datetime, months: int) -> Optional[datetime]:
+    """Soma meses mantendo o dia; retorna None se o dia não existe no mês (regra do RFC 5545)."""
+    month_index = dt.month - 1 + months
+    year, month = dt.year + month_index // 12, month_index % 12 + 1
+    if dt.day > calendar.monthrange(year, month)[1]:
+        return None
+    return dt.replace(year=year, month=month)
+
+
+def iter_starts(first_start: datetime, freq: str, interval: int = 1, count: Optional[int] = None,
+                until: Optional[datetime] = None, not_before: Optional[datetime] = None) -> Iterator[datetime]:
+    """
+    Gera os inícios das ocorrências em ordem.
+    `not_before` permite pular direto para perto de uma janela (DAILY/WEEKLY calculam o índice
+    inicial em O(1); MONTHLY percorre, pois meses inválidos não contam para COUNT).
+    """
+    if freq in _STEP_DAYS:
+        step = timedelta(days=_STEP_DAYS[freq] * interval)
+        k = 0
+        if not_before is not None and not_before > first_start:
+            k = (not_before - first_start) // step
+        while count is None or k < count:
+            start = first_start + k * step
+            if until is not None and start > until:
+                return
+            yield start
+            k += 1
+    elif freq == "MONTHLY":
+        produced, k = 0, 0
+        while count is None or produced < count:
+            start = _add_months(first_start, k * interval)
+            k += 1
+            if start is None:
+                continue
+            if until is not None and start > until:
+                return
+            produced += 1
+            if not_before is None or start >= not_before:
+                yield start
+    else:
+        raise ValueError(f"Frequência não suportada: {freq}")
+
+
+def occurrences(series, window_start: Optional[datetime] = None,
+                window_end: Optional[datetime] = None) -> Iterator[Interval]:
+    """Ocorrências (início, fim) de uma série que tocam a janela [window_start, window_end)."""
+    duration = timedelta(minutes=series.duration_minutes)
+    not_before = window_start - duration if window_start is not None else None
+    for start in iter_starts(series.start_time, series.freq, series.interval or 1,
+                             series.count, series.until, not_before):
+        if window_end is not None and start >= window_end:
+            return
+        end = start + duration
+        if window_start is not None and end <= window_start:
+            continue
+        yield start, end
+
+
+def merge_occurrences(series_list: Iterable, window_start: Optional[datetime] = None,
+                      window_end: Optional[datetime] = None) -> Iterator[Tuple[datetime, datetime, object]]:
+    """Intercala as ocorrências de várias séries em uma única sequência ordenada por início."""
+    streams = [((s, e, series) for s, e in occurrences(series, window_start, window_end)) for series in series_list]
+    return heapq.merge(*streams, key=lambda item: item[0])
+
+
+class Occurrence(NamedTuple):
+    """Ocorrência de série com a forma de um agendamento; id é None (não há linha própria)."""
+    series_id: int
+    user_id: int
+    resource_id: int
+    start_time: datetime
+    end_time: datetime
+    status: str
+    notes: Optional[str]
+    id: Optional[int] = None
+
+
+def as_appointments(series_list: Iterable, window_start: Optional[datetime] = None,
+                    window_end: Optional[datetime] = None) -> Iterator[Occurrence]:
+    """
+    Ocorrências contidas em [window_start, window_end], ordenadas por início: o mesmo filtro
+    da listagem de agendamentos (começa depois de start, termina antes de end).
+    """
+    for start, end, series in merge_occurrences(series_list, window_start, window_end):
+        if window_start is not None and start < window_start:
+            continue
+        if window_end is not None and end > window_end:
+            continue
+        yield Occurrence(series.id, series.user_id, series.resource_id, start, end,
+                         series.status or "scheduled", series.notes)
+
+
+def first_overlap(candidates: Iterable[Interval], busy: Iterable[Interval]) -> Optional[Tuple[Interval, Interval]]:
+    """
+    Varredura única sobre dois fluxos ordenados por início.
+    Guarda, de cada lado, o intervalo de maior fim já visto: um intervalo novo só pode
+    sobrepor o outro lado se começar antes desse fim. O(n + m) sem materializar listas.
+    Retorna (candidato, ocupado) do primeiro conflito ou None.
+    """
+    tagged = heapq.merge(((s, e, 0) for s, e in candidates), ((s, e, 1) for s, e in busy))
+    reach = [None, None]
+    for start, end, side in tagged:
+        other = reach[1 - side]
+        if other is not None and other[1] > start:
+            current = (start, end)
+            return (current, other) if side == 0 else (other, current)
+        if reach[side] is None or end > reach[side][1]:
+            reach[side] = (start, end)
+    return None
@@ -0,0 +1,124 @@
+"""
+Relatórios agregados calculados no banco (GROUP BY), sem trafegar a tabela para o cliente.
+"""
+from collections import Counter
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from .archive import appointment_source
+from .cache import TTLCache
+from .config import config_section
+from .recurrence import as_appointments
+from .repositories import SqlAlchemySeriesRepository
+
+_cache: Optional[TTLCache] = None
+
+
+def _report_cache() -> TTLCache:
+    global _cache
+    if _cache is None:
+        _cache = TTLCache(ttl=float(config_section("reports").get("cache_ttl_seconds", 30)))
+    return _cache
+
+
+def duration_minutes(src):
+    """Duração em minutos calculada no SQLite (julianday é em dias)."""
+    return func.round((func.julianday(src.c.end_time) - func.julianday(src.c.start_time)) * 1440)
+
+
+def live_minutes(src):
+    """Minutos que ocupam agenda: cancelados não contam."""
+    return func.coalesce(func.sum(case((src.c.status != "cancelled", duration_minutes(src)), else_=0)), 0)
+
+
+def _window(stmt, src, start: Optional[datetime], end: Optional[datetime]):
+    if start is not None:
+        stmt = stmt.where(src.c.start_time >= start)
+    if end is not None:
+        stmt = stmt.where(src.c.start_time < end)
+    return stmt
+
+
+GROUPS = ("status", "resource_id", "user_id")
+
+
+def _series_totals(db: Session, start: Optional[datetime], end: Optional[datetime]):
+    """Ocorrências de séries com início na janela, somadas nos grupos do resumo: (contagens, minutos, por dia)."""
+    counts = {g: Counter() for g in GROUPS}
+    minutes = {g: Counter() for g in GROUPS}
+    days: Counter = Counter()
+    found = SqlAlchemySeriesRepository().list_overlapping(db, start=start, end=end)
+    for o in as_appointments(found, start):
+        if end is not None and o.start_time >= end:
+            break
+        for g in GROUPS:
+            counts[g][getattr(o, g)] += 1
+            minutes[g][getattr(o, g)] += int((o.end_time - o.start_time).total_seconds() // 60)
+        days[o.start_time.date().isoformat()] += 1
+    return counts, minutes, days
+
+
+def _merged(rows: List[Tuple], counts: Counter, minutes: Counter) -> List[Tuple]:
+    """Soma as ocorrências às linhas (chave, contagem, minutos) do GROUP BY."""
+    totals = {key: [n, m] for key, n, m in rows}
+    for key, n in counts.items():
+        t = totals.setdefault(key, [0, 0])
+        t[0] += n
+        t[1] += minutes[key]
+    return sorted(((key, n, m) for key, (n, m) in totals.items()), key=lambda r: (r[0] is None, r[0]))
+
+
+def build_summary(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                  include_archived: bool = False, include_series: bool = False) -> Dict[str, Any]:
+    """
+    Totais por status, por recurso, por usuário e por dia; quatro consultas agregadas.
+    include_series soma as ocorrências das séries recorrentes, expandidas na janela.
+    """
+    src = appointment_source(include_archived)
+    c = src.c
+
+    def grouped(key):
+        return db.execute(_window(
+            select(key, func.count(), live_minutes(src)).group_by(key).order_by(key), src, start, end)).all()
+
+    by_status = grouped(c.status)
+    by_resource = grouped(c.resource_id)
+    by_user = grouped(c.user_id)
+    day = func.date(c.start_time)
+    by_day = db.execute(_window(select(day, func.count()).group_by(day).order_by(day), src, start, end)).all()
+    if include_series:
+        counts, minutes, days = _series_totals(db, start, end)
+        by_status = _merged(by_status, counts["status"], minutes["status"])
+        by_resource = _merged(by_resource, counts["resource_id"], minutes["resource_id"])
+        by_user = _merged(by_user, counts["user_id"], minutes["user_id"])
+        days.update(dict(by_day))
+        by_day = sorted(days.items())
+
+    return {
+        "start": start,
+        "end": end,
+        "include_archived": include_archived,
+        "include_series": include_series,
+        "generated_at": datetime.now(),
+        "total": sum(n for _, n, _ in by_status),
+        "total_minutes": int(sum(m for _, _, m in by_status)),
+        "by_status": [{"status": s or "scheduled", "count": n, "minutes": int(m)} for s, n, m in by_status],
+        "by_resource": [{"id": r, "count": n, "minutes": int(m)} for r, n, m in by_resource],
+        "by_user": [{"id": u, "count": n, "minutes": int(m)} for u, n, m in by_user],
+        "by_day": [{"day": date.fromisoformat(d), "count": n} for d, n in by_day],
+    }
+
+
+def cached_summary(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   include_archived: bool = False, include_series: bool = False) -> Dict[str, Any]:
+    """build_summary com cache curto (reports.cache_ttl_seconds) por janela."""
+    cache = _report_cache()
+    key = ("summary", start, end, include_archived, include_series)
+    report = cache.get(key)
+    if report is None:
+        report = build_summary(db, start, end, include_archived, include_series)
+        cache.set(key, report)
+    return report
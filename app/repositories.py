@@ -1,8 +1,95 @@
+import heapq
 from abc import ABC, abstractmethod
-from typing import List, Optional
-from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from datetime import date, datetime, time, timedelta
 from . import models
-from sqlalchemy.orm import Session
+from sqlalchemy import (DateTime, Integer, String, Text, delete, exists, func, insert, lambda_stmt, literal,
+                        literal_column, select, update)
+from sqlalchemy.orm import Session, joinedload, selectinload
+from .compact import IntervalStore
+from .config import config_section
+from .db import begin_immediate
+from .events import change_bus
+
+A = models.Appointment
+S = models.AppointmentSeries
+
+# INSERT ... RETURNING montados uma vez: a instância volta preenchida (id e defaults) na
+# mesma ida ao banco, sem o refresh() depois do commit
+_INSERT_USER = insert(models.User).returning(models.User)
+_INSERT_APPOINTMENT = insert(A).returning(A)
+_INSERT_SERIES = insert(S).returning(S)
+_BULK_INSERT_USERS = (insert(models.User.__table__)
+                      .returning(models.User.id, models.User.email, sort_by_parameter_order=True))
+
+# SQLite aceita até 32766 parâmetros por instrução; blocos menores mantêm o plano com o índice de email
+IN_CHUNK_SIZE = 5000
+
+# "status != 'cancelled'" como literal, não parâmetro: é o termo que o planner do SQLite
+# precisa ver na consulta para usar os índices parciais de reservas vivas (models.Appointment)
+CANCELLED = literal_column("'cancelled'")
+LIVE = A.status != CANCELLED
+
+def _column_values(obj) -> dict:
+    """Colunas já preenchidas num objeto transiente; o que ficou None fica para os defaults."""
+    state = obj.__dict__
+    return {attr.key: state[attr.key] for attr in type(obj).__mapper__.column_attrs
+            if state.get(attr.key) is not None}
+
+def assigned_values(obj, fields: Optional[Iterable[str]] = None) -> dict:
+    """
+    Colunas a gravar num update: as de `fields` (ex.: model_dump(exclude_unset=True)) ou, sem
+    `fields`, as atribuídas no objeto transiente, inclusive None (que grava NULL).
+    """
+    state = obj.__dict__
+    columns = {attr.key for attr in type(obj).__mapper__.column_attrs}
+    keys = columns & set(state) if fields is None else columns & set(fields)
+    return {key: getattr(obj, key) for key in keys}
+
+def _update_returning(db: Session, model, obj, fields: Optional[Iterable[str]] = None):
+    """Atualiza pela chave as colunas pedidas (ver assigned_values); None se a linha não existe."""
+    values = assigned_values(obj, fields)
+    values.pop("id", None)
+    key = obj.id
+    if not values:
+        return db.get(model, key)
+    # synchronize_session=False: a própria linha do RETURNING atualiza o objeto já carregado na session
+    stmt = update(model).where(model.id == key).values(**values).returning(model)
+    return db.scalars(stmt, execution_options={"synchronize_session": False}).first()
+
+def user_payload(u: models.User) -> dict:
+    return {"id": u.id, "user_id": u.id, "name": u.name, "email": u.email, "is_active": u.is_active}
+
+def appointment_payload(a: models.Appointment) -> dict:
+    return {"id": a.id, "user_id": a.user_id, "resource_id": a.resource_id,
+            "start_time": a.start_time.isoformat(), "end_time": a.end_time.isoformat(),
+            "status": a.status, "notes": a.notes}
+
+# Tabelas filhas de users/resources. Não há FK com ON DELETE CASCADE nos bancos já criados
+# (o SQLite não altera FK de tabela existente), então a cascata é feita aqui, com um DELETE
+# por tabela: custo de uma instrução por filho, não de uma linha carregada por filho.
+CHILD_TABLES = (models.Appointment.__table__, models.AppointmentSeries.__table__, models.ArchivedAppointment.__table__,
+                models.WaitlistEntry.__table__)
+
+CALENDAR_TABLES = (models.ResourceSchedule.__table__, models.CalendarException.__table__)
+
+def delete_children(db: Session, column: str, value: int) -> list:
+    """
+    DELETE em massa das filhas com `column == value`; roda na transação de quem chama. Devolve
+    os agendamentos removidos (DELETE ... RETURNING), para os eventos e a fila de espera depois
+    do commit (ver publish_removed e AppointmentService.release_freed).
+    """
+    appointments, *others = CHILD_TABLES
+    removed = db.execute(delete(appointments).where(appointments.c[column] == value)
+                         .returning(*appointments.c)).all()
+    for t in others:
+        db.execute(delete(t).where(t.c[column] == value))
+    return removed
+
+def publish_removed(rows) -> None:
+    """Um appointment.deleted por agendamento removido em massa; só depois do commit."""
+    for row in rows:
+        change_bus.publish("appointment.deleted", appointment_payload(row))
 
 # Interface (abstração) — Repository Pattern
 class UserRepository(ABC):
@@ -11,76 +98,592 @@ class UserRepository(ABC):
     @abstractmethod
     def get(self, db: Session, user_id: int) -> Optional[models.User]: ...
     @abstractmethod
+    def get_many(self, db: Session, ids: Iterable[int]) -> List[models.User]: ...
+    @abstractmethod
     def list(self, db: Session, skip: int=0, limit: int=100) -> List[models.User]: ...
     @abstractmethod
-    def update(self, db: Session, user: models.User) -> models.User: ...
+    def update(self, db: Session, user: models.User, fields: Optional[Iterable[str]] = None) -> models.User: ...
+    @abstractmethod
+    def delete(self, db: Session, user_id: int) -> list: ...
+    @abstractmethod
+    def existing_emails(self, db: Session, emails: Iterable[str]) -> Set[str]: ...
     @abstractmethod
-    def delete(self, db: Session, user_id: int) -> None: ...
+    def bulk_create(self, db: Session, rows: List[dict]) -> List[Tuple[int, str]]: ...
 
 # Implementação concreta para SQLite (SQLAlchemy)
 class SqlAlchemyUserRepository(UserRepository):
+    # None: segue deletes.mode da config ("hard" ou "soft"), lida na hora do delete
+    soft_delete: Optional[bool] = None
+
+    def __init__(self, soft_delete: Optional[bool] = None):
+        self.soft_delete = soft_delete
+
     def create(self, db: Session, user: models.User) -> models.User:
-        db.add(user); db.commit(); db.refresh(user)
-        return user
+        created = db.scalars(_INSERT_USER, [_column_values(user)]).one()
+        payload = user_payload(created)
+        db.commit()
+        change_bus.publish("user.created", payload)
+        return created
 
     def get(self, db: Session, user_id: int) -> Optional[models.User]:
-        return db.query(models.User).filter(models.User.id == user_id).first()
+        user = db.get(models.User, user_id)
+        return user if user is not None and user.deleted_at is None else None
+
+    def get_many(self, db: Session, ids: Iterable[int]) -> List[models.User]:
+        """Um SELECT ... IN por bloco de ids, sem os removidos; a ordem não é garantida."""
+        ids = list(dict.fromkeys(ids))
+        U = models.User
+        found: List[models.User] = []
+        for i in range(0, len(ids), IN_CHUNK_SIZE):
+            found.extend(db.scalars(select(U).where(U.id.in_(ids[i:i + IN_CHUNK_SIZE]), U.deleted_at.is_(None))))
+        return found
 
     def list(self, db: Session, skip: int=0, limit: int=100):
-        return db.query(models.User).offset(skip).limit(limit).all()
+        stmt = select(models.User).where(models.User.deleted_at.is_(None)).order_by(models.User.id)
+        return db.scalars(stmt.offset(skip).limit(limit)).all()
 
-    def update(self, db: Session, user: models.User) -> models.User:
-        db.merge(user)
+    def update(self, db: Session, user: models.User, fields: Optional[Iterable[str]] = None) -> models.User:
+        """UPDATE ... RETURNING só das colunas atribuídas em `user` ou de `fields` (sem SELECT antes, como o merge fazia)."""
+        updated = _update_returning(db, models.User, user, fields)
+        if updated is None:
+            raise ValueError(f"Usuário {user.id} não existe")
+        payload = user_payload(updated)
         db.commit()
-        db.refresh(user)
-        return user
+        change_bus.publish("user.updated", payload)
+        return updated
 
-    def delete(self, db: Session, user_id: int) -> None:
-        u = db.query(models.User).filter(models.User.id == user_id).first()
-        if u:
-            db.delete(u); db.commit()
+    def delete(self, db: Session, user_id: int) -> list:
+        """
+        Remove o usuário e tudo que é dele sem carregar os filhos; devolve os agendamentos
+        removidos (para AppointmentService.release_freed promover a fila de espera).
+        Modo "soft": só marca deleted_at (um UPDATE) e o job de ciclo de vida apaga em lotes depois.
+        """
+        U = models.User
+        soft = self.soft_delete
+        if soft is None:
+            soft = config_section("deletes").get("mode", "hard") == "soft"
+        try:
+            if soft:
+                row = db.execute(update(U).where(U.id == user_id, U.deleted_at.is_(None))
+                                 .values(deleted_at=datetime.now(), is_active=False)
+                                 .returning(U.id, U.name, U.email, U.is_active)).first()
+                removed = []
+            else:
+                removed = delete_children(db, "user_id", user_id)
+                row = db.execute(delete(U).where(U.id == user_id)
+                                 .returning(U.id, U.name, U.email, U.is_active)).first()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        publish_removed(removed)
+        if row is not None:
+            change_bus.publish("user.deleted", {**user_payload(row), "soft": soft, "appointments_removed": len(removed)})
+        return removed
+
+    def existing_emails(self, db: Session, emails: Iterable[str]) -> Set[str]:
+        """Quais desses emails já estão cadastrados; IN em blocos para não estourar o limite de parâmetros."""
+        emails = list(emails)
+        found: Set[str] = set()
+        for i in range(0, len(emails), IN_CHUNK_SIZE):
+            chunk = emails[i:i + IN_CHUNK_SIZE]
+            found.update(db.scalars(select(models.User.email).where(models.User.email.in_(chunk))))
+        return found
+
+    def bulk_create(self, db: Session, rows: List[dict]) -> List[Tuple[int, str]]:
+        """
+        executemany de um bloco de usuários (dicts name/email) numa transação; devolve (id, email)
+        na ordem da entrada. Sem eventos por linha: quem chama publica um resumo.
+        """
+        if not rows:
+            return []
+        try:
+            created = db.execute(_BULK_INSERT_USERS, rows).all()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return [(r.id, r.email) for r in created]
 
 # Repositórios para Appointment, Resource, Location, Event seguem padrão semelhante:
 class AppointmentRepository(ABC):
     @abstractmethod
     def create(self, db: Session, app: models.Appointment) -> models.Appointment: ...
     @abstractmethod
+    def reserve(self, db: Session, app: models.Appointment,
+                daily_limit: Optional[int] = None) -> Optional[models.Appointment]: ...
+    @abstractmethod
     def get(self, db: Session, id: int) -> Optional[models.Appointment]: ...
     @abstractmethod
     def list_by_filter(self, db: Session, user_id: Optional[int]=None,
                        start: Optional[datetime]=None, end: Optional[datetime]=None,
-                       order_by: str = "start_time") -> List[models.Appointment]: ...
+                       order_by: str = "start_time", include_archived: bool = False,
+                       include_cancelled: bool = False) -> List[models.Appointment]: ...
+    @abstractmethod
+    def list_by_resource(self, db: Session, resource_id: int, start: datetime, end: datetime) -> List[models.Appointment]: ...
     @abstractmethod
-    def update(self, db: Session, app: models.Appointment) -> models.Appointment: ...
+    def intervals(self, db: Session, resource_ids: Iterable[int], start: datetime, end: datetime) -> IntervalStore: ...
+    @abstractmethod
+    def count_by_day(self, db: Session, user_id: int, start: datetime, end: datetime) -> Dict[date, int]: ...
+    @abstractmethod
+    def reserved_minutes(self, db: Session, user_id: int, after: datetime) -> int: ...
+    @abstractmethod
+    def update(self, db: Session, app: models.Appointment, fields: Optional[Iterable[str]] = None) -> models.Appointment: ...
     @abstractmethod
     def delete(self, db: Session, id: int) -> None: ...
+    @abstractmethod
+    def mark_no_show(self, db: Session, id: int, now: datetime) -> Optional[models.Appointment]: ...
+    # sem commit: para o service compor com a promoção da fila de espera na mesma transação
+    @abstractmethod
+    def insert_if_free(self, db: Session, app: models.Appointment,
+                       daily_limit: Optional[int] = None) -> Optional[models.Appointment]: ...
+    @abstractmethod
+    def mark_cancelled(self, db: Session, id: int) -> Optional[models.Appointment]: ...
+    @abstractmethod
+    def remove(self, db: Session, id: int): ...
 
 class SqlAlchemyAppointmentRepository(AppointmentRepository):
     def create(self, db: Session, app: models.Appointment) -> models.Appointment:
-        db.add(app); db.commit(); db.refresh(app); return app
+        created = db.scalars(_INSERT_APPOINTMENT, [_column_values(app)]).one()
+        payload = appointment_payload(created)
+        db.commit()
+        change_bus.publish("appointment.created", payload)
+        return created
+
+    def insert_if_free(self, db: Session, app: models.Appointment, daily_limit: Optional[int] = None):
+        """
+        INSERT ... SELECT ... WHERE NOT EXISTS (sobreposição no recurso), sem abrir nem fechar
+        transação: para quem já está dentro de uma (ex.: promoção da fila de espera).
+        Com `daily_limit`, o mesmo SELECT exige que o usuário tenha menos que isso de agendamentos
+        ativos começando no dia do novo. Retorna None quando o horário já foi tomado ou o limite
+        foi atingido.
+        """
+        clash = select(A.id).where(A.resource_id == app.resource_id, LIVE,
+                                   A.start_time < app.end_time,
+                                   A.end_time > app.start_time)
+        row = select(literal(app.user_id, Integer), literal(app.resource_id, Integer),
+                     literal(app.start_time, DateTime), literal(app.end_time, DateTime),
+                     literal(app.status or "scheduled", String), literal(app.notes, Text)).where(~exists(clash))
+        if daily_limit is not None:
+            day_start = datetime.combine(app.start_time.date(), time.min)
+            same_day = (select(func.count(A.id))
+                        .where(A.user_id == app.user_id, LIVE,
+                               A.start_time >= day_start, A.start_time < day_start + timedelta(days=1))
+                        .scalar_subquery())
+            row = row.where(same_day < daily_limit)
+        stmt = (insert(A)
+                .from_select([A.user_id, A.resource_id, A.start_time, A.end_time, A.status, A.notes], row)
+                .returning(A))
+        return db.scalars(stmt).first()
+
+    def reserve(self, db: Session, app: models.Appointment, daily_limit: Optional[int] = None):
+        """
+        Insere o agendamento só se não houver sobreposição no recurso (e, com `daily_limit`,
+        só se o usuário ainda couber no limite do dia).
+        Checagem e escrita são um único INSERT ... SELECT ... WHERE NOT EXISTS dentro de
+        BEGIN IMMEDIATE, então nem outro worker/processo consegue intercalar.
+        Retorna None quando o horário já foi tomado ou o limite foi atingido.
+        """
+        try:
+            begin_immediate(db)
+            created = self.insert_if_free(db, app, daily_limit)
+            if created is None:
+                db.rollback()
+                return None
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        change_bus.publish("appointment.created", appointment_payload(created))
+        return created
 
     def get(self, db: Session, id: int):
-        return db.query(models.Appointment).filter(models.Appointment.id == id).first()
+        return db.get(A, id)
+
+    def list_by_filter(self, db: Session, user_id=None, start=None, end=None, order_by="start_time",
+                       include_archived=False, include_cancelled=False):
+        hot = self._filtered(db, A, user_id, start, end, order_by, include_cancelled)
+        if not include_archived:
+            return hot
+        cold = self._filtered(db, models.ArchivedAppointment, user_id, start, end, order_by, include_cancelled)
+        if order_by == "start_time":
+            return list(heapq.merge(cold, hot, key=lambda a: a.start_time))
+        return cold + hot
 
-    def list_by_filter(self, db: Session, user_id=None, start=None, end=None, order_by="start_time"):
-        q = db.query(models.Appointment)
+    @staticmethod
+    def _filtered(db: Session, model, user_id, start, end, order_by, include_cancelled=False):
+        # lambda_stmt: cada combinação de filtros vira uma entrada no cache de compilação,
+        # e os valores entram só como parâmetros
+        stmt = lambda_stmt(lambda: select(model))
+        if not include_cancelled:
+            stmt += lambda s: s.where(model.status != CANCELLED)
         if user_id:
-            q = q.filter(models.Appointment.user_id == user_id)
+            stmt += lambda s: s.where(model.user_id == user_id)
         if start:
-            q = q.filter(models.Appointment.start_time >= start)
+            stmt += lambda s: s.where(model.start_time >= start)
         if end:
-            q = q.filter(models.Appointment.end_time <= end)
+            stmt += lambda s: s.where(model.end_time <= end)
         if order_by == "start_time":
-            q = q.order_by(models.Appointment.start_time)
-        return q.all()
+            stmt += lambda s: s.order_by(model.start_time)
+        return db.scalars(stmt).all()
+
+    def list_by_resource(self, db: Session, resource_id: int, start: datetime, end: datetime):
+        """Agendamentos não cancelados do recurso que cruzam [start, end), ordenados por início."""
+        stmt = lambda_stmt(lambda: select(A)
+                           .where(A.resource_id == resource_id, LIVE, A.start_time < end, A.end_time > start)
+                           .order_by(A.start_time))
+        return db.scalars(stmt).all()
+
+    def intervals(self, db: Session, resource_ids: Iterable[int], start: datetime, end: datetime) -> IntervalStore:
+        """Ocupação (não cancelados) de vários recursos em [start, end): um select Core, sem hidratar ORM."""
+        return IntervalStore.from_db(db, start, end, resource_ids=resource_ids)
+
+    def count_by_day(self, db: Session, user_id: int, start: datetime, end: datetime):
+        """Quantidade de agendamentos não cancelados do usuário por dia dentro da janela (GROUP BY no banco)."""
+        stmt = lambda_stmt(lambda: select(func.date(A.start_time), func.count(A.id))
+                           .where(A.user_id == user_id, LIVE, A.start_time >= start, A.start_time < end)
+                           .group_by(func.date(A.start_time)))
+        return {date.fromisoformat(d): n for d, n in db.execute(stmt)}
+
+    def reserved_minutes(self, db: Session, user_id: int, after: datetime) -> int:
+        """Minutos somados dos agendamentos não cancelados do usuário que terminam depois de `after` (SUM no banco)."""
+        minutes = func.round((func.julianday(A.end_time) - func.julianday(A.start_time)) * 1440)
+        return int(db.scalar(select(func.coalesce(func.sum(minutes), 0))
+                             .where(A.user_id == user_id, LIVE, A.end_time > after)))
+
+    def update(self, db: Session, app: models.Appointment, fields: Optional[Iterable[str]] = None):
+        """UPDATE ... RETURNING só das colunas atribuídas em `app` ou de `fields` (sem SELECT antes, como o merge fazia)."""
+        updated = _update_returning(db, A, app, fields)
+        if updated is None:
+            raise ValueError(f"Agendamento {app.id} não existe")
+        payload = appointment_payload(updated)
+        db.commit()
+        change_bus.publish("appointment.updated", payload)
+        return updated
+
+    def mark_no_show(self, db: Session, id: int, now: datetime):
+        """UPDATE status='no_show' (de 'scheduled' ou 'done', se já começou em `now`) ... RETURNING; None se não mudou."""
+        row = db.scalars(update(A).where(A.id == id, A.status.in_(("scheduled", "done")), A.start_time <= now)
+                         .values(status="no_show").returning(A)
+                         .execution_options(synchronize_session=False)).first()
+        payload = appointment_payload(row) if row is not None else None
+        db.commit()
+        if payload is not None:
+            change_bus.publish("appointment.updated", payload)
+        return row
+
+    def mark_cancelled(self, db: Session, id: int):
+        """UPDATE status='cancelled' (só de 'scheduled') ... RETURNING, sem commit; None se não mudou."""
+        return db.scalars(update(A).where(A.id == id, A.status == "scheduled")
+                          .values(status="cancelled").returning(A)).first()
+
+    def remove(self, db: Session, id: int):
+        """DELETE ... RETURNING da linha, sem commit (quem chama fecha a transação)."""
+        return db.execute(delete(A).where(A.id == id).returning(*A.__table__.c)).first()
+
+    def delete(self, db: Session, id: int):
+        # DELETE ... RETURNING: o payload do evento sai da própria instrução, sem SELECT antes
+        row = self.remove(db, id)
+        db.commit()
+        if row is not None:
+            change_bus.publish("appointment.deleted", appointment_payload(row))
+
+class SeriesRepository(ABC):
+    @abstractmethod
+    def create(self, db: Session, series: models.AppointmentSeries) -> models.AppointmentSeries: ...
+    @abstractmethod
+    def get(self, db: Session, id: int) -> Optional[models.AppointmentSeries]: ...
+    @abstractmethod
+    def list_overlapping(self, db: Session, start: Optional[datetime]=None, end: Optional[datetime]=None,
+                         resource_id: Optional[int]=None, user_id: Optional[int]=None) -> List[models.AppointmentSeries]: ...
+    @abstractmethod
+    def delete(self, db: Session, id: int) -> None: ...
+
+class SqlAlchemySeriesRepository(SeriesRepository):
+    def create(self, db: Session, series: models.AppointmentSeries) -> models.AppointmentSeries:
+        created = db.scalars(_INSERT_SERIES, [_column_values(series)]).one()
+        db.commit()
+        return created
+
+    def get(self, db: Session, id: int):
+        return db.get(S, id)
 
-    def update(self, db: Session, app: models.Appointment):
-        db.merge(app); db.commit(); db.refresh(app); return app
+    def list_overlapping(self, db: Session, start=None, end=None, resource_id=None, user_id=None):
+        """Séries cuja faixa [primeira ocorrência, fim da última] cruza a janela pedida."""
+        stmt = lambda_stmt(lambda: select(S).where(S.status != "cancelled"))
+        if resource_id:
+            stmt += lambda s: s.where(S.resource_id == resource_id)
+        if user_id:
+            stmt += lambda s: s.where(S.user_id == user_id)
+        if start:
+            stmt += lambda s: s.where(S.end_time > start)
+        if end:
+            stmt += lambda s: s.where(S.start_time < end)
+        stmt += lambda s: s.order_by(S.start_time)
+        return db.scalars(stmt).all()
 
     def delete(self, db: Session, id: int):
-        a = db.query(models.Appointment).filter(models.Appointment.id == id).first()
-        if a:
-            db.delete(a); db.commit()
+        db.execute(delete(S).where(S.id == id))
+        db.commit()
+
+# Resource, Location e Event: mesmo contrato de CRUD + get_many. Os relacionamentos dessas
+# entidades são lazy="raise_on_sql", então quem precisa dos filhos passa `options` explícitas
+# (selectinload para coleções, joinedload para muitos-para-um) e nunca cai em N+1 por acidente.
+class EntityRepository(ABC):
+    @abstractmethod
+    def create(self, db: Session, values: dict): ...
+    @abstractmethod
+    def get(self, db: Session, id: int, options: Sequence = ()): ...
+    @abstractmethod
+    def get_many(self, db: Session, ids: Iterable[int], options: Sequence = ()) -> List: ...
+    @abstractmethod
+    def list(self, db: Session, skip: int = 0, limit: int = 100, options: Sequence = ()) -> List: ...
+    @abstractmethod
+    def update(self, db: Session, id: int, values: dict): ...
+    @abstractmethod
+    def delete(self, db: Session, id: int) -> bool: ...
+
+class SqlAlchemyEntityRepository(EntityRepository):
+    model = None
+
+    def create(self, db: Session, values: dict):
+        created = db.scalars(insert(self.model).returning(self.model), [values]).one()
+        db.commit()
+        return created
+
+    def get(self, db: Session, id: int, options: Sequence = ()):
+        if not options:
+            return db.get(self.model, id)
+        return db.scalars(select(self.model).where(self.model.id == id).options(*options)).first()
+
+    def get_many(self, db: Session, ids: Iterable[int], options: Sequence = ()) -> List:
+        """Um SELECT ... IN por bloco de ids; devolve na ordem pedida, sem os inexistentes."""
+        ids = list(dict.fromkeys(ids))
+        found = {}
+        for i in range(0, len(ids), IN_CHUNK_SIZE):
+            chunk = ids[i:i + IN_CHUNK_SIZE]
+            found.update((o.id, o) for o in db.scalars(select(self.model).where(self.model.id.in_(chunk)).options(*options)))
+        return [found[i] for i in ids if i in found]
+
+    def list(self, db: Session, skip: int = 0, limit: int = 100, options: Sequence = ()) -> List:
+        stmt = select(self.model).order_by(self.model.id).offset(skip).limit(limit).options(*options)
+        return db.scalars(stmt).all()
+
+    def update(self, db: Session, id: int, values: dict):
+        updated = db.scalars(update(self.model).where(self.model.id == id).values(**values)
+                             .returning(self.model)).first()
+        db.commit()
+        return updated
+
+    def delete(self, db: Session, id: int) -> bool:
+        deleted = db.execute(delete(self.model).where(self.model.id == id).returning(self.model.id)).first()
+        db.commit()
+        return deleted is not None
+
+class ResourceRepository(EntityRepository):
+    @abstractmethod
+    def list_with_upcoming(self, db: Session, since: datetime, until: Optional[datetime] = None,
+                           skip: int = 0, limit: int = 100) -> List[models.Resource]: ...
+    @abstractmethod
+    def ids_by_type(self, db: Session, types: Iterable[str]) -> Dict[str, List[int]]: ...
+
+class SqlAlchemyResourceRepository(SqlAlchemyEntityRepository, ResourceRepository):
+    model = models.Resource
+
+    @staticmethod
+    def upcoming(since: datetime, until: Optional[datetime] = None):
+        """Opção de carga: só os agendamentos vivos do recurso que terminam depois de `since` (e começam antes de `until`)."""
+        criteria = LIVE & (A.end_time > since)
+        if until is not None:
+            criteria = criteria & (A.start_time < until)
+        return selectinload(models.Resource.appointments.and_(criteria))
+
+    def list_with_upcoming(self, db: Session, since, until=None, skip=0, limit=100):
+        """Página de recursos com os próximos agendamentos: 2 consultas, qualquer que seja o tamanho da página."""
+        return self.list(db, skip, limit, options=[self.upcoming(since, until)])
+
+    def ids_by_type(self, db: Session, types: Iterable[str]) -> Dict[str, List[int]]:
+        """Ids dos recursos disponíveis (availability) de cada tipo pedido, numa consulta."""
+        R = self.model
+        found: Dict[str, List[int]] = {}
+        stmt = (select(R.resource_type, R.id).where(R.resource_type.in_(list(types)), R.availability.is_not(False))
+                .order_by(R.id))
+        for kind, id in db.execute(stmt):
+            found.setdefault(kind, []).append(id)
+        return found
+
+    def delete(self, db: Session, id: int) -> bool:
+        """Recurso e seus agendamentos/séries (inclusive arquivados) numa transação, em DELETEs por conjunto."""
+        try:
+            removed = delete_children(db, "resource_id", id)
+            for t in CALENDAR_TABLES:
+                db.execute(delete(t).where(t.c.resource_id == id))
+            deleted = db.execute(delete(self.model).where(self.model.id == id).returning(self.model.id)).first()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        publish_removed(removed)
+        if deleted is not None:
+            change_bus.publish("calendar.changed", {"resource_id": id, "deleted": True})
+        return deleted is not None
+
+class LocationRepository(EntityRepository):
+    pass
+
+class SqlAlchemyLocationRepository(SqlAlchemyEntityRepository, LocationRepository):
+    model = models.Location
+
+    # propriedade e não atributo de classe: montar a opção configura os mappers, o que não
+    # precisa acontecer no import
+    @property
+    def WITH_EVENTS(self):
+        return selectinload(models.Location.events)
+
+class EventRepository(EntityRepository):
+    @abstractmethod
+    def list_by_location(self, db: Session, location_id: int, options: Sequence = ()) -> List[models.Event]: ...
+
+class SqlAlchemyEventRepository(SqlAlchemyEntityRepository, EventRepository):
+    model = models.Event
+
+    @property
+    def WITH_LOCATION(self):
+        return joinedload(models.Event.location)
+
+    def list_by_location(self, db: Session, location_id: int, options: Sequence = ()):
+        stmt = (select(models.Event).where(models.Event.location_id == location_id)
+                .order_by(models.Event.start_time).options(*options))
+        return db.scalars(stmt).all()
+
+# Calendários: toda escrita publica "calendar.changed" com o resource_id afetado (None = todos),
+# que é o que invalida os calendários compilados em cache (ver calendars.py).
+CS = models.ResourceSchedule
+CE = models.CalendarException
+
+class CalendarRepository(ABC):
+    @abstractmethod
+    def schedule(self, db: Session, resource_id: int) -> List[models.ResourceSchedule]: ...
+    @abstractmethod
+    def replace_schedule(self, db: Session, resource_id: int, slots: List[dict]) -> List[models.ResourceSchedule]: ...
+    @abstractmethod
+    def exceptions(self, db: Session, resource_id: Optional[int] = None, start: Optional[date] = None,
+                   end: Optional[date] = None, include_global: bool = True) -> List[models.CalendarException]: ...
+    @abstractmethod
+    def add_exception(self, db: Session, values: dict) -> models.CalendarException: ...
+    @abstractmethod
+    def delete_exception(self, db: Session, id: int) -> bool: ...
+
+class SqlAlchemyCalendarRepository(CalendarRepository):
+    def schedule(self, db: Session, resource_id: int):
+        stmt = lambda_stmt(lambda: select(CS).where(CS.resource_id == resource_id).order_by(CS.weekday, CS.start))
+        return db.scalars(stmt).all()
+
+    def replace_schedule(self, db: Session, resource_id: int, slots: List[dict]):
+        """Troca a grade semanal inteira do recurso numa transação (lista vazia = volta ao expediente global)."""
+        try:
+            db.execute(delete(CS).where(CS.resource_id == resource_id))
+            created = (db.scalars(insert(CS).returning(CS, sort_by_parameter_order=True),
+                                  [{**slot, "resource_id": resource_id} for slot in slots]).all()
+                       if slots else [])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        change_bus.publish("calendar.changed", {"resource_id": resource_id})
+        return sorted(created, key=lambda c: (c.weekday, c.start))
+
+    def exceptions(self, db: Session, resource_id=None, start=None, end=None, include_global=True):
+        """Exceções do recurso (e as globais, com include_global) no intervalo de datas [start, end]."""
+        stmt = lambda_stmt(lambda: select(CE))
+        if resource_id is not None and include_global:
+            stmt += lambda s: s.where((CE.resource_id == resource_id) | CE.resource_id.is_(None))
+        elif resource_id is not None:
+            stmt += lambda s: s.where(CE.resource_id == resource_id)
+        if start is not None:
+            stmt += lambda s: s.where(CE.day >= start)
+        if end is not None:
+            stmt += lambda s: s.where(CE.day <= end)
+        stmt += lambda s: s.order_by(CE.day, CE.start)
+        return db.scalars(stmt).all()
+
+    def add_exception(self, db: Session, values: dict):
+        created = db.scalars(insert(CE).returning(CE), [values]).one()
+        db.commit()
+        change_bus.publish("calendar.changed", {"resource_id": created.resource_id})
+        return created
+
+    def delete_exception(self, db: Session, id: int) -> bool:
+        row = db.execute(delete(CE).where(CE.id == id).returning(CE.resource_id)).first()
+        db.commit()
+        if row is not None:
+            change_bus.publish("calendar.changed", {"resource_id": row.resource_id})
+        return row is not None
+
+# Fila de espera: as escritas não fazem commit, porque a promoção precisa acontecer na mesma
+# transação que libera o horário (ver AppointmentService.delete_appointment).
+W = models.WaitlistEntry
+
+class WaitlistRepository(ABC):
+    @abstractmethod
+    def add(self, db: Session, values: dict) -> models.WaitlistEntry: ...
+    @abstractmethod
+    def get(self, db: Session, id: int) -> Optional[models.WaitlistEntry]: ...
+    @abstractmethod
+    def waiting(self, db: Session, resource_id: int) -> List[models.WaitlistEntry]: ...
+    @abstractmethod
+    def still_waiting(self, db: Session, ids: Iterable[int]) -> Set[int]: ...
+    @abstractmethod
+    def promote(self, db: Session, id: int, appointment_id: int) -> Optional[models.WaitlistEntry]: ...
+    @abstractmethod
+    def cancel(self, db: Session, id: int) -> Optional[models.WaitlistEntry]: ...
+    @abstractmethod
+    def list(self, db: Session, resource_id: Optional[int] = None, user_id: Optional[int] = None,
+             status: Optional[str] = None, limit: int = 100) -> List[models.WaitlistEntry]: ...
+    @abstractmethod
+    def expire(self, db: Session, now: datetime) -> int: ...
+
+class SqlAlchemyWaitlistRepository(WaitlistRepository):
+    def add(self, db: Session, values: dict):
+        return db.scalars(insert(W).returning(W), [values]).one()
+
+    def get(self, db: Session, id: int):
+        return db.get(W, id)
+
+    def waiting(self, db: Session, resource_id: int):
+        """Pedidos em espera do recurso, por ordem de chegada (índice resource/status/requested_at)."""
+        stmt = lambda_stmt(lambda: select(W).where(W.resource_id == resource_id, W.status == "waiting")
+                           .order_by(W.requested_at, W.id))
+        return db.scalars(stmt).all()
+
+    def still_waiting(self, db: Session, ids: Iterable[int]) -> Set[int]:
+        ids = list(ids)
+        found: Set[int] = set()
+        for i in range(0, len(ids), IN_CHUNK_SIZE):
+            chunk = ids[i:i + IN_CHUNK_SIZE]
+            found.update(db.scalars(select(W.id).where(W.id.in_(chunk), W.status == "waiting")))
+        return found
+
+    def promote(self, db: Session, id: int, appointment_id: int):
+        return db.scalars(update(W).where(W.id == id, W.status == "waiting")
+                          .values(status="promoted", appointment_id=appointment_id).returning(W)).first()
+
+    def cancel(self, db: Session, id: int):
+        return db.scalars(update(W).where(W.id == id, W.status == "waiting")
+                          .values(status="cancelled").returning(W)).first()
+
+    def list(self, db: Session, resource_id=None, user_id=None, status=None, limit=100):
+        stmt = lambda_stmt(lambda: select(W))
+        if resource_id is not None:
+            stmt += lambda s: s.where(W.resource_id == resource_id)
+        if user_id is not None:
+            stmt += lambda s: s.where(W.user_id == user_id)
+        if status is not None:
+            stmt += lambda s: s.where(W.status == status)
+        stmt += lambda s: s.order_by(W.requested_at, W.id).limit(limit)
+        return db.scalars(stmt).all()
 
-# Você pode implementar ResourceRepository, LocationRepository, EventRepository do mesmo jeito.
-# Para manter o exemplo enxuto, só incluí os dois acima — no projeto real copie o padrão para todas as entidades.
+    def expire(self, db: Session, now: datetime) -> int:
+        """Pedidos cujo horário já começou saem da fila (job de ciclo de vida)."""
+        return db.execute(update(W).where(W.status == "waiting", W.start_time <= now)
+                          .values(status="expired").execution_options(synchronize_session=False)).rowcount
@@ -0,0 +1,127 @@
+"""
+Alocação em lote de pedidos flexíveis ("qualquer sala do tipo X, terça de manhã, 60 min").
+
+Cada recurso candidato vira uma lista ordenada de janelas livres (expediente do calendário menos
+o que já está ocupado). Os pedidos são varridos por início da janela (sweep line); para cada
+tipo de recurso há um min-heap (livre a partir de, id) dos recursos. O topo do heap é um limite
+inferior do horário mais cedo possível em cada recurso, então a busca para assim que o topo não
+pode mais bater o melhor encaixe achado, e em geral só um ou dois recursos são examinados por
+pedido. Cada pedido fica com o início mais cedo que cabe na sua janela; empate vai para o menor id.
+O limite diário do usuário é contado junto com o que o próprio lote já alocou.
+
+Só o algoritmo mora aqui (sem banco); montar as janelas e gravar é com
+AppointmentService.assign_batch.
+"""
+import heapq
+from bisect import bisect_right
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+Interval = Tuple[datetime, datetime]
+
+
+class FlexibleRequest(NamedTuple):
+    """Pedido do lote: o agendamento precisa começar e terminar dentro de [earliest, latest]."""
+    index: int
+    user_id: int
+    resource_type: str
+    earliest: datetime
+    latest: datetime
+    duration: timedelta
+    notes: Optional[str] = None
+
+
+class Assignment(NamedTuple):
+    index: int
+    user_id: int
+    resource_id: int
+    start_time: datetime
+    end_time: datetime
+    notes: Optional[str] = None
+
+
+class ResourceGaps:
+    """Janelas livres (disjuntas, ordenadas) de um recurso, consumidas conforme o lote é alocado."""
+    __slots__ = ("id", "starts", "ends")
+
+    def __init__(self, resource_id: int, free: Iterable[Interval]):
+        self.id = resource_id
+        self.starts: List[datetime] = []
+        self.ends: List[datetime] = []
+        for s, e in free:
+            self.starts.append(s)
+            self.ends.append(e)
+
+    def free_at(self, after: datetime) -> datetime:
+        """Limite inferior do início de qualquer encaixe a partir de `after` (datetime.max se não há mais nada)."""
+        i = bisect_right(self.ends, after)
+        return max(after, self.starts[i]) if i < len(self.starts) else datetime.max
+
+    def fit(self, r: FlexibleRequest, full_days: set) -> Optional[datetime]:
+        """Início mais cedo em que `r` cabe neste recurso, pulando dias em que o usuário já está no limite."""
+        last_start = r.latest - r.duration
+        for i in range(bisect_right(self.ends, r.earliest), len(self.starts)):
+            start = max(self.starts[i], r.earliest)
+            if start > last_start:
+                return None
+            if self.ends[i] - start >= r.duration and start.date() not in full_days:
+                return start
+        return None
+
+    def take(self, start: datetime, end: datetime) -> None:
+        """Tira [start, end) da janela que o contém (partindo-a em até duas)."""
+        i = bisect_right(self.starts, start) - 1
+        s, e = self.starts[i], self.ends[i]
+        pieces = [(a, b) for a, b in ((s, start), (end, e)) if b > a]
+        self.starts[i:i + 1] = [a for a, _ in pieces]
+        self.ends[i:i + 1] = [b for _, b in pieces]
+
+
+def assign(requests: Iterable[FlexibleRequest], pools: Dict[str, List[ResourceGaps]],
+           per_day: Counter, daily_limit: int) -> Tuple[List[Assignment], Dict[int, str]]:
+    """
+    Aloca os pedidos; devolve as alocações e, por índice, o motivo de cada pedido que ficou de fora.
+    `per_day[(user_id, dia)]` traz o que o usuário já tem em cada dia e é atualizado aqui.
+    """
+    heaps: Dict[str, list] = {}
+    for kind, gaps in pools.items():
+        heaps[kind] = [(g.free_at(datetime.min), g.id, g) for g in gaps]
+        heapq.heapify(heaps[kind])
+
+    assigned: List[Assignment] = []
+    failed: Dict[int, str] = {}
+    for r in sorted(requests, key=lambda r: (r.earliest, r.latest, r.index)):
+        heap = heaps.get(r.resource_type)
+        if not heap:
+            failed[r.index] = f"Nenhum recurso disponível do tipo '{r.resource_type}'"
+            continue
+        days = {d for d in _days(r.earliest, r.latest) if per_day[(r.user_id, d)] >= daily_limit}
+        bound = r.latest - r.duration
+        best: Optional[Tuple[datetime, int, ResourceGaps]] = None
+        popped = []
+        while heap and heap[0][0] <= bound and (best is None or heap[0][:2] < best[:2]):
+            _, _, gaps = heapq.heappop(heap)
+            popped.append(gaps)
+            start = gaps.fit(r, days)
+            if start is not None and (best is None or (start, gaps.id) < best[:2]):
+                best = (start, gaps.id, gaps)
+        if best is not None:
+            start, _, gaps = best
+            end = start + r.duration
+            gaps.take(start, end)
+            per_day[(r.user_id, start.date())] += 1
+            assigned.append(Assignment(r.index, r.user_id, gaps.id, start, end, r.notes))
+        elif days and len(days) == len(_days(r.earliest, r.latest)):
+            failed[r.index] = f"Usuário atingiu limite diário de {daily_limit} agendamentos"
+        else:
+            failed[r.index] = "Sem horário livre na janela pedida"
+        # o sweep só avança: o que terminou antes deste pedido não serve para os próximos
+        for gaps in popped:
+            heapq.heappush(heap, (gaps.free_at(r.earliest), gaps.id, gaps))
+    return assigned, failed
+
+
+def _days(start: datetime, end: datetime) -> List[date]:
+    last = (end - timedelta(microseconds=1)).date()
+    return [start.date() + timedelta(days=i) for i in range((last - start.date()).days + 1)]
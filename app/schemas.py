@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, field_validator, model_validator
-from datetime import datetime, time
-from typing import Optional
+from datetime import date, datetime, time
+from typing import List, Optional
 
 class UserCreate(BaseModel):
     name: str
@@ -13,13 +13,33 @@ class UserRead(UserCreate):
     class Config:
         from_attributes = True
 
+class UserBulkItem(BaseModel):
+    # email sem EmailStr: linha inválida vira resultado "invalid" em vez de derrubar o lote inteiro
+    name: str
+    email: str
+
+class UserBulkCreate(BaseModel):
+    users: List[UserBulkItem]
+
+class UserBulkResult(BaseModel):
+    index: int
+    email: str
+    status: str  # created / exists / duplicate / invalid
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+class UserBulkResponse(BaseModel):
+    created: int
+    skipped: int
+    results: List[UserBulkResult]
+
 class LocationCreate(BaseModel):
     name: str
     capacity: int
+    description: Optional[str] = None
 
 class LocationRead(LocationCreate):
     id: int
-    description: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -27,6 +47,7 @@ class LocationRead(LocationCreate):
 class ResourceCreate(BaseModel):
     name: str
     resource_type: str
+    availability: bool = True
 
 class ResourceRead(ResourceCreate):
     id: int
@@ -67,12 +88,32 @@ class AppointmentRead(BaseModel):
     class Config:
         from_attributes = True
 
+class AppointmentListItem(AppointmentRead):
+    """Linha da listagem: agendamento, ou ocorrência de série (id None, series_id preenchido)."""
+    id: Optional[int]
+    series_id: Optional[int] = None
+
+class WaitlistEntryRead(BaseModel):
+    id: int
+    user_id: int
+    resource_id: int
+    start_time: datetime
+    end_time: datetime
+    notes: Optional[str]
+    requested_at: datetime
+    status: str  # waiting / promoted / expired / cancelled
+    appointment_id: Optional[int]
+
+    class Config:
+        from_attributes = True
+
 class EventCreate(BaseModel):
     title: str
     location_id: int
     start_time: datetime
     end_time: datetime
     capacity: int
+    description: Optional[str] = None
 
     @model_validator(mode="after")
     def end_after_start(self):
@@ -82,7 +123,207 @@ class EventCreate(BaseModel):
 
 class EventRead(EventCreate):
     id: int
-    description: Optional[str]
 
     class Config:
         from_attributes = True
+
+class ResourceWithAppointments(ResourceRead):
+    appointments: List[AppointmentRead]
+
+class LocationWithEvents(LocationRead):
+    events: List[EventRead]
+
+class EventWithLocation(EventRead):
+    location: Optional[LocationRead] = None
+
+class ScheduleSlot(BaseModel):
+    weekday: int  # segunda = 0 ... domingo = 6
+    start: time
+    end: time
+
+    @field_validator("weekday")
+    @classmethod
+    def weekday_range(cls, v: int) -> int:
+        if not 0 <= v <= 6:
+            raise ValueError("weekday deve estar entre 0 (segunda) e 6 (domingo)")
+        return v
+
+    @model_validator(mode="after")
+    def end_after_start(self):
+        if self.end <= self.start:
+            raise ValueError("end deve ser depois do start")
+        return self
+
+class ScheduleSlotRead(ScheduleSlot):
+    id: int
+    resource_id: int
+
+    class Config:
+        from_attributes = True
+
+class CalendarExceptionCreate(BaseModel):
+    day: date
+    resource_id: Optional[int] = None  # nulo = todos os recursos (feriado)
+    start: Optional[time] = None  # sem horários = fechado o dia todo
+    end: Optional[time] = None
+    description: Optional[str] = None
+
+    @model_validator(mode="after")
+    def hours_pair(self):
+        if (self.start is None) != (self.end is None):
+            raise ValueError("informe start e end juntos (ou nenhum, para fechar o dia)")
+        if self.start is not None and self.end <= self.start:
+            raise ValueError("end deve ser depois do start")
+        return self
+
+class CalendarExceptionRead(CalendarExceptionCreate):
+    id: int
+
+    class Config:
+        from_attributes = True
+
+class FreeSlot(BaseModel):
+    start_time: datetime
+    end_time: datetime
+
+class FlexibleAppointmentRequest(BaseModel):
+    """Pedido flexível: qualquer recurso do tipo, começando e terminando dentro de [earliest, latest]."""
+    user_id: int
+    resource_type: str
+    earliest: datetime
+    latest: datetime
+    duration_minutes: int
+    notes: Optional[str] = None
+
+    @field_validator("duration_minutes")
+    @classmethod
+    def duration_positive(cls, v: int) -> int:
+        if v <= 0:
+            raise ValueError("duration_minutes deve ser positivo")
+        return v
+
+    @model_validator(mode="after")
+    def window_fits_duration(self):
+        if (self.latest - self.earliest).total_seconds() < self.duration_minutes * 60:
+            raise ValueError("janela [earliest, latest] menor que a duração")
+        return self
+
+class BatchAssignRequest(BaseModel):
+    requests: List[FlexibleAppointmentRequest]
+    dry_run: bool = False  # só calcula a alocação, sem gravar
+
+class BatchAssignResult(BaseModel):
+    index: int
+    status: str  # assigned / unassigned
+    resource_id: Optional[int] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    appointment_id: Optional[int] = None
+    detail: Optional[str] = None
+
+class BatchAssignResponse(BaseModel):
+    assigned: int
+    unassigned: int
+    results: List[BatchAssignResult]
+
+class SeriesCreate(BaseModel):
+    user_id: int
+    resource_id: int
+    start_time: datetime
+    duration_minutes: int
+    freq: str = "WEEKLY"
+    interval: int = 1
+    count: Optional[int] = None
+    until: Optional[datetime] = None
+    notes: Optional[str] = None
+
+    @field_validator("duration_minutes", "interval")
+    @classmethod
+    def must_be_positive(cls, v: int) -> int:
+        if v <= 0:
+            raise ValueError("deve ser positivo")
+        return v
+
+    @field_validator("count")
+    @classmethod
+    def count_positive(cls, v: Optional[int]) -> Optional[int]:
+        if v is not None and v <= 0:
+            raise ValueError("count deve ser positivo")
+        return v
+
+    @model_validator(mode="after")
+    def bounded_and_future(self):
+        if self.count is None and self.until is None:
+            raise ValueError("informe count ou until")
+        if self.start_time <= datetime.now():
+            raise ValueError("start_time deve ser no futuro")
+        return self
+
+class SeriesRead(BaseModel):
+    id: int
+    user_id: int
+    resource_id: int
+    start_time: datetime
+    end_time: datetime
+    duration_minutes: int
+    freq: str
+    interval: int
+    count: Optional[int]
+    until: Optional[datetime]
+    status: str
+    notes: Optional[str]
+
+    class Config:
+        from_attributes = True
+
+class OccurrenceRead(BaseModel):
+    series_id: int
+    user_id: int
+    resource_id: int
+    start_time: datetime
+    end_time: datetime
+
+class StatusCount(BaseModel):
+    status: str
+    count: int
+    minutes: int
+
+class GroupCount(BaseModel):
+    id: int
+    count: int
+    minutes: int
+
+class DayCount(BaseModel):
+    day: date
+    count: int
+
+class ReportSummary(BaseModel):
+    start: Optional[datetime]
+    end: Optional[datetime]
+    include_archived: bool = False
+    include_series: bool = False
+    generated_at: datetime
+    total: int
+    total_minutes: int
+    by_status: List[StatusCount]
+    by_resource: List[GroupCount]
+    by_user: List[GroupCount]
+    by_day: List[DayCount]
+
+class SearchHit(BaseModel):
+    kind: str  # users / appointments
+    id: int
+    score: float
+    snippet: str
+    name: Optional[str] = None
+    email: Optional[str] = None
+    user_id: Optional[int] = None
+    resource_id: Optional[int] = None
+    start_time: Optional[datetime] = None
+
+class SearchResponse(BaseModel):
+    query: str
+    offset: int
+    limit: int
+    has_more: bool
+    hits: List[SearchHit]
@@ -0,0 +1,103 @@
+"""
+Busca textual com SQLite FTS5 sobre usuários (nome/email) e observações dos agendamentos.
+
+As tabelas FTS são de conteúdo externo (não duplicam o texto) e ficam em dia por triggers,
+então nenhum repositório precisa saber delas. Usuários usam o tokenizer trigram (acha
+pedaços de email/nome no meio da palavra); notas usam unicode61 sem acentos, com prefixo.
+"""
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+KINDS = ("users", "appointments")
+
+DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+        name, email, content='users', content_rowid='id', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts(rowid, name, email) VALUES (new.id, new.name, new.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF name, email ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+        INSERT INTO users_fts(rowid, name, email) VALUES (new.id, new.name, new.email);
+    END""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS appointments_fts USING fts5(
+        notes, content='appointments', content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS appointments_fts_ai AFTER INSERT ON appointments BEGIN
+        INSERT INTO appointments_fts(rowid, notes) VALUES (new.id, new.notes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS appointments_fts_ad AFTER DELETE ON appointments BEGIN
+        INSERT INTO appointments_fts(appointments_fts, rowid, notes) VALUES ('delete', old.id, old.notes);
+    END""",
+    # só quando notes muda: o job de ciclo de vida atualiza status em massa e não deve mexer no índice
+    """CREATE TRIGGER IF NOT EXISTS appointments_fts_au AFTER UPDATE OF notes ON appointments BEGIN
+        INSERT INTO appointments_fts(appointments_fts, rowid, notes) VALUES ('delete', old.id, old.notes);
+        INSERT INTO appointments_fts(rowid, notes) VALUES (new.id, new.notes);
+    END""",
+)
+
+
+def install(engine: Engine) -> None:
+    """Cria tabelas FTS e triggers; se as tabelas são novas, indexa o que já existe (rebuild)."""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        existing = set(conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE name IN ('users_fts', 'appointments_fts')").scalars())
+        for stmt in DDL:
+            conn.exec_driver_sql(stmt)
+        for table in ("users_fts", "appointments_fts"):
+            if table not in existing:
+                conn.exec_driver_sql(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+
+def fts_query(q: str, prefix: bool = False) -> Optional[str]:
+    """
+    Converte o texto digitado numa consulta FTS5 segura: cada termo vira uma frase entre
+    aspas (operadores e aspas do usuário não quebram o MATCH) e os termos são combinados com AND.
+    """
+    terms = [t.replace('"', '""') for t in q.split()]
+    if not terms:
+        return None
+    return " ".join(f'"{t}"' + ("*" if prefix else "") for t in terms)
+
+
+_USERS_SQL = """
+    SELECT 'users' AS kind, u.id AS id, bm25(users_fts) AS score,
+           snippet(users_fts, -1, '[', ']', '…', 8) AS snippet,
+           u.name AS name, u.email AS email, NULL AS user_id, NULL AS resource_id, NULL AS start_time
+    FROM users_fts JOIN users u ON u.id = users_fts.rowid
+    WHERE users_fts MATCH :users_q AND u.deleted_at IS NULL
+"""
+
+_APPOINTMENTS_SQL = """
+    SELECT 'appointments' AS kind, a.id AS id, bm25(appointments_fts) AS score,
+           snippet(appointments_fts, 0, '[', ']', '…', 12) AS snippet,
+           NULL AS name, NULL AS email, a.user_id AS user_id, a.resource_id AS resource_id,
+           a.start_time AS start_time
+    FROM appointments_fts JOIN appointments a ON a.id = appointments_fts.rowid
+    LEFT JOIN users u ON u.id = a.user_id
+    WHERE appointments_fts MATCH :appointments_q AND u.deleted_at IS NULL
+"""
+
+
+def search(db: Session, q: str, kinds: Optional[List[str]] = None, limit: int = 20, offset: int = 0) -> dict:
+    """
+    Hits de usuários e agendamentos num único ranking por bm25 (menor = mais relevante),
+    paginados por limit/offset. `has_more` vem de buscar uma linha a mais. Usuários removidos
+    (deleted_at, à espera do job de ciclo de vida) e os agendamentos deles não aparecem.
+    """
+    kinds = [k for k in (kinds or KINDS) if k in KINDS]
+    params = {"users_q": fts_query(q), "appointments_q": fts_query(q, prefix=True),
+              "limit": limit + 1, "offset": offset}
+    parts = [{"users": _USERS_SQL, "appointments": _APPOINTMENTS_SQL}[k] for k in kinds]
+    hits = []
+    if params["users_q"] and parts:
+        sql = " UNION ALL ".join(parts) + " ORDER BY score, kind, id LIMIT :limit OFFSET :offset"
+        hits = [dict(row) for row in db.execute(text(sql), params).mappings()]
+    return {"query": q, "offset": offset, "limit": limit, "has_more": len(hits) > limit, "hits": hits[:limit]}
@@ -1,10 +1,47 @@
-from datetime import timedelta, datetime, time
-from typing import List, Optional
+import heapq
+import re
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+from datetime import date, timedelta, datetime, time
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional
+from pydantic import validate_email
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from .repositories import SqlAlchemyAppointmentRepository, SqlAlchemyUserRepository
+from .events import change_bus
+from .repositories import (SqlAlchemyAppointmentRepository, SqlAlchemyUserRepository, SqlAlchemySeriesRepository,
+                           appointment_payload)
 from . import models
 from .exceptions import NotFoundException, BusinessRuleException
-from .config import CONFIG
+from .calendars import CalendarRegistry, CompiledCalendar, calendars as shared_calendars
+from .db import begin_immediate
+from .locks import LockStripes
+from .scheduler import FlexibleRequest, ResourceGaps, assign
+from .waitlist import WaitlistIndex
+from .recurrence import (FREQUENCIES, MAX_OCCURRENCES, Interval, first_overlap, iter_starts,
+                         merge_occurrences, occurrences)
+
+DAILY_LIMIT = 3
+BULK_CHUNK_SIZE = 1000
+
+# parte local ASCII em dot-atom (RFC 5322); o resto (unicode, aspas) vai para o validador completo
+_LOCAL_PART = re.compile(r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*")
+
+@lru_cache(maxsize=4096)
+def _normalized_domain(domain: str) -> str:
+    # a validação do domínio (IDNA) é a parte cara e num lote quase todos os emails repetem o domínio
+    return validate_email(f"a@{domain}")[1].rpartition("@")[2]
+
+def normalize_email(email: str) -> str:
+    """
+    Mesmo critério e mesma forma normalizada do EmailStr (domínio em minúsculas/IDNA, "Nome <email>"
+    reduzido ao email), com o domínio validado uma vez por lote; ValueError se inválido.
+    """
+    local, sep, domain = email.rpartition("@")
+    if sep and len(local) <= 64 and len(email) <= 254 and _LOCAL_PART.fullmatch(local):
+        return f"{local}@{_normalized_domain(domain)}"
+    return validate_email(email)[1]
 
 class AppointmentService:
     """
@@ -12,65 +49,479 @@ class AppointmentService:
     - Aplica regras: ausência de conflito de horários, horário de trabalho, limite por usuário.
     - Calcula end_time a partir do duration.
     """
-    def __init__(self, appointment_repo: SqlAlchemyAppointmentRepository, user_repo: SqlAlchemyUserRepository):
+    def __init__(self, appointment_repo: SqlAlchemyAppointmentRepository, user_repo: SqlAlchemyUserRepository,
+                 series_repo: Optional[SqlAlchemySeriesRepository] = None, locks: Optional[LockStripes] = None,
+                 calendars: Optional[CalendarRegistry] = None, waitlist: Optional[WaitlistIndex] = None):
         self.app_repo = appointment_repo
         self.user_repo = user_repo
-        cfg = CONFIG["app"]
-        wh = CONFIG["app"]["working_hours"]
-        start_h, end_h = wh["start"], wh["end"]
-        self.working_start = time.fromisoformat(start_h)
-        self.working_end = time.fromisoformat(end_h)
+        self.series_repo = series_repo
+        self.locks = locks or LockStripes()
+        # sem registry (ou sem session) vale o working_hours global para todo recurso
+        self.calendars = calendars
+        self.waitlist = waitlist or WaitlistIndex()
+
+    def calendar_for(self, db: Session, resource_id: int) -> CompiledCalendar:
+        """Calendário compilado do recurso (cache do registry; compila na primeira vez)."""
+        if self.calendars is None or db is None:
+            return shared_calendars.default
+        return self.calendars.get(db, resource_id)
+
+    def _get_active_user(self, db: Session, user_id: int):
+        user = self.user_repo.get(db, user_id)
+        if not user:
+            raise NotFoundException("Usuário não encontrado")
+        if not user.is_active:
+            raise BusinessRuleException("Usuário inativo")
+        return user
+
+    @staticmethod
+    def _require_future(start_time: datetime) -> None:
+        # Regra de séries e da fila de espera; o agendamento avulso é validado no schema
+        if start_time <= datetime.now():
+            raise BusinessRuleException("Agendamento deve começar no futuro")
+
+    def _check_time_window(self, calendar: CompiledCalendar, start_time: datetime, end_time: datetime) -> None:
+        # Regra: horário dentro do expediente do recurso naquele dia (bisect no calendário compilado)
+        if not calendar.allows(start_time, end_time):
+            day = start_time.date()
+            raise BusinessRuleException(
+                f"Agendamento fora do expediente em {day.isoformat()} ({calendar.hours_on(day)})")
+
+    def _series_occurrences(self, db: Session, start: datetime, end: datetime,
+                            resource_id: Optional[int] = None, user_id: Optional[int] = None) -> Iterator[Interval]:
+        """Ocorrências (ordenadas) de séries existentes na janela; vazio quando não há repositório de séries."""
+        if self.series_repo is None:
+            return iter(())
+        found = self.series_repo.list_overlapping(db, start=start, end=end, resource_id=resource_id, user_id=user_id)
+        return ((s, e) for s, e, _ in merge_occurrences(found, start, end))
 
     def create_appointment(self, db: Session, user_id: int, resource_id: int,
                            start_time: datetime, duration_minutes: int, notes: Optional[str]=None) -> models.Appointment:
         """
         Regras complexas (exemplos):
         1) Validação de múltiplas condições:
-           - horário dentro do expediente (working_hours)
+           - horário dentro do expediente do recurso (calendário)
            - usuário ativo
            - duração positiva (validado no schema)
         2) Cálculo:
            - calcula end_time = start_time + duration
            - calcula total horas diárias do usuário ao criar
         3) Interação entre entidades:
-           - checa se recurso já está ocupado (overlap)
+           - checa se recurso já está ocupado (overlap), inclusive por séries recorrentes
            - checa número máximo de agendamentos do usuário no mesmo dia (ex: 3)
         """
-        user = self.user_repo.get(db, user_id)
-        if not user:
-            raise NotFoundException("Usuário não encontrado")
-        if not user.is_active:
-            raise BusinessRuleException("Usuário inativo")
+        self._get_active_user(db, user_id)
 
         end_time = start_time + timedelta(minutes=duration_minutes)
+        self._check_time_window(self.calendar_for(db, resource_id), start_time, end_time)
+
+        # Checagens e escrita sob o lock do recurso: duas reservas simultâneas no mesmo
+        # recurso não passam juntas pela checagem; recursos diferentes seguem em paralelo.
+        with self.locks.lock_for(resource_id):
+            # Regra: limite de agendamentos por usuário por dia
+            day_start = datetime.combine(start_time.date(), time.min)
+            day_end = datetime.combine(start_time.date(), time.max)
+            user_apps = self.app_repo.list_by_filter(db, user_id=user_id, start=day_start, end=day_end)
+            series_today = sum(1 for _ in self._series_occurrences(db, day_start, day_end, user_id=user_id))
+            if len(user_apps) + series_today >= DAILY_LIMIT:
+                raise BusinessRuleException(f"Usuário atingiu limite diário de {DAILY_LIMIT} agendamentos")
+
+            # Regra: evitar overlap com séries recorrentes do recurso
+            if first_overlap([(start_time, end_time)], self._series_occurrences(db, start_time, end_time, resource_id=resource_id)):
+                raise BusinessRuleException("Conflito com série recorrente no recurso (sobreposição)")
+
+            # Regra: evitar overlap no mesmo recurso — garantida pelo insert condicional,
+            # que também protege contra outros processos. O lock acima é por recurso: duas
+            # reservas do mesmo usuário em recursos diferentes passam juntas pela checagem do
+            # limite diário, então o insert também refaz essa contagem.
+            appointment = models.Appointment(
+                user_id=user_id,
+                resource_id=resource_id,
+                start_time=start_time,
+                end_time=end_time,
+                notes=notes
+            )
+            created = self.app_repo.reserve(db, appointment, daily_limit=DAILY_LIMIT - series_today)
+        if created is None:
+            booked = self.app_repo.count_by_day(db, user_id, day_start, day_start + timedelta(days=1))
+            if booked.get(start_time.date(), 0) + series_today >= DAILY_LIMIT:
+                raise BusinessRuleException(f"Usuário atingiu limite diário de {DAILY_LIMIT} agendamentos")
+            raise BusinessRuleException("Conflito com outro agendamento no recurso (sobreposição)")
+        return created
+
+    def create_series(self, db: Session, user_id: int, resource_id: int, start_time: datetime,
+                      duration_minutes: int, freq: str, interval: int = 1, count: Optional[int] = None,
+                      until: Optional[datetime] = None, notes: Optional[str] = None) -> models.AppointmentSeries:
+        """
+        Cria uma série recorrente como uma única linha.
+        As mesmas regras do agendamento avulso valem para cada ocorrência, mas a checagem é feita
+        em bloco: uma consulta para os agendamentos do recurso na faixa da série, uma para a
+        contagem diária do usuário, e uma única varredura ordenada para detectar conflitos.
+        """
+        if self.series_repo is None:
+            raise BusinessRuleException("Séries recorrentes não estão habilitadas")
+        self._get_active_user(db, user_id)
+
+        freq = freq.upper()
+        if freq not in FREQUENCIES:
+            raise BusinessRuleException(f"Frequência inválida (use {', '.join(FREQUENCIES)})")
+        if count is None and until is None:
+            raise BusinessRuleException("Série precisa de count ou until")
+
+        duration = timedelta(minutes=duration_minutes)
+        calendar = self.calendar_for(db, resource_id)
+        self._require_future(start_time)
+        self._check_time_window(calendar, start_time, start_time + duration)
 
-        # Regra: horário dentro do expediente
-        if not (self.working_start <= start_time.time() < self.working_end and self.working_start < end_time.time() <= self.working_end):
-            raise BusinessRuleException(f"Agendamento fora do expediente ({self.working_start} - {self.working_end})")
-
-        # Regra: limite de agendamentos por usuário por dia
-        day_start = datetime.combine(start_time.date(), time.min)
-        day_end = datetime.combine(start_time.date(), time.max)
-        user_apps = self.app_repo.list_by_filter(db, user_id=user_id, start=day_start, end=day_end)
-        if len(user_apps) >= 3:
-            raise BusinessRuleException("Usuário atingiu limite diário de 3 agendamentos")
-
-        # Regra: evitar overlap no mesmo recurso
-        all_resource_apps = db.query(models.Appointment).filter(models.Appointment.resource_id == resource_id).all()
-        for a in all_resource_apps:
-            # overlap check
-            if not (end_time <= a.start_time or start_time >= a.end_time):
-                raise BusinessRuleException("Conflito com outro agendamento no recurso (sobreposição)")
-
-        # Se passou, cria
-        appointment = models.Appointment(
-            user_id=user_id,
-            resource_id=resource_id,
-            start_time=start_time,
-            end_time=end_time,
-            notes=notes
+        # o expediente muda por dia da semana e feriado: cada ocorrência é checada (um bisect cada)
+        total, last_start = 0, None
+        for last_start in iter_starts(start_time, freq, interval, count, until):
+            total += 1
+            if total > MAX_OCCURRENCES:
+                raise BusinessRuleException(f"Série excede o máximo de {MAX_OCCURRENCES} ocorrências")
+            if not calendar.allows(last_start, last_start + duration):
+                day = last_start.date()
+                raise BusinessRuleException(
+                    f"Ocorrência fora do expediente em {day.isoformat()} ({calendar.hours_on(day)})")
+        if not total:
+            raise BusinessRuleException("Série não gera nenhuma ocorrência")
+
+        series = models.AppointmentSeries(
+            user_id=user_id, resource_id=resource_id, start_time=start_time,
+            end_time=last_start + duration, duration_minutes=duration_minutes,
+            freq=freq, interval=interval, count=count, until=until, notes=notes,
         )
-        return self.app_repo.create(db, appointment)
+        window_start, window_end = series.start_time, series.end_time
+
+        # Regra: limite diário, contando agendamentos avulsos e outras séries do usuário
+        per_day = Counter(self.app_repo.count_by_day(db, user_id, window_start, window_end))
+        per_day.update(s.date() for s, _ in self._series_occurrences(db, window_start, window_end, user_id=user_id))
+        for occ_start, _ in occurrences(series):
+            if per_day[occ_start.date()] + 1 > DAILY_LIMIT:
+                raise BusinessRuleException(
+                    f"Usuário atingiu limite diário de {DAILY_LIMIT} agendamentos em {occ_start.date().isoformat()}")
+
+        # Regra: overlap no recurso — agendamentos avulsos e outras séries num único fluxo ordenado
+        with self.locks.lock_for(resource_id):
+            busy = heapq.merge(
+                ((a.start_time, a.end_time) for a in self.app_repo.list_by_resource(db, resource_id, window_start, window_end)),
+                self._series_occurrences(db, window_start, window_end, resource_id=resource_id),
+            )
+            conflict = first_overlap(occurrences(series), busy)
+            if conflict:
+                raise BusinessRuleException(
+                    f"Conflito com outro agendamento no recurso em {conflict[0][0].isoformat()} (sobreposição)")
+            return self.series_repo.create(db, series)
+
+    def join_waitlist(self, db: Session, user_id: int, resource_id: int, start_time: datetime,
+                      duration_minutes: int, notes: Optional[str] = None) -> models.WaitlistEntry:
+        """
+        Coloca o pedido na fila de espera do recurso (mesmas validações da reserva: usuário
+        ativo, futuro, expediente). Se o horário já estiver livre o pedido sai promovido na
+        mesma transação; senão espera até um agendamento que o bloqueia ser liberado.
+        """
+        self._get_active_user(db, user_id)
+        end_time = start_time + timedelta(minutes=duration_minutes)
+        self._require_future(start_time)
+        self._check_time_window(self.calendar_for(db, resource_id), start_time, end_time)
+        with self.locks.lock_for(resource_id):
+            try:
+                begin_immediate(db)
+                entry = self.waitlist.repo.add(db, {"user_id": user_id, "resource_id": resource_id,
+                                                    "start_time": start_time, "end_time": end_time,
+                                                    "notes": notes, "requested_at": datetime.now()})
+                self.waitlist.push(resource_id, entry)
+                promoted = self._promote_waiting(db, resource_id, start_time, end_time)
+                db.commit()
+            except Exception:
+                db.rollback()
+                self.waitlist.invalidate(resource_id)
+                raise
+        self._announce_promoted(resource_id, promoted)
+        return entry
+
+    def leave_waitlist(self, db: Session, entry_id: int) -> models.WaitlistEntry:
+        """Tira um pedido da fila (só enquanto ainda está esperando)."""
+        entry = self.waitlist.repo.cancel(db, entry_id)
+        db.commit()
+        if entry is None:
+            raise NotFoundException("Pedido em espera não encontrado")
+        self.waitlist.discard(entry.resource_id, [entry.id])
+        return entry
+
+    def delete_appointment(self, db: Session, appointment_id: int) -> dict:
+        """
+        Exclui o agendamento e, na mesma transação, promove os pedidos da fila de espera que
+        cabem no intervalo liberado. Retorna o payload da linha excluída.
+        """
+        row, promoted = self._release(db, appointment_id, self.app_repo.remove)
+        if row is None:
+            raise NotFoundException("Agendamento não encontrado")
+        payload = appointment_payload(row)
+        change_bus.publish("appointment.deleted", payload)
+        self._announce_promoted(row.resource_id, promoted)
+        return payload
+
+    def cancel_appointment(self, db: Session, appointment_id: int) -> models.Appointment:
+        """
+        Marca o agendamento como cancelado (a linha fica para histórico e relatórios) e promove
+        a fila de espera na mesma transação. Cancelar de novo devolve o agendamento como está.
+        """
+        row, promoted = self._release(db, appointment_id, self.app_repo.mark_cancelled)
+        if row is None:
+            current = self.app_repo.get(db, appointment_id)
+            if current is None:
+                raise NotFoundException("Agendamento não encontrado")
+            if current.status != "cancelled":
+                raise BusinessRuleException(f"Agendamento com status '{current.status}' não pode ser cancelado")
+            return current
+        change_bus.publish("appointment.updated", appointment_payload(row))
+        self._announce_promoted(row.resource_id, promoted)
+        return row
+
+    def mark_no_show(self, db: Session, appointment_id: int, now: Optional[datetime] = None) -> models.Appointment:
+        """
+        Registra que o usuário não compareceu. Só vale para agendamento que já começou (em `now`)
+        e não foi cancelado; o horário já passou, então não há o que liberar nem promover.
+        Marcar de novo devolve o agendamento como está.
+        """
+        now = now or datetime.now()
+        row = self.app_repo.mark_no_show(db, appointment_id, now)
+        if row is not None:
+            return row
+        current = self.app_repo.get(db, appointment_id)
+        if current is None:
+            raise NotFoundException("Agendamento não encontrado")
+        if current.status == "no_show":
+            return current
+        if current.status == "cancelled":
+            raise BusinessRuleException("Agendamento cancelado não pode ser marcado como não comparecimento")
+        raise BusinessRuleException("Agendamento ainda não começou")
+
+    def _release(self, db: Session, appointment_id: int, release) -> tuple:
+        """
+        Libera o horário com `release` (remove ou mark_cancelled) e promove a fila de espera,
+        tudo numa transação BEGIN IMMEDIATE sob o lock do recurso. (None, []) se nada mudou.
+        """
+        found = self.app_repo.get(db, appointment_id)
+        if found is None:
+            return None, []
+        resource_id = found.resource_id
+        # cancelado já não ocupava o horário: excluir não libera nada
+        freed = found.status != "cancelled"
+        with self.locks.lock_for(resource_id):
+            try:
+                begin_immediate(db)
+                row = release(db, appointment_id)
+                if row is None:
+                    db.rollback()
+                    return None, []
+                promoted = self._promote_waiting(db, resource_id, row.start_time, row.end_time) if freed else []
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        return row, promoted
+
+    def release_freed(self, db: Session, rows: Iterable) -> None:
+        """
+        Promove a fila de espera nos horários liberados por uma remoção em massa (usuário
+        excluído, expurgo do ciclo de vida), a partir das linhas do DELETE ... RETURNING de quem
+        removeu. Uma transação por horário que ainda não terminou, sob o lock do recurso.
+        """
+        now = datetime.now()
+        for row in rows:
+            if row.status == "cancelled" or row.end_time <= now:
+                continue
+            with self.locks.lock_for(row.resource_id):
+                try:
+                    begin_immediate(db)
+                    promoted = self._promote_waiting(db, row.resource_id, row.start_time, row.end_time)
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    raise
+            self._announce_promoted(row.resource_id, promoted)
+
+    def _promote_waiting(self, db: Session, resource_id: int, start: datetime, end: datetime) -> list:
+        """
+        Uma passada pelos pedidos em espera que cruzam [start, end), por ordem de chegada.
+        Cada um é promovido se o intervalo inteiro estiver livre (agendamentos, séries e os já
+        promovidos nesta passada), dentro do expediente e sem estourar o limite diário do
+        usuário. Roda dentro da transação de quem chamou, sob o lock do recurso.
+        """
+        candidates = self.waitlist.candidates(db, resource_id, start, end)
+        if not candidates:
+            return []
+        alive = self.waitlist.repo.still_waiting(db, (c.id for c in candidates))
+        stale = [c.id for c in candidates if c.id not in alive]
+        candidates = [c for c in candidates if c.id in alive]
+        self.waitlist.discard(resource_id, stale)
+        if not candidates:
+            return []
+
+        # ocupação da faixa dos candidatos, ordenada; agendamentos e séries nunca se sobrepõem
+        # entre si, então os fins também ficam ordenados e um bisect basta para achar conflito
+        lo = min(c.start_time for c in candidates)
+        hi = max(c.end_time for c in candidates)
+        busy = list(heapq.merge(
+            ((a.start_time, a.end_time) for a in self.app_repo.list_by_resource(db, resource_id, lo, hi)),
+            self._series_occurrences(db, lo, hi, resource_id=resource_id),
+        ))
+        starts = [s for s, _ in busy]
+        calendar = self.calendar_for(db, resource_id)
+        now = datetime.now()
+        per_day: dict = {}
+        promoted = []
+        for c in candidates:
+            if c.start_time <= now or not calendar.allows(c.start_time, c.end_time):
+                continue
+            i = bisect_left(starts, c.end_time)
+            if i and busy[i - 1][1] > c.start_time:
+                continue
+            key = (c.user_id, c.start_time.date())
+            if key not in per_day:
+                day_start = datetime.combine(key[1], time.min)
+                day_end = day_start + timedelta(days=1)
+                per_day[key] = (self.app_repo.count_by_day(db, c.user_id, day_start, day_end).get(key[1], 0)
+                                + sum(1 for _ in self._series_occurrences(db, day_start, day_end, user_id=c.user_id)))
+            if per_day[key] >= DAILY_LIMIT:
+                continue
+            created = self.app_repo.insert_if_free(db, models.Appointment(
+                user_id=c.user_id, resource_id=resource_id, start_time=c.start_time, end_time=c.end_time,
+                notes=c.notes))
+            if created is None:
+                continue
+            self.waitlist.repo.promote(db, c.id, created.id)
+            busy.insert(i, (c.start_time, c.end_time))
+            starts.insert(i, c.start_time)
+            per_day[key] += 1
+            promoted.append((c, created))
+        return promoted
+
+    def _announce_promoted(self, resource_id: int, promoted: List[tuple]) -> None:
+        """Eventos das promoções; só depois do commit."""
+        self.waitlist.discard(resource_id, (c.id for c, _ in promoted))
+        for request, created in promoted:
+            change_bus.publish("appointment.created", appointment_payload(created))
+            change_bus.publish("waitlist.promoted", {"id": request.id, "user_id": request.user_id,
+                                                     "resource_id": resource_id, "appointment_id": created.id})
+
+    def free_slots(self, db: Session, resource_id: int, day: date, duration_minutes: int = 1) -> List[Interval]:
+        """
+        Janelas livres do recurso no dia: expediente do calendário menos agendamentos
+        não cancelados e ocorrências de séries, só as que comportam `duration_minutes`.
+        """
+        start = datetime.combine(day, time.min)
+        end = start + timedelta(days=1)
+        busy = heapq.merge(
+            ((a.start_time, a.end_time) for a in self.app_repo.list_by_resource(db, resource_id, start, end)),
+            self._series_occurrences(db, start, end, resource_id=resource_id),
+        )
+        return self.calendar_for(db, resource_id).free_slots(day, busy, duration_minutes)
+
+    def _free_between(self, db: Session, resource_id: int, start: datetime, end: datetime,
+                      duration_minutes: int, booked: Optional[Iterable[Interval]] = None) -> List[Interval]:
+        """
+        Janelas livres do recurso de `start` a `end`, dia a dia, com uma consulta de ocupação para a
+        faixa toda. `booked`: agendamentos do recurso já carregados, por início (ver assign_batch).
+        """
+        if booked is None:
+            booked = ((a.start_time, a.end_time) for a in self.app_repo.list_by_resource(db, resource_id, start, end))
+        busy = list(heapq.merge(booked, self._series_occurrences(db, start, end, resource_id=resource_id)))
+        calendar = self.calendar_for(db, resource_id)
+        free: List[Interval] = []
+        k = 0
+        day = start.date()
+        while day <= end.date():
+            day_start = datetime.combine(day, time.min)
+            day_end = day_start + timedelta(days=1)
+            while k < len(busy) and busy[k][1] <= day_start:
+                k += 1
+            today = [b for b in busy[k:bisect_left(busy, (day_end,))] if b[1] > day_start]
+            free.extend(calendar.free_slots(day, today, duration_minutes))
+            day += timedelta(days=1)
+        return free
+
+    def assign_batch(self, db: Session, requests: List[FlexibleRequest], resources: Dict[str, List[int]],
+                     dry_run: bool = False) -> List[dict]:
+        """
+        Aloca pedidos flexíveis (tipo de recurso + janela + duração) entre os recursos
+        intercambiáveis de cada tipo (`resources`: tipo -> ids), com o sweep de app/scheduler.py.
+        Valem as regras do agendamento avulso: usuário ativo, futuro, expediente do calendário
+        de cada recurso, sem sobreposição e limite diário (contando o próprio lote).
+        Tudo é gravado numa transação; um resultado por pedido, na ordem da entrada.
+        """
+        results: List[Optional[dict]] = [None] * len(requests)
+        now = datetime.now().replace(second=0, microsecond=0) + timedelta(minutes=1)
+        users: Dict[int, Optional[str]] = {}
+        pending = []
+        for r in requests:
+            if r.user_id not in users:
+                try:
+                    self._get_active_user(db, r.user_id)
+                    users[r.user_id] = None
+                except (NotFoundException, BusinessRuleException) as e:
+                    users[r.user_id] = str(e)
+            earliest = max(r.earliest, now)
+            detail = users[r.user_id] or (None if earliest + r.duration <= r.latest
+                                          else "Janela do pedido já passou ou é menor que a duração")
+            if detail:
+                results[r.index] = {"index": r.index, "status": "unassigned", "detail": detail}
+            else:
+                pending.append(r._replace(earliest=earliest))
+        if not pending:
+            return results
+
+        lo = min(r.earliest for r in pending)
+        hi = max(r.latest for r in pending)
+        shortest = min(r.duration for r in pending) // timedelta(minutes=1)
+        kinds = {r.resource_type for r in pending}
+        # locks de todos os recursos envolvidos, sempre na mesma ordem (listras repetidas uma vez só)
+        locks = {id(lock): lock for kind in kinds for lock in map(self.locks.lock_for, resources.get(kind, ()))}
+        created = []
+        with ExitStack() as held:
+            for key in sorted(locks):
+                held.enter_context(locks[key])
+            # ocupação de todos os recursos do lote numa carga só, em colunas compactas (app/compact.py)
+            booked = self.app_repo.intervals(db, [rid for kind in kinds for rid in resources.get(kind, ())], lo, hi)
+            pools = {kind: [ResourceGaps(rid, self._free_between(db, rid, lo, hi, shortest, booked.busy_datetimes(rid)))
+                            for rid in resources.get(kind, ())] for kind in kinds}
+            per_day: Counter = Counter()
+            day_start, day_end = datetime.combine(lo.date(), time.min), datetime.combine(hi.date(), time.max)
+            for user_id in {r.user_id for r in pending}:
+                per_day.update({(user_id, d): n for d, n in self.app_repo.count_by_day(db, user_id, day_start, day_end).items()})
+                per_day.update((user_id, s.date()) for s, _ in self._series_occurrences(db, day_start, day_end, user_id=user_id))
+            assigned, failed = assign(pending, pools, per_day, DAILY_LIMIT)
+
+            for index, detail in failed.items():
+                results[index] = {"index": index, "status": "unassigned", "detail": detail}
+            if dry_run:
+                for a in assigned:
+                    results[a.index] = {"index": a.index, "status": "assigned", "resource_id": a.resource_id,
+                                        "start_time": a.start_time, "end_time": a.end_time}
+                return results
+            try:
+                begin_immediate(db)
+                for a in assigned:
+                    row = self.app_repo.insert_if_free(db, models.Appointment(
+                        user_id=a.user_id, resource_id=a.resource_id, start_time=a.start_time,
+                        end_time=a.end_time, notes=a.notes))
+                    if row is None:
+                        # outro processo levou o horário entre a leitura e a escrita
+                        results[a.index] = {"index": a.index, "status": "unassigned",
+                                            "detail": "Conflito com outro agendamento no recurso (sobreposição)"}
+                        continue
+                    created.append(row)
+                    results[a.index] = {"index": a.index, "status": "assigned", "resource_id": a.resource_id,
+                                        "start_time": a.start_time, "end_time": a.end_time, "appointment_id": row.id}
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        for row in created:
+            change_bus.publish("appointment.created", appointment_payload(row))
+        return results
 
     def export_appointments_csv(self, db: Session, file_path: str):
         """
@@ -91,7 +542,61 @@ class UserService:
         self.app_repo = appointment_repo
 
     def total_reserved_minutes(self, db: Session, user_id: int) -> int:
-        """Calcula total de minutos agendados do usuário no futuro."""
-        apps = db.query(models.Appointment).filter(models.Appointment.user_id == user_id, models.Appointment.end_time > datetime.now()).all()
-        total = sum(int((a.end_time - a.start_time).total_seconds() / 60) for a in apps)
-        return total
+        """Calcula total de minutos agendados do usuário no futuro (pelo repositório: vale no backend em memória)."""
+        return self.app_repo.reserved_minutes(db, user_id, datetime.now())
+
+    def bulk_create_users(self, db: Session, rows: List[dict], chunk_size: int = BULK_CHUNK_SIZE) -> List[dict]:
+        """
+        Cadastro em massa com um resultado por linha (mesma ordem da entrada).
+        Emails são normalizados como no EmailStr antes de tudo. Duplicados dentro do payload saem
+        por um set; os já cadastrados, por consultas IN em blocos antes de inserir. Os novos entram
+        em executemany de `chunk_size` linhas por transação.
+        Status: created, exists (email já cadastrado), duplicate (repetido no payload), invalid.
+        """
+        results: List[Optional[dict]] = [None] * len(rows)
+        seen = set()
+        pending = []  # (índice, linha normalizada)
+        for i, row in enumerate(rows):
+            name, email = (row.get("name") or "").strip(), (row.get("email") or "").strip()
+            try:
+                if not name:
+                    raise ValueError("nome vazio")
+                # grava e deduplica pela forma normalizada, como o POST /users (EmailStr)
+                email = normalize_email(email)
+            except ValueError as e:
+                results[i] = {"index": i, "email": email, "status": "invalid", "detail": str(e)}
+                continue
+            if email in seen:
+                results[i] = {"index": i, "email": email, "status": "duplicate"}
+                continue
+            seen.add(email)
+            pending.append((i, {"name": name, "email": email, "is_active": True}))
+
+        existing = self.user_repo.existing_emails(db, (r["email"] for _, r in pending))
+        new = []
+        for i, r in pending:
+            if r["email"] in existing:
+                results[i] = {"index": i, "email": r["email"], "status": "exists"}
+            else:
+                new.append((i, r))
+
+        created = 0
+        for start in range(0, len(new), chunk_size):
+            chunk = new[start:start + chunk_size]
+            try:
+                ids = self.user_repo.bulk_create(db, [r for _, r in chunk])
+            except IntegrityError:
+                # outro cadastro levou algum email entre a checagem e o insert: recalcula só este bloco
+                taken = self.user_repo.existing_emails(db, (r["email"] for _, r in chunk))
+                for i, r in chunk:
+                    if r["email"] in taken:
+                        results[i] = {"index": i, "email": r["email"], "status": "exists"}
+                chunk = [(i, r) for i, r in chunk if r["email"] not in taken]
+                ids = self.user_repo.bulk_create(db, [r for _, r in chunk])
+            for (i, r), (user_id, _) in zip(chunk, ids):
+                results[i] = {"index": i, "email": r["email"], "status": "created", "id": user_id}
+            created += len(ids)
+
+        if created:
+            change_bus.publish("users.bulk_created", {"count": created})
+        return results
@@ -0,0 +1,245 @@
+"""
+Simulação de demanda por eventos discretos passando pelo AppointmentService de verdade.
+
+A demanda é sorteada de uma vez com NumPy: chegadas de Poisson por recurso (taxa por hora),
+antecedência em dias, horário dentro do expediente, duração numa distribuição discreta,
+e quais reservas aceitas serão canceladas ou terão no-show. Os eventos (pedido, cancelamento,
+no-show) são processados em ordem de tempo simulado por um heap. Cada pedido vira uma chamada
+a `create_appointment`, e cada cancelamento uma chamada a `cancel_appointment`, com as mesmas
+regras da API. O banco é um SQLite em memória, ou o backend em memória de app/memory.py para
+usuários e agendamentos.
+
+O relatório traz taxa de aceitação, recusas por regra, ocupação (reservada e efetiva, sem
+no-shows) e vazão/latência do service. Serve para dimensionar recursos e para pegar lentidão
+nas regras antes da produção:
+
+    python -m app.simulation --resources 5 --users 40 --days 5 --rate 1.5 --backend memory
+"""
+import argparse
+import heapq
+import json
+import re
+import tempfile
+import time as _time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from . import memory, models
+from .calendars import CalendarRegistry, CompiledCalendar, calendars as shared_calendars
+from .db import init_schema
+from .exceptions import AppException
+from .repositories import SqlAlchemyAppointmentRepository, SqlAlchemySeriesRepository, SqlAlchemyUserRepository
+from .services import AppointmentService
+from .waitlist import WaitlistIndex
+
+SLOT_MINUTES = 15
+DURATIONS = (30, 60, 90, 120)
+DURATION_WEIGHTS = (0.4, 0.35, 0.15, 0.1)
+BACKENDS = ("sqlite", "memory")
+
+# mensagem do service -> categoria do relatório (a primeira que casar)
+REJECTION_REASONS = (
+    ("série recorrente", "conflito_serie"),
+    ("sobreposição", "conflito"),
+    ("limite diário", "limite_diario"),
+    ("expediente", "fora_do_expediente"),
+    ("no futuro", "passado"),
+    ("inativo", "usuario_inativo"),
+    ("não encontrado", "nao_encontrado"),
+)
+
+REQUEST, CANCEL, NO_SHOW = 0, 1, 2
+
+
+def rejection_reason(message: str) -> str:
+    for needle, reason in REJECTION_REASONS:
+        if needle in message:
+            return reason
+    return re.sub(r"\d", "#", message)
+
+
+def generate_demand(rng: np.random.Generator, resources: int, users: int, days: int, rate_per_hour: float,
+                    open_minute: int, close_minute: int, lead_days: float = 2.0,
+                    durations: Sequence[int] = DURATIONS, weights: Sequence[float] = DURATION_WEIGHTS,
+                    cancel_rate: float = 0.05, no_show_rate: float = 0.05) -> Dict[str, np.ndarray]:
+    """
+    Pedidos da simulação como colunas NumPy, ordenados por chegada. Tempos em minutos desde o
+    início da simulação: chegadas nos primeiros `days` dias, inícios nos `days` dias seguintes
+    ao da chegada (dia 1 em diante), sempre em múltiplos de SLOT_MINUTES.
+    """
+    horizon = days * 1440
+    counts = rng.poisson(rate_per_hour * horizon / 60, size=resources)
+    n = int(counts.sum())
+    resource = np.repeat(np.arange(1, resources + 1), counts)
+    # condicionado à contagem, um processo de Poisson tem chegadas uniformes na janela
+    arrival = rng.uniform(0, horizon, size=n)
+    order = np.argsort(arrival, kind="stable")
+    arrival, resource = arrival[order], resource[order]
+
+    duration = rng.choice(np.asarray(durations), size=n, p=np.asarray(weights) / np.sum(weights))
+    day = np.minimum(arrival // 1440 + 1 + rng.poisson(max(lead_days - 1, 0), size=n), days).astype(np.int64)
+    # último início que ainda cabe no expediente; duração maior que o expediente fica de fora (é recusada)
+    slots = np.maximum((close_minute - open_minute - duration) // SLOT_MINUTES + 1, 1)
+    start = day * 1440 + open_minute + rng.integers(0, slots) * SLOT_MINUTES
+
+    cancel = rng.random(n) < cancel_rate
+    # cancelamento entre a chegada e o início
+    cancel_at = arrival + rng.random(n) * (start - arrival)
+    return {"arrival": arrival, "resource": resource, "user": rng.integers(1, users + 1, size=n),
+            "start": start, "duration": duration, "cancel": cancel, "cancel_at": cancel_at,
+            "no_show": ~cancel & (rng.random(n) < no_show_rate)}
+
+
+def _open_close(calendar: CompiledCalendar) -> Tuple[int, int]:
+    ranges = list(calendar.weekly[0])
+    return ranges[0][0], ranges[-1][1]
+
+
+def _capacity_minutes(calendar: CompiledCalendar, t0: datetime, days: int) -> int:
+    """Minutos de expediente de um recurso nos dias 1..days da simulação."""
+    return sum(e - s for d in range(1, days + 1) for s, e in calendar.hours_on((t0 + timedelta(days=d)).date()))
+
+
+class _Environment:
+    """Banco SQLite em memória com usuários/recursos semeados e o service no backend pedido."""
+
+    def __init__(self, backend: str, users: int, resources: int):
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend inválido: {backend} (use {', '.join(BACKENDS)})")
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        init_schema(self.engine)
+        self.db: Session = sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)()
+        people = [{"name": f"Usuário {i}", "email": f"sim{i}@simulacao.local", "is_active": True}
+                  for i in range(1, users + 1)]
+        self.db.execute(insert(models.Resource), [{"name": f"Recurso {i}", "resource_type": "sim"}
+                                                  for i in range(1, resources + 1)])
+        self.store = self._tmp = None
+        if backend == "memory":
+            # fsync desligado: mede o custo das regras e dos índices, não o do disco da máquina
+            self._tmp = tempfile.TemporaryDirectory()
+            self.store = memory.MemoryStore(self._tmp.name, fsync_interval_ms=0, fsync=False)
+            user_repo, app_repo = memory.repositories(self.store)
+            user_repo.bulk_create(None, people)
+        else:
+            user_repo, app_repo = SqlAlchemyUserRepository(), SqlAlchemyAppointmentRepository()
+            self.db.execute(insert(models.User), people)
+        self.db.commit()
+        self.service = AppointmentService(app_repo, user_repo, SqlAlchemySeriesRepository(),
+                                          calendars=CalendarRegistry(), waitlist=WaitlistIndex())
+
+    def close(self) -> None:
+        self.db.close()
+        if self.store is not None:
+            self.store.close(snapshot=False)
+            self._tmp.cleanup()
+        self.engine.dispose()
+
+
+def run(resources: int = 3, users: int = 20, days: int = 5, rate_per_hour: float = 1.0, seed: Optional[int] = None,
+        backend: str = "sqlite", lead_days: float = 2.0, cancel_rate: float = 0.05, no_show_rate: float = 0.05,
+        start: Optional[datetime] = None) -> dict:
+    """Gera a demanda, passa cada evento pelo service e devolve o relatório."""
+    t0 = start or datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    calendar = shared_calendars.default
+    open_minute, close_minute = _open_close(calendar)
+    demand = generate_demand(np.random.default_rng(seed), resources, users, days, rate_per_hour,
+                             open_minute, close_minute, lead_days, cancel_rate=cancel_rate, no_show_rate=no_show_rate)
+    n = len(demand["arrival"])
+    events = [(float(demand["arrival"][i]), REQUEST, i) for i in range(n)]
+    heapq.heapify(events)
+
+    env = _Environment(backend, users, resources)
+    service, db = env.service, env.db
+    booked = np.zeros(n, dtype=bool)       # aceito e não cancelado
+    showed_up = np.zeros(n, dtype=bool)
+    created_ids = np.zeros(n, dtype=np.int64)
+    latency = np.zeros(n)
+    rejections: Counter = Counter()
+    cancelled = no_shows = 0
+    started = _time.perf_counter()
+    try:
+        while events:
+            at, kind, i = heapq.heappop(events)
+            if kind == REQUEST:
+                when = t0 + timedelta(minutes=int(demand["start"][i]))
+                t = _time.perf_counter()
+                try:
+                    created = service.create_appointment(db, int(demand["user"][i]), int(demand["resource"][i]),
+                                                         when, int(demand["duration"][i]))
+                except AppException as e:
+                    rejections[rejection_reason(str(e))] += 1
+                    created = None
+                latency[i] = _time.perf_counter() - t
+                if created is None:
+                    continue
+                booked[i], showed_up[i], created_ids[i] = True, True, created.id
+                if demand["cancel"][i]:
+                    heapq.heappush(events, (float(demand["cancel_at"][i]), CANCEL, i))
+                elif demand["no_show"][i]:
+                    heapq.heappush(events, (float(demand["start"][i]), NO_SHOW, i))
+            elif kind == CANCEL:
+                service.cancel_appointment(db, int(created_ids[i]))
+                booked[i] = showed_up[i] = False
+                cancelled += 1
+            else:
+                # relógio simulado: o agendamento começa agora
+                service.mark_no_show(db, int(created_ids[i]), now=t0 + timedelta(minutes=int(demand["start"][i])))
+                showed_up[i] = False
+                no_shows += 1
+        elapsed = _time.perf_counter() - started
+    finally:
+        env.close()
+
+    capacity = _capacity_minutes(calendar, t0, days) or 1
+    res_idx = demand["resource"] - 1
+    per_resource = np.bincount(res_idx[booked], weights=demand["duration"][booked], minlength=resources) / capacity
+    effective = np.bincount(res_idx[showed_up], weights=demand["duration"][showed_up], minlength=resources) / capacity
+    accepted = int(booked.sum()) + cancelled
+    ms = latency * 1000
+    return {
+        "backend": backend,
+        "seed": seed,
+        "resources": resources,
+        "users": users,
+        "days": days,
+        "requests": n,
+        "accepted": accepted,
+        "acceptance_rate": round(accepted / n, 4) if n else 0.0,
+        "rejections": dict(rejections.most_common()),
+        "cancelled": cancelled,
+        "no_shows": no_shows,
+        "utilization": round(float(per_resource.mean()), 4),
+        "effective_utilization": round(float(effective.mean()), 4),
+        "utilization_by_resource": [round(float(u), 4) for u in per_resource],
+        "elapsed_seconds": round(elapsed, 4),
+        "throughput_per_second": round(n / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {q: round(float(np.percentile(ms, p)), 3) if n else 0.0
+                       for q, p in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulação de demanda pelo AppointmentService")
+    parser.add_argument("--resources", type=int, default=3)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--rate", type=float, default=1.0, help="pedidos por hora por recurso")
+    parser.add_argument("--lead-days", type=float, default=2.0, help="antecedência média (dias)")
+    parser.add_argument("--cancel-rate", type=float, default=0.05)
+    parser.add_argument("--no-show-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--backend", choices=BACKENDS, default="sqlite")
+    args = parser.parse_args(argv)
+    report = run(args.resources, args.users, args.days, args.rate, args.seed, args.backend, args.lead_days,
+                 args.cancel_rate, args.no_show_rate)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Single-flight: requisições idênticas e simultâneas compartilham uma única execução.
+
+O primeiro a chegar (líder) roda a consulta e serializa o resultado em bytes JSON; quem chega
+enquanto isso espera e recebe os mesmos bytes. Não é cache: terminada a execução a chave some,
+e a próxima requisição consulta de novo. Há uma versão para rotas síncronas (threadpool,
+coordenada por threading.Event) e outra para rotas async (uma task compartilhada por chave).
+"""
+import asyncio
+import threading
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+from .metrics import metrics
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Versão para código síncrono (rotas def rodando no threadpool)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Executa fn uma vez por chave em voo; retorna (resultado, compartilhado?)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            metrics.incr("singleflight.shared")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    Versão para rotas async. O trabalho roda numa task própria: se o cliente do líder
+    desconectar, os demais continuam esperando o mesmo resultado.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Tuple[int, Hashable], asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        slot = (id(asyncio.get_running_loop()), key)
+        task = self._tasks.get(slot)
+        shared = task is not None
+        if shared:
+            metrics.incr("singleflight.shared")
+        else:
+            task = self._tasks[slot] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._tasks.pop(slot, None))
+        return await asyncio.shield(task), shared
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+
+@lru_cache(maxsize=64)
+def _adapter(type_) -> TypeAdapter:
+    return TypeAdapter(type_)
+
+
+def serialize(value: Any, type_: Any = Any) -> bytes:
+    """Bytes JSON no formato do response_model (ORM -> schema via from_attributes)."""
+    adapter = _adapter(type_)
+    if type_ is not Any:
+        value = adapter.validate_python(value, from_attributes=True)
+    return adapter.dump_json(value)
+
+
+def request_key(request: Request) -> Tuple:
+    """Chave da requisição: método, caminho e query string normalizada."""
+    return request.method, request.url.path, tuple(sorted(request.query_params.multi_items()))
+
+
+def json_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+
+reads = SingleFlight()
+async_reads = AsyncSingleFlight()
@@ -0,0 +1,105 @@
+"""
+Fila de espera por recurso.
+
+Um pedido que esbarrou num horário ocupado entra na tabela `waitlist` em vez de ficar
+retentando. Em memória cada recurso tem um heap dos pedidos em espera, ordenado por chegada
+(requested_at, id). Quando um agendamento é excluído ou cancelado, o intervalo liberado é
+comparado com esse heap numa passada só. Os pedidos que cabem são promovidos a agendamento
+na mesma transação que liberou o horário (ver AppointmentService.delete_appointment).
+
+A tabela é a fonte da verdade. O heap de um recurso é carregado dela no primeiro uso e
+recarregado depois de `waitlist.reload_seconds`, o que cobre pedidos criados por outros
+processos. Antes de promover, os candidatos são reconfirmados no banco, então um heap
+defasado nunca promove um pedido que já saiu da fila.
+"""
+import heapq
+import threading
+import time as _time
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from .config import config_section
+from .repositories import SqlAlchemyWaitlistRepository
+
+
+class WaitingRequest(NamedTuple):
+    """Item do heap; a ordem da tupla é a prioridade (quem pediu antes sai antes)."""
+    requested_at: datetime
+    id: int
+    user_id: int
+    start_time: datetime
+    end_time: datetime
+    notes: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row) -> "WaitingRequest":
+        return cls(row.requested_at, row.id, row.user_id, row.start_time, row.end_time, row.notes)
+
+
+class WaitlistIndex:
+    """Heaps por resource_id dos pedidos em espera, espelhando a tabela."""
+
+    def __init__(self, repo: Optional[SqlAlchemyWaitlistRepository] = None, reload_seconds: Optional[float] = None):
+        self.repo = repo or SqlAlchemyWaitlistRepository()
+        self._reload_seconds = reload_seconds
+        self._heaps: Dict[int, List[WaitingRequest]] = {}
+        self._loaded_at: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def reload_seconds(self) -> float:
+        if self._reload_seconds is None:
+            self._reload_seconds = float(config_section("waitlist").get("reload_seconds", 60))
+        return self._reload_seconds
+
+    def _heap(self, db: Session, resource_id: int) -> List[WaitingRequest]:
+        loaded = self._loaded_at.get(resource_id)
+        if loaded is None or _time.monotonic() - loaded > self.reload_seconds:
+            # já vem ordenado por (requested_at, id): uma lista ordenada é um heap válido
+            self._heaps[resource_id] = [WaitingRequest.from_row(r) for r in self.repo.waiting(db, resource_id)]
+            self._loaded_at[resource_id] = _time.monotonic()
+        return self._heaps[resource_id]
+
+    def push(self, resource_id: int, row) -> None:
+        """Registra um pedido novo; recurso ainda não carregado pega o pedido da tabela depois."""
+        with self._lock:
+            if resource_id in self._heaps:
+                heapq.heappush(self._heaps[resource_id], WaitingRequest.from_row(row))
+
+    def candidates(self, db: Session, resource_id: int, start: datetime, end: datetime) -> List[WaitingRequest]:
+        """Pedidos em espera que cruzam [start, end), na ordem de chegada."""
+        with self._lock:
+            # filtra antes e ordena só o que cruza a janela: o heap inteiro não precisa sair em ordem
+            found = [w for w in self._heap(db, resource_id) if w.start_time < end and w.end_time > start]
+        found.sort()
+        return found
+
+    def waiting_count(self, db: Session, resource_id: int) -> int:
+        with self._lock:
+            return len(self._heap(db, resource_id))
+
+    def discard(self, resource_id: int, ids: Iterable[int]) -> None:
+        """Tira do heap pedidos promovidos/cancelados (chamado depois do commit)."""
+        ids = set(ids)
+        if not ids:
+            return
+        with self._lock:
+            heap = self._heaps.get(resource_id)
+            if heap is not None:
+                heap[:] = [w for w in heap if w.id not in ids]
+                heapq.heapify(heap)
+
+    def invalidate(self, resource_id: Optional[int] = None) -> None:
+        """Força recarga da tabela no próximo uso (None = todos os recursos)."""
+        with self._lock:
+            if resource_id is None:
+                self._heaps.clear()
+                self._loaded_at.clear()
+            else:
+                self._heaps.pop(resource_id, None)
+                self._loaded_at.pop(resource_id, None)
+
+
+waitlist = WaitlistIndex()
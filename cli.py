@@ -1,15 +1,42 @@
 #!/usr/bin/env python
-"""CLI interativa para o Sistema de Agendamento."""
+"""CLI interativa para o Sistema de Agendamento (com subcomandos para uso em lote, sem menus)."""
 import requests
+from requests.adapters import HTTPAdapter
+import argparse
+import csv
 import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, Iterator, List
 import os
 import sys
 
 # Configuração
 API_BASE_URL = "http://localhost:8001/api"
 TIMEOUT = 5
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RETRIES = 3
+# 429 é o servidor ditando o ritmo (ex.: 2 agendamentos/s por cliente), não uma falha: essas
+# esperas não gastam retentativas, só este orçamento de tempo por requisição
+DEFAULT_MAX_WAIT = 120.0
+TRANSIENT_STATUS = {429, 502, 503, 504}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def get_session(pool_size: int = DEFAULT_CONCURRENCY) -> requests.Session:
+    """Session compartilhada (keep-alive) com pool do tamanho da concorrência pedida."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
 
 class Colors:
     """Cores para terminal."""
@@ -106,7 +133,7 @@ def criar_usuario():
             return
         
         payload = {"name": name, "email": email}
-        response = requests.post(f"{API_BASE_URL}/users", json=payload, timeout=TIMEOUT)
+        response = get_session().post(f"{API_BASE_URL}/users", json=payload, timeout=TIMEOUT)
         
         if response.status_code == 200:
             user = response.json()
@@ -138,7 +165,7 @@ def consultar_usuario():
             input("Pressione ENTER para continuar...")
             return
         
-        response = requests.get(f"{API_BASE_URL}/users/{user_id}", timeout=TIMEOUT)
+        response = get_session().get(f"{API_BASE_URL}/users/{user_id}", timeout=TIMEOUT)
         
         if response.status_code == 200:
             user = response.json()
@@ -178,7 +205,7 @@ def deletar_usuario():
             input("Pressione ENTER para continuar...")
             return
         
-        response = requests.delete(f"{API_BASE_URL}/users/{user_id}", timeout=TIMEOUT)
+        response = get_session().delete(f"{API_BASE_URL}/users/{user_id}", timeout=TIMEOUT)
         
         if response.status_code == 204:
             print_success("Usuário deletado com sucesso!")
@@ -268,7 +295,7 @@ def criar_agendamento():
             "notes": notes or None
         }
         
-        response = requests.post(f"{API_BASE_URL}/appointments", json=payload, timeout=TIMEOUT)
+        response = get_session().post(f"{API_BASE_URL}/appointments", json=payload, timeout=TIMEOUT)
         
         if response.status_code == 200:
             appt = response.json()
@@ -296,7 +323,7 @@ def listar_agendamentos():
     print_header("LISTAR AGENDAMENTOS")
     
     try:
-        response = requests.get(f"{API_BASE_URL}/appointments", timeout=TIMEOUT)
+        response = get_session().get(f"{API_BASE_URL}/appointments", timeout=TIMEOUT)
         
         if response.status_code == 200:
             appointments = response.json()
@@ -342,7 +369,7 @@ def filtrar_agendamentos():
             params["end"] = end_date
         params["order_by"] = order_by
         
-        response = requests.get(f"{API_BASE_URL}/appointments", params=params, timeout=TIMEOUT)
+        response = get_session().get(f"{API_BASE_URL}/appointments", params=params, timeout=TIMEOUT)
         
         if response.status_code == 200:
             appointments = response.json()
@@ -372,7 +399,7 @@ def exportar_agendamentos():
     print_header("EXPORTAR AGENDAMENTOS")
     
     try:
-        response = requests.get(f"{API_BASE_URL}/appointments/export", timeout=TIMEOUT)
+        response = get_session().get(f"{API_BASE_URL}/appointments/export", timeout=TIMEOUT)
         
         if response.status_code == 200:
             result = response.json()
@@ -402,7 +429,7 @@ def consultar_minutos_reservados():
             input("Pressione ENTER para continuar...")
             return
         
-        response = requests.get(f"{API_BASE_URL}/users/{user_id}/reserved_minutes", timeout=TIMEOUT)
+        response = get_session().get(f"{API_BASE_URL}/users/{user_id}/reserved_minutes", timeout=TIMEOUT)
         
         if response.status_code == 200:
             result = response.json()
@@ -442,18 +469,45 @@ def menu_relatorios():
             input("Pressione ENTER para continuar...")
 
 def visualizar_resumo():
-    """Visualiza um resumo do sistema."""
+    """Visualiza um resumo do sistema (agregado no servidor)."""
     clear_screen()
     print_header("RESUMO DO SISTEMA")
     
     try:
-        # Total de agendamentos
-        resp_appts = requests.get(f"{API_BASE_URL}/appointments", timeout=TIMEOUT)
-        if resp_appts.status_code == 200:
-            appts = resp_appts.json()
-            print(f"{Colors.BOLD}Total de Agendamentos:{Colors.ENDC} {len(appts)}")
-        
-        print_success("Relatório gerado com sucesso!")
+        print(f"{Colors.BOLD}Período (deixe em branco para considerar tudo):{Colors.ENDC}")
+        start = input("Início (YYYY-MM-DD HH:MM:SS, opcional): ").strip()
+        end = input("Fim (YYYY-MM-DD HH:MM:SS, opcional): ").strip()
+        params = {}
+        if start:
+            params["start"] = start
+        if end:
+            params["end"] = end
+        
+        response = get_session().get(f"{API_BASE_URL}/reports/summary", params=params, timeout=TIMEOUT)
+        if response.status_code != 200:
+            print_error(f"Erro ao gerar relatório: {response.text}")
+        else:
+            report = response.json()
+            print(f"\n{Colors.BOLD}Total de Agendamentos:{Colors.ENDC} {report['total']}")
+            print(f"{Colors.BOLD}Minutos reservados:{Colors.ENDC} {report['total_minutes']}")
+            
+            print(f"\n{Colors.BOLD}Por status:{Colors.ENDC}")
+            for row in report["by_status"]:
+                print(f"  {row['status']:<12} {row['count']:>6}  ({row['minutes']} min)")
+            
+            print(f"\n{Colors.BOLD}{'Recurso':<10} {'Qtd':>6} {'Minutos':>9}{Colors.ENDC}")
+            for row in report["by_resource"]:
+                print(f"{row['id']:<10} {row['count']:>6} {row['minutes']:>9}")
+            
+            print(f"\n{Colors.BOLD}{'Usuário':<10} {'Qtd':>6} {'Minutos':>9}{Colors.ENDC}")
+            for row in report["by_user"]:
+                print(f"{row['id']:<10} {row['count']:>6} {row['minutes']:>9}")
+            
+            print(f"\n{Colors.BOLD}Agendamentos por dia:{Colors.ENDC}")
+            for row in report["by_day"]:
+                print(f"  {row['day']}  {row['count']}")
+            
+            print_success("Relatório gerado com sucesso!")
     
     except requests.exceptions.ConnectionError:
         print_error("Não foi possível conectar à API. Verifique se o servidor está rodando.")
@@ -462,6 +516,234 @@ def visualizar_resumo():
     
     input("\nPressione ENTER para continuar...")
 
+# ============================================================================
+# MODO BATCH (não interativo)
+# ============================================================================
+
+class BatchStats:
+    """Contadores de uma execução em lote."""
+    def __init__(self):
+        self.ok = 0
+        self.failed = 0
+        self.retries = 0
+        self.errors: List[str] = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, ok: bool, retries: int, error: Optional[str] = None):
+        with self._lock:
+            self.retries += retries
+            if ok:
+                self.ok += 1
+            else:
+                self.failed += 1
+                if error and len(self.errors) < 20:
+                    self.errors.append(error)
+
+    def finish(self) -> "BatchStats":
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def summary(self) -> str:
+        total = self.ok + self.failed
+        rate = total / self.elapsed if self.elapsed > 0 else float(total)
+        return (f"{total} requisições em {self.elapsed:.2f}s ({rate:.1f} req/s) — "
+                f"{self.ok} ok, {self.failed} falhas, {self.retries} retentativas")
+
+def request_with_retry(session, method: str, url: str, retries: int = DEFAULT_RETRIES,
+                       backoff: float = 0.2, timeout: float = TIMEOUT, max_wait: float = DEFAULT_MAX_WAIT,
+                       **kwargs):
+    """
+    Faz a requisição repetindo falhas transitórias (conexão, timeout, 429/502/503/504).
+    Respeita Retry-After quando o servidor manda. Um 429 é repetido enquanto o tempo total
+    esperado por 429 couber em `max_wait` segundos, sem contar em `retries`.
+    Retorna (response, retentativas); se desistir com exceção, ela leva as retentativas feitas
+    no atributo `retries`.
+    """
+    attempt, retried, throttled = 0, 0, 0.0
+    while True:
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except requests.exceptions.RequestException as e:
+            transient = isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+            if not transient or attempt == retries:
+                e.retries = retried
+                raise
+            time.sleep(backoff * (2 ** attempt))
+            attempt += 1
+            retried += 1
+            continue
+        if response.status_code in TRANSIENT_STATUS:
+            retry_after = response.headers.get("Retry-After", "")
+            delay = float(retry_after) if retry_after.replace(".", "", 1).isdigit() else backoff * (2 ** attempt)
+            if response.status_code == 429 and throttled + delay <= max_wait:
+                throttled += delay
+            elif attempt < retries:
+                attempt += 1
+            else:
+                return response, retried
+            time.sleep(delay)
+            retried += 1
+            continue
+        return response, retried
+
+def run_batch(session, method: str, url: str, payloads: Iterable[Dict[str, Any]],
+              concurrency: int = DEFAULT_CONCURRENCY, retries: int = DEFAULT_RETRIES,
+              ok_status: Iterable[int] = (200, 201), max_wait: float = DEFAULT_MAX_WAIT,
+              to_payload=None) -> BatchStats:
+    """
+    Envia os payloads com no máximo `concurrency` requisições em voo ao mesmo tempo. Com
+    `to_payload`, cada item é uma linha do arquivo convertida no worker: linha inválida conta
+    como falha (com o número da linha) e o lote segue.
+    """
+    stats = BatchStats()
+    ok_status = set(ok_status)
+
+    def send(index: int, payload: Dict[str, Any]):
+        if to_payload is not None:
+            try:
+                payload = to_payload(payload)
+            except (KeyError, TypeError, ValueError) as e:
+                stats.record(False, 0, f"linha {index}: inválida ({type(e).__name__}: {e})")
+                return
+        # uma chave por linha, repetida nas retentativas: o servidor devolve a resposta da primeira
+        headers = {"Idempotency-Key": str(uuid.uuid4())} if method.upper() == "POST" else None
+        try:
+            response, attempts = request_with_retry(session, method, url, retries=retries, json=payload,
+                                                    headers=headers, max_wait=max_wait)
+        except requests.exceptions.RequestException as e:
+            stats.record(False, getattr(e, "retries", 0), f"linha {index}: {e}")
+            return
+        if response.status_code in ok_status:
+            stats.record(True, attempts)
+        else:
+            stats.record(False, attempts, f"linha {index}: HTTP {response.status_code} {response.text[:200]}")
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        in_flight = set()
+        for index, payload in enumerate(payloads, start=1):
+            if len(in_flight) >= concurrency:
+                _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            in_flight.add(pool.submit(send, index, payload))
+        wait(in_flight)
+    return stats.finish()
+
+def read_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """Lê linhas de um arquivo CSV (com cabeçalho), JSON (lista) ou JSON Lines (.jsonl)."""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if ext == ".csv":
+            for row in csv.DictReader(f):
+                yield {k: (v if v != "" else None) for k, v in row.items()}
+        elif ext == ".jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif ext == ".json":
+            yield from json.load(f)
+        else:
+            raise ValueError(f"Formato não suportado: {ext} (use .csv, .json ou .jsonl)")
+
+def user_payload(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {"name": row["name"], "email": row["email"]}
+
+def appointment_payload(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "user_id": int(row["user_id"]),
+        "resource_id": int(row["resource_id"]),
+        "start_time": row["start_time"],
+        "duration_minutes": int(row["duration_minutes"]),
+        "notes": row.get("notes") or None,
+    }
+
+def write_rows(rows: List[Dict[str, Any]], path: str) -> None:
+    """Grava a lista em CSV ou JSON, conforme a extensão do arquivo."""
+    if path.lower().endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        return
+    fields = ["id", "user_id", "resource_id", "start_time", "end_time", "status", "notes"]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        w.writeheader()
+        w.writerows(rows)
+
+def fetch_appointments(session, base_url: str, args) -> List[Dict[str, Any]]:
+    params = {"order_by": args.order_by}
+    if args.user_id:
+        params["user_id"] = args.user_id
+    if args.start:
+        params["start"] = args.start
+    if args.end:
+        params["end"] = args.end
+    response, _ = request_with_retry(session, "GET", f"{base_url}/appointments", retries=args.retries, params=params)
+    response.raise_for_status()
+    return response.json()
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Sistema de Agendamento — modo batch")
+    parser.add_argument("--base-url", default=API_BASE_URL)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="requisições simultâneas")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="retentativas em falhas transitórias")
+    parser.add_argument("--max-wait", type=float, default=DEFAULT_MAX_WAIT,
+                        help="segundos que cada requisição pode esperar por 429 (limite de taxa)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import-users", help="cria usuários a partir de CSV/JSON")
+    p.add_argument("file")
+    p = sub.add_parser("import-appointments", help="cria agendamentos a partir de CSV/JSON")
+    p.add_argument("file")
+    for name in ("list", "export"):
+        p = sub.add_parser(name, help="lista agendamentos" if name == "list" else "exporta agendamentos")
+        p.add_argument("--user-id", type=int)
+        p.add_argument("--start")
+        p.add_argument("--end")
+        p.add_argument("--order-by", default="start_time")
+    sub.choices["list"].add_argument("--json", action="store_true", help="saída em JSON")
+    sub.choices["export"].add_argument("--output", help="arquivo local .csv/.json; sem ele, exporta no servidor")
+    return parser
+
+def run_headless(argv: List[str]) -> int:
+    """Executa um subcomando sem menus; retorna o código de saída."""
+    args = build_parser().parse_args(argv)
+    base_url = args.base_url.rstrip("/")
+    session = get_session(args.concurrency)
+
+    if args.command in ("import-users", "import-appointments"):
+        to_payload = user_payload if args.command == "import-users" else appointment_payload
+        endpoint = "users" if args.command == "import-users" else "appointments"
+        stats = run_batch(session, "POST", f"{base_url}/{endpoint}", read_rows(args.file),
+                          concurrency=args.concurrency, retries=args.retries, max_wait=args.max_wait,
+                          to_payload=to_payload)
+        for error in stats.errors:
+            print(error, file=sys.stderr)
+        print(stats.summary())
+        return 0 if stats.failed == 0 else 1
+
+    if args.command == "list":
+        rows = fetch_appointments(session, base_url, args)
+        if args.json:
+            print(json.dumps(rows, ensure_ascii=False, indent=2))
+        else:
+            print(f"{'ID':<7} {'Usuário':<8} {'Recurso':<8} {'Início':<20} {'Status':<12}")
+            for appt in rows:
+                print(f"{appt['id']:<7} {appt['user_id']:<8} {appt['resource_id']:<8} {appt['start_time']:<20} {appt['status']:<12}")
+            print(f"Total: {len(rows)}")
+        return 0
+
+    if args.command == "export":
+        if args.output:
+            rows = fetch_appointments(session, base_url, args)
+            write_rows(rows, args.output)
+            print(f"{len(rows)} agendamento(s) gravados em {args.output}")
+        else:
+            response, _ = request_with_retry(session, "GET", f"{base_url}/appointments/export", retries=args.retries)
+            response.raise_for_status()
+            print(response.json().get("path"))
+        return 0
+    return 2
+
 def main():
     """Loop principal da aplicação."""
     while True:
@@ -482,6 +764,12 @@ def main():
             input("Pressione ENTER para continuar...")
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        try:
+            sys.exit(run_headless(sys.argv[1:]))
+        except requests.exceptions.ConnectionError:
+            print_error("Não foi possível conectar à API. Verifique se o servidor está rodando.")
+            sys.exit(1)
     try:
         main()
     except KeyboardInterrupt:
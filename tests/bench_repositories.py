@@ -0,0 +1,106 @@
+"""
+Micro-benchmark dos repositórios: API 2.0 (select/RETURNING/lambda_stmt) contra o padrão
+antigo com Query + commit/refresh. Não é coletado pelo pytest; rode com
+
+    python -m tests.bench_repositories [--rows 2000] [--calls 2000] [--repeats 5] [--seed 0]
+
+Cada rodada mede as duas variantes em ordem alternada, com ids sorteados; o resultado é a
+mediana das rodadas.
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.db import init_schema
+from app.repositories import SqlAlchemyAppointmentRepository
+
+BASE = datetime(2030, 1, 7, 8, 0)
+
+
+class LegacyAppointmentRepository:
+    """Como os repositórios eram antes: Query montada a cada chamada e refresh após o commit."""
+
+    def create(self, db, app):
+        db.add(app); db.commit(); db.refresh(app)
+        return app
+
+    def get(self, db, id):
+        return db.query(models.Appointment).filter(models.Appointment.id == id).first()
+
+    def list_by_filter(self, db, user_id=None, start=None, end=None, order_by="start_time"):
+        q = db.query(models.Appointment)
+        if user_id:
+            q = q.filter(models.Appointment.user_id == user_id)
+        if start:
+            q = q.filter(models.Appointment.start_time >= start)
+        if end:
+            q = q.filter(models.Appointment.end_time <= end)
+        if order_by == "start_time":
+            q = q.order_by(models.Appointment.start_time)
+        return q.all()
+
+
+def _appointment(i):
+    start = BASE + timedelta(hours=i)
+    return models.Appointment(user_id=i % 50 + 1, resource_id=i % 7 + 1, start_time=start,
+                              end_time=start + timedelta(minutes=30))
+
+
+def _operations(repo, db, rows, calls, rng):
+    """Cada operação como (função sem argumentos, número de chamadas); ids sorteados a cada rodada."""
+    ids = iter([rng.randint(1, rows) for _ in range(calls)])
+    day = BASE + timedelta(days=3)
+    return {
+        "get": (lambda: (repo.get(db, next(ids)), db.expunge_all()), calls),
+        "list_by_filter": (lambda: repo.list_by_filter(db, user_id=7, start=day, end=day + timedelta(days=5)), calls),
+        "create": (lambda: repo.create(db, _appointment(rows)), calls // 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+    variants = (("legacy", LegacyAppointmentRepository()), ("2.0", SqlAlchemyAppointmentRepository()))
+    with tempfile.TemporaryDirectory() as tmp:
+        engines, sessions = [], {}
+        for label, _ in variants:
+            engine = create_engine(f"sqlite:///{Path(tmp) / (label + '.db')}")
+            init_schema(engine)
+            db = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)()
+            db.add_all(_appointment(i) for i in range(args.rows))
+            db.commit()
+            engines.append(engine)
+            sessions[label] = db
+        # µs por chamada de cada rodada; a ordem das variantes alterna para ninguém pagar sozinho o aquecimento
+        samples = {label: {} for label, _ in variants}
+        for r in range(args.repeats):
+            for label, repo in (variants if r % 2 == 0 else variants[::-1]):
+                for op, (fn, number) in _operations(repo, sessions[label], args.rows, args.calls, rng).items():
+                    samples[label].setdefault(op, []).append(timeit.timeit(fn, number=number) / number * 1e6)
+        for db in sessions.values():
+            db.close()
+        for engine in engines:
+            engine.dispose()
+    medians = {label: {op: statistics.median(v) for op, v in ops.items()} for label, ops in samples.items()}
+    for label, ops in medians.items():
+        print(f"{label:>8}: " + "  ".join(f"{op}={us:8.1f}us" for op, us in ops.items()))
+    print(f"mediana de {args.repeats} rodadas; legacy / 2.0:")
+    for op in medians["legacy"]:
+        print(f"{op:>15}: {medians['legacy'][op] / medians['2.0'][op]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
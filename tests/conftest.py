@@ -29,3 +29,47 @@ def pytest_configure(config):
         if 'mutmut' in sys.modules or any('mutmut' in str(arg) for arg in sys.argv):
             config.option.maxfail = 1  # Parar no primeiro erro se algo der errado
 
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+
+@pytest.fixture
+def db_engine(tmp_path):
+    """Banco SQLite em arquivo temporário, com o schema da aplicação criado."""
+    from app.db import init_schema
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    init_schema(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db_session(db_engine):
+    """Session ligada ao banco temporário de db_engine."""
+    session = sessionmaker(bind=db_engine, autocommit=False, autoflush=False)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def api_client(db_engine):
+    """TestClient da aplicação com get_db apontando para o banco temporário (sem lifespan)."""
+    from fastapi.testclient import TestClient
+    from app.db import get_db
+    from app.main import app
+
+    factory = sessionmaker(bind=db_engine, autoflush=False, expire_on_commit=False)
+
+    def override():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_db, None)
@@ -0,0 +1,186 @@
+"""
+Testes do controle de admissão: token buckets (429) e limite de concorrência com fila (503).
+"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.admission import AdmissionMiddleware, ConcurrencyGate, RateLimiter, RouteRule, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _app(settings, clock=None, delay=0.0):
+    app = FastAPI()
+
+    @app.get("/api/ping")
+    async def ping():
+        await asyncio.sleep(delay)
+        return {"ok": True}
+
+    @app.post("/api/appointments")
+    def book():
+        return {"ok": True}
+
+    @app.get("/api/appointments/stream")
+    def stream():
+        return {"ok": True}
+
+    app.add_middleware(AdmissionMiddleware, settings=settings, **({"clock": clock} if clock else {}))
+    return app
+
+
+def _run(app, requests):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.request(m, p) for m, p in requests))
+    return asyncio.run(scenario())
+
+
+# ============================================================================
+# Token buckets
+# ============================================================================
+
+class TestTokenBucket:
+    """Reabastecimento contínuo e Retry-After calculado."""
+
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(rate=2, burst=3, now=0)
+        assert [bucket.take(0) for _ in range(3)] == [0, 0, 0]
+        assert bucket.take(0) == pytest.approx(0.5)
+        assert bucket.take(0.5) == 0
+
+    def test_route_rule_overrides_client_limits(self):
+        clock = FakeClock()
+        limiter = RateLimiter(100, 100, [RouteRule("POST", "/api/appointments", client_rate=1, client_burst=1)], clock)
+        assert limiter.check("a", "POST", "/api/appointments") == 0
+        assert limiter.check("a", "POST", "/api/appointments") > 0
+        assert limiter.check("b", "POST", "/api/appointments") == 0
+        assert limiter.check("a", "GET", "/api/appointments") == 0
+
+    def test_global_route_bucket_refunds_client(self):
+        clock = FakeClock()
+        limiter = RateLimiter(100, 100, [RouteRule("POST", "/api/appointments", rate=1, burst=1)], clock)
+        assert limiter.check("a", "POST", "/api/appointments") == 0
+        assert limiter.check("b", "POST", "/api/appointments") == pytest.approx(1)
+        assert limiter._clients[("b", "POST /api/appointments")].tokens == 100
+
+    def test_rules_match_exact_path_unless_prefix(self):
+        clock = FakeClock()
+        rules = [RouteRule("POST", "/api/appointments", client_rate=1, client_burst=1),
+                 RouteRule("POST", "/api/users", client_rate=1, client_burst=1, prefix=True)]
+        limiter = RateLimiter(100, 100, rules, clock)
+        assert limiter.check("a", "POST", "/api/appointments") == 0
+        assert limiter.check("a", "POST", "/api/appointments/7/cancel") == 0  # não gasta a ficha do POST
+        assert limiter.check("a", "POST", "/api/appointments/7/no_show") == 0
+        assert limiter.check("a", "POST", "/api/appointments/") > 0
+        assert limiter.check("a", "POST", "/api/users/bulk") == 0
+        assert limiter.check("a", "POST", "/api/users") > 0
+
+    def test_non_positive_rate_is_rejected(self):
+        with pytest.raises(ValueError):
+            RouteRule("POST", "/api/appointments", client_rate=0)
+        with pytest.raises(ValueError):
+            RouteRule("POST", "/api/appointments", rate=-1)
+        middleware = AdmissionMiddleware(None, settings={"client_rate": 0})
+        with pytest.raises(ValueError):
+            middleware._load()
+
+    def test_client_table_is_bounded(self):
+        limiter = RateLimiter(1, 1, [], FakeClock(), max_clients=3)
+        for i in range(10):
+            limiter.check(f"c{i}", "GET", "/x")
+        assert len(limiter._clients) == 3
+
+
+class TestMiddlewareRateLimit:
+    """429 com Retry-After antes de chegar na rota; rotas isentas passam."""
+
+    SETTINGS = {"client_rate": 1, "client_burst": 2, "max_concurrent": 10, "max_queue": 10,
+                "routes": [{"method": "POST", "path": "/api/appointments", "client_rate": 0.5, "client_burst": 1}]}
+
+    def test_429_with_retry_after(self):
+        responses = _run(_app(self.SETTINGS, FakeClock()), [("POST", "/api/appointments")] * 3)
+        assert [r.status_code for r in responses].count(200) == 1
+        rejected = [r for r in responses if r.status_code == 429]
+        assert rejected and rejected[0].headers["retry-after"] == "2"
+
+    def test_exempt_stream(self):
+        responses = _run(_app(self.SETTINGS, FakeClock()), [("GET", "/api/appointments/stream")] * 5)
+        assert {r.status_code for r in responses} == {200}
+
+
+# ============================================================================
+# Concorrência
+# ============================================================================
+
+class TestConcurrencyGate:
+    """Fila limitada, FIFO e timeout."""
+
+    def test_sheds_when_queue_full(self):
+        settings = {"client_rate": 1000, "client_burst": 1000, "max_concurrent": 2, "max_queue": 2,
+                    "queue_timeout_seconds": 5}
+        responses = _run(_app(settings, delay=0.05), [("GET", "/api/ping")] * 8)
+        codes = [r.status_code for r in responses]
+        assert codes.count(200) == 4 and codes.count(503) == 4
+        assert all(r.headers["retry-after"] == "1" for r in responses if r.status_code == 503)
+
+    def test_queue_timeout(self):
+        settings = {"client_rate": 1000, "client_burst": 1000, "max_concurrent": 1, "max_queue": 5,
+                    "queue_timeout_seconds": 0.01}
+        codes = [r.status_code for r in _run(_app(settings, delay=0.1), [("GET", "/api/ping")] * 3)]
+        assert codes.count(200) == 1 and codes.count(503) == 2
+
+    def test_release_hands_slot_to_next_waiter(self):
+        async def scenario():
+            gate = ConcurrencyGate(limit=1, max_queue=2, timeout=1)
+            assert await gate.acquire()
+            waiter = asyncio.ensure_future(gate.acquire())
+            await asyncio.sleep(0)
+            assert gate.waiting == 1
+            gate.release()
+            assert await waiter is True
+            assert gate.in_flight == 1
+            gate.release()
+            assert gate.in_flight == 0
+        asyncio.run(scenario())
+
+    def test_cancelled_waiter_leaves_the_queue(self):
+        async def scenario():
+            gate = ConcurrencyGate(limit=1, max_queue=2, timeout=5)
+            assert await gate.acquire()
+            waiter = asyncio.ensure_future(gate.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert gate.waiting == 0
+            gate.release()
+            assert gate.in_flight == 0
+        asyncio.run(scenario())
+
+    def test_cancelled_after_grant_passes_the_slot_on(self):
+        async def scenario():
+            gate = ConcurrencyGate(limit=1, max_queue=2, timeout=5)
+            assert await gate.acquire()
+            first = asyncio.ensure_future(gate.acquire())
+            second = asyncio.ensure_future(gate.acquire())
+            await asyncio.sleep(0)
+            first.cancel()
+            gate.release()  # a vaga vai para `first`, que já foi cancelado e ainda não acordou
+            with pytest.raises(asyncio.CancelledError):
+                await first
+            assert await second is True
+            assert gate.in_flight == 1 and gate.waiting == 0
+            gate.release()
+            assert gate.in_flight == 0
+        asyncio.run(scenario())
@@ -0,0 +1,224 @@
+"""
+Testes do motor de ocupação vetorizado (comparado com uma conta ingênua em Python).
+"""
+import asyncio
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import pytest
+
+from app import analytics, models
+from app.analytics import STATUS_CODES, compute_utilization, hour_window, hourly_capacity, load_intervals, to_epoch_minutes
+from app.calendars import CompiledCalendar, DayHours
+
+MONDAY = datetime(2030, 3, 4)  # segunda-feira
+WORK = (8 * 60, 18 * 60)
+EVERY_DAY = CompiledCalendar([DayHours([WORK])] * 7)
+
+
+def naive_booked(intervals, window_start, window_end):
+    """Minutos ocupados por recurso dentro do expediente, percorrendo minuto a minuto."""
+    out = {}
+    for rid, start, end, status in intervals:
+        if status == "cancelled":
+            continue
+        t = max(start, window_start)
+        while t < min(end, window_end):
+            if WORK[0] <= t.hour * 60 + t.minute < WORK[1]:
+                out[rid] = out.get(rid, 0) + 1
+            t += timedelta(minutes=1)
+    return out
+
+
+def columns(intervals):
+    return (np.array([i[0] for i in intervals], dtype=np.int64),
+            np.array([to_epoch_minutes(i[1]) for i in intervals], dtype=np.int64),
+            np.array([to_epoch_minutes(i[2]) for i in intervals], dtype=np.int64),
+            np.array([STATUS_CODES[i[3]] for i in intervals], dtype=np.int64))
+
+
+def capacity(intervals, start, end, calendars=None, resource_ids=()):
+    """Capacidade (recurso x hora da janela) como utilization_report monta; EVERY_DAY por padrão."""
+    aligned, n_hours = hour_window(start, end)
+    return np.array([hourly_capacity((calendars or {}).get(rid, EVERY_DAY), aligned, n_hours)
+                     for rid in sorted({i[0] for i in intervals} | set(resource_ids))]).reshape(-1, n_hours)
+
+
+class TestComputeUtilization:
+    """Ocupação, mapa de calor, pico e taxas."""
+
+    INTERVALS = [
+        (1, MONDAY.replace(hour=9), MONDAY.replace(hour=10, minute=30), "done"),
+        (1, MONDAY.replace(hour=14, minute=15), MONDAY.replace(hour=14, minute=45), "no_show"),
+        (1, MONDAY.replace(hour=11), MONDAY.replace(hour=12), "cancelled"),
+        (2, MONDAY.replace(hour=9, minute=30), MONDAY.replace(hour=11), "scheduled"),
+        (2, (MONDAY + timedelta(days=1)).replace(hour=9), (MONDAY + timedelta(days=1)).replace(hour=10), "done"),
+    ]
+
+    def result(self, start=MONDAY, end=MONDAY + timedelta(days=7)):
+        return compute_utilization(*columns(self.INTERVALS), to_epoch_minutes(start), to_epoch_minutes(end),
+                                   capacity(self.INTERVALS, start, end))
+
+    def test_booked_minutes_match_naive(self):
+        window = (MONDAY, MONDAY + timedelta(days=7))
+        expected = naive_booked(self.INTERVALS, *window)
+        got = {r["resource_id"]: r["booked_minutes"] for r in self.result()["resources"]}
+        assert got == expected
+
+    def test_utilization_against_capacity(self):
+        res = self.result()
+        assert res["capacity_minutes"] == 2 * 7 * 10 * 60
+        r1 = next(r for r in res["resources"] if r["resource_id"] == 1)
+        assert r1["capacity_minutes"] == 4200 and r1["utilization"] == round(120 / 4200, 4)
+
+    def test_heatmap_and_peak(self):
+        res = self.result()
+        heat = np.array(res["heatmap"])
+        assert heat.shape == (7, 24)
+        # segunda 9h: recurso 1 ocupa 60 min, recurso 2 ocupa 30 -> 90 / (60 * 2)
+        assert heat[0, 9] == pytest.approx(0.75)
+        assert heat[0, 20] == 0
+        assert res["peak_hours"][0] == 9
+
+    def test_rates(self):
+        res = self.result()
+        assert res["cancellation_rate"] == 0.2
+        assert res["no_show_rate"] == 0.2
+        r1 = next(r for r in res["resources"] if r["resource_id"] == 1)
+        assert r1["cancellation_rate"] == round(1 / 3, 4)
+
+    def test_window_clips_intervals(self):
+        res = self.result(start=MONDAY.replace(hour=10), end=MONDAY.replace(hour=11))
+        got = {r["resource_id"]: r["booked_minutes"] for r in res["resources"]}
+        assert got == {1: 30, 2: 60}
+
+    def test_empty_window(self):
+        empty = np.array([], dtype=np.int64)
+        res = compute_utilization(empty, empty, empty, empty, to_epoch_minutes(MONDAY),
+                                  to_epoch_minutes(MONDAY + timedelta(days=1)), np.zeros((0, 24), dtype=np.int64))
+        assert res["resources"] == [] and res["appointments"] == 0
+
+    def test_capacity_must_cover_the_window(self):
+        with pytest.raises(ValueError, match="horas"):
+            compute_utilization(*columns(self.INTERVALS), to_epoch_minutes(MONDAY),
+                                to_epoch_minutes(MONDAY + timedelta(days=1)),
+                                capacity(self.INTERVALS, MONDAY, MONDAY + timedelta(days=2)))
+
+
+class TestPerResourceCalendars:
+    """Capacidade pelo expediente de cada recurso (grade semanal e exceções), não pelo global."""
+
+    # recurso 2 abre só de manhã, seg a sex, e fecha na terça (exceção)
+    MORNINGS = CompiledCalendar([DayHours([(8 * 60, 12 * 60)])] * 5 + [DayHours()] * 2,
+                                {(MONDAY + timedelta(days=1)).date(): DayHours()})
+
+    def test_hourly_capacity(self):
+        cap = hourly_capacity(self.MORNINGS, MONDAY, 7 * 24).reshape(7, 24)
+        assert cap[0, 8:12].tolist() == [60] * 4 and cap[0].sum() == 240
+        assert cap[1].sum() == 0 and cap[2].sum() == 240 and cap[5:].sum() == 0
+        half = CompiledCalendar([DayHours([(8 * 60 + 30, 9 * 60 + 15)])] * 7)
+        assert hourly_capacity(half, MONDAY.replace(hour=8), 2).tolist() == [30, 15]
+
+    def test_utilization_per_calendar(self):
+        intervals = TestComputeUtilization.INTERVALS
+        start, end = MONDAY, MONDAY + timedelta(days=7)
+        res = compute_utilization(*columns(intervals), to_epoch_minutes(start), to_epoch_minutes(end),
+                                  capacity(intervals, start, end, {2: self.MORNINGS}))
+        r1, r2 = res["resources"]
+        assert r1["capacity_minutes"] == 4200 and r2["capacity_minutes"] == 4 * 240
+        # recurso 2: 90 min na segunda; o horário de terça cai num dia fechado e não conta
+        assert r2["booked_minutes"] == 90 and r2["utilization"] == round(90 / 960, 4)
+        heat = np.array(r2["heatmap"])
+        assert heat[0, 9] == 0.5 and heat[0, 10] == 1.0 and heat[1].sum() == 0
+        # mapa geral: segunda 9h tem 60 + 30 ocupados sobre 60 + 60 abertos; terça 9h só o recurso 1 abre
+        overall = np.array(res["heatmap"])
+        assert overall[0, 9] == pytest.approx(0.75) and overall[1, 9] == 0
+        assert res["capacity_minutes"] == 4200 + 960
+
+    def test_route_uses_resource_schedule(self, api_client, db_session, monkeypatch):
+        monkeypatch.setattr(analytics, "_get_pool", lambda: None)
+        db_session.add_all([models.User(name="Ana", email="ana@x.com"),
+                            models.Resource(name="Sala", resource_type="sala"),
+                            models.ResourceSchedule(resource_id=1, weekday=0, start=time(8), end=time(12)),
+                            models.Appointment(user_id=1, resource_id=1, start_time=MONDAY.replace(hour=9),
+                                               end_time=MONDAY.replace(hour=11))])
+        db_session.commit()
+        resp = api_client.get("/api/reports/utilization",
+                              params={"start": MONDAY.isoformat(), "end": (MONDAY + timedelta(days=7)).isoformat()})
+        assert resp.status_code == 200
+        (r1,) = resp.json()["resources"]
+        assert r1["capacity_minutes"] == 240 and r1["utilization"] == 0.5
+
+    def test_idle_resource_counts_capacity(self):
+        intervals = [(1, MONDAY.replace(hour=9), MONDAY.replace(hour=10), "scheduled")]
+        start, end = MONDAY, MONDAY + timedelta(days=1)
+        ids = np.array([1, 5])  # recurso 5 sem nenhum agendamento na janela
+        res = compute_utilization(*columns(intervals), to_epoch_minutes(start), to_epoch_minutes(end),
+                                  capacity(intervals, start, end, resource_ids=ids), ids)
+        r1, r5 = res["resources"]
+        assert r5["resource_id"] == 5 and r5["booked_minutes"] == 0 and r5["utilization"] == 0
+        assert r5["capacity_minutes"] == 600 and res["capacity_minutes"] == 1200
+        # 9h: 60 ocupados sobre 60 + 60 abertos
+        assert np.array(res["heatmap"])[0, 9] == pytest.approx(0.5)
+
+    def test_route_includes_idle_resources(self, api_client, db_session, monkeypatch):
+        monkeypatch.setattr(analytics, "_get_pool", lambda: None)
+        db_session.add_all([models.User(name="Ana", email="ana@x.com"),
+                            models.Resource(name="Sala", resource_type="sala"),
+                            models.Resource(name="Auditório", resource_type="sala"),
+                            models.ResourceSchedule(resource_id=2, weekday=0, start=time(8), end=time(10)),
+                            models.Appointment(user_id=1, resource_id=1, start_time=MONDAY.replace(hour=9),
+                                               end_time=MONDAY.replace(hour=11))])
+        db_session.commit()
+        params = {"start": MONDAY.isoformat(), "end": (MONDAY + timedelta(days=1)).isoformat()}
+        body = api_client.get("/api/reports/utilization", params=params).json()
+        assert [r["resource_id"] for r in body["resources"]] == [1, 2]
+        assert body["resources"][1]["capacity_minutes"] == 120 and body["resources"][1]["utilization"] == 0
+        only = api_client.get("/api/reports/utilization", params={**params, "resource_id": 2}).json()
+        assert [r["resource_id"] for r in only["resources"]] == [2]
+
+
+class TestLoadIntervals:
+    """Leitura colunar direto do banco."""
+
+    def test_columns_from_select(self, db_session):
+        start = MONDAY.replace(hour=9)
+        db_session.add(models.Appointment(user_id=1, resource_id=3, start_time=start,
+                                          end_time=start + timedelta(minutes=45), status="cancelled"))
+        db_session.commit()
+        cols = load_intervals(db_session, MONDAY, MONDAY + timedelta(days=1))
+        assert cols["resource"].tolist() == [3]
+        assert cols["end"][0] - cols["start"][0] == 45
+        assert cols["start"][0] == to_epoch_minutes(start)
+        assert cols["status"].tolist() == [STATUS_CODES["cancelled"]]
+
+    def test_report_runs_inline_without_pool(self, db_session, monkeypatch):
+        monkeypatch.setattr(analytics, "_get_pool", lambda: None)
+        cols = load_intervals(db_session, MONDAY, MONDAY + timedelta(days=1))
+        report = asyncio.run(analytics.utilization_report(cols, MONDAY, MONDAY + timedelta(days=1)))
+        assert report["start"] == MONDAY
+        assert report["appointments"] == 0
+
+    def test_route_reads_with_its_own_session(self, api_client, monkeypatch):
+        """A leitura roda na task compartilhada, com session própria e não a da requisição do líder."""
+        from app.db import get_db
+        override = api_client.app.dependency_overrides[get_db]
+        handed, used = [], []
+
+        def tracking():
+            gen = override()
+            db = next(gen)
+            handed.append(db)
+            try:
+                yield db
+            finally:
+                gen.close()
+
+        real = analytics.load_intervals
+        monkeypatch.setitem(api_client.app.dependency_overrides, get_db, tracking)
+        monkeypatch.setattr(analytics, "load_intervals", lambda db, *args: (used.append(db), real(db, *args))[1])
+        monkeypatch.setattr(analytics, "_get_pool", lambda: None)
+        resp = api_client.get("/api/reports/utilization",
+                              params={"start": MONDAY.isoformat(), "end": (MONDAY + timedelta(days=1)).isoformat()})
+        assert resp.status_code == 200 and resp.json()["appointments"] == 0
+        assert len(handed) == 1 and len(used) == 1 and used[0] is not handed[0]
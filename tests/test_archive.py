@@ -0,0 +1,71 @@
+"""
+Testes do arquivamento quente/frio.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import models, reports
+from app.archive import archive_expired, retention_horizon
+from app.repositories import SqlAlchemyAppointmentRepository
+
+NOW = datetime(2030, 6, 1, 12, 0)
+
+
+@pytest.fixture
+def seeded(db_session):
+    for i in range(7):
+        start = NOW - timedelta(days=200 - i * 30, hours=2)
+        db_session.add(models.Appointment(user_id=1, resource_id=1, start_time=start,
+                                          end_time=start + timedelta(hours=1), status="done"))
+    db_session.commit()
+    return db_session
+
+
+class TestArchive:
+    """Movimentação em lotes e leitura transparente."""
+
+    def test_moves_only_past_horizon(self, seeded):
+        horizon = retention_horizon(NOW, retention_days=90)
+        moved = archive_expired(seeded, horizon, batch_size=2)
+        assert moved == 4
+        assert seeded.query(models.Appointment).count() == 3
+        assert seeded.query(models.ArchivedAppointment).count() == 4
+        assert all(a.end_time < horizon for a in seeded.query(models.ArchivedAppointment))
+
+    def test_resumable_in_chunks(self, seeded):
+        horizon = retention_horizon(NOW, retention_days=90)
+        assert archive_expired(seeded, horizon, batch_size=1, max_batches=1) == 1
+        assert archive_expired(seeded, horizon, batch_size=1) == 3
+        assert archive_expired(seeded, horizon, batch_size=1) == 0
+
+    def test_keeps_ids(self, seeded):
+        ids = sorted(a.id for a in seeded.query(models.Appointment))
+        archive_expired(seeded, NOW)
+        assert sorted(a.id for a in seeded.query(models.ArchivedAppointment)) == ids
+
+    def test_ids_are_not_reused_after_archiving(self, seeded):
+        """Arquivar tudo, reservar de novo e arquivar outra vez: o id novo não colide com o arquivo."""
+        archive_expired(seeded, NOW)
+        archived = {a.id for a in seeded.query(models.ArchivedAppointment)}
+        start = NOW - timedelta(days=10)
+        again = SqlAlchemyAppointmentRepository().create(seeded, models.Appointment(
+            user_id=1, resource_id=1, start_time=start, end_time=start + timedelta(hours=1), status="done"))
+        assert again.id > max(archived)
+        assert archive_expired(seeded, NOW) == 1
+        assert {a.id for a in seeded.query(models.ArchivedAppointment)} == archived | {again.id}
+
+    def test_listing_with_include_archived(self, seeded):
+        archive_expired(seeded, retention_horizon(NOW, retention_days=90))
+        repo = SqlAlchemyAppointmentRepository()
+        assert len(repo.list_by_filter(seeded, user_id=1)) == 3
+        merged = repo.list_by_filter(seeded, user_id=1, include_archived=True)
+        assert len(merged) == 7
+        assert [a.start_time for a in merged] == sorted(a.start_time for a in merged)
+
+    def test_summary_with_include_archived(self, seeded):
+        archive_expired(seeded, retention_horizon(NOW, retention_days=90))
+        assert reports.build_summary(seeded)["total"] == 3
+        full = reports.build_summary(seeded, include_archived=True)
+        assert full["total"] == 7
+        assert full["total_minutes"] == 7 * 60
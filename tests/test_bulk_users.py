@@ -0,0 +1,80 @@
+"""
+Testes do cadastro em massa de usuários (POST /api/users/bulk).
+"""
+import time
+
+import pytest
+
+from app import models
+from app.repositories import SqlAlchemyAppointmentRepository, SqlAlchemyUserRepository
+from app.services import UserService
+
+
+@pytest.fixture
+def service():
+    return UserService(SqlAlchemyUserRepository(), SqlAlchemyAppointmentRepository())
+
+
+class TestBulkCreateUsers:
+    """Deduplicação por conjunto e resultado por linha."""
+
+    def test_statuses_per_row(self, service, db_session):
+        db_session.add(models.User(name="Antiga", email="old@x.com"))
+        db_session.commit()
+        rows = [
+            {"name": "Ana", "email": "ana@x.com"},
+            {"name": "Ana 2", "email": "ana@x.com"},
+            {"name": "Velha", "email": "old@x.com"},
+            {"name": "Sem email", "email": "não-é-email"},
+            {"name": "Bia", "email": " bia@x.com "},
+        ]
+        results = service.bulk_create_users(db_session, rows)
+        assert [r["status"] for r in results] == ["created", "duplicate", "exists", "invalid", "created"]
+        assert [r["index"] for r in results] == list(range(5))
+        assert results[4]["email"] == "bia@x.com"
+        stored = {u.email: u.id for u in db_session.query(models.User)}
+        assert stored["ana@x.com"] == results[0]["id"]
+        assert len(stored) == 3
+
+    def test_emails_are_normalized_like_emailstr(self, service, db_session, api_client):
+        created = api_client.post("/api/users", json={"name": "Ana", "email": "ana@X.com"})
+        assert created.json()["email"] == "ana@x.com"
+        rows = [{"name": "Ana", "email": "ana@X.COM"},
+                {"name": "Bia", "email": "bia@Bücher.DE"},
+                {"name": "Bia 2", "email": "bia@bücher.de"},
+                {"name": "Cris", "email": "Cris <cris@X.com>"}]
+        results = service.bulk_create_users(db_session, rows)
+        assert [r["status"] for r in results] == ["exists", "created", "duplicate", "created"]
+        assert {u.email for u in db_session.query(models.User)} == {"ana@x.com", "bia@bücher.de", "cris@x.com"}
+
+    def test_chunks_keep_order_of_ids(self, service, db_session):
+        rows = [{"name": f"U{i}", "email": f"u{i}@x.com"} for i in range(25)]
+        results = service.bulk_create_users(db_session, rows, chunk_size=7)
+        by_email = {u.email: u.id for u in db_session.query(models.User)}
+        assert all(r["id"] == by_email[r["email"]] for r in results)
+
+    def test_race_on_insert_is_reported_as_exists(self, service, db_session, monkeypatch):
+        # simula outro cadastro entre a checagem e o insert: a checagem inicial não vê nada
+        db_session.add(models.User(name="Concorrente", email="c@x.com"))
+        db_session.commit()
+        real = service.user_repo.existing_emails
+        calls = []
+
+        def stale_once(db, emails):
+            calls.append(1)
+            return set() if len(calls) == 1 else real(db, emails)
+
+        monkeypatch.setattr(service.user_repo, "existing_emails", stale_once)
+        results = service.bulk_create_users(db_session, [{"name": "A", "email": "a@x.com"},
+                                                         {"name": "C", "email": "c@x.com"}])
+        assert [r["status"] for r in results] == ["created", "exists"]
+
+    def test_hundred_thousand_rows(self, service, db_session):
+        rows = [{"name": f"U{i}", "email": f"user{i}@example.com"} for i in range(100_000)]
+        rows += rows[:10]
+        t0 = time.perf_counter()
+        results = service.bulk_create_users(db_session, rows)
+        elapsed = time.perf_counter() - t0
+        assert sum(r["status"] == "created" for r in results) == 100_000
+        assert sum(r["status"] == "duplicate" for r in results) == 10
+        assert elapsed < 30
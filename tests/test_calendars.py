@@ -0,0 +1,200 @@
+"""
+Testes dos calendários por recurso: compilação em faixas por dia, regra de expediente,
+horários livres, cache/invalidação e as rotas de grade/exceções.
+"""
+from datetime import date, datetime, time, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app import models
+from app.calendars import CalendarRegistry, DayHours, compile_calendar, calendars
+from app.events import change_bus
+from app.exceptions import BusinessRuleException
+from app.repositories import (SqlAlchemyAppointmentRepository, SqlAlchemyCalendarRepository,
+                              SqlAlchemySeriesRepository, SqlAlchemyUserRepository)
+from app.services import AppointmentService
+
+OFFICE = DayHours([(8 * 60, 18 * 60)])
+MONDAY = date(2030, 6, 3)
+
+
+def next_weekday_at(weekday, hour):
+    """Próxima data (a partir de amanhã) no dia da semana pedido, no horário dado."""
+    day = datetime.now().replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    while day.weekday() != weekday:
+        day += timedelta(days=1)
+    return day
+
+
+def slot(weekday, start, end):
+    return SimpleNamespace(weekday=weekday, start=time.fromisoformat(start), end=time.fromisoformat(end))
+
+
+def closing(day, resource_id=None, start=None, end=None):
+    return SimpleNamespace(day=day, resource_id=resource_id, start=start and time.fromisoformat(start),
+                           end=end and time.fromisoformat(end))
+
+
+@pytest.fixture(autouse=True)
+def fresh_calendars():
+    # o registry compartilhado sobrevive entre bancos temporários com os mesmos ids de recurso
+    calendars.invalidate()
+    yield
+    calendars.invalidate()
+
+
+# ============================================================================
+# Compilação e consultas
+# ============================================================================
+
+class TestCompiledCalendar:
+    """Faixas por dia, exceções e bisect."""
+
+    def test_ranges_are_merged_and_sorted(self):
+        hours = DayHours([(780, 1080), (480, 720), (700, 750), (1080, 1100)])
+        assert list(hours) == [(480, 750), (780, 1100)]
+        assert str(hours) == "08:00-12:30, 13:00-18:20"
+        assert str(DayHours()) == "fechado"
+
+    def test_allows_respects_breaks(self):
+        cal = compile_calendar([slot(0, "08:00", "12:00"), slot(0, "13:00", "18:00")], [], OFFICE)
+        at = lambda h, m=0: datetime.combine(MONDAY, time(h, m))
+        assert cal.allows(at(8), at(12))
+        assert not cal.allows(at(11, 30), at(12, 30))  # atravessa o almoço
+        assert not cal.allows(at(7, 30), at(8, 30))
+        assert not cal.allows(at(9), at(9) + timedelta(days=1))
+        assert not cal.allows(at(9) + timedelta(days=1), at(10) + timedelta(days=1))  # terça sem grade
+
+    def test_without_schedule_uses_default_every_day(self):
+        cal = compile_calendar([], [], OFFICE)
+        assert all(list(cal.hours_on(MONDAY + timedelta(days=d))) == [(480, 1080)] for d in range(7))
+
+    def test_own_exception_overrides_global(self):
+        cal = compile_calendar([], [closing(MONDAY), closing(MONDAY, 1, "10:00", "14:00"),
+                                    closing(MONDAY + timedelta(days=1))], OFFICE)
+        assert str(cal.hours_on(MONDAY)) == "10:00-14:00"
+        assert not cal.hours_on(MONDAY + timedelta(days=1))
+        assert str(cal.hours_on(MONDAY + timedelta(days=2))) == "08:00-18:00"
+
+    def test_free_slots_subtract_busy(self):
+        cal = compile_calendar([slot(0, "08:00", "12:00"), slot(0, "13:00", "18:00")], [], OFFICE)
+        at = lambda h, m=0: datetime.combine(MONDAY, time(h, m))
+        busy = [(at(7), at(9)), (at(10), at(11)), (at(10, 30), at(11, 30)), (at(11, 50), at(13, 30))]
+        assert cal.free_slots(MONDAY, busy, 30) == [(at(9), at(10)), (at(13, 30), at(18))]
+        assert (at(11, 30), at(11, 50)) in cal.free_slots(MONDAY, busy, 20)
+
+
+# ============================================================================
+# Cache e invalidação
+# ============================================================================
+
+class CountingRepo(SqlAlchemyCalendarRepository):
+    def __init__(self):
+        self.loads = 0
+
+    def schedule(self, db, resource_id):
+        self.loads += 1
+        return super().schedule(db, resource_id)
+
+
+class TestRegistry:
+    """Compila uma vez por recurso e descarta quando o calendário muda."""
+
+    def test_compiled_once_until_changed(self, db_session):
+        repo = CountingRepo()
+        registry = CalendarRegistry(repo)
+        change_bus.add_listener(registry.on_change)
+        try:
+            for _ in range(3):
+                registry.get(db_session, 1)
+            assert repo.loads == 1
+            repo.replace_schedule(db_session, 1, [{"weekday": 0, "start": time(9), "end": time(12)}])
+            assert str(registry.get(db_session, 1).hours_on(MONDAY)) == "09:00-12:00"
+            repo.add_exception(db_session, {"day": MONDAY, "resource_id": None})
+            assert not registry.get(db_session, 1).hours_on(MONDAY)
+            assert repo.loads == 3
+        finally:
+            change_bus.remove_listener(registry.on_change)
+
+
+# ============================================================================
+# Regras do serviço
+# ============================================================================
+
+class TestServiceRules:
+    """Reservas e séries usam o calendário do recurso."""
+
+    @pytest.fixture
+    def setup(self, db_session):
+        db_session.add_all([models.User(name="Ana", email="ana@test.com"),
+                            models.Resource(name="Sala 1", resource_type="sala")])
+        db_session.commit()
+        service = AppointmentService(SqlAlchemyAppointmentRepository(), SqlAlchemyUserRepository(),
+                                     SqlAlchemySeriesRepository(), calendars=calendars)
+        repo = SqlAlchemyCalendarRepository()
+        # sábado das 08:00 às 12:00, domingo fechado, resto 07:00-20:00
+        repo.replace_schedule(db_session, 1, [{"weekday": d, "start": time(7), "end": time(20)} for d in range(5)]
+                              + [{"weekday": 5, "start": time(8), "end": time(12)}])
+        return SimpleNamespace(db=db_session, service=service, repo=repo)
+
+    def test_hours_follow_resource_schedule(self, setup):
+        created = setup.service.create_appointment(setup.db, 1, 1, next_weekday_at(1, 19), 60)
+        assert created.id is not None
+        with pytest.raises(BusinessRuleException, match="expediente"):
+            setup.service.create_appointment(setup.db, 1, 1, next_weekday_at(5, 12), 30)
+        with pytest.raises(BusinessRuleException, match="fechado"):
+            setup.service.create_appointment(setup.db, 1, 1, next_weekday_at(6, 10), 30)
+
+    def test_series_occurrence_on_holiday_is_rejected(self, setup):
+        start = next_weekday_at(1, 10)
+        setup.repo.add_exception(setup.db, {"day": (start + timedelta(weeks=2)).date(), "resource_id": None})
+        with pytest.raises(BusinessRuleException, match=(start + timedelta(weeks=2)).date().isoformat()):
+            setup.service.create_series(setup.db, 1, 1, start, 60, "WEEKLY", count=4)
+
+    def test_free_slots_skip_bookings_and_series(self, setup):
+        start = next_weekday_at(1, 9)
+        setup.service.create_appointment(setup.db, 1, 1, start, 60)
+        setup.service.create_series(setup.db, 1, 1, start.replace(hour=14), 30, "DAILY", count=2)
+        slots = setup.service.free_slots(setup.db, 1, start.date(), 30)
+        hours = [(s.strftime("%H:%M"), e.strftime("%H:%M")) for s, e in slots]
+        assert hours == [("07:00", "09:00"), ("10:00", "14:00"), ("14:30", "20:00")]
+
+
+# ============================================================================
+# Rotas
+# ============================================================================
+
+class TestCalendarRoutes:
+    """Grade, exceções e horários livres pela API."""
+
+    def test_schedule_roundtrip_and_free_slots(self, api_client, db_session):
+        db_session.add(models.Resource(name="Sala 1", resource_type="sala"))
+        db_session.commit()
+        resp = api_client.put("/api/resources/1/schedule", json=[{"weekday": 0, "start": "13:00", "end": "15:00"},
+                                                                 {"weekday": 0, "start": "09:00", "end": "11:00"}])
+        assert resp.status_code == 200
+        assert [s["start"] for s in api_client.get("/api/resources/1/schedule").json()] == ["09:00:00", "13:00:00"]
+        day = next_weekday_at(0, 0).date()
+        free = api_client.get("/api/resources/1/free_slots", params={"day": day.isoformat(), "duration_minutes": 90})
+        assert [s["start_time"][11:16] for s in free.json()] == ["09:00", "13:00"]
+
+        created = api_client.post("/api/calendar/exceptions", json={"day": day.isoformat(), "resource_id": 1})
+        assert created.status_code == 200
+        assert api_client.get("/api/resources/1/free_slots", params={"day": day.isoformat()}).json() == []
+        assert api_client.delete(f"/api/calendar/exceptions/{created.json()['id']}").status_code == 204
+        assert len(api_client.get("/api/resources/1/free_slots", params={"day": day.isoformat()}).json()) == 2
+
+    def test_validation_and_missing_resource(self, api_client):
+        assert api_client.put("/api/resources/1/schedule", json=[]).status_code == 404
+        assert api_client.post("/api/calendar/exceptions",
+                               json={"day": "2030-01-01", "start": "10:00"}).status_code == 422
+        assert api_client.post("/api/calendar/exceptions", json={"day": "2030-01-01"}).status_code == 200
+        assert api_client.delete("/api/calendar/exceptions/99").status_code == 404
+
+    def test_resource_delete_drops_calendar(self, api_client, db_session):
+        db_session.add(models.Resource(name="Sala 1", resource_type="sala"))
+        db_session.commit()
+        api_client.put("/api/resources/1/schedule", json=[{"weekday": 0, "start": "09:00", "end": "11:00"}])
+        assert api_client.delete("/api/resources/1").status_code == 204
+        assert db_session.query(models.ResourceSchedule).count() == 0
@@ -0,0 +1,184 @@
+"""
+Testes do cancelamento: rota, horário liberado, listagens sem cancelados e uso dos índices
+parciais de reservas vivas.
+"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import models
+from app.exceptions import BusinessRuleException, NotFoundException
+from app.repositories import SqlAlchemyAppointmentRepository, SqlAlchemyUserRepository
+from app.services import AppointmentService, UserService
+from app.waitlist import WaitlistIndex
+
+
+def next_weekday_at(weekday, hour):
+    """Próxima data (a partir de amanhã) no dia da semana pedido, no horário dado."""
+    day = datetime.now().replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    while day.weekday() != weekday:
+        day += timedelta(days=1)
+    return day
+
+
+@pytest.fixture
+def setup(db_session):
+    db_session.add_all([models.User(name="Ana", email="ana@test.com"), models.User(name="Bia", email="bia@test.com"),
+                        models.Resource(name="Sala 1", resource_type="sala")])
+    db_session.commit()
+    service = AppointmentService(SqlAlchemyAppointmentRepository(), SqlAlchemyUserRepository(),
+                                 waitlist=WaitlistIndex())
+    return SimpleNamespace(db=db_session, service=service, repo=service.app_repo, at=next_weekday_at(3, 10))
+
+
+# ============================================================================
+# Serviço
+# ============================================================================
+
+class TestCancel:
+    """Cancelado não ocupa horário nem conta no limite diário."""
+
+    def test_cancelled_slot_can_be_booked_again(self, setup):
+        first = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        assert setup.service.cancel_appointment(setup.db, first.id).status == "cancelled"
+        again = setup.service.create_appointment(setup.db, 2, 1, setup.at, 60)
+        assert again.id != first.id
+
+    def test_cancel_promotes_waitlist(self, setup):
+        booked = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        waiting = setup.service.join_waitlist(setup.db, 2, 1, setup.at, 60)
+        setup.service.cancel_appointment(setup.db, booked.id)
+        setup.db.expire_all()
+        assert setup.db.get(models.WaitlistEntry, waiting.id).status == "promoted"
+
+    def test_cancel_is_idempotent_but_not_for_done(self, setup):
+        booked = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        setup.service.cancel_appointment(setup.db, booked.id)
+        assert setup.service.cancel_appointment(setup.db, booked.id).status == "cancelled"
+        done = setup.service.create_appointment(setup.db, 1, 1, setup.at + timedelta(hours=2), 60)
+        setup.db.query(models.Appointment).filter_by(id=done.id).update({"status": "done"})
+        setup.db.commit()
+        with pytest.raises(BusinessRuleException, match="done"):
+            setup.service.cancel_appointment(setup.db, done.id)
+        with pytest.raises(NotFoundException):
+            setup.service.cancel_appointment(setup.db, 999)
+
+    def test_cancelled_do_not_count_for_daily_limit(self, setup):
+        for h in range(3):
+            created = setup.service.create_appointment(setup.db, 1, 1, setup.at.replace(hour=9 + h), 30)
+        setup.service.cancel_appointment(setup.db, created.id)
+        assert setup.service.create_appointment(setup.db, 1, 1, setup.at.replace(hour=15), 30).id
+
+    def test_cancelled_do_not_count_as_reserved_minutes(self, setup):
+        users = UserService(setup.service.user_repo, setup.repo)
+        booked = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        assert users.total_reserved_minutes(setup.db, 1) == 60
+        setup.service.cancel_appointment(setup.db, booked.id)
+        assert users.total_reserved_minutes(setup.db, 1) == 0
+
+    def test_listings_skip_cancelled(self, setup):
+        kept = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        gone = setup.service.create_appointment(setup.db, 1, 1, setup.at + timedelta(hours=2), 60)
+        setup.service.cancel_appointment(setup.db, gone.id)
+        assert [a.id for a in setup.repo.list_by_filter(setup.db, user_id=1)] == [kept.id]
+        assert [a.id for a in setup.repo.list_by_filter(setup.db, user_id=1, include_cancelled=True)] == [kept.id, gone.id]
+        day = setup.at.replace(hour=0)
+        assert [a.id for a in setup.repo.list_by_resource(setup.db, 1, day, day + timedelta(days=1))] == [kept.id]
+
+
+# ============================================================================
+# Índices parciais
+# ============================================================================
+
+class TestPartialIndexes:
+    """Checagem de conflito e listagens caem nos índices de reservas vivas."""
+
+    @pytest.fixture
+    def plans(self, setup, db_engine):
+        """EXPLAIN QUERY PLAN de cada SELECT/INSERT emitido no engine."""
+        seen = []
+
+        def capture(conn, cursor, stmt, params, ctx, many):
+            if not many and stmt.lstrip().startswith(("SELECT", "INSERT")) and "appointments" in stmt:
+                rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {stmt}", params).all()
+                seen.append(" | ".join(r[-1] for r in rows))
+
+        event.listen(db_engine, "before_cursor_execute", capture)
+        yield seen
+        event.remove(db_engine, "before_cursor_execute", capture)
+
+    def test_conflict_check_uses_live_index(self, setup, plans):
+        setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        assert any("ix_appointments_live_resource_start" in p for p in plans)
+        assert any("ix_appointments_live_user_start" in p for p in plans)
+
+    def test_index_has_where_clause(self, db_engine):
+        with db_engine.connect() as conn:
+            sql = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = 'ix_appointments_live_resource_start'").scalar()
+            retired = conn.exec_driver_sql("SELECT count(*) FROM sqlite_master WHERE name = 'ix_appointments_user_start'").scalar()
+        assert "WHERE status != 'cancelled'" in sql
+        assert retired == 0
+
+
+# ============================================================================
+# Rota
+class TestNoShow:
+    """Não comparecimento: só depois do início e nunca para cancelado."""
+
+    def test_mark_after_start(self, setup):
+        booked = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        with pytest.raises(BusinessRuleException, match="não começou"):
+            setup.service.mark_no_show(setup.db, booked.id)
+        marked = setup.service.mark_no_show(setup.db, booked.id, now=setup.at + timedelta(minutes=5))
+        assert marked.status == "no_show"
+        # de novo devolve como está; e o horário continua ocupado
+        assert setup.service.mark_no_show(setup.db, booked.id, now=setup.at).status == "no_show"
+        with pytest.raises(BusinessRuleException, match="sobreposição"):
+            setup.service.create_appointment(setup.db, 2, 1, setup.at, 60)
+
+    def test_done_can_be_marked_but_not_cancelled(self, setup):
+        done = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        setup.db.query(models.Appointment).filter_by(id=done.id).update({"status": "done"})
+        setup.db.commit()
+        assert setup.service.mark_no_show(setup.db, done.id, now=setup.at + timedelta(hours=2)).status == "no_show"
+        cancelled = setup.service.create_appointment(setup.db, 1, 1, setup.at + timedelta(hours=2), 60)
+        setup.service.cancel_appointment(setup.db, cancelled.id)
+        with pytest.raises(BusinessRuleException, match="cancelado"):
+            setup.service.mark_no_show(setup.db, cancelled.id, now=setup.at + timedelta(days=1))
+        with pytest.raises(NotFoundException):
+            setup.service.mark_no_show(setup.db, 999)
+
+# ============================================================================
+
+class TestCancelRoute:
+    """POST /api/appointments/{id}/cancel."""
+
+    def test_cancel_route(self, api_client, db_session):
+        db_session.add_all([models.User(name="Ana", email="ana@x.com"), models.Resource(name="Sala 1", resource_type="sala")])
+        db_session.commit()
+        at = next_weekday_at(3, 11).isoformat()
+        created = api_client.post("/api/appointments", json={"user_id": 1, "resource_id": 1, "start_time": at,
+                                                             "duration_minutes": 30}).json()
+        resp = api_client.post(f"/api/appointments/{created['id']}/cancel")
+        assert resp.status_code == 200 and resp.json()["status"] == "cancelled"
+        assert api_client.get("/api/appointments", params={"user_id": 1}).json() == []
+        assert len(api_client.get("/api/appointments", params={"user_id": 1, "include_cancelled": True}).json()) == 1
+        assert api_client.post("/api/appointments/999/cancel").status_code == 404
+
+    def test_no_show_route(self, api_client, db_session):
+        db_session.add_all([models.User(name="Ana", email="ana@x.com"), models.Resource(name="Sala 1", resource_type="sala")])
+        past = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+        future = next_weekday_at(3, 11)
+        db_session.add_all([models.Appointment(user_id=1, resource_id=1, start_time=past, end_time=past + timedelta(minutes=30)),
+                            models.Appointment(user_id=1, resource_id=1, start_time=future,
+                                               end_time=future + timedelta(minutes=30))])
+        db_session.commit()
+        # cliente próprio: POST /api/appointments* divide o balde de admissão por IP
+        client = TestClient(api_client.app, client=("10.0.0.52", 50000))
+        resp = client.post("/api/appointments/1/no_show")
+        assert resp.status_code == 200 and resp.json()["status"] == "no_show"
+        assert client.post("/api/appointments/2/no_show").status_code == 422
+        assert client.post("/api/appointments/999/no_show").status_code == 404
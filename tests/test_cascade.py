@@ -0,0 +1,102 @@
+"""
+Testes da exclusão em cascata por conjunto (usuários e recursos) e da exclusão lógica com expurgo.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+
+from app import lifecycle, models
+from app.db import init_schema
+from app.repositories import SqlAlchemyResourceRepository, SqlAlchemyUserRepository
+
+NOW = datetime(2030, 6, 3, 9, 0)
+
+
+@pytest.fixture
+def seeded(db_session):
+    db_session.add_all([models.User(name="Ana", email="ana@x.com"), models.User(name="Bia", email="bia@x.com"),
+                        models.Resource(name="Sala", resource_type="sala")])
+    db_session.flush()
+    for user_id in (1, 2):
+        for i in range(30):
+            start = NOW + timedelta(hours=i)
+            db_session.add(models.Appointment(user_id=user_id, resource_id=1, start_time=start,
+                                              end_time=start + timedelta(minutes=30)))
+        db_session.add(models.AppointmentSeries(user_id=user_id, resource_id=1, start_time=NOW,
+                                                end_time=NOW + timedelta(days=7), duration_minutes=30,
+                                                freq="DAILY", interval=1, count=7))
+        db_session.add(models.ArchivedAppointment(id=1000 + user_id, user_id=user_id, resource_id=1,
+                                                  start_time=NOW - timedelta(days=400),
+                                                  end_time=NOW - timedelta(days=400), status="done",
+                                                  archived_at=NOW))
+    db_session.commit()
+    db_session.expunge_all()
+    return db_session
+
+
+def _count(db, model, **filters):
+    return db.query(model).filter_by(**filters).count()
+
+
+class TestHardDelete:
+    """Um DELETE por tabela filha, sem carregar as linhas."""
+
+    def test_user_and_children_removed(self, seeded, db_engine):
+        statements = []
+        listener = lambda conn, cursor, stmt, params, ctx, many: statements.append(stmt)
+        event.listen(db_engine, "before_cursor_execute", listener)
+        SqlAlchemyUserRepository(soft_delete=False).delete(seeded, 1)
+        event.remove(db_engine, "before_cursor_execute", listener)
+        assert not [s for s in statements if s.startswith("SELECT")]
+        for model in (models.Appointment, models.AppointmentSeries, models.ArchivedAppointment):
+            assert _count(seeded, model, user_id=1) == 0
+            assert _count(seeded, model, user_id=2) > 0
+        assert seeded.get(models.User, 1) is None
+
+    def test_resource_delete_cascades(self, seeded):
+        assert SqlAlchemyResourceRepository().delete(seeded, 1) is True
+        assert seeded.query(models.Appointment).count() == 0
+        assert seeded.query(models.AppointmentSeries).count() == 0
+        assert SqlAlchemyResourceRepository().delete(seeded, 1) is False
+
+
+class TestSoftDelete:
+    """Marca deleted_at na hora e o job apaga em lotes depois."""
+
+    def test_hidden_then_purged(self, seeded):
+        repo = SqlAlchemyUserRepository(soft_delete=True)
+        repo.delete(seeded, 1)
+        assert repo.get(seeded, 1) is None
+        assert [u.id for u in repo.list(seeded)] == [2]
+        assert _count(seeded, models.Appointment, user_id=1) == 30
+
+        removed = lifecycle.purge_deleted_users(seeded, batch_size=7)
+        assert removed == 30 + 1 + 1
+        assert _count(seeded, models.Appointment, user_id=1) == 0
+        assert _count(seeded, models.Appointment, user_id=2) == 30
+        assert seeded.query(models.User).count() == 1
+
+    def test_soft_delete_is_idempotent(self, seeded):
+        repo = SqlAlchemyUserRepository(soft_delete=True)
+        repo.delete(seeded, 1)
+        first = seeded.get(models.User, 1).deleted_at
+        repo.delete(seeded, 1)
+        seeded.expire_all()
+        assert seeded.get(models.User, 1).deleted_at == first
+
+
+class TestMigration:
+    """Bancos antigos ganham a coluna deleted_at no próximo start."""
+
+    def test_adds_missing_column(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, "
+                              "email VARCHAR NOT NULL UNIQUE, is_active BOOLEAN)"))
+            conn.execute(text("INSERT INTO users (name, email, is_active) VALUES ('Ana', 'ana@x.com', 1)"))
+        init_schema(engine)
+        assert "deleted_at" in {c["name"] for c in inspect(engine).get_columns("users")}
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT name FROM users WHERE deleted_at IS NULL")).scalar() == "Ana"
+        engine.dispose()
@@ -0,0 +1,189 @@
+"""
+Testes do modo batch do cli.py (a Session é substituída por um fake, ou por um TestClient da API
+com a admissão da config padrão).
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+import requests
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import cli
+from app import api, models
+from app.admission import AdmissionMiddleware
+from app.config import get_config
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self._body = body if body is not None else {}
+        self.headers = headers or {}
+        self.text = json.dumps(self._body)
+
+    def json(self):
+        return self._body
+
+
+class FakeSession:
+    """Responde a partir de uma fila de respostas e mede o pico de requisições simultâneas."""
+
+    def __init__(self, responses=None, delay=0.0):
+        self.responses = list(responses or [])
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def request(self, method, url, timeout=None, **kwargs):
+        with self._lock:
+            self.calls.append((method, url, kwargs))
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            nxt = self.responses.pop(0) if self.responses else FakeResponse(200, {"id": len(self.calls)})
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        if isinstance(nxt, Exception):
+            raise nxt
+        return nxt
+
+
+class TestRetry:
+    """Falhas transitórias são repetidas; erros de negócio não."""
+
+    def test_retries_transient_status_then_succeeds(self):
+        session = FakeSession([FakeResponse(503, headers={"Retry-After": "0"}), FakeResponse(200, {"id": 1})])
+        response, retries = cli.request_with_retry(session, "POST", "http://x/api/users", backoff=0)
+        assert response.status_code == 200
+        assert retries == 1
+
+    def test_retries_connection_errors(self):
+        session = FakeSession([requests.exceptions.ConnectionError(), FakeResponse(200)])
+        response, retries = cli.request_with_retry(session, "GET", "http://x", backoff=0)
+        assert response.status_code == 200
+
+    def test_rate_limit_waits_do_not_spend_retries(self):
+        throttled = [FakeResponse(429, headers={"Retry-After": "0"}) for _ in range(10)]
+        session = FakeSession(throttled + [FakeResponse(200)])
+        response, retries = cli.request_with_retry(session, "POST", "http://x", retries=1, backoff=0)
+        assert response.status_code == 200 and retries == 10
+
+    def test_rate_limit_budget_runs_out(self):
+        session = FakeSession([FakeResponse(429, headers={"Retry-After": "0.5"}) for _ in range(10)])
+        response, _ = cli.request_with_retry(session, "POST", "http://x", retries=0, max_wait=1.0,
+                                             backoff=0)
+        assert response.status_code == 429 and len(session.calls) == 3
+
+    def test_does_not_retry_business_errors(self):
+        session = FakeSession([FakeResponse(422, {"detail": "conflito"})])
+        response, retries = cli.request_with_retry(session, "POST", "http://x", backoff=0)
+        assert response.status_code == 422
+        assert len(session.calls) == 1
+
+
+class TestBatch:
+    """Envio concorrente com limite de requisições em voo."""
+
+    def test_bounded_concurrency_and_stats(self):
+        session = FakeSession(delay=0.01)
+        payloads = ({"name": f"U{i}", "email": f"u{i}@x.com"} for i in range(40))
+        stats = cli.run_batch(session, "POST", "http://x/api/users", payloads, concurrency=4)
+        assert stats.ok == 40
+        assert stats.failed == 0
+        assert 1 < session.peak <= 4
+        assert "40 requisições" in stats.summary()
+
+    def test_retries_reuse_idempotency_key(self):
+        session = FakeSession([FakeResponse(503, headers={"Retry-After": "0"}), FakeResponse(200),
+                               FakeResponse(200)])
+        cli.run_batch(session, "POST", "http://x/api/users", [{"a": 1}, {"a": 2}], concurrency=1)
+        keys = [kwargs["headers"]["Idempotency-Key"] for _, _, kwargs in session.calls]
+        assert keys[0] == keys[1] != keys[2]
+
+    def test_failures_are_reported_per_row(self):
+        session = FakeSession([FakeResponse(200), FakeResponse(422, {"detail": "fora do expediente"})])
+        stats = cli.run_batch(session, "POST", "http://x", [{}, {}], concurrency=1, retries=0)
+        assert (stats.ok, stats.failed) == (1, 1)
+        assert stats.errors[0].startswith("linha 2")
+
+    def test_invalid_rows_fail_without_stopping_the_batch(self):
+        session = FakeSession()
+        rows = [{"user_id": "1", "resource_id": "1", "start_time": "2030-01-01T09:00", "duration_minutes": "30"},
+                {"user_id": "x", "resource_id": "1", "start_time": "2030-01-01T10:00", "duration_minutes": "30"},
+                {"user_id": "1", "resource_id": "1"},
+                {"user_id": "1", "resource_id": "1", "start_time": "2030-01-01T11:00", "duration_minutes": "30"}]
+        stats = cli.run_batch(session, "POST", "http://x", rows, concurrency=2, to_payload=cli.appointment_payload)
+        assert (stats.ok, stats.failed, len(session.calls)) == (2, 2, 2)
+        assert sorted(e.split(":")[0] for e in stats.errors) == ["linha 2", "linha 3"]
+
+    def test_exception_records_attempts_made(self):
+        session = FakeSession([requests.exceptions.ConnectionError()] * 2)
+        stats = cli.run_batch(session, "POST", "http://x", [{}], concurrency=1, retries=1)
+        assert (stats.failed, stats.retries) == (1, 1)
+        session = FakeSession([requests.exceptions.InvalidURL("sem host")])
+        stats = cli.run_batch(session, "POST", "http://x", [{}], concurrency=1, retries=5)
+        assert (stats.failed, stats.retries) == (1, 0)
+
+
+class TestAgainstDefaultAdmission:
+    """
+    Lote de agendamentos contra a API com a regra de admissão da config.yaml (2/s por cliente,
+    rajada de 5). O relógio dos baldes e os sleeps do cli correm SPEED vezes mais rápido.
+    """
+
+    SPEED = 20
+    ROWS = 40
+
+    @pytest.fixture
+    def session(self, api_client, db_session, monkeypatch):
+        db_session.add_all([models.User(name=f"U{i}", email=f"u{i}@x.com") for i in range(8)])
+        db_session.add_all([models.Resource(name=f"R{i}", resource_type="sala") for i in range(5)])
+        db_session.commit()
+        app = FastAPI()
+        app.include_router(api.router, prefix="/api")
+        app.dependency_overrides.update(api_client.app.dependency_overrides)
+        app.add_middleware(AdmissionMiddleware, settings=get_config()["admission"],
+                           clock=lambda: time.monotonic() * self.SPEED)
+        monkeypatch.setattr(cli, "time", SimpleNamespace(sleep=lambda s: time.sleep(s / self.SPEED),
+                                                         perf_counter=time.perf_counter))
+        return TestClient(app, client=("10.0.60.1", 50000))
+
+    def test_batch_of_bookings_completes(self, session):
+        day = datetime.now().replace(hour=10, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        # cada dia com 5 recursos e 5 usuários diferentes: nenhum conflito nem limite diário
+        payloads = [{"user_id": i % 8 + 1, "resource_id": i % 5 + 1, "duration_minutes": 30,
+                     "start_time": (day + timedelta(days=i // 5)).isoformat()} for i in range(self.ROWS)]
+        stats = cli.run_batch(session, "POST", "http://testserver/api/appointments", payloads)
+        assert (stats.ok, stats.failed) == (self.ROWS, 0), stats.errors
+        assert stats.retries > 0  # o limite de taxa atuou e foi respeitado
+
+
+class TestFiles:
+    """Leitura de CSV/JSON e conversão para payload."""
+
+    def test_read_csv_appointments(self, tmp_path):
+        path = tmp_path / "appts.csv"
+        path.write_text("user_id,resource_id,start_time,duration_minutes,notes\n1,2,2030-01-01T10:00:00,30,\n",
+                        encoding="utf-8")
+        rows = [cli.appointment_payload(r) for r in cli.read_rows(str(path))]
+        assert rows == [{"user_id": 1, "resource_id": 2, "start_time": "2030-01-01T10:00:00",
+                         "duration_minutes": 30, "notes": None}]
+
+    def test_read_json_and_jsonl(self, tmp_path):
+        (tmp_path / "u.json").write_text('[{"name": "A", "email": "a@x.com"}]', encoding="utf-8")
+        (tmp_path / "u.jsonl").write_text('{"name": "B", "email": "b@x.com"}\n', encoding="utf-8")
+        assert [r["name"] for r in cli.read_rows(str(tmp_path / "u.json"))] == ["A"]
+        assert [r["name"] for r in cli.read_rows(str(tmp_path / "u.jsonl"))] == ["B"]
+
+    def test_unknown_extension(self, tmp_path):
+        path = tmp_path / "u.txt"
+        path.write_text("x", encoding="utf-8")
+        with pytest.raises(ValueError):
+            list(cli.read_rows(str(path)))
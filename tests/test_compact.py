@@ -0,0 +1,114 @@
+"""
+Testes do store colunar compacto de intervalos.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import models
+from app.compact import IntervalRecord, IntervalStore, to_epoch_minutes
+
+BASE = datetime(2030, 6, 3, 8, 0)
+
+
+def _m(hours):
+    return to_epoch_minutes(BASE + timedelta(hours=hours))
+
+
+@pytest.fixture
+def store():
+    s = IntervalStore()
+    s.extend([
+        (1, 2, 10, _m(3), _m(4)),
+        (2, 1, 10, _m(0), _m(5)),   # longo: define a maior duração
+        (3, 1, 11, _m(6), _m(7)),
+        (4, 2, 11, _m(0), _m(1)),
+    ])
+    s.sort()
+    return s
+
+
+# ============================================================================
+# Representação
+# ============================================================================
+
+class TestLayout:
+    """Registros com __slots__ e colunas int64."""
+
+    def test_record_has_no_dict(self):
+        rec = IntervalRecord(1, 1, 1, 0, 10)
+        assert not hasattr(rec, "__dict__")
+
+    def test_nbytes_is_five_int64_per_row(self, store):
+        assert store.nbytes == len(store) * 5 * 8
+
+    def test_sort_groups_by_resource_and_start(self, store):
+        assert [(r.resource_id, r.id) for r in store] == [(1, 2), (1, 3), (2, 4), (2, 1)]
+
+    def test_numpy_views_share_memory(self, store):
+        np = pytest.importorskip("numpy")
+        cols = store.as_numpy()
+        assert cols["start"].dtype == np.int64
+        assert cols["id"].tolist() == list(store.id)
+        store.end[0] += 1
+        assert cols["end"][0] == store.end[0]
+
+
+# ============================================================================
+# Consultas
+# ============================================================================
+
+class TestQueries:
+    """Sobreposição por recurso com bisect e duração máxima."""
+
+    def test_long_interval_found_from_later_window(self, store):
+        assert [r.id for r in store.overlapping(1, _m(4), _m(6))] == [2]
+
+    def test_touching_is_not_overlap(self, store):
+        assert not store.has_overlap(1, _m(5), _m(6))
+        assert store.has_overlap(2, _m(3.5), _m(3.75))
+
+    def test_unknown_resource(self, store):
+        assert list(store.overlapping(99, _m(0), _m(10))) == []
+        assert list(store.busy(99)) == []
+
+    def test_busy_is_sorted(self, store):
+        assert list(store.busy(2)) == [(_m(0), _m(1)), (_m(3), _m(4))]
+
+
+class TestFromDb:
+    """Carga direta de select Core."""
+
+    def test_loads_window_without_cancelled(self, db_session):
+        for i, status in enumerate(["scheduled", "cancelled", "done"]):
+            start = BASE + timedelta(hours=i)
+            db_session.add(models.Appointment(user_id=1, resource_id=1, start_time=start,
+                                              end_time=start + timedelta(minutes=30), status=status))
+        db_session.commit()
+        loaded = IntervalStore.from_db(db_session, BASE, BASE + timedelta(days=1), chunk_size=1)
+        assert len(loaded) == 2
+        assert loaded[0].start == _m(0)
+        assert loaded[1].end - loaded[1].start == 30
+        assert all(isinstance(r, IntervalRecord) for r in loaded)
+
+    def test_rows_arrive_sorted(self, db_session, monkeypatch):
+        # inseridos fora de ordem; a ordem vem do ORDER BY, sem passar por sort()
+        for resource_id, hours in [(2, 5), (1, 3), (2, 1), (1, 0)]:
+            start = BASE + timedelta(hours=hours)
+            db_session.add(models.Appointment(user_id=1, resource_id=resource_id, start_time=start,
+                                              end_time=start + timedelta(minutes=30)))
+        db_session.commit()
+        monkeypatch.setattr(IntervalStore, "sort", lambda self: pytest.fail("reordenou em Python"))
+        loaded = IntervalStore.from_db(db_session)
+        assert [(r.resource_id, r.start) for r in loaded] == [(1, _m(0)), (1, _m(3)), (2, _m(1)), (2, _m(5))]
+        assert [r.id for r in loaded.overlapping(2, _m(5), _m(6))] == [1]
+
+    def test_resource_set_and_datetimes(self, db_session):
+        for resource_id in (1, 2, 3):
+            db_session.add(models.Appointment(user_id=1, resource_id=resource_id, start_time=BASE,
+                                              end_time=BASE + timedelta(minutes=45)))
+        db_session.commit()
+        loaded = IntervalStore.from_db(db_session, resource_ids=[1, 3])
+        assert sorted({r.resource_id for r in loaded}) == [1, 3]
+        assert list(loaded.busy_datetimes(3)) == [(BASE, BASE + timedelta(minutes=45))]
+        assert list(loaded.busy_datetimes(2)) == []
@@ -0,0 +1,169 @@
+"""
+Teste de estresse de reservas concorrentes: nenhum double-booking, com ou sem lock em processo,
+limite diário garantido pelo insert condicional e paralelismo entre recursos diferentes.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.exceptions import BusinessRuleException
+from app.locks import LockStripes
+from app.repositories import SqlAlchemyAppointmentRepository, SqlAlchemyUserRepository
+from app.services import DAILY_LIMIT, AppointmentService
+
+WORKERS = 16
+
+
+def tomorrow_at(hour):
+    return datetime.now().replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+
+@pytest.fixture
+def seeded(db_engine):
+    """Um usuário por worker e um recurso por worker."""
+    Session = sessionmaker(bind=db_engine, autocommit=False, autoflush=False)
+    with Session() as db:
+        db.add_all([models.User(name=f"U{i}", email=f"u{i}@test.com") for i in range(WORKERS)])
+        db.add_all([models.Resource(name=f"R{i}", resource_type="sala") for i in range(WORKERS)])
+        db.commit()
+        user_ids = [u.id for u in db.query(models.User).order_by(models.User.id)]
+        resource_ids = [r.id for r in db.query(models.Resource).order_by(models.Resource.id)]
+    return Session, user_ids, resource_ids
+
+
+def run_concurrently(Session, make_service, jobs):
+    """
+    Dispara todos os jobs (user_id, resource_id[, hora]) ao mesmo tempo, às 10h quando a hora
+    não vem; retorna (criados, rejeitados), com a mensagem de cada rejeição.
+    """
+    barrier = threading.Barrier(len(jobs))
+    created, rejected, errors = [], [], []
+
+    def worker(index, user_id, resource_id, hour=10):
+        service = make_service(index)
+        with Session() as db:
+            barrier.wait()
+            try:
+                appt = service.create_appointment(db, user_id, resource_id, tomorrow_at(hour), 60)
+                created.append(appt.id)
+            except BusinessRuleException as e:
+                rejected.append(str(e))
+            except Exception as e:  # pragma: no cover - falha do teste
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i, *job)) for i, job in enumerate(jobs)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    return created, rejected
+
+
+def count_overlaps(Session, resource_id):
+    with Session() as db:
+        apps = db.query(models.Appointment).filter(models.Appointment.resource_id == resource_id).all()
+    return sum(1 for i, a in enumerate(apps) for b in apps[i + 1:]
+               if a.start_time < b.end_time and b.start_time < a.end_time)
+
+
+class TestConcurrentBooking:
+    """Várias threads disputando o mesmo horário."""
+
+    def test_same_slot_shared_service(self, seeded):
+        Session, users, resources = seeded
+        service = AppointmentService(SqlAlchemyAppointmentRepository(), SqlAlchemyUserRepository())
+        created, rejected = run_concurrently(Session, lambda i: service, [(u, resources[0]) for u in users])
+        assert len(created) == 1
+        assert len(rejected) == WORKERS - 1
+        assert count_overlaps(Session, resources[0]) == 0
+
+    def test_same_slot_without_shared_locks(self, seeded):
+        """Cada thread com seu próprio service (como workers separados): o insert condicional segura sozinho."""
+        Session, users, resources = seeded
+        make = lambda i: AppointmentService(SqlAlchemyAppointmentRepository(), SqlAlchemyUserRepository(),
+                                            locks=LockStripes(1))
+        created, rejected = run_concurrently(Session, make, [(u, resources[0]) for u in users])
+        assert len(created) == 1
+        assert count_overlaps(Session, resources[0]) == 0
+
+    def test_distinct_resources_all_succeed(self, seeded):
+        Session, users, resources = seeded
+        service = AppointmentService(SqlAlchemyAppointmentRepository(), SqlAlchemyUserRepository())
+        created, rejected = run_concurrently(Session, lambda i: service, list(zip(users, resources)))
+        assert len(created) == WORKERS
+        assert rejected == []
+
+    def test_daily_limit_without_shared_locks(self, seeded):
+        """Mesmo usuário, recursos e horários diferentes, services separados: o limite diário vale no insert."""
+        Session, users, resources = seeded
+        make = lambda i: AppointmentService(SqlAlchemyAppointmentRepository(), SqlAlchemyUserRepository(),
+                                            locks=LockStripes(1))
+        jobs = [(users[0], r, 8 + i % 8) for i, r in enumerate(resources[:8])]
+        created, rejected = run_concurrently(Session, make, jobs)
+        assert len(created) == DAILY_LIMIT
+        assert len(rejected) == 8 - DAILY_LIMIT
+        assert all("limite diário" in message for message in rejected)
+
+
+class SlowCheckRepo(SqlAlchemyAppointmentRepository):
+    """Checagem do limite diário lenta e instrumentada: mede quantas threads estão dentro do lock ao mesmo tempo."""
+
+    DELAY = 0.05
+
+    def __init__(self):
+        self.inside = 0
+        self.peak = 0
+        self.guard = threading.Lock()
+
+    def list_by_filter(self, db, *args, **kwargs):
+        with self.guard:
+            self.inside += 1
+            self.peak = max(self.peak, self.inside)
+        time.sleep(self.DELAY)
+        with self.guard:
+            self.inside -= 1
+        return super().list_by_filter(db, *args, **kwargs)
+
+
+class TestContention:
+    """O lock é por recurso: reservas num mesmo recurso se enfileiram, em recursos diferentes andam juntas."""
+
+    JOBS = 8
+
+    def book(self, seeded, spread):
+        Session, users, resources = seeded
+        repo = SlowCheckRepo()
+        service = AppointmentService(repo, SqlAlchemyUserRepository())
+        # recursos espalhados vêm da segunda metade, que o caso de um recurso só não usa
+        jobs = [(users[i], resources[self.JOBS + i] if spread else resources[0], 8 + i) for i in range(self.JOBS)]
+        started = time.perf_counter()
+        created, rejected = run_concurrently(Session, lambda i: service, jobs)
+        elapsed = time.perf_counter() - started
+        assert len(created) == self.JOBS and rejected == []
+        return elapsed, repo.peak
+
+    def test_one_resource_against_many(self, seeded):
+        one, one_peak = self.book(seeded, spread=False)
+        many, many_peak = self.book(seeded, spread=True)
+        assert one_peak == 1
+        assert one >= self.JOBS * SlowCheckRepo.DELAY
+        assert many_peak > 1
+        assert many < one / 2
+
+
+class TestLockStripes:
+    """Mesma chave sempre cai no mesmo lock."""
+
+    def test_stable_mapping(self):
+        stripes = LockStripes(8)
+        assert stripes.lock_for(42) is stripes.lock_for(42)
+        assert len({id(stripes.lock_for(k)) for k in range(64)}) == 8
+
+    def test_invalid_size(self):
+        with pytest.raises(ValueError):
+            LockStripes(0)
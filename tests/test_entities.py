@@ -0,0 +1,103 @@
+"""
+Testes dos repositórios/rotas de Resource, Location e Event (carga explícita, sem N+1).
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
+
+from app import models
+from app.api import event_repo, location_repo, resource_repo
+
+NOW = datetime(2030, 6, 3, 9, 0)
+
+
+@pytest.fixture
+def queries(db_engine):
+    """Conta os SELECTs emitidos no engine."""
+    seen = []
+    listener = lambda conn, cursor, stmt, params, ctx, many: seen.append(stmt) if stmt.startswith("SELECT") else None
+    event.listen(db_engine, "before_cursor_execute", listener)
+    yield seen
+    event.remove(db_engine, "before_cursor_execute", listener)
+
+
+@pytest.fixture
+def resources(db_session):
+    db_session.add_all(models.Resource(name=f"Sala {i}", resource_type="sala") for i in range(500))
+    db_session.flush()
+    for rid in range(1, 501):
+        for h in (-48, 1, 2):  # um passado, dois futuros
+            start = NOW + timedelta(hours=h)
+            db_session.add(models.Appointment(user_id=1, resource_id=rid, start_time=start,
+                                              end_time=start + timedelta(minutes=30)))
+    db_session.commit()
+    db_session.expunge_all()
+    return db_session
+
+
+# ============================================================================
+# Repositórios
+# ============================================================================
+
+class TestEntityRepositories:
+    """CRUD genérico, get_many e proteção contra lazy load."""
+
+    def test_crud_roundtrip(self, db_session):
+        loc = location_repo.create(db_session, {"name": "Auditório", "capacity": 80})
+        ev = event_repo.create(db_session, {"title": "Workshop", "location_id": loc.id, "start_time": NOW,
+                                            "end_time": NOW + timedelta(hours=2), "capacity": 30})
+        updated = event_repo.update(db_session, ev.id, {"title": "Workshop II"})
+        assert updated.title == "Workshop II" and updated.capacity == 30
+        assert event_repo.delete(db_session, ev.id) is True
+        assert event_repo.delete(db_session, ev.id) is False
+        assert event_repo.update(db_session, 999, {"title": "x"}) is None
+
+    def test_get_many_keeps_requested_order(self, resources):
+        found = resource_repo.get_many(resources, [7, 3, 999, 7, 1])
+        assert [r.id for r in found] == [7, 3, 1]
+
+    def test_lazy_load_raises(self, resources):
+        r = resource_repo.get(resources, 1)
+        with pytest.raises(InvalidRequestError):
+            r.appointments
+
+    def test_upcoming_filters_children(self, resources):
+        r = resource_repo.get(resources, 1, [resource_repo.upcoming(NOW)])
+        assert [a.start_time for a in r.appointments] == [NOW + timedelta(hours=1), NOW + timedelta(hours=2)]
+
+
+# ============================================================================
+# Rotas: número de consultas constante
+# ============================================================================
+
+class TestQueryCounts:
+    """500 recursos com os próximos agendamentos não podem virar 501 consultas."""
+
+    def test_resources_upcoming_constant_queries(self, api_client, resources, queries):
+        resp = api_client.get("/api/resources/upcoming", params={"since": NOW.isoformat(), "limit": 500})
+        assert resp.status_code == 200
+        body = resp.json()
+        assert len(body) == 500
+        assert all(len(r["appointments"]) == 2 for r in body)
+        assert len(queries) == 2
+
+    def test_events_with_location_single_query(self, api_client, db_session, queries):
+        loc = location_repo.create(db_session, {"name": "Sala A", "capacity": 5})
+        for i in range(20):
+            event_repo.create(db_session, {"title": f"E{i}", "location_id": loc.id, "start_time": NOW,
+                                           "end_time": NOW + timedelta(hours=1), "capacity": 5})
+        queries.clear()
+        body = api_client.get("/api/events").json()
+        assert len(body) == 20 and body[0]["location"]["name"] == "Sala A"
+        assert len(queries) == 1
+
+    def test_location_detail_and_404(self, api_client, db_session):
+        loc = api_client.post("/api/locations", json={"name": "Sala B", "capacity": 3}).json()
+        api_client.post("/api/events", json={"title": "Aula", "location_id": loc["id"], "start_time": NOW.isoformat(),
+                                         "end_time": (NOW + timedelta(hours=1)).isoformat(), "capacity": 3})
+        detail = api_client.get(f"/api/locations/{loc['id']}").json()
+        assert [e["title"] for e in detail["events"]] == ["Aula"]
+        assert api_client.get("/api/locations/999").status_code == 404
+        assert api_client.delete("/api/locations/999").status_code == 404
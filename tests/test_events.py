@@ -0,0 +1,99 @@
+"""
+Testes do barramento de mudanças e do stream SSE.
+"""
+import asyncio
+import threading
+
+from app.events import ChangeBus, sse_stream
+
+
+async def take(stream, n):
+    out = []
+    async for chunk in stream:
+        out.append(chunk)
+        if len(out) == n:
+            break
+    return out
+
+
+class TestChangeBus:
+    """Fan-out, filtros e retomada pelo ring buffer."""
+
+    def test_publish_from_other_thread_reaches_subscriber(self):
+        bus = ChangeBus()
+
+        async def scenario():
+            sub, backlog = bus.subscribe()
+            t = threading.Thread(target=bus.publish, args=("appointment.created", {"id": 1, "user_id": 7}))
+            t.start()
+            t.join()
+            event = await asyncio.wait_for(sub.queue.get(), 1)
+            bus.unsubscribe(sub)
+            return backlog, event
+
+        backlog, event = asyncio.run(scenario())
+        assert backlog == []
+        assert event.type == "appointment.created"
+        assert event.wire.startswith("id: 1\nevent: appointment.created\ndata: ")
+
+    def test_filters_by_user_and_resource(self):
+        bus = ChangeBus()
+
+        async def scenario():
+            by_user, _ = bus.subscribe(user_id=1)
+            by_resource, _ = bus.subscribe(resource_id=5)
+            bus.publish("appointment.created", {"id": 1, "user_id": 1, "resource_id": 9})
+            bus.publish("appointment.created", {"id": 2, "user_id": 2, "resource_id": 5})
+            bus.publish("user.updated", {"id": 2, "user_id": 2})
+            await asyncio.sleep(0)
+            return ([by_user.queue.get_nowait().data["id"] for _ in range(by_user.queue.qsize())],
+                    [by_resource.queue.get_nowait().data["id"] for _ in range(by_resource.queue.qsize())])
+
+        assert asyncio.run(scenario()) == ([1], [2])
+
+    def test_resume_from_last_event_id(self):
+        bus = ChangeBus(history=3)
+        for i in range(5):
+            bus.publish("appointment.updated", {"id": i, "user_id": 1})
+
+        async def scenario():
+            _, recent = bus.subscribe(last_event_id=3)
+            _, lost = bus.subscribe(last_event_id=1)
+            _, future = bus.subscribe(last_event_id=99)
+            return recent, lost, future
+
+        recent, lost, future = asyncio.run(scenario())
+        assert [e.id for e in recent] == [4, 5]
+        assert lost is None
+        assert future is None
+
+    def test_listener_is_called_synchronously(self):
+        bus = ChangeBus()
+        seen = []
+        bus.add_listener(lambda e: seen.append(e.type))
+        bus.publish("user.deleted", {"id": 1, "user_id": 1})
+        assert seen == ["user.deleted"]
+
+
+class TestSseStream:
+    """Formato do corpo text/event-stream."""
+
+    def test_backlog_then_keepalive(self):
+        bus = ChangeBus()
+        bus.publish("appointment.created", {"id": 1, "user_id": 1})
+
+        async def scenario():
+            sub, backlog = bus.subscribe(last_event_id=0)
+            return await take(sse_stream(sub, backlog, heartbeat=0.01), 3)
+
+        retry, first, keepalive = asyncio.run(scenario())
+        assert retry.startswith("retry:")
+        assert first.startswith("id: 1\n")
+        assert keepalive == ": keepalive\n\n"
+
+    def test_reset_when_history_lost(self):
+        async def scenario():
+            sub, _ = ChangeBus().subscribe()
+            return await take(sse_stream(sub, None, heartbeat=0.01), 2)
+
+        assert asyncio.run(scenario())[1].startswith("event: reset")
@@ -0,0 +1,189 @@
+"""
+Testes dos feeds iCalendar: formato (escape, dobra de linha, CRLF, UTC), séries e cancelados,
+ETag derivado dos dados (304, cache do corpo e escrita feita fora deste processo).
+"""
+import itertools
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import api, ics, models
+from app.ics import escape, feeds, fold, write_calendar
+
+# um IP por teste: o balde de admissão de POST /api/appointments é por cliente
+ADDRESSES = (f"10.0.50.{i}" for i in itertools.count(1))
+
+
+def next_weekday_at(weekday, hour):
+    """Próxima data (a partir de amanhã) no dia da semana pedido, no horário dado."""
+    day = datetime.now().replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    while day.weekday() != weekday:
+        day += timedelta(days=1)
+    return day
+
+
+@pytest.fixture(autouse=True)
+def fresh_feeds():
+    feeds.cache.clear()
+    yield
+    feeds.cache.clear()
+
+
+# ============================================================================
+# Formato
+# ============================================================================
+
+class TestWriter:
+    """Escrita do VCALENDAR em pedaços, conforme a RFC 5545."""
+
+    def test_escape_and_fold(self):
+        assert escape("a;b,c\\d\ne") == "a\\;b\\,c\\\\d\\ne"
+        line = "SUMMARY:" + "ç" * 60
+        folded = fold(line)
+        pieces = folded[:-2].split("\r\n")
+        assert folded.endswith("\r\n") and len(pieces) > 1
+        assert all(len(p.encode("utf-8")) <= 75 for p in pieces)
+        assert all(p.startswith(" ") for p in pieces[1:])
+        assert pieces[0] + "".join(p[1:] for p in pieces[1:]) == line
+
+    def test_events(self):
+        at = datetime(2030, 6, 4, 9, 30)
+        rows = [SimpleNamespace(id=7, start_time=at, end_time=at + timedelta(hours=1), notes="Trazer, notebook"),
+                SimpleNamespace(id=None, series_id=3, start_time=at, end_time=at, notes=None)]
+        chunks = list(write_calendar("Sala 1", rows, lambda a: f"Reunião {a.id}"))
+        assert len(chunks) == 4  # cabeçalho, dois eventos, rodapé
+        text = "".join(chunks)
+        assert text.startswith("BEGIN:VCALENDAR\r\nVERSION:2.0\r\n") and text.endswith("END:VCALENDAR\r\n")
+        assert "\n" not in text.replace("\r\n", "")
+        assert "UID:appointment-7@agendamento\r\n" in text
+        assert "UID:series-3-20300604T093000@agendamento\r\n" in chunks[2]
+        # horário local de São Paulo (UTC-3) em UTC, sem TZID (que exigiria um VTIMEZONE)
+        assert "DTSTART:20300604T123000Z\r\n" in text and "TZID" not in text
+        assert "DESCRIPTION:Trazer\\, notebook\r\n" in text
+
+    def test_if_none_match(self):
+        assert ics.if_none_match('"x", W/"y"', '"y"')
+        assert ics.if_none_match('"y"', 'W/"y"')
+        assert ics.if_none_match("*", '"y"')
+        assert not ics.if_none_match('"x"', '"y"') and not ics.if_none_match(None, '"y"')
+
+
+# ============================================================================
+# Rotas, cache e ETag
+# ============================================================================
+
+class TestFeeds:
+    """GET /api/users/{id}/calendar.ics e /api/resources/{id}/calendar.ics."""
+
+    @pytest.fixture
+    def setup(self, api_client, db_session):
+        db_session.add_all([models.User(name="Ana", email="ana@x.com"), models.User(name="Bia", email="bia@x.com"),
+                            models.Resource(name="Sala 1", resource_type="sala")])
+        db_session.commit()
+        client = TestClient(api_client.app, client=(next(ADDRESSES), 50000))
+        return SimpleNamespace(client=client, db=db_session, at=next_weekday_at(2, 10))
+
+    def book(self, setup, user_id, hour):
+        resp = setup.client.post("/api/appointments", json={"user_id": user_id, "resource_id": 1,
+                                                             "start_time": setup.at.replace(hour=hour).isoformat(),
+                                                             "duration_minutes": 60})
+        assert resp.status_code == 200
+        return resp.json()["id"]
+
+    def test_user_and_resource_feeds(self, setup):
+        first = self.book(setup, 1, 9)
+        self.book(setup, 2, 11)
+        resp = setup.client.get("/api/users/1/calendar.ics")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/calendar")
+        assert resp.headers["etag"] and resp.text.count("BEGIN:VEVENT") == 1
+        assert f"UID:appointment-{first}@agendamento" in resp.text and "SUMMARY:Sala 1" in resp.text
+        assert "X-WR-CALNAME:Agenda de Ana" in resp.text
+
+        resource = setup.client.get("/api/resources/1/calendar.ics").text
+        assert resource.count("BEGIN:VEVENT") == 2 and "SUMMARY:Sala 1: Bia" in resource
+
+    def test_resource_feed_loads_names_in_one_query(self, setup, monkeypatch):
+        self.book(setup, 1, 9)
+        self.book(setup, 2, 11)
+
+        def one_by_one(*args, **kwargs):
+            raise AssertionError("um SELECT por usuário")
+
+        monkeypatch.setattr(api.user_repo, "get", one_by_one)
+        resource = setup.client.get("/api/resources/1/calendar.ics").text
+        assert "SUMMARY:Sala 1: Ana" in resource and "SUMMARY:Sala 1: Bia" in resource
+
+    def test_window_is_bounded(self, setup):
+        self.book(setup, 1, 9)
+        _, end = ics.window()
+        far = setup.at + timedelta(days=400)
+        setup.db.add(models.Appointment(user_id=1, resource_id=1, start_time=far, end_time=far + timedelta(hours=1)))
+        setup.db.commit()
+        assert end < far
+        assert setup.client.get("/api/users/1/calendar.ics").text.count("BEGIN:VEVENT") == 1
+
+    def test_not_modified_and_cache_skip_rendering(self, setup, monkeypatch):
+        self.book(setup, 1, 9)
+        first = setup.client.get("/api/users/1/calendar.ics")
+        etag = first.headers["etag"]
+
+        def no_render(*args, **kwargs):
+            raise AssertionError("escreveu o feed de novo")
+
+        monkeypatch.setattr(ics, "write_calendar", no_render)
+        again = setup.client.get("/api/users/1/calendar.ics", headers={"If-None-Match": etag})
+        assert again.status_code == 304 and again.headers["etag"] == etag and again.content == b""
+        cached = setup.client.get("/api/users/1/calendar.ics")
+        assert cached.status_code == 200 and cached.content == first.content
+
+        feeds.cache.clear()  # outro worker, sem nada em cache: os mesmos dados dão o mesmo ETag
+        assert setup.client.get("/api/users/1/calendar.ics", headers={"If-None-Match": etag}).status_code == 304
+
+    def test_etag_follows_the_data(self, setup):
+        self.book(setup, 1, 9)
+        user1 = setup.client.get("/api/users/1/calendar.ics").headers["etag"]
+        user2 = setup.client.get("/api/users/2/calendar.ics").headers["etag"]
+        resource = setup.client.get("/api/resources/1/calendar.ics").headers["etag"]
+
+        booked = self.book(setup, 2, 14)
+        assert setup.client.get("/api/users/1/calendar.ics", headers={"If-None-Match": user1}).status_code == 304
+        fresh = setup.client.get("/api/users/2/calendar.ics", headers={"If-None-Match": user2})
+        assert fresh.status_code == 200 and f"appointment-{booked}@" in fresh.text
+        fresh = setup.client.get("/api/resources/1/calendar.ics", headers={"If-None-Match": resource})
+        assert fresh.status_code == 200 and fresh.text.count("BEGIN:VEVENT") == 2
+
+        # cancelado sai do feed
+        etag = fresh.headers["etag"]
+        assert setup.client.post(f"/api/appointments/{booked}/cancel").status_code == 200
+        after = setup.client.get("/api/resources/1/calendar.ics", headers={"If-None-Match": etag})
+        assert after.status_code == 200 and after.text.count("BEGIN:VEVENT") == 1
+        assert f"appointment-{booked}@" not in after.text
+
+        # escrita que não passou por este processo (nenhum evento no change_bus)
+        etag = after.headers["etag"]
+        at = setup.at.replace(hour=16)
+        setup.db.add(models.Appointment(user_id=1, resource_id=1, start_time=at, end_time=at + timedelta(hours=1)))
+        setup.db.commit()
+        assert setup.client.get("/api/resources/1/calendar.ics", headers={"If-None-Match": etag}).status_code == 200
+
+    def test_series_occurrences(self, setup):
+        resp = setup.client.post("/api/series", json={"user_id": 1, "resource_id": 1, "duration_minutes": 60,
+                                                      "start_time": setup.at.replace(hour=8).isoformat(),
+                                                      "freq": "WEEKLY", "count": 3})
+        assert resp.status_code == 200
+        series_id = resp.json()["id"]
+        self.book(setup, 2, 11)
+        for url in ("/api/users/1/calendar.ics", "/api/resources/1/calendar.ics"):
+            text = setup.client.get(url).text
+            assert text.count(f"UID:series-{series_id}-") == 3
+        resource = setup.client.get("/api/resources/1/calendar.ics").text
+        assert resource.count("BEGIN:VEVENT") == 4
+        starts = [line for line in resource.split("\r\n") if line.startswith("DTSTART:")]
+        assert starts == sorted(starts)
+
+    def test_missing(self, setup):
+        assert setup.client.get("/api/users/99/calendar.ics").status_code == 404
+        assert setup.client.get("/api/resources/99/calendar.ics").status_code == 404
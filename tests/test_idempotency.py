@@ -0,0 +1,150 @@
+"""
+Testes de Idempotency-Key (replay, conflito de payload, duplicatas simultâneas e expiração).
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from app import idempotency, models
+from app.config import CONFIG
+from app.idempotency import IdempotencyStore, StoredResponse
+from app.schemas import UserCreate
+
+
+@pytest.fixture(autouse=True)
+def fresh_store(monkeypatch):
+    monkeypatch.setattr(idempotency, "store", IdempotencyStore(ttl=60, maxsize=100))
+    return idempotency.store
+
+
+def _tomorrow_at(hour):
+    return (datetime.now() + timedelta(days=1)).replace(hour=hour, minute=0, second=0, microsecond=0)
+
+
+class TestReplay:
+    """Mesma chave, mesma resposta, sem segundo efeito."""
+
+    def test_user_created_once(self, api_client, db_session):
+        headers = {"Idempotency-Key": "k-1"}
+        first = api_client.post("/api/users", json={"name": "Ana", "email": "ana@x.com"}, headers=headers)
+        second = api_client.post("/api/users", json={"name": "Ana", "email": "ana@x.com"}, headers=headers)
+        assert first.status_code == second.status_code == 200
+        assert first.json() == second.json()
+        assert "idempotent-replayed" not in first.headers
+        assert second.headers["idempotent-replayed"] == "true"
+        assert db_session.query(models.User).count() == 1
+
+    def test_other_payload_is_rejected(self, api_client):
+        headers = {"Idempotency-Key": "k-2"}
+        api_client.post("/api/users", json={"name": "Ana", "email": "ana@x.com"}, headers=headers)
+        resp = api_client.post("/api/users", json={"name": "Bia", "email": "bia@x.com"}, headers=headers)
+        assert resp.status_code == 422
+
+    def test_business_errors_are_replayed(self, api_client):
+        headers = {"Idempotency-Key": "k-3"}
+        payload = {"user_id": 99, "resource_id": 1, "start_time": _tomorrow_at(10).isoformat(), "duration_minutes": 30}
+        first = api_client.post("/api/appointments", json=payload, headers=headers)
+        second = api_client.post("/api/appointments", json=payload, headers=headers)
+        assert first.status_code == second.status_code == 404
+        assert second.headers["idempotent-replayed"] == "true"
+
+    def test_without_header_nothing_changes(self, api_client, fresh_store):
+        assert api_client.post("/api/users", json={"name": "Ana", "email": "ana@x.com"}).status_code == 200
+        assert len(fresh_store.memory) == 0
+
+
+class TestConcurrentDuplicates:
+    """Duplicatas simultâneas esperam a primeira tentativa."""
+
+    def test_one_appointment_for_parallel_retries(self, api_client, db_session):
+        # cliente próprio: o balde de POST /api/appointments (burst 5) é por IP e compartilhado entre testes
+        client = TestClient(api_client.app, client=("10.0.0.43", 50000))
+        db_session.add(models.User(name="Ana", email="ana@x.com"))
+        db_session.commit()
+        payload = {"user_id": 1, "resource_id": 1, "start_time": _tomorrow_at(10).isoformat(), "duration_minutes": 30}
+        results = []
+
+        def post():
+            results.append(client.post("/api/appointments", json=payload, headers={"Idempotency-Key": "dup"}))
+
+        threads = [threading.Thread(target=post) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert {r.status_code for r in results} == {200}
+        assert len({r.json()["id"] for r in results}) == 1
+        assert db_session.query(models.Appointment).count() == 1
+
+
+    def test_workers_share_one_run(self, db_engine):
+        """Dois workers (stores e sessions separados): só quem reivindicou a chave roda o handler."""
+        Session = sessionmaker(bind=db_engine, autoflush=False, expire_on_commit=False)
+        calls, results = [], []
+        barrier = threading.Barrier(2)
+
+        def handler():
+            calls.append(1)
+            time.sleep(0.2)
+            return 200, b'{"id": 1}'
+
+        def worker():
+            with Session() as db:
+                barrier.wait()
+                results.append(IdempotencyStore(ttl=60, maxsize=10).run(db, "users:k", "fp", handler))
+
+        threads = [threading.Thread(target=worker) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(calls) == 1
+        assert sorted(replayed for _, replayed in results) == [False, True]
+        assert {stored.body for stored, _ in results} == {b'{"id": 1}'}
+
+
+class TestStore:
+    """Memória na frente do SQLite, TTL e respostas 5xx."""
+
+    def test_falls_back_to_table(self, db_session, fresh_store):
+        fresh_store.save(db_session, "users:k", StoredResponse("fp", 200, b"{}"))
+        fresh_store.memory.clear()
+        stored = fresh_store.get(db_session, "users:k")
+        assert (stored.fingerprint, stored.status_code, stored.body) == ("fp", 200, b"{}")
+
+    def test_expired_rows_are_ignored_and_purged(self, db_session, fresh_store):
+        fresh_store.save(db_session, "users:k", StoredResponse("fp", 200, b"{}"))
+        fresh_store.memory.clear()
+        later = datetime.now() + timedelta(seconds=61)
+        assert idempotency.purge_expired(db_session, later) == 1
+        assert fresh_store.get(db_session, "users:k") is None
+
+    def test_server_errors_are_not_stored(self, db_session, fresh_store):
+        calls = []
+
+        def handler():
+            calls.append(1)
+            raise HTTPException(status_code=500, detail="Erro interno")
+
+        for _ in range(2):
+            resp = idempotency.idempotent_response(db_session, "x", "k", UserCreate(name="Ana", email="ana@x.com"), handler, dict)
+            assert resp.status_code == 500
+        assert len(calls) == 2
+        assert db_session.query(models.IdempotencyRecord).count() == 0  # a reivindicação foi desfeita
+
+    def test_abandoned_claim_is_taken_over(self, db_session, fresh_store, monkeypatch):
+        other = IdempotencyStore(ttl=60, maxsize=10)
+        monkeypatch.setitem(CONFIG["idempotency"], "claim_seconds", 0)
+        assert other.claim(db_session, "users:k", "fp")  # worker que caiu antes de responder
+        stored, replayed = fresh_store.run(db_session, "users:k", "fp", lambda: (200, b"{}"))
+        assert (stored.status_code, replayed) == (200, False)
+
+    def test_pending_claim_is_not_a_response(self, db_session, fresh_store):
+        assert fresh_store.claim(db_session, "users:k", "fp")
+        assert not IdempotencyStore(ttl=60, maxsize=10).claim(db_session, "users:k", "fp")
+        assert fresh_store.get(db_session, "users:k") is None
@@ -0,0 +1,92 @@
+"""
+Testes do job de ciclo de vida (scheduled -> done) e das métricas emitidas.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.orm import sessionmaker
+
+from app import lifecycle, models
+from app.metrics import metrics
+
+NOW = datetime(2030, 6, 1, 12, 0)
+
+
+@pytest.fixture
+def seeded(db_session):
+    # 5 já terminados, 1 em andamento, 1 futuro, 1 terminado mas cancelado
+    for i in range(5):
+        start = NOW - timedelta(days=i + 1)
+        db_session.add(models.Appointment(user_id=1, resource_id=1, start_time=start,
+                                          end_time=start + timedelta(hours=1)))
+    db_session.add(models.Appointment(user_id=1, resource_id=1, start_time=NOW - timedelta(minutes=30),
+                                      end_time=NOW + timedelta(minutes=30)))
+    db_session.add(models.Appointment(user_id=1, resource_id=1, start_time=NOW + timedelta(days=1),
+                                      end_time=NOW + timedelta(days=1, hours=1)))
+    db_session.add(models.Appointment(user_id=1, resource_id=1, start_time=NOW - timedelta(days=9),
+                                      end_time=NOW - timedelta(days=9) + timedelta(hours=1), status="cancelled"))
+    db_session.commit()
+    return db_session
+
+
+def _statuses(db):
+    return sorted(a.status for a in db.query(models.Appointment))
+
+
+# ============================================================================
+# UPDATE em lotes
+# ============================================================================
+
+class TestCompleteExpired:
+    """Só agendamentos 'scheduled' já terminados viram 'done'."""
+
+    def test_marks_only_expired_scheduled(self, seeded):
+        assert lifecycle.complete_expired(seeded, NOW) == 5
+        assert _statuses(seeded) == ["cancelled"] + ["done"] * 5 + ["scheduled"] * 2
+
+    def test_small_batches_reach_everything(self, seeded):
+        assert lifecycle.complete_expired(seeded, NOW, batch_size=2) == 5
+        assert lifecycle.complete_expired(seeded, NOW, batch_size=2) == 0
+
+    def test_status_end_index_exists(self, db_engine):
+        names = {ix["name"] for ix in inspect(db_engine).get_indexes("appointments")}
+        assert "ix_appointments_status_end" in names
+
+
+# ============================================================================
+# Rodada do worker
+# ============================================================================
+
+class TestRunOnce:
+    """run_once abre a própria session e registra métricas."""
+
+    def test_counts_into_metrics(self, seeded, db_engine):
+        metrics.reset()
+        factory = sessionmaker(bind=db_engine)
+        result = lifecycle.run_once(factory, NOW)
+        assert result == {"completed": 5, "archived": 0, "purged": 0}
+        assert metrics.get("lifecycle.runs") == 1
+        assert metrics.get("lifecycle.completed") == 5
+
+    def test_worker_survives_errors_and_cancels(self, monkeypatch):
+        metrics.reset()
+        calls = []
+
+        def boom(factory, release=None):
+            calls.append(1)
+            raise RuntimeError("banco fora")
+
+        monkeypatch.setattr(lifecycle, "run_once", boom)
+
+        async def scenario():
+            task = asyncio.create_task(lifecycle.worker_loop(lambda: None, interval=0.01))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(scenario())
+        assert len(calls) >= 2
+        assert metrics.get("lifecycle.errors") == len(calls)
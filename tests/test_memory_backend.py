@@ -0,0 +1,324 @@
+"""
+Testes do backend em memória: mesmo contrato dos repositórios SQL, durabilidade pelo journal
+(replay, snapshot, linha incompleta), reserva concorrente e o service rodando em cima dele.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import api, memory, models
+from app.config import CONFIG
+from app.exceptions import BusinessRuleException
+from app.memory import JOURNAL, MemoryStore, read_journal
+from app.services import AppointmentService
+from app.waitlist import WaitlistIndex
+
+
+def next_weekday_at(weekday, hour):
+    """Próxima data (a partir de amanhã) no dia da semana pedido, no horário dado."""
+    day = datetime.now().replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    while day.weekday() != weekday:
+        day += timedelta(days=1)
+    return day
+
+
+def booking(user_id, resource_id, start, minutes=60, **extra):
+    return models.Appointment(user_id=user_id, resource_id=resource_id, start_time=start,
+                              end_time=start + timedelta(minutes=minutes), **extra)
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = MemoryStore(tmp_path, fsync_interval_ms=0)
+    yield s
+    s.close(snapshot=False)
+
+
+@pytest.fixture
+def repos(store):
+    users, appointments = memory.repositories(store)
+    return SimpleNamespace(store=store, users=users, appointments=appointments, at=next_weekday_at(2, 10))
+
+
+# ============================================================================
+# Contrato dos repositórios
+# ============================================================================
+
+class TestRepositories:
+    """Mesmo comportamento observável dos repositórios SQLAlchemy."""
+
+    def test_users_crud_and_unique_email(self, repos):
+        ana = repos.users.create(None, models.User(name="Ana", email="ana@x.com"))
+        assert (ana.id, ana.is_active) == (1, True)
+        with pytest.raises(IntegrityError):
+            repos.users.create(None, models.User(name="Outra", email="ana@x.com"))
+        assert repos.users.bulk_create(None, [{"name": "B", "email": "b@x.com"}, {"name": "C", "email": "c@x.com"}]) \
+            == [(2, "b@x.com"), (3, "c@x.com")]
+        assert repos.users.existing_emails(None, ["b@x.com", "z@x.com"]) == {"b@x.com"}
+        assert repos.users.update(None, models.User(id=1, name="Ana Maria")).name == "Ana Maria"
+        assert [u.id for u in repos.users.list(None, skip=1, limit=1)] == [2]
+
+    def test_intervals_of_several_resources(self, repos):
+        for rid in (1, 2, 3):
+            repos.appointments.create(None, booking(1, rid, repos.at))
+        repos.appointments.mark_cancelled(None, 2)
+        found = repos.appointments.intervals(None, [3, 2, 1], repos.at, repos.at + timedelta(hours=1))
+        assert [(r.resource_id, r.id) for r in found] == [(1, 1), (3, 3)]
+        assert list(found.busy_datetimes(3)) == [(repos.at, repos.at + timedelta(hours=1))]
+
+    def test_update_writes_assigned_none(self, repos):
+        created = repos.appointments.create(None, booking(1, 1, repos.at, notes="Trazer notebook"))
+        assert repos.appointments.update(None, models.Appointment(id=created.id, status="done")).notes == "Trazer notebook"
+        cleared = repos.appointments.update(None, models.Appointment(id=created.id, notes=None))
+        assert (cleared.notes, cleared.status) == (None, "done")
+
+    def test_user_delete_takes_appointments(self, repos):
+        repos.users.create(None, models.User(name="Ana", email="ana@x.com"))
+        booked = repos.appointments.create(None, booking(1, 1, repos.at))
+        assert repos.users.delete(None, 1) == [booked]  # para a fila de espera (release_freed)
+        assert repos.users.get(None, 1) is None
+        assert repos.store.appointments == {} and repos.store.by_email == {}
+
+    def test_reserve_rejects_overlap_only_while_live(self, repos):
+        first = repos.appointments.reserve(None, booking(1, 1, repos.at))
+        assert repos.appointments.reserve(None, booking(2, 1, repos.at + timedelta(minutes=30))) is None
+        assert repos.appointments.reserve(None, booking(2, 2, repos.at)) is not None  # outro recurso
+        assert repos.appointments.reserve(None, booking(2, 1, repos.at + timedelta(hours=1))) is not None
+        repos.appointments.mark_cancelled(None, first.id)
+        assert repos.appointments.reserve(None, booking(2, 1, repos.at)) is not None
+
+    def test_long_booking_is_found_from_later_start(self, repos):
+        repos.appointments.create(None, booking(1, 1, repos.at, minutes=8 * 60))
+        repos.appointments.create(None, booking(1, 1, repos.at - timedelta(hours=1), minutes=30))
+        later = repos.at + timedelta(hours=5)
+        assert repos.store.clashes(1, later, later + timedelta(minutes=30))
+        got = repos.appointments.list_by_resource(None, 1, later, later + timedelta(hours=1))
+        assert [a.start_time for a in got] == [repos.at]
+
+    def test_filters_and_daily_counts(self, repos):
+        a = repos.appointments.create(None, booking(1, 1, repos.at))
+        b = repos.appointments.create(None, booking(1, 2, repos.at + timedelta(days=1)))
+        c = repos.appointments.create(None, booking(1, 3, repos.at - timedelta(hours=2)))
+        repos.appointments.mark_cancelled(None, c.id)
+        assert [x.id for x in repos.appointments.list_by_filter(None, user_id=1)] == [a.id, b.id]
+        assert [x.id for x in repos.appointments.list_by_filter(None, user_id=1, include_cancelled=True)] \
+            == [c.id, a.id, b.id]
+        assert [x.id for x in repos.appointments.list_by_filter(None, end=repos.at + timedelta(hours=2))] == [a.id]
+        day = repos.at.replace(hour=0)
+        assert repos.appointments.count_by_day(None, 1, day, day + timedelta(days=2)) \
+            == {repos.at.date(): 1, (repos.at + timedelta(days=1)).date(): 1}
+
+
+# ============================================================================
+# Durabilidade
+# ============================================================================
+
+class TestDurability:
+    """Replay do journal, snapshot + journal e queda no meio de um write."""
+
+    def fill(self, store):
+        users, appointments = memory.repositories(store)
+        users.create(None, models.User(name="Ana", email="ana@x.com"))
+        at = next_weekday_at(2, 10)
+        first = appointments.reserve(None, booking(1, 1, at))
+        appointments.reserve(None, booking(1, 1, at + timedelta(hours=1)))
+        appointments.mark_cancelled(None, first.id)
+        return at
+
+    def state(self, store):
+        return dict(store.users), dict(store.appointments), store.next_appointment_id
+
+    def test_reopen_replays_journal(self, tmp_path):
+        store = MemoryStore(tmp_path, fsync_interval_ms=0)
+        at = self.fill(store)
+        before = self.state(store)
+        store.close(snapshot=False)  # só o journal fica no disco
+
+        again = MemoryStore(tmp_path)
+        try:
+            assert self.state(again) == before
+            assert again.clashes(1, at + timedelta(hours=1), at + timedelta(hours=2))
+            assert not again.clashes(1, at, at + timedelta(hours=1))  # o cancelado não volta a ocupar
+        finally:
+            again.close(snapshot=False)
+
+    def test_snapshot_then_journal(self, tmp_path):
+        store = MemoryStore(tmp_path, fsync_interval_ms=0)
+        self.fill(store)
+        store.snapshot()
+        assert read_journal(tmp_path / JOURNAL)[0] == []
+        memory.repositories(store)[0].create(None, models.User(name="Bia", email="bia@x.com"))
+        before = self.state(store)
+        store.close(snapshot=False)
+
+        again = MemoryStore(tmp_path)
+        try:
+            assert self.state(again) == before
+            assert sorted(p.name for p in tmp_path.iterdir()) == [JOURNAL, memory.SNAPSHOT]
+        finally:
+            again.close(snapshot=False)
+
+    def test_periodic_snapshot_rotates_journal(self, tmp_path):
+        store = MemoryStore(tmp_path, fsync_interval_ms=0, snapshot_every=3)
+        self.fill(store)
+        store.close()
+        assert (tmp_path / memory.SNAPSHOT).exists()
+        again = MemoryStore(tmp_path)
+        try:
+            assert len(again.appointments) == 2 and again.journal.seq == store.journal.seq
+        finally:
+            again.close(snapshot=False)
+
+    def test_lone_write_skips_group_window(self, tmp_path):
+        store = MemoryStore(tmp_path, fsync_interval_ms=500)
+        try:
+            users = memory.repositories(store)[0]
+            started = time.perf_counter()
+            users.create(None, models.User(name="Ana", email="ana@x.com"))
+            assert time.perf_counter() - started < 0.25
+            assert read_journal(tmp_path / JOURNAL)[0][0]["op"] == "user.put"
+        finally:
+            store.close(snapshot=False)
+
+    def test_torn_last_line_is_dropped(self, tmp_path):
+        store = MemoryStore(tmp_path, fsync_interval_ms=0)
+        self.fill(store)
+        before = self.state(store)
+        store.close(snapshot=False)
+        with open(tmp_path / JOURNAL, "ab") as f:
+            f.write(b'{"seq": 99, "op": "user.put", "da')
+
+        again = MemoryStore(tmp_path, fsync_interval_ms=0)
+        try:
+            assert self.state(again) == before
+            # o arquivo foi cortado na última linha íntegra: o próximo registro não cola no lixo
+            memory.repositories(again)[0].create(None, models.User(name="Bia", email="bia@x.com"))
+            assert len(read_journal(tmp_path / JOURNAL)[0]) == again.journal.seq
+        finally:
+            again.close(snapshot=False)
+
+
+# ============================================================================
+# Concorrência e service
+# ============================================================================
+
+class TestConcurrency:
+    """Reservas simultâneas no mesmo horário: exatamente uma passa."""
+
+    def test_one_winner(self, repos):
+        results, barrier = [], threading.Barrier(16)
+
+        def attempt(user_id):
+            barrier.wait()
+            results.append(repos.appointments.reserve(None, booking(user_id, 1, repos.at)))
+
+        threads = [threading.Thread(target=attempt, args=(i,)) for i in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sum(r is not None for r in results) == 1
+        assert len(repos.store.appointments) == 1
+
+
+class TestService:
+    """AppointmentService e rotas sobre o backend em memória."""
+
+    @pytest.fixture
+    def setup(self, repos, db_session):
+        db_session.add(models.Resource(name="Sala 1", resource_type="sala"))
+        db_session.commit()
+        repos.users.create(db_session, models.User(name="Ana", email="ana@x.com"))
+        repos.users.create(db_session, models.User(name="Bia", email="bia@x.com"))
+        service = AppointmentService(repos.appointments, repos.users, waitlist=WaitlistIndex())
+        return SimpleNamespace(db=db_session, service=service, **vars(repos))
+
+    def test_rules_apply(self, setup):
+        created = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        assert setup.store.appointments[created.id].status == "scheduled"
+        with pytest.raises(BusinessRuleException, match="sobreposição"):
+            setup.service.create_appointment(setup.db, 2, 1, setup.at + timedelta(minutes=30), 60)
+        for h in range(2):
+            setup.service.create_appointment(setup.db, 1, 1, setup.at.replace(hour=14 + h), 30)
+        with pytest.raises(BusinessRuleException, match="limite diário"):
+            setup.service.create_appointment(setup.db, 1, 1, setup.at.replace(hour=17), 30)
+
+    def test_cancel_promotes_waitlist(self, setup):
+        booked = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        waiting = setup.service.join_waitlist(setup.db, 2, 1, setup.at, 60)
+        setup.service.cancel_appointment(setup.db, booked.id)
+        setup.db.expire_all()
+        promoted = setup.db.get(models.WaitlistEntry, waiting.id)
+        assert promoted.status == "promoted"
+        assert setup.store.appointments[promoted.appointment_id].user_id == 2
+
+    def test_failed_promotion_restores_appointment(self, setup, monkeypatch):
+        booked = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        setup.service.join_waitlist(setup.db, 2, 1, setup.at, 60)
+
+        def boom(*args, **kwargs):
+            raise RuntimeError("falha no meio da promoção")
+
+        monkeypatch.setattr(setup.appointments, "insert_if_free", boom)
+        with pytest.raises(RuntimeError):
+            setup.service.delete_appointment(setup.db, booked.id)
+        assert setup.store.appointments[booked.id] == booked
+        assert setup.store.clashes(1, setup.at, setup.at + timedelta(hours=1))
+
+    def test_routes_use_selected_backend(self, repos, api_client, db_session):
+        db_session.add(models.Resource(name="Sala 1", resource_type="sala"))
+        db_session.commit()
+        previous = api.user_repo, api.app_repo
+        api.use_repositories(repos.users, repos.appointments)
+        try:
+            user = api_client.post("/api/users", json={"name": "Ana", "email": "ana@x.com"}).json()
+            resp = api_client.post("/api/appointments", json={"user_id": user["id"], "resource_id": 1,
+                                                              "start_time": repos.at.isoformat(),
+                                                              "duration_minutes": 30})
+            assert resp.status_code == 200
+            assert [a["id"] for a in api_client.get("/api/appointments").json()] == [resp.json()["id"]]
+            assert db_session.query(models.Appointment).count() == 0
+        finally:
+            api.use_repositories(*previous)
+
+    def test_routes_read_through_repositories(self, repos, api_client, db_session, monkeypatch, tmp_path):
+        db_session.add(models.Resource(name="Sala 1", resource_type="sala"))
+        db_session.commit()
+        user = repos.users.create(None, models.User(name="Ana", email="ana@x.com"))
+        repos.appointments.reserve(None, booking(user.id, 1, repos.at, 45))
+        monkeypatch.setitem(CONFIG["export"], "csv_dir", str(tmp_path / "exports"))
+        previous = api.user_repo, api.app_repo
+        api.use_repositories(repos.users, repos.appointments)
+        try:
+            assert api_client.get(f"/api/users/{user.id}/reserved_minutes").json()["reserved_minutes"] == 45
+            cancelled = repos.appointments.reserve(None, booking(user.id, 1, repos.at + timedelta(hours=2), 30))
+            repos.appointments.mark_cancelled(None, cancelled.id)
+            assert api_client.get(f"/api/users/{user.id}/reserved_minutes").json()["reserved_minutes"] == 45
+            with open(api_client.get("/api/appointments/export").json()["path"], encoding="utf-8") as f:
+                assert len(f.read().splitlines()) == 3  # cabeçalho + os dois, cancelado incluído
+            # o que só lê o SQLite recusa em vez de responder sem os agendamentos
+            window = {"start": repos.at.isoformat(), "end": (repos.at + timedelta(days=1)).isoformat()}
+            for url, params in (("/api/reports/summary", {}), ("/api/reports/utilization", window),
+                                ("/api/search", {"q": "x"}), ("/api/resources/1", {})):
+                assert api_client.get(url, params=params).status_code == 501, url
+            assert api_client.post("/api/admin/archive").status_code == 501
+        finally:
+            api.use_repositories(*previous)
+        assert api_client.get("/api/reports/summary").status_code == 200
+
+
+class TestStartup:
+    """Jobs que trabalham na tabela appointments do SQLite não sobem com o backend em memória."""
+
+    def test_refuses_sql_only_jobs(self, monkeypatch):
+        monkeypatch.setitem(CONFIG["lifecycle"], "enabled", True)
+        monkeypatch.setitem(CONFIG["archive"], "auto", True)
+        with pytest.raises(RuntimeError, match="lifecycle.enabled, archive.auto"):
+            memory.check_supported()
+        monkeypatch.setitem(CONFIG["lifecycle"], "enabled", False)
+        monkeypatch.setitem(CONFIG["archive"], "auto", False)
+        memory.check_supported()
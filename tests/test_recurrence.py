@@ -0,0 +1,167 @@
+"""
+Testes de séries recorrentes: expansão preguiçosa, varredura de conflitos e regras do service.
+"""
+import itertools
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app import models, reports
+from app.cache import TTLCache
+from app.exceptions import BusinessRuleException
+from app.recurrence import first_overlap, iter_starts, occurrences
+from app.repositories import (SqlAlchemyAppointmentRepository, SqlAlchemySeriesRepository,
+                              SqlAlchemyUserRepository)
+from app.services import AppointmentService
+
+
+def next_weekday_at(weekday, hour):
+    """Próxima data (a partir de amanhã) no dia da semana pedido, no horário dado."""
+    day = datetime.now().replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    while day.weekday() != weekday:
+        day += timedelta(days=1)
+    return day
+
+
+# ============================================================================
+# EXPANSÃO
+# ============================================================================
+
+class TestExpansion:
+    """Geração das ocorrências."""
+
+    def test_weekly_count(self):
+        first = datetime(2030, 1, 1, 10, 0)
+        starts = list(iter_starts(first, "WEEKLY", count=52))
+        assert len(starts) == 52
+        assert starts[1] - starts[0] == timedelta(days=7)
+        assert starts[-1] == first + timedelta(weeks=51)
+
+    def test_until_is_inclusive(self):
+        first = datetime(2030, 1, 1, 10, 0)
+        starts = list(iter_starts(first, "DAILY", interval=2, until=datetime(2030, 1, 5, 10, 0)))
+        assert starts == [datetime(2030, 1, 1, 10), datetime(2030, 1, 3, 10), datetime(2030, 1, 5, 10)]
+
+    def test_monthly_skips_missing_days(self):
+        starts = list(iter_starts(datetime(2030, 1, 31, 9, 0), "MONTHLY", count=3))
+        assert [s.month for s in starts] == [1, 3, 5]
+
+    def test_window_jumps_without_expanding_prefix(self):
+        series = SimpleNamespace(start_time=datetime(2030, 1, 1, 10, 0), duration_minutes=60,
+                                 freq="WEEKLY", interval=1, count=None, until=None)
+        window = list(occurrences(series, datetime(2031, 1, 1), datetime(2031, 1, 15)))
+        assert len(window) == 2
+        assert all(datetime(2031, 1, 1) <= s < datetime(2031, 1, 15) for s, _ in window)
+
+    def test_unbounded_series_is_lazy(self):
+        series = SimpleNamespace(start_time=datetime(2030, 1, 1, 10, 0), duration_minutes=30,
+                                 freq="DAILY", interval=1, count=None, until=None)
+        assert len(list(itertools.islice(occurrences(series), 5))) == 5
+
+
+class TestFirstOverlap:
+    """Varredura ordenada entre dois fluxos de intervalos."""
+
+    def test_no_overlap_when_touching(self):
+        a = [(datetime(2030, 1, 1, 10), datetime(2030, 1, 1, 11))]
+        b = [(datetime(2030, 1, 1, 11), datetime(2030, 1, 1, 12))]
+        assert first_overlap(a, b) is None
+
+    def test_detects_overlap_behind_long_interval(self):
+        a = [(datetime(2030, 1, 1, 9), datetime(2030, 1, 1, 17))]
+        b = [(datetime(2030, 1, 1, 8), datetime(2030, 1, 1, 9)), (datetime(2030, 1, 1, 12), datetime(2030, 1, 1, 13))]
+        cand, busy = first_overlap(a, b)
+        assert cand == a[0]
+        assert busy == b[1]
+
+
+# ============================================================================
+# SERVICE
+# ============================================================================
+
+class TestSeriesService:
+    """Criação de séries contra um banco SQLite real."""
+
+    @pytest.fixture
+    def setup(self, db_session):
+        user = models.User(name="Ana", email="ana@test.com")
+        resource = models.Resource(name="Sala 1", resource_type="sala")
+        db_session.add_all([user, resource])
+        db_session.commit()
+        service = AppointmentService(SqlAlchemyAppointmentRepository(), SqlAlchemyUserRepository(),
+                                     SqlAlchemySeriesRepository())
+        return SimpleNamespace(db=db_session, service=service, user=user, resource=resource)
+
+    def test_year_long_weekly_series_is_one_row(self, setup):
+        start = next_weekday_at(1, 10)
+        series = setup.service.create_series(setup.db, setup.user.id, setup.resource.id, start, 60, "weekly", count=52)
+        assert series.id is not None
+        assert series.end_time == start + timedelta(weeks=51, hours=1)
+        assert setup.db.query(models.AppointmentSeries).count() == 1
+        assert setup.db.query(models.Appointment).count() == 0
+
+    def test_series_conflicts_with_existing_booking(self, setup):
+        start = next_weekday_at(1, 10)
+        setup.service.create_appointment(setup.db, setup.user.id, setup.resource.id, start + timedelta(weeks=10), 30)
+        with pytest.raises(BusinessRuleException, match="Conflito"):
+            setup.service.create_series(setup.db, setup.user.id, setup.resource.id, start, 60, "WEEKLY", count=52)
+
+    def test_single_booking_conflicts_with_series(self, setup):
+        start = next_weekday_at(1, 10)
+        setup.service.create_series(setup.db, setup.user.id, setup.resource.id, start, 60, "WEEKLY", count=52)
+        with pytest.raises(BusinessRuleException, match="série"):
+            setup.service.create_appointment(setup.db, setup.user.id, setup.resource.id,
+                                             start + timedelta(weeks=20, minutes=30), 30)
+
+    def test_series_conflicts_with_other_series(self, setup):
+        start = next_weekday_at(1, 10)
+        setup.service.create_series(setup.db, setup.user.id, setup.resource.id, start, 60, "WEEKLY", interval=2, count=10)
+        with pytest.raises(BusinessRuleException, match="Conflito"):
+            setup.service.create_series(setup.db, setup.user.id, setup.resource.id,
+                                        start + timedelta(days=14), 60, "DAILY", count=3)
+
+    def test_series_outside_working_hours(self, setup):
+        with pytest.raises(BusinessRuleException, match="expediente"):
+            setup.service.create_series(setup.db, setup.user.id, setup.resource.id,
+                                        next_weekday_at(1, 20), 60, "WEEKLY", count=4)
+
+    def test_series_requires_bound(self, setup):
+        with pytest.raises(BusinessRuleException):
+            setup.service.create_series(setup.db, setup.user.id, setup.resource.id,
+                                        next_weekday_at(1, 10), 60, "WEEKLY")
+
+    def test_past_start_is_a_series_rule_only(self, setup):
+        past = next_weekday_at(1, 10) - timedelta(weeks=2)
+        with pytest.raises(BusinessRuleException, match="futuro"):
+            setup.service.create_series(setup.db, setup.user.id, setup.resource.id, past, 60, "WEEKLY", count=4)
+        # o avulso é validado no schema (AppointmentCreate); o service não tem regra própria de passado
+        created = setup.service.create_appointment(setup.db, setup.user.id, setup.resource.id, past, 60)
+        assert created.start_time == past
+
+
+class TestSeriesInListings:
+    """Ocorrências nas listagens de agendamentos e no resumo, quando pedidas."""
+
+    def test_listing_and_summary(self, api_client, db_session, monkeypatch):
+        monkeypatch.setattr(reports, "_cache", TTLCache(ttl=60))
+        db_session.add_all([models.User(name="Ana", email="ana@test.com"),
+                            models.Resource(name="Sala 1", resource_type="sala")])
+        db_session.commit()
+        start = next_weekday_at(1, 10)
+        service = AppointmentService(SqlAlchemyAppointmentRepository(), SqlAlchemyUserRepository(),
+                                     SqlAlchemySeriesRepository())
+        series = service.create_series(db_session, 1, 1, start, 60, "WEEKLY", count=3)
+        booked = service.create_appointment(db_session, 1, 1, start + timedelta(days=8), 30)
+
+        assert [a["id"] for a in api_client.get("/api/appointments").json()] == [booked.id]
+        window = {"include_series": "true", "end": (start + timedelta(days=10)).isoformat()}
+        rows = api_client.get("/api/appointments", params=window).json()
+        day = lambda d: (start + timedelta(days=d)).date().isoformat()
+        assert [(r["id"], r["series_id"], r["start_time"][:10]) for r in rows] == [
+            (None, series.id, day(0)), (None, series.id, day(7)), (booked.id, None, day(8))]
+
+        summary = api_client.get("/api/reports/summary", params={"include_series": "true"}).json()
+        assert summary["total"] == 4 and summary["total_minutes"] == 3 * 60 + 30
+        assert summary["by_resource"] == [{"id": 1, "count": 4, "minutes": 210}]
+        assert api_client.get("/api/reports/summary").json()["total"] == 1
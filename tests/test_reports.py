@@ -0,0 +1,81 @@
+"""
+Testes do relatório agregado (GROUP BY no banco).
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app import models, reports
+from app.cache import TTLCache
+
+
+@pytest.fixture
+def seeded(db_session):
+    base = datetime(2030, 3, 4, 9, 0)
+    users = [models.User(name="A", email="a@x.com"), models.User(name="B", email="b@x.com")]
+    resources = [models.Resource(name="Sala", resource_type="sala"), models.Resource(name="Dr", resource_type="medico")]
+    db_session.add_all(users + resources)
+    db_session.flush()
+    rows = [
+        (users[0], resources[0], base, 60, "scheduled"),
+        (users[0], resources[1], base + timedelta(hours=2), 30, "done"),
+        (users[1], resources[0], base + timedelta(days=1), 45, "scheduled"),
+        (users[1], resources[0], base + timedelta(days=1, hours=2), 30, "cancelled"),
+    ]
+    for user, resource, start, minutes, status in rows:
+        db_session.add(models.Appointment(user_id=user.id, resource_id=resource.id, start_time=start,
+                                          end_time=start + timedelta(minutes=minutes), status=status))
+    db_session.commit()
+    return db_session, users, resources
+
+
+class TestSummary:
+    """Agregações por status, recurso, usuário e dia."""
+
+    def test_totals(self, seeded):
+        db, users, resources = seeded
+        report = reports.build_summary(db)
+        assert report["total"] == 4
+        assert report["total_minutes"] == 135  # cancelado não ocupa agenda
+        assert {r["status"]: r["count"] for r in report["by_status"]} == {"cancelled": 1, "done": 1, "scheduled": 2}
+
+    def test_groups(self, seeded):
+        db, users, resources = seeded
+        report = reports.build_summary(db)
+        by_resource = {r["id"]: (r["count"], r["minutes"]) for r in report["by_resource"]}
+        assert by_resource == {resources[0].id: (3, 105), resources[1].id: (1, 30)}
+        by_user = {r["id"]: r["minutes"] for r in report["by_user"]}
+        assert by_user == {users[0].id: 90, users[1].id: 45}
+        assert [(d["day"], d["count"]) for d in report["by_day"]] == [(date(2030, 3, 4), 2), (date(2030, 3, 5), 2)]
+
+    def test_window(self, seeded):
+        db, _, _ = seeded
+        report = reports.build_summary(db, start=datetime(2030, 3, 5), end=datetime(2030, 3, 6))
+        assert report["total"] == 2
+
+    def test_cached_summary_reuses_result(self, seeded, monkeypatch):
+        db, _, _ = seeded
+        monkeypatch.setattr(reports, "_cache", TTLCache(ttl=60))
+        first = reports.cached_summary(db)
+        db.add(models.Appointment(user_id=1, resource_id=1, start_time=datetime(2030, 4, 1, 9),
+                                  end_time=datetime(2030, 4, 1, 10)))
+        db.commit()
+        assert reports.cached_summary(db) is first
+
+
+class TestTTLCache:
+    """Expiração e limite de tamanho."""
+
+    def test_expires(self):
+        cache = TTLCache(ttl=0)
+        cache.set("k", 1)
+        assert cache.get("k") is None
+
+    def test_lru_eviction(self):
+        cache = TTLCache(ttl=60, maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
@@ -0,0 +1,117 @@
+"""
+Testes dos repositórios SQLAlchemy contra um SQLite real (select/RETURNING/lambda_stmt).
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app import models
+from app.events import change_bus
+from app.repositories import (SqlAlchemyAppointmentRepository, SqlAlchemySeriesRepository,
+                              SqlAlchemyUserRepository)
+
+BASE = datetime(2030, 6, 3, 9, 0)
+
+
+@pytest.fixture
+def statements(db_engine):
+    """Lista com o SQL de cada instrução executada no engine."""
+    seen = []
+    listener = lambda conn, cursor, stmt, params, ctx, many: seen.append(stmt)
+    event.listen(db_engine, "before_cursor_execute", listener)
+    yield seen
+    event.remove(db_engine, "before_cursor_execute", listener)
+
+
+def _appointment(hours, user_id=1, resource_id=1):
+    start = BASE + timedelta(hours=hours)
+    return models.Appointment(user_id=user_id, resource_id=resource_id, start_time=start,
+                              end_time=start + timedelta(minutes=30))
+
+
+class TestCreateReturning:
+    """create devolve a linha completa com um único INSERT ... RETURNING."""
+
+    def test_user_create_single_statement(self, db_session, statements):
+        created = SqlAlchemyUserRepository().create(db_session, models.User(name="Ana", email="ana@x.com"))
+        inserts = [s for s in statements if s.startswith("INSERT")]
+        assert len(inserts) == 1 and "RETURNING" in inserts[0]
+        assert not [s for s in statements if s.startswith("SELECT")]
+        assert created.id is not None
+        assert created.is_active is True
+
+    def test_appointment_defaults_come_back(self, db_session):
+        created = SqlAlchemyAppointmentRepository().create(db_session, _appointment(0))
+        assert created.status == "scheduled"
+
+    def test_series_create(self, db_session):
+        series = models.AppointmentSeries(user_id=1, resource_id=1, start_time=BASE, end_time=BASE + timedelta(days=2),
+                                          duration_minutes=30, freq="DAILY", interval=1, count=3)
+        created = SqlAlchemySeriesRepository().create(db_session, series)
+        assert SqlAlchemySeriesRepository().get(db_session, created.id).freq == "DAILY"
+
+
+class TestUpdateReturning:
+    """update é um único UPDATE ... RETURNING das colunas preenchidas, sem SELECT antes."""
+
+    def test_partial_update_single_statement(self, db_session, statements):
+        repo = SqlAlchemyAppointmentRepository()
+        created = repo.create(db_session, _appointment(0))
+        id, start = created.id, created.start_time
+        statements.clear()
+        updated = repo.update(db_session, models.Appointment(id=id, status="no_show"))
+        assert [s.split()[0] for s in statements] == ["UPDATE"] and "RETURNING" in statements[0]
+        assert (updated.status, updated.start_time, updated.user_id) == ("no_show", start, 1)
+
+    def test_assigned_none_clears_column(self, db_session):
+        repo = SqlAlchemyAppointmentRepository()
+        booking = _appointment(0)
+        booking.notes = "Trazer notebook"
+        created = repo.create(db_session, booking)
+        assert repo.update(db_session, models.Appointment(id=created.id, status="done")).notes == "Trazer notebook"
+        cleared = repo.update(db_session, models.Appointment(id=created.id, notes=None))
+        assert (cleared.notes, cleared.status) == (None, "done")
+        # fields explícitos (model_dump(exclude_unset=True)): só essas colunas, mesmo com outras atribuídas
+        again = repo.update(db_session, models.Appointment(id=created.id, status="no_show", notes="x"), fields={"status"})
+        assert (again.status, again.notes) == ("no_show", None)
+
+    def test_user_update_and_missing_row(self, db_session):
+        repo = SqlAlchemyUserRepository()
+        created = repo.create(db_session, models.User(name="Ana", email="ana@x.com"))
+        updated = repo.update(db_session, models.User(id=created.id, name="Ana Maria"))
+        assert (updated.name, updated.email) == ("Ana Maria", "ana@x.com")
+        with pytest.raises(ValueError):
+            repo.update(db_session, models.User(id=999, name="Ninguém"))
+        with pytest.raises(ValueError):
+            SqlAlchemyAppointmentRepository().update(db_session, models.Appointment(id=999, status="done"))
+
+
+class TestQueries:
+    """Filtros compostos com lambda_stmt e DELETE ... RETURNING."""
+
+    @pytest.fixture
+    def repo(self, db_session):
+        repo = SqlAlchemyAppointmentRepository()
+        for h, user in ((0, 1), (2, 2), (1, 1), (30, 1)):
+            repo.create(db_session, _appointment(h, user_id=user))
+        return repo
+
+    def test_filters_change_between_calls(self, repo, db_session):
+        assert [a.start_time.hour for a in repo.list_by_filter(db_session, user_id=1)] == [9, 10, 15]
+        assert len(repo.list_by_filter(db_session, user_id=2)) == 1
+        assert len(repo.list_by_filter(db_session, user_id=1, end=BASE + timedelta(hours=2))) == 2
+        assert len(repo.list_by_filter(db_session)) == 4
+
+    def test_delete_publishes_returned_row(self, repo, db_session):
+        seen = []
+        change_bus.add_listener(seen.append)
+        try:
+            target = repo.list_by_filter(db_session, user_id=2)[0]
+            repo.delete(db_session, target.id)
+            repo.delete(db_session, 999)
+        finally:
+            change_bus.remove_listener(seen.append)
+        assert [e.type for e in seen] == ["appointment.deleted"]
+        assert seen[0].data["user_id"] == 2
+        assert repo.get(db_session, target.id) is None
@@ -0,0 +1,184 @@
+"""
+Testes da alocação em lote: sweep + heap sobre janelas livres, regras do service (expediente,
+limite diário, ocupação existente) e a rota POST /api/appointments/assign.
+"""
+import time as _time
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import models
+from app.repositories import (SqlAlchemyAppointmentRepository, SqlAlchemyResourceRepository,
+                              SqlAlchemySeriesRepository, SqlAlchemyUserRepository)
+from app.scheduler import FlexibleRequest, ResourceGaps, assign
+from app.services import AppointmentService
+from app.waitlist import WaitlistIndex
+
+DAY = date(2030, 6, 4)
+
+
+def at(h, m=0, day=DAY):
+    return datetime.combine(day, time(h, m))
+
+
+def req(index, earliest, latest, minutes=60, user_id=None, kind="sala"):
+    return FlexibleRequest(index, index if user_id is None else user_id, kind, earliest, latest,
+                           timedelta(minutes=minutes))
+
+
+def office(rid, *busy):
+    """Recurso aberto das 08:00 às 18:00 em DAY, menos os intervalos ocupados."""
+    free, cursor = [], at(8)
+    for s, e in busy:
+        if s > cursor:
+            free.append((cursor, s))
+        cursor = max(cursor, e)
+    if cursor < at(18):
+        free.append((cursor, at(18)))
+    return ResourceGaps(rid, free)
+
+
+def next_weekday_at(weekday, hour):
+    """Próxima data (a partir de amanhã) no dia da semana pedido, no horário dado."""
+    day = datetime.now().replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    while day.weekday() != weekday:
+        day += timedelta(days=1)
+    return day
+
+
+# ============================================================================
+# Algoritmo
+# ============================================================================
+
+class TestAssign:
+    """Sweep por início de janela; cada pedido pega o encaixe mais cedo entre os recursos do tipo."""
+
+    def test_spreads_over_interchangeable_resources(self):
+        pools = {"sala": [office(1), office(2)]}
+        done, failed = assign([req(i, at(9), at(12)) for i in range(5)], pools, Counter(), 3)
+        placed = sorted((a.start_time.hour, a.resource_id) for a in done)
+        assert placed == [(9, 1), (9, 2), (10, 1), (10, 2), (11, 1)]
+        assert failed == {}
+
+    def test_earliest_start_wins_over_lower_id(self):
+        pools = {"sala": [office(1, (at(8), at(11))), office(2)]}
+        done, _ = assign([req(0, at(9), at(12))], pools, Counter(), 3)
+        assert (done[0].resource_id, done[0].start_time) == (2, at(9))
+
+    def test_gap_too_short_is_skipped(self):
+        pools = {"sala": [office(1, (at(8), at(9)), (at(9, 30), at(18)))]}
+        done, failed = assign([req(0, at(8), at(18), 45), req(1, at(8), at(18), 30)], pools, Counter(), 3)
+        assert [a.index for a in done] == [1]
+        assert failed == {0: "Sem horário livre na janela pedida"}
+
+    def test_daily_limit_moves_to_next_day(self):
+        tomorrow = DAY + timedelta(days=1)
+        pools = {"sala": [ResourceGaps(1, [(at(8), at(18)), (at(8, day=tomorrow), at(18, day=tomorrow))])]}
+        per_day = Counter({(7, DAY): 3})
+        done, _ = assign([req(0, at(8), at(18, day=tomorrow), user_id=7)], pools, per_day, 3)
+        assert done[0].start_time == at(8, day=tomorrow)
+        done, failed = assign([req(1, at(8), at(18), user_id=7)], pools, per_day, 3)
+        assert done == [] and "limite diário" in failed[1]
+
+    def test_unknown_type(self):
+        _, failed = assign([req(0, at(8), at(9), kind="projetor")], {"sala": [office(1)]}, Counter(), 3)
+        assert "projetor" in failed[0]
+
+    def test_hundreds_of_requests_in_milliseconds(self):
+        days = [DAY + timedelta(days=d) for d in range(5)]
+        pools = {"sala": [ResourceGaps(r, [(at(8, day=d), at(18, day=d)) for d in days]) for r in range(1, 21)]}
+        requests = [req(i, at(8 + i % 8, day=days[i % 5]), at(18, day=days[i % 5]), 30 + 30 * (i % 3))
+                    for i in range(600)]
+        started = _time.perf_counter()
+        done, failed = assign(requests, pools, Counter(), 3)
+        elapsed = _time.perf_counter() - started
+        assert len(done) + len(failed) == 600 and len(done) > 500
+        assert elapsed < 0.5
+        for gaps in pools["sala"]:  # nada sobreposto dentro de um recurso
+            mine = sorted((a.start_time, a.end_time) for a in done if a.resource_id == gaps.id)
+            assert all(e <= s for (_, e), (s, _) in zip(mine, mine[1:]))
+
+
+# ============================================================================
+# Service e rota
+# ============================================================================
+
+class TestAssignBatch:
+    """Janelas vêm do calendário e da ocupação atual; grava numa transação."""
+
+    @pytest.fixture
+    def setup(self, db_session):
+        db_session.add_all([models.User(name=f"U{i}", email=f"u{i}@test.com") for i in range(1, 4)]
+                           + [models.Resource(name=f"Sala {i}", resource_type="sala") for i in range(1, 3)]
+                           + [models.Resource(name="Projetor", resource_type="equipamento")])
+        db_session.commit()
+        service = AppointmentService(SqlAlchemyAppointmentRepository(), SqlAlchemyUserRepository(),
+                                     SqlAlchemySeriesRepository(), waitlist=WaitlistIndex())
+        resources = SqlAlchemyResourceRepository().ids_by_type(db_session, {"sala", "equipamento"})
+        return SimpleNamespace(db=db_session, service=service, resources=resources, day=next_weekday_at(1, 0))
+
+    def flexible(self, setup, index, user_id, start_hour, end_hour, minutes=60, kind="sala"):
+        return FlexibleRequest(index, user_id, kind, setup.day.replace(hour=start_hour),
+                               setup.day.replace(hour=end_hour), timedelta(minutes=minutes))
+
+    def test_respects_existing_bookings_and_hours(self, setup):
+        assert setup.resources == {"sala": [1, 2], "equipamento": [3]}
+        setup.service.create_appointment(setup.db, 1, 1, setup.day.replace(hour=9), 60)
+        results = setup.service.assign_batch(setup.db, [
+            self.flexible(setup, 0, 2, 9, 10),
+            self.flexible(setup, 1, 3, 9, 10),
+            self.flexible(setup, 2, 3, 17, 20),  # só 17:00-18:00 está no expediente
+        ], setup.resources)
+        assert [(r["status"], r.get("resource_id")) for r in results] == [("assigned", 2), ("unassigned", None),
+                                                                          ("assigned", 1)]
+        assert results[2]["start_time"].hour == 17
+        assert setup.db.query(models.Appointment).count() == 3
+
+    def test_occupancy_loaded_once_for_all_resources(self, setup, monkeypatch):
+        setup.service.create_appointment(setup.db, 1, 1, setup.day.replace(hour=9), 60)
+        monkeypatch.setattr(setup.service.app_repo, "list_by_resource",
+                            lambda *a: pytest.fail("uma consulta de ocupação por recurso"))
+        results = setup.service.assign_batch(setup.db, [self.flexible(setup, 0, 2, 9, 10),
+                                                        self.flexible(setup, 1, 3, 9, 10)], setup.resources)
+        assert [(r["status"], r.get("resource_id")) for r in results] == [("assigned", 2), ("unassigned", None)]
+
+    def test_daily_limit_counts_existing_and_batch(self, setup):
+        for h in (9, 10):
+            setup.service.create_appointment(setup.db, 1, 1, setup.day.replace(hour=h), 30)
+        results = setup.service.assign_batch(setup.db, [self.flexible(setup, i, 1, 12, 18, 30) for i in range(2)],
+                                             setup.resources)
+        assert [r["status"] for r in results] == ["assigned", "unassigned"]
+        assert "limite diário" in results[1]["detail"]
+
+    def test_dry_run_and_invalid_user(self, setup):
+        results = setup.service.assign_batch(setup.db, [self.flexible(setup, 0, 1, 9, 12, kind="equipamento"),
+                                                        self.flexible(setup, 1, 99, 9, 12)],
+                                             setup.resources, dry_run=True)
+        assert results[0]["status"] == "assigned" and "appointment_id" not in results[0]
+        assert results[1] == {"index": 1, "status": "unassigned", "detail": "Usuário não encontrado"}
+        assert setup.db.query(models.Appointment).count() == 0
+
+
+class TestAssignRoute:
+    """POST /api/appointments/assign."""
+
+    def test_route(self, api_client, db_session):
+        db_session.add_all([models.User(name="Ana", email="ana@x.com"), models.User(name="Bia", email="bia@x.com"),
+                            models.Resource(name="Sala 1", resource_type="sala")])
+        db_session.commit()
+        client = TestClient(api_client.app, client=("10.0.0.49", 50000))
+        day = next_weekday_at(2, 0)
+        window = {"resource_type": "sala", "earliest": day.replace(hour=9).isoformat(),
+                  "latest": day.replace(hour=11).isoformat(), "duration_minutes": 60}
+        resp = client.post("/api/appointments/assign", json={"requests": [{"user_id": 1, **window},
+                                                                          {"user_id": 2, **window}]})
+        body = resp.json()
+        assert resp.status_code == 200 and body["assigned"] == 2
+        assert [r["start_time"][11:16] for r in body["results"]] == ["09:00", "10:00"]
+        assert len(client.get("/api/appointments").json()) == 2
+
+        bad = {**window, "latest": day.replace(hour=9, minute=30).isoformat()}
+        assert client.post("/api/appointments/assign", json={"requests": [{"user_id": 1, **bad}]}).status_code == 422
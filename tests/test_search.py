@@ -0,0 +1,93 @@
+"""
+Testes da busca FTS5 (triggers de sincronização, ranking e paginação).
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app import models, search
+from app.archive import archive_expired
+from app.db import init_schema
+from app.repositories import SqlAlchemyUserRepository
+
+BASE = datetime(2030, 6, 3, 9, 0)
+
+
+@pytest.fixture
+def seeded(db_session):
+    db_session.add_all([
+        models.User(name="Mariana Souza", email="mariana.souza@clinica.com.br"),
+        models.User(name="João Pereira", email="joao@empresa.com"),
+    ])
+    for i, notes in enumerate(["Retorno pós-operatório do joelho", "Avaliação inicial", None,
+                               "Joelho dolorido, trazer exames"]):
+        start = BASE + timedelta(hours=i)
+        db_session.add(models.Appointment(user_id=1, resource_id=1, start_time=start,
+                                          end_time=start + timedelta(minutes=30), notes=notes))
+    db_session.commit()
+    return db_session
+
+
+def _ids(result, kind):
+    return [h["id"] for h in result["hits"] if h["kind"] == kind]
+
+
+class TestQuerySyntax:
+    """Texto do usuário nunca vira sintaxe FTS5."""
+
+    def test_terms_are_quoted(self):
+        assert search.fts_query('joelho "dor') == '"joelho" """dor"'
+        assert search.fts_query("exa", prefix=True) == '"exa"*'
+        assert search.fts_query("   ") is None
+
+    def test_operators_are_literal(self, seeded):
+        assert search.search(seeded, "AND OR NOT (")["hits"] == []
+
+
+class TestSearch:
+    """Trechos de email, palavras sem acento e ranking."""
+
+    def test_email_fragment(self, seeded):
+        result = search.search(seeded, "clinica")
+        assert _ids(result, "users") == [1]
+        assert "[" in result["hits"][0]["snippet"]
+
+    def test_notes_ignore_accents_and_prefix(self, seeded):
+        assert sorted(_ids(search.search(seeded, "pos operatorio"), "appointments")) == [1]
+        assert sorted(_ids(search.search(seeded, "joel", kinds=["appointments"]), "appointments")) == [1, 4]
+
+    def test_pagination(self, seeded):
+        first = search.search(seeded, "joelho", limit=1)
+        second = search.search(seeded, "joelho", limit=1, offset=1)
+        assert first["has_more"] and not second["has_more"]
+        assert first["hits"][0]["id"] != second["hits"][0]["id"]
+
+
+class TestSync:
+    """Triggers acompanham insert/update/delete e o rebuild cobre dados antigos."""
+
+    def test_update_and_delete(self, seeded):
+        seeded.execute(update(models.Appointment).where(models.Appointment.id == 2).values(notes="Joelho travado"))
+        seeded.commit()
+        assert 2 in _ids(search.search(seeded, "joelho"), "appointments")
+        seeded.delete(seeded.get(models.User, 2))
+        seeded.commit()
+        assert search.search(seeded, "empresa")["hits"] == []
+
+    def test_soft_deleted_user_leaves_results(self, seeded):
+        SqlAlchemyUserRepository(soft_delete=True).delete(seeded, 1)
+        assert search.search(seeded, "clinica")["hits"] == []
+        assert search.search(seeded, "joelho")["hits"] == []
+        assert _ids(search.search(seeded, "pereira"), "users") == [2]
+
+    def test_archived_rows_leave_the_index(self, seeded):
+        archive_expired(seeded, BASE + timedelta(days=1))
+        assert search.search(seeded, "joelho")["hits"] == []
+
+    def test_rebuild_indexes_existing_rows(self, seeded, db_engine):
+        with db_engine.begin() as conn:
+            for stmt in ("DROP TABLE users_fts", "DROP TRIGGER users_fts_ai", "PRAGMA user_version = 0"):
+                conn.exec_driver_sql(stmt)
+        init_schema(db_engine)
+        assert _ids(search.search(seeded, "pereira"), "users") == [2]
@@ -0,0 +1,82 @@
+"""
+Testes da simulação de demanda: geração vetorizada, categorias de recusa e o relatório de uma
+rodada pelo service (nos dois backends, com a mesma semente).
+"""
+import numpy as np
+import pytest
+
+from app import simulation
+
+
+# ============================================================================
+# Demanda
+# ============================================================================
+
+class TestDemand:
+    """Chegadas, horários e flags sorteados com NumPy."""
+
+    def demand(self, seed=7, **kw):
+        params = dict(resources=4, users=10, days=3, rate_per_hour=2.0, open_minute=480, close_minute=1080)
+        params.update(kw)
+        return simulation.generate_demand(np.random.default_rng(seed), **params)
+
+    def test_shapes_and_ordering(self):
+        d = self.demand()
+        n = len(d["arrival"])
+        assert all(len(col) == n for col in d.values())
+        assert np.all(np.diff(d["arrival"]) >= 0)
+        assert d["resource"].min() >= 1 and d["resource"].max() <= 4
+        assert d["user"].min() >= 1 and d["user"].max() <= 10
+
+    def test_poisson_volume(self):
+        # 4 recursos x 72 h x 2/h = 576 pedidos esperados
+        sizes = [len(self.demand(seed=s)["arrival"]) for s in range(20)]
+        assert abs(np.mean(sizes) - 576) < 30
+
+    def test_starts_fit_working_hours(self):
+        d = self.demand()
+        minute = d["start"] % 1440
+        assert np.all(d["start"] > d["arrival"])
+        assert np.all(minute % simulation.SLOT_MINUTES == 0)
+        assert np.all((minute >= 480) & (minute + d["duration"] <= 1080))
+        assert np.all((d["cancel_at"] >= d["arrival"]) & (d["cancel_at"] <= d["start"]))
+        assert not np.any(d["cancel"] & d["no_show"])
+
+    def test_same_seed_same_demand(self):
+        a, b = self.demand(seed=3), self.demand(seed=3)
+        assert all(np.array_equal(a[k], b[k]) for k in a)
+
+    def test_rejection_reasons(self):
+        assert simulation.rejection_reason("Conflito com outro agendamento no recurso (sobreposição)") == "conflito"
+        assert simulation.rejection_reason("Conflito com série recorrente no recurso (sobreposição)") == "conflito_serie"
+        assert simulation.rejection_reason("Agendamento fora do expediente em 2030-01-01 (fechado)") \
+            == "fora_do_expediente"
+
+
+# ============================================================================
+# Rodada pelo service
+# ============================================================================
+
+class TestRun:
+    """Relatório coerente e o mesmo resultado nos dois backends."""
+
+    @pytest.fixture(scope="class")
+    def reports(self):
+        params = dict(resources=2, users=4, days=2, rate_per_hour=1.5, seed=11, cancel_rate=0.1, no_show_rate=0.1)
+        return {backend: simulation.run(backend=backend, **params) for backend in simulation.BACKENDS}
+
+    def test_report_adds_up(self, reports):
+        r = reports["sqlite"]
+        assert r["requests"] == r["accepted"] + sum(r["rejections"].values())
+        assert r["accepted"] > 0 and "conflito" in r["rejections"]
+        assert 0 < r["effective_utilization"] <= r["utilization"] <= 1
+        assert len(r["utilization_by_resource"]) == 2
+        assert r["throughput_per_second"] > 0 and r["latency_ms"]["p50"] <= r["latency_ms"]["max"]
+
+    def test_backends_apply_the_same_rules(self, reports):
+        keys = ("requests", "accepted", "rejections", "cancelled", "no_shows", "utilization")
+        assert {k: reports["sqlite"][k] for k in keys} == {k: reports["memory"][k] for k in keys}
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            simulation.run(backend="postgres", days=1)
@@ -0,0 +1,132 @@
+"""
+Testes do single-flight (rotas síncronas e async) e do formato das respostas serializadas.
+"""
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import models
+from app.singleflight import AsyncSingleFlight, SingleFlight, serialize
+from app.schemas import AppointmentRead
+
+
+class TestSingleFlight:
+    """Chamadas simultâneas com a mesma chave executam uma vez."""
+
+    def test_concurrent_threads_share_one_call(self):
+        flight, calls, results = SingleFlight(), [], []
+        start = threading.Barrier(10)
+
+        def work():
+            calls.append(1)
+            time.sleep(0.1)
+            return b"[]"
+
+        def client():
+            start.wait()
+            results.append(flight.do("k", work))
+
+        threads = [threading.Thread(target=client) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(calls) == 1
+        assert [shared for _, shared in results].count(False) == 1
+        assert {body for body, _ in results} == {b"[]"}
+        assert len(flight) == 0
+
+    def test_error_reaches_followers_and_key_is_released(self):
+        flight = SingleFlight()
+        gate = threading.Event()
+        errors = []
+
+        def boom():
+            gate.wait()
+            raise LookupError("x")
+
+        def client():
+            try:
+                flight.do("k", boom)
+            except LookupError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=client) for _ in range(3)]
+        for t in threads:
+            t.start()
+        while len(flight) == 0:
+            time.sleep(0.001)
+        time.sleep(0.02)
+        gate.set()
+        for t in threads:
+            t.join()
+        assert len(errors) == 3
+        assert flight.do("k", lambda: 1) == (1, False)
+
+    def test_different_keys_do_not_wait(self):
+        flight = SingleFlight()
+        assert flight.do("a", lambda: 1) == (1, False)
+        assert flight.do("b", lambda: 2) == (2, False)
+
+
+class TestAsyncSingleFlight:
+    """Uma task por chave; cancelar o líder não derruba os demais."""
+
+    def test_gather_runs_once(self):
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return b"ok"
+
+        async def scenario():
+            flight = AsyncSingleFlight()
+            results = await asyncio.gather(*(flight.do("k", work) for _ in range(20)))
+            return flight, results
+
+        flight, results = asyncio.run(scenario())
+        assert len(calls) == 1
+        assert [shared for _, shared in results].count(False) == 1
+        assert len(flight) == 0
+
+    def test_leader_cancelled_followers_still_served(self):
+        async def work():
+            await asyncio.sleep(0.05)
+            return b"ok"
+
+        async def scenario():
+            flight = AsyncSingleFlight()
+            leader = asyncio.ensure_future(flight.do("k", work))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.do("k", work))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await follower
+
+        assert asyncio.run(scenario()) == (b"ok", True)
+
+
+class TestRoutes:
+    """Rotas de leitura continuam devolvendo o formato do response_model."""
+
+    def test_serialize_orm_rows(self):
+        start = datetime(2030, 1, 1, 9)
+        a = models.Appointment(id=1, user_id=2, resource_id=3, start_time=start,
+                               end_time=start + timedelta(hours=1), status="scheduled", notes=None)
+        assert serialize([a], list[AppointmentRead]).startswith(b'[{"id":1,"user_id":2')
+
+    def test_list_and_reserved_minutes(self, api_client, db_session):
+        start = datetime.now() + timedelta(days=2)
+        db_session.add(models.User(name="Ana", email="ana@x.com"))
+        db_session.add(models.Appointment(user_id=1, resource_id=1, start_time=start,
+                                          end_time=start + timedelta(minutes=45)))
+        db_session.commit()
+        body = api_client.get("/api/appointments", params={"user_id": 1}).json()
+        assert body[0]["user_id"] == 1 and body[0]["status"] == "scheduled"
+        assert api_client.get("/api/users/1/reserved_minutes").json() == {"user_id": 1, "reserved_minutes": 45}
+        assert api_client.get("/api/users/1").json()["email"] == "ana@x.com"
+        assert api_client.get("/api/users/99").status_code == 404
@@ -0,0 +1,119 @@
+"""
+Testes de cold start: imports baratos, config/engine preguiçosos e checagem de versão do schema.
+"""
+import json
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, inspect
+
+from app import db as app_db
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# só carregados quando usados: no lifespan, no pool de relatórios ou no primeiro acesso à config
+DEFERRED_MODULES = ("yaml", "numpy", "app.analytics", "app.memory", "app.lifecycle", "uvicorn")
+
+PROBE = """
+import json, sys
+import app.main
+import app.config, app.db, app.models
+print(json.dumps({"engine_built": app.db.get_engine.cache_info().currsize,
+                  "config_loaded": app.config.get_config.cache_info().currsize,
+                  "loaded": sorted(m for m in %r if m in sys.modules),
+                  "mappers_configured": app.models.User.__mapper__.configured}))
+""" % (DEFERRED_MODULES,)
+
+
+def _run_probe(code, env=None):
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True, env=env)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+class TestColdStart:
+    """Importar a aplicação não pode ler config, abrir banco nem rodar DDL."""
+
+    def test_import_app_main_is_lazy(self):
+        result = _run_probe(PROBE)
+        assert (result["engine_built"], result["config_loaded"]) == (0, 0)
+        assert result["mappers_configured"] is False
+        assert result["loaded"] == []
+
+    def test_import_services_does_not_read_config(self):
+        result = _run_probe(
+            "import json, sys\n"
+            "import app.api, app.config\n"
+            "print(json.dumps({'loaded': app.config.get_config.cache_info().currsize, 'yaml': 'yaml' in sys.modules}))"
+        )
+        assert result == {"loaded": 0, "yaml": False}
+
+
+class TestSchemaVersion:
+    """init_schema só roda create_all quando a versão gravada no banco é diferente."""
+
+    @pytest.fixture
+    def engine(self, tmp_path):
+        eng = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+        yield eng
+        eng.dispose()
+
+    def test_first_start_creates_schema(self, engine):
+        assert app_db.get_schema_version(engine) == 0
+        assert app_db.init_schema(engine) is True
+        assert app_db.get_schema_version(engine) == app_db.SCHEMA_VERSION
+        assert "appointments" in inspect(engine).get_table_names()
+
+    def test_second_start_skips_create_all(self, engine, monkeypatch):
+        app_db.init_schema(engine)
+        calls = []
+        monkeypatch.setattr(app_db.Base.metadata, "create_all", lambda *a, **kw: calls.append(1))
+        assert app_db.init_schema(engine) is False
+        assert calls == []
+
+    def test_outdated_version_recreates(self, engine):
+        app_db.init_schema(engine)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("PRAGMA user_version = 0")
+        assert app_db.init_schema(engine) is True
+
+    def test_missing_not_null_column_fails_loudly(self, engine, monkeypatch):
+        app_db.init_schema(engine)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("PRAGMA user_version = 0")
+        newer = MetaData()
+        Table("resources", newer, Column("id", Integer, primary_key=True), Column("code", String, nullable=False))
+        monkeypatch.setattr(app_db, "Base", SimpleNamespace(metadata=newer))
+        with pytest.raises(RuntimeError, match="resources.code"):
+            app_db.init_schema(engine)
+        assert app_db.get_schema_version(engine) == 0
+
+    def test_old_appointments_table_gets_autoincrement(self, engine):
+        """Banco de antes do AUTOINCREMENT: a tabela é recriada e a sequência passa do maior id arquivado."""
+        with engine.begin() as conn:
+            conn.exec_driver_sql("CREATE TABLE appointments (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL, "
+                                 "resource_id INTEGER NOT NULL, start_time DATETIME NOT NULL, "
+                                 "end_time DATETIME NOT NULL, status VARCHAR, notes TEXT)")
+            conn.exec_driver_sql("CREATE TABLE appointments_archive (id INTEGER NOT NULL PRIMARY KEY, "
+                                 "user_id INTEGER NOT NULL, resource_id INTEGER NOT NULL, start_time DATETIME NOT NULL, "
+                                 "end_time DATETIME NOT NULL, status VARCHAR, notes TEXT, archived_at DATETIME NOT NULL)")
+            conn.exec_driver_sql("INSERT INTO appointments VALUES (5, 1, 1, '2030-01-01 10:00:00.000000', "
+                                 "'2030-01-01 11:00:00.000000', 'scheduled', 'projetor')")
+            conn.exec_driver_sql("INSERT INTO appointments_archive VALUES (9, 1, 1, '2029-01-01 10:00:00.000000', "
+                                 "'2029-01-01 11:00:00.000000', 'done', NULL, '2029-06-01 00:00:00.000000')")
+        assert app_db.init_schema(engine) is True
+        with engine.begin() as conn:
+            ddl = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = 'appointments'").scalar()
+            assert "AUTOINCREMENT" in ddl
+            assert conn.exec_driver_sql("SELECT id, notes FROM appointments").all() == [(5, "projetor")]
+            new_id = conn.exec_driver_sql("INSERT INTO appointments (user_id, resource_id, start_time, end_time) "
+                                          "VALUES (1, 1, '2030-01-02 10:00:00', '2030-01-02 11:00:00') "
+                                          "RETURNING id").scalar()
+            assert new_id == 10
+            # índices e gatilhos da busca voltaram com a tabela nova
+            names = {r[0] for r in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE tbl_name = 'appointments'")}
+            assert {"ix_appointments_live_resource_start", "appointments_fts_ai"} <= names
+            assert conn.exec_driver_sql("SELECT rowid FROM appointments_fts WHERE appointments_fts MATCH 'projetor'"
+                                        ).scalar() == 5
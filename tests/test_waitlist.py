@@ -0,0 +1,195 @@
+"""
+Testes da fila de espera: entrada, promoção por ordem de chegada ao liberar horário,
+atomicidade com a exclusão, rotas e expiração pelo job de ciclo de vida.
+"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app import lifecycle, models
+from app.events import change_bus
+from app.exceptions import NotFoundException
+from app.repositories import (SqlAlchemyAppointmentRepository, SqlAlchemySeriesRepository,
+                              SqlAlchemyUserRepository)
+from app.services import AppointmentService
+from app.waitlist import WaitlistIndex, waitlist as shared_waitlist
+
+
+def next_weekday_at(weekday, hour):
+    """Próxima data (a partir de amanhã) no dia da semana pedido, no horário dado."""
+    day = datetime.now().replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    while day.weekday() != weekday:
+        day += timedelta(days=1)
+    return day
+
+
+@pytest.fixture
+def setup(db_session):
+    db_session.add_all([models.User(name=f"U{i}", email=f"u{i}@test.com") for i in range(1, 4)]
+                       + [models.Resource(name="Sala 1", resource_type="sala")])
+    db_session.commit()
+    service = AppointmentService(SqlAlchemyAppointmentRepository(), SqlAlchemyUserRepository(),
+                                 SqlAlchemySeriesRepository(), waitlist=WaitlistIndex(reload_seconds=3600))
+    return SimpleNamespace(db=db_session, service=service, at=next_weekday_at(1, 10))
+
+
+def entry(setup, id):
+    setup.db.expire_all()
+    return setup.db.get(models.WaitlistEntry, id)
+
+
+# ============================================================================
+# Promoção
+# ============================================================================
+
+class TestPromotion:
+    """Horário liberado vai para quem pediu antes, na mesma transação."""
+
+    def test_free_slot_is_promoted_immediately(self, setup):
+        got = setup.service.join_waitlist(setup.db, 1, 1, setup.at, 60)
+        assert got.status == "promoted" and got.appointment_id is not None
+        assert setup.db.query(models.Appointment).count() == 1
+
+    def test_first_come_first_served(self, setup):
+        booked = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        first = setup.service.join_waitlist(setup.db, 2, 1, setup.at, 60)
+        second = setup.service.join_waitlist(setup.db, 3, 1, setup.at + timedelta(minutes=30), 30)
+        assert first.status == second.status == "waiting"
+
+        setup.service.delete_appointment(setup.db, booked.id)
+        assert entry(setup, first.id).status == "promoted"
+        assert entry(setup, second.id).status == "waiting"  # sobrepõe o que acabou de ser promovido
+        owners = [a.user_id for a in setup.db.query(models.Appointment)]
+        assert owners == [2]
+
+    def test_one_pass_fills_several_gaps(self, setup):
+        booked = setup.service.create_appointment(setup.db, 1, 1, setup.at, 120)
+        a = setup.service.join_waitlist(setup.db, 2, 1, setup.at, 60)
+        b = setup.service.join_waitlist(setup.db, 3, 1, setup.at + timedelta(hours=1), 60)
+        setup.service.delete_appointment(setup.db, booked.id)
+        assert entry(setup, a.id).status == entry(setup, b.id).status == "promoted"
+
+    def test_partial_overlap_keeps_waiting(self, setup):
+        first = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        setup.service.create_appointment(setup.db, 2, 1, setup.at + timedelta(hours=1), 60)
+        waiting = setup.service.join_waitlist(setup.db, 3, 1, setup.at + timedelta(minutes=30), 60)
+        setup.service.delete_appointment(setup.db, first.id)
+        assert entry(setup, waiting.id).status == "waiting"
+
+    def test_daily_limit_is_respected(self, setup):
+        for h in range(3):
+            setup.service.create_appointment(setup.db, 2, 1, setup.at.replace(hour=14 + h), 30)
+        booked = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        waiting = setup.service.join_waitlist(setup.db, 2, 1, setup.at, 60)
+        setup.service.delete_appointment(setup.db, booked.id)
+        assert entry(setup, waiting.id).status == "waiting"
+
+    def test_entry_left_by_other_process_is_skipped(self, setup):
+        booked = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        gone = setup.service.join_waitlist(setup.db, 2, 1, setup.at, 60)
+        setup.service.join_waitlist(setup.db, 3, 1, setup.at, 60)
+        # cancelado direto na tabela: o heap deste processo ainda tem o pedido
+        setup.db.query(models.WaitlistEntry).filter_by(id=gone.id).update({"status": "cancelled"})
+        setup.db.commit()
+        setup.service.delete_appointment(setup.db, booked.id)
+        assert [a.user_id for a in setup.db.query(models.Appointment)] == [3]
+
+    def test_failed_promotion_rolls_back_delete(self, setup, monkeypatch):
+        booked = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        setup.service.join_waitlist(setup.db, 2, 1, setup.at, 60)
+
+        def boom(*args, **kwargs):
+            raise RuntimeError("falha no meio da promoção")
+
+        monkeypatch.setattr(setup.service.app_repo, "insert_if_free", boom)
+        with pytest.raises(RuntimeError):
+            setup.service.delete_appointment(setup.db, booked.id)
+        setup.db.expire_all()
+        assert setup.db.get(models.Appointment, booked.id) is not None
+
+    def test_user_delete_promotes_and_announces(self, setup):
+        booked = setup.service.create_appointment(setup.db, 1, 1, setup.at, 60).id
+        waiting = setup.service.join_waitlist(setup.db, 2, 1, setup.at, 60)
+        seen = []
+        change_bus.add_listener(seen.append)
+        try:
+            setup.service.release_freed(setup.db, SqlAlchemyUserRepository(soft_delete=False).delete(setup.db, 1))
+        finally:
+            change_bus.remove_listener(seen.append)
+        assert entry(setup, waiting.id).status == "promoted"
+        assert [(e.type, e.data["id"]) for e in seen][:1] == [("appointment.deleted", booked)]
+        assert "waitlist.promoted" in [e.type for e in seen]
+
+    def test_purge_promotes_soft_deleted_users_slots(self, setup):
+        setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        waiting = setup.service.join_waitlist(setup.db, 2, 1, setup.at, 60)
+        SqlAlchemyUserRepository(soft_delete=True).delete(setup.db, 1)
+        assert entry(setup, waiting.id).status == "waiting"  # o horário continua ocupado até o expurgo
+        lifecycle.purge_deleted_users(setup.db, release=setup.service.release_freed)
+        assert entry(setup, waiting.id).status == "promoted"
+        assert [a.user_id for a in setup.db.query(models.Appointment)] == [2]
+
+    def test_leave_waitlist(self, setup):
+        setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        waiting = setup.service.join_waitlist(setup.db, 2, 1, setup.at, 60)
+        assert setup.service.leave_waitlist(setup.db, waiting.id).status == "cancelled"
+        with pytest.raises(NotFoundException):
+            setup.service.leave_waitlist(setup.db, waiting.id)
+        assert setup.service.waitlist.waiting_count(setup.db, 1) == 0
+
+
+# ============================================================================
+# Rotas e ciclo de vida
+# ============================================================================
+
+class TestIndex:
+    """Heap em memória: candidatos filtrados pela janela, na ordem de chegada."""
+
+    def test_candidates_in_arrival_order(self, monkeypatch):
+        at = datetime(2030, 3, 4, 10)
+        row = lambda id, minutes, hour: SimpleNamespace(id=id, requested_at=at - timedelta(minutes=minutes), user_id=1,
+                                                        start_time=at.replace(hour=hour),
+                                                        end_time=at.replace(hour=hour + 1), notes=None)
+        index = WaitlistIndex(SimpleNamespace(waiting=lambda db, resource_id: []), reload_seconds=3600)
+        index.waiting_count(None, 1)  # carrega o recurso (vazio)
+        for id, minutes, hour in ((1, 5, 10), (2, 50, 14), (3, 30, 10), (4, 40, 11), (5, 90, 10)):
+            index.push(1, row(id, minutes, hour))
+        monkeypatch.setattr("heapq.nsmallest", None)  # não ordena o heap inteiro
+        assert [w.id for w in index.candidates(None, 1, at, at.replace(hour=12))] == [5, 4, 3, 1]
+        assert index.candidates(None, 1, at.replace(hour=12), at.replace(hour=14)) == []
+        assert index.waiting_count(None, 1) == 5
+
+
+class TestWaitlistRoutes:
+    """Conflito -> fila -> exclusão promove."""
+
+    def test_conflict_then_queue_then_promotion(self, api_client, db_session):
+        shared_waitlist.invalidate()
+        db_session.add_all([models.User(name="Ana", email="ana@x.com"), models.User(name="Bia", email="bia@x.com"),
+                            models.Resource(name="Sala 1", resource_type="sala")])
+        db_session.commit()
+        at = next_weekday_at(2, 9).isoformat()
+        booked = api_client.post("/api/appointments", json={"user_id": 1, "resource_id": 1, "start_time": at,
+                                                            "duration_minutes": 60})
+        payload = {"user_id": 2, "resource_id": 1, "start_time": at, "duration_minutes": 60}
+        assert api_client.post("/api/appointments", json=payload).status_code == 422
+        queued = api_client.post("/api/waitlist", json=payload).json()
+        assert queued["status"] == "waiting"
+
+        assert api_client.delete(f"/api/appointments/{booked.json()['id']}").status_code == 204
+        promoted = api_client.get(f"/api/waitlist/{queued['id']}").json()
+        assert promoted["status"] == "promoted"
+        assert [a["user_id"] for a in api_client.get("/api/appointments").json()] == [2]
+        assert api_client.delete("/api/appointments/999").status_code == 404
+        shared_waitlist.invalidate()
+
+
+class TestExpiry:
+    """Pedidos cujo horário já passou saem da fila."""
+
+    def test_lifecycle_expires_past_requests(self, setup):
+        setup.service.create_appointment(setup.db, 1, 1, setup.at, 60)
+        waiting = setup.service.join_waitlist(setup.db, 2, 1, setup.at, 60)
+        assert lifecycle.expire_waitlist(setup.db, setup.at + timedelta(minutes=1)) == 1
+        assert entry(setup, waiting.id).status == "expired"